@@ -2,43 +2,91 @@
 # -*- coding: utf-8 -*-
 """
 Módulo de conexão com o banco de dados PostgreSQL
+
+O engine (e o driver do PostgreSQL) só é criado na primeira sessão ou
+reflexão: importar este módulo não lê as configurações nem abre conexões,
+e comandos que não usam o banco iniciam sem esse custo.
 """
 
 import logging
+import threading
+from typing import Optional
+
 from sqlalchemy import create_engine, MetaData
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
 from app.utils.config import get_settings
 
 # Logger
 logger = logging.getLogger(__name__)
 
-# Configurações
-settings = get_settings()
+# Base para os modelos
+Base = declarative_base()
+
+# Metadata para refletir tabelas existentes
+metadata = MetaData()
+
+_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+_engine_lock = threading.Lock()
+_reflect_lock = threading.Lock()
+
+
+def database_url() -> str:
+    """
+    Monta a URL de conexão a partir das configurações
+
+    Returns:
+        URL do PostgreSQL
+    """
+    settings = get_settings()
+    return (
+        f"postgresql://{settings.db_user}:{settings.db_password}@"
+        f"{settings.db_host}:{settings.db_port}/{settings.db_name}"
+    )
+
 
-# Criação da URL de conexão
-DATABASE_URL = (
-    f"postgresql://{settings.db_user}:{settings.db_password}@"
-    f"{settings.db_host}:{settings.db_port}/{settings.db_name}"
-)
+def get_engine() -> Engine:
+    """
+    Obtém o engine do banco, criado no primeiro uso
+
+    Returns:
+        Engine do SQLAlchemy compartilhado pelo processo
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    database_url(),
+                    pool_pre_ping=True,  # Verifica conexão antes de usar
+                    pool_recycle=3600,   # Reconecta após 1 hora
+                    echo=get_settings().db_echo
+                )
+                _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+
+class _LazySessionFactory:
+    """Fábrica de sessões que cria o engine na primeira chamada"""
+
+    def __call__(self, **kwargs) -> Session:
+        get_engine()
+        return _session_factory(**kwargs)
 
-# Criação do engine
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Verifica conexão antes de usar
-    pool_recycle=3600,   # Reconecta após 1 hora
-    echo=settings.db_echo
-)
 
 # Criação da sessão
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionFactory()
 
-# Base para os modelos
-Base = declarative_base()
 
-# Metadata para refletir tabelas existentes
-metadata = MetaData()
+def __getattr__(name: str):
+    # Compatibilidade: ``engine`` continua acessível como atributo do módulo
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Função para obter conexão com o banco de dados
 def get_db() -> Session:
@@ -57,7 +105,7 @@ def get_db() -> Session:
 # Função para refletir uma tabela do banco de dados
 def reflect_table(table_name: str):
     """
-    Reflete uma tabela do banco de dados
+    Reflete uma tabela do banco de dados, uma única vez por processo
     
     Args:
         table_name: Nome da tabela a ser refletida
@@ -66,17 +114,18 @@ def reflect_table(table_name: str):
         Objeto Table do SQLAlchemy
     """
     try:
-        # Verifica se a tabela já está na metadata
-        if table_name in metadata.tables:
-            return metadata.tables[table_name]
-        
-        # Reflete a tabela específica
-        schema = settings.db_schema
-        metadata.reflect(bind=engine, only=[table_name], schema=schema)
-        
-        # Retorna a tabela com esquema
+        # As tabelas ficam na metadata com o nome qualificado pelo esquema
+        schema = get_settings().db_schema
         full_table_name = f"{schema}.{table_name}"
-        return metadata.tables.get(full_table_name)
+        table = metadata.tables.get(full_table_name)
+        if table is not None:
+            return table
+        
+        # Reflete a tabela específica (uma thread por vez: a metadata é compartilhada)
+        with _reflect_lock:
+            if full_table_name not in metadata.tables:
+                metadata.reflect(bind=get_engine(), only=[table_name], schema=schema)
+            return metadata.tables.get(full_table_name)
     except Exception as e:
         logger.error(f"Erro ao refletir tabela {table_name}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
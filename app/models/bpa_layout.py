@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Layout de largura fixa do arquivo BPA-I (SIA/SUS)
+
+As posições seguem o layout oficial e estão expressas como nas
+especificações do DATASUS: início e fim com base 1, ambos inclusivos.
+"""
+
+from typing import Dict, Tuple
+
+# Quantidade de linhas de produção por folha do BPA
+LINHAS_POR_FOLHA = 20
+
+# Identificadores de tipo de registro
+TIPO_CABECALHO = "01"
+TIPO_BPA_I = "03"
+
+# Cabeçalho (tipo 01)
+HEADER_FIELDS: Dict[str, Tuple[int, int]] = {
+    "cbc_hdr": (1, 2),          # Tipo de registro (01)
+    "cbc_hdr_id": (3, 7),       # Indicador "#BPA#"
+    "cbc_mvm": (8, 13),         # Competência (AAAAMM)
+    "cbc_lin": (14, 19),        # Total de linhas
+    "cbc_flh": (20, 25),        # Total de folhas
+    "cbc_smt_vrf": (26, 29),    # Campo de controle
+    "cbc_rsp": (30, 59),        # Órgão de origem
+    "cbc_sgl": (60, 65),        # Sigla do órgão de origem
+    "cbc_cgccpf": (66, 79),     # CNPJ/CPF do órgão de origem
+    "cbc_dst": (80, 119),       # Órgão de destino
+    "cbc_dst_in": (120, 120),   # Indicador do destino (M/E)
+    "cbc_versao": (121, 130),   # Versão do sistema
+}
+
+# Linha de produção individualizada (tipo 03)
+RECORD_FIELDS: Dict[str, Tuple[int, int]] = {
+    "prd_ident": (1, 2),
+    "prd_cnes": (3, 9),
+    "prd_cmp": (10, 15),
+    "prd_cnsmed": (16, 30),
+    "prd_cbo": (31, 36),
+    "prd_dtaten": (37, 44),
+    "prd_flh": (45, 47),
+    "prd_seq": (48, 49),
+    "prd_pa": (50, 59),
+    "prd_cnspac": (60, 74),
+    "prd_sexo": (75, 75),
+    "prd_ibge": (76, 81),
+    "prd_cid": (82, 85),
+    "prd_idade": (86, 88),
+    "prd_qt": (89, 94),
+    "prd_caten": (95, 96),
+    "prd_naut": (97, 109),
+    "prd_org": (110, 112),
+    "prd_nmpac": (113, 142),
+    "prd_dtnasc": (143, 150),
+    "prd_raca": (151, 152),
+    "prd_etnia": (153, 156),
+    "prd_nac": (157, 159),
+    "prd_srv": (160, 162),
+    "prd_clf": (163, 165),
+    "prd_equipe_seq": (166, 173),
+    "prd_equipe_area": (174, 177),
+    "prd_cnpj": (178, 191),
+    "prd_cep_pcnte": (192, 199),
+    "prd_lograd_pcnte": (200, 202),
+    "prd_end_pcnte": (203, 232),
+    "prd_compl_pcnte": (233, 242),
+    "prd_num_pcnte": (243, 247),
+    "prd_bairro_pcnte": (248, 277),
+    "prd_ddtel_pcnte": (278, 288),
+    "prd_email_pcnte": (289, 328),
+    "prd_ine": (329, 338),
+    "prd_cpf_pcnte": (339, 349),
+}
+
+
+def calcular_controle(soma: int) -> int:
+    """
+    Calcula o campo de controle do cabeçalho a partir da soma
+    dos códigos de procedimento e quantidades
+
+    Args:
+        soma: Somatório de prd_pa + prd_qt de todas as linhas
+
+    Returns:
+        Valor do campo de controle (entre 1111 e 2221)
+    """
+    return soma % 1111 + 1111
+
+
+def total_folhas(total_linhas: int) -> int:
+    """
+    Calcula a quantidade de folhas para um total de linhas
+
+    Args:
+        total_linhas: Quantidade de linhas de produção
+
+    Returns:
+        Quantidade de folhas
+    """
+    return (total_linhas + LINHAS_POR_FOLHA - 1) // LINHAS_POR_FOLHA
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Modelos da configuração de mapeamento e dos valores padrão do BPA-I
+"""
+
+from typing import Dict
+
+from pydantic import BaseModel
+
+from app.utils.config import Settings
+
+
+class MappingField(BaseModel):
+    """Modelo para campo de mapeamento"""
+    table: str
+    field: str
+    fixedValue: str = ""
+
+class MappingSection(BaseModel):
+    """Modelo para seção de mapeamento"""
+    fields: Dict[str, MappingField]
+
+class MappingConfig(BaseModel):
+    """Modelo para configuração de mapeamento"""
+    header: Dict[str, MappingField]
+    record: Dict[str, MappingField]
+
+class DefaultValues(BaseModel):
+    """Modelo para valores padrão configuráveis"""
+    cnes: str = "2560372"
+    orgao_emissor: str = "SECRETARIA MUNICIPAL DE SAUDE"
+    carater_atendimento: str = "01"
+    nacionalidade: str = "010"
+    origem: str = "BPA"
+
+
+def get_default_mapping(settings: Settings) -> MappingConfig:
+    """
+    Obtém a configuração de mapeamento padrão
+
+    Args:
+        settings: Configurações da aplicação
+
+    Returns:
+        Configuração de mapeamento padrão
+    """
+    return MappingConfig(
+        header={
+            "cnes": MappingField(table="ficha_amb_int", field="cod_hospital", fixedValue=""),
+            "competencia": MappingField(table="calculated", field="from_data_atendimento", fixedValue=""),
+            "orgao_emissor": MappingField(table="fixed", field="", fixedValue=settings.default_orgao_emissor),
+        },
+        record={
+            "cns_paciente": MappingField(table="ficha_amb_int", field="matricula", fixedValue=""),
+            "cns_profissional": MappingField(table="prestadores", field="cns", fixedValue=""),
+            "cbo": MappingField(table="lancamentos", field="cod_cbo", fixedValue=""),
+            "data_atendimento": MappingField(table="ficha_amb_int", field="data_atendimento", fixedValue=""),
+            "procedimento": MappingField(table="lancamentos", field="cod_proc", fixedValue=""),
+            "quantidade": MappingField(table="lancamentos", field="quantidade", fixedValue=""),
+            "cid": MappingField(table="lancamentos", field="cod_cid", fixedValue=""),
+            "carater_atendimento": MappingField(table="fixed", field="", fixedValue="01"),
+            "sexo_paciente": MappingField(table="fixed", field="", fixedValue=""),
+            "nome_paciente": MappingField(table="fixed", field="", fixedValue=""),
+            "data_nascimento": MappingField(table="fixed", field="", fixedValue=""),
+            "tipo_atendimento": MappingField(table="calculated", field="from_tipo_atend", fixedValue=""),
+            "origem": MappingField(table="fixed", field="", fixedValue="BPA"),
+        }
+    )
+
+
+def get_default_values(settings: Settings) -> DefaultValues:
+    """
+    Obtém os valores padrão usados sem arquivo de configuração
+
+    Args:
+        settings: Configurações da aplicação
+
+    Returns:
+        Valores padrão do ambiente (DEFAULT_CNES, DEFAULT_ORGAO_EMISSOR)
+    """
+    return DefaultValues(
+        cnes=settings.default_cnes,
+        orgao_emissor=settings.default_orgao_emissor,
+        carater_atendimento="01",
+        nacionalidade="010",
+        origem="BPA"
+    )
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rotas para consultar e gerenciar os arquivos de exportação (cache e retenção)
+"""
+
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel, Field
+
+from app.utils.config import get_settings, Settings
+from app.utils.downloads import artifact_response, media_type_for
+from app.services.artifact_cache import ArtifactCache
+from app.services.retention_service import RetentionManager
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Router
+router = APIRouter(prefix="/artifacts", tags=["Arquivos"])
+
+# Modelos de dados
+class PinRequest(BaseModel):
+    """Modelo para fixar ou liberar um arquivo"""
+    referencia: str = Field(..., description="Chave, caminho ou nome do arquivo")
+    fixar: bool = Field(True, description="True para fixar, False para liberar")
+
+# Rotas
+@router.get("")
+async def list_artifacts(settings: Settings = Depends(get_settings)):
+    """
+    Lista os arquivos de exportação com tamanho, último acesso e fixação
+
+    Returns:
+        Uso do disco e arquivos, do acesso mais antigo para o mais recente
+    """
+    try:
+        manager = RetentionManager(settings)
+        manager.scan()
+        entries = manager.cache.entries()
+
+        return {
+            "cota": settings.export_quota_bytes,
+            "total": sum(entry["size"] for entry in entries),
+            "fixados": sum(entry["size"] for entry in entries if entry["pinned"]),
+            "arquivos": entries
+        }
+    except Exception as e:
+        logger.error(f"Erro ao listar arquivos de exportação: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao listar arquivos de exportação: {str(e)}"
+        )
+
+@router.get("/{key}/download")
+async def download_artifact(key: str, request: Request, settings: Settings = Depends(get_settings)):
+    """
+    Baixa um artefato pela chave (endereço fixo, com ETag, 304 e Range)
+
+    A chave inclui o token de atualização dos dados, então o conteúdo
+    deste endereço nunca muda: downloads interrompidos podem ser
+    retomados com Range mesmo depois que os dados mudarem.
+
+    Args:
+        key: Hash da chave do artefato (Content-Location das exportações)
+        
+    Returns:
+        Arquivo ou o trecho pedido
+    """
+    cache = ArtifactCache(settings)
+    artifact = cache.lookup_digest(key)
+    if artifact is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Arquivo não encontrado (removido pela cota?): {key}"
+        )
+    cache.pin_download(artifact)
+
+    headers = {}
+    if "duplicados" in artifact.metadata:
+        headers["X-BPA-Duplicados"] = str(artifact.metadata["duplicados"])
+    return artifact_response(request, artifact, media_type_for(artifact.filename), headers=headers, immutable=True)
+
+@router.post("/gc")
+async def collect_artifacts(
+    cota: Optional[int] = Query(None, description="Cota em bytes (padrão: EXPORT_QUOTA_BYTES)"),
+    simular: bool = Query(False, description="Apenas informa o que seria removido"),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Aplica a cota de disco imediatamente
+
+    Args:
+        cota: Cota em bytes
+        simular: Não remove nada, apenas informa
+
+    Returns:
+        Resultado da retenção
+    """
+    try:
+        report = RetentionManager(settings).collect(cota, simular)
+        return report.to_dict()
+    except Exception as e:
+        logger.error(f"Erro ao aplicar a retenção: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao aplicar a retenção: {str(e)}"
+        )
+
+@router.post("/pin")
+async def pin_artifact(request: PinRequest, settings: Settings = Depends(get_settings)):
+    """
+    Fixa um arquivo (nunca removido pela cota) ou libera a fixação
+
+    Args:
+        request: Referência do arquivo e ação
+
+    Returns:
+        Caminho do arquivo alterado
+    """
+    try:
+        manager = RetentionManager(settings)
+        manager.scan()
+        path = manager.cache.set_pinned(request.referencia, request.fixar)
+
+        if path is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Arquivo não encontrado: {request.referencia}"
+            )
+
+        return {"arquivo": path, "fixado": request.fixar}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao fixar arquivo: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao fixar arquivo: {str(e)}"
+        )
+
+@router.delete("/pin")
+def unpin_artifact(
+    referencia: str = Query(..., description="Chave, caminho ou nome do arquivo"),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Libera a fixação de um arquivo, manual ou automática (BPA-I baixado)
+
+    Args:
+        referencia: Chave, caminho ou nome do arquivo
+
+    Returns:
+        Caminho do arquivo liberado
+    """
+    try:
+        path = ArtifactCache(settings).set_pinned(referencia, False)
+    except Exception as e:
+        logger.error(f"Erro ao liberar arquivo: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao liberar arquivo: {str(e)}"
+        )
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Arquivo não encontrado: {referencia}")
+    return {"arquivo": path, "fixado": False}
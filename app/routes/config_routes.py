@@ -4,15 +4,19 @@
 Rotas para gerenciar configurações do BPA Exporter
 """
 
-import json
+import asyncio
 import logging
 from typing import Dict, Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from app.database.connection import get_db
+from app.models.config import MappingConfig, DefaultValues
+from app.services.config_store import ConfigConflict, ConfigEntry, get_config_store
+from app.services.schema_catalog import (
+    ALVO_COLUNA, MAPPING_TABLES, MODO_PREFIXO, get_schema_catalog, refresh_catalog
+)
 from app.utils.config import get_settings, Settings
 
 # Logger
@@ -21,48 +25,56 @@ logger = logging.getLogger(__name__)
 # Router
 router = APIRouter(prefix="/config", tags=["Configurações"])
 
-# Modelos de dados
-class MappingField(BaseModel):
-    """Modelo para campo de mapeamento"""
-    table: str
-    field: str
-    fixedValue: str = ""
+def _expected_version(if_match: Optional[str]) -> Optional[int]:
+    """
+    Versão informada no cabeçalho If-Match
+    
+    Args:
+        if_match: Valor do cabeçalho (ETag devolvido pela leitura, ou *)
+        
+    Returns:
+        Versão esperada (None sem conferência)
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cabeçalho If-Match inválido: {if_match}"
+        )
 
-class MappingSection(BaseModel):
-    """Modelo para seção de mapeamento"""
-    fields: Dict[str, MappingField]
+def _set_version(response: Response, entry: ConfigEntry) -> None:
+    """Informa a versão da configuração no ETag da resposta"""
+    response.headers["ETag"] = f'"{entry.version}"'
 
-class MappingConfig(BaseModel):
-    """Modelo para configuração de mapeamento"""
-    header: Dict[str, MappingField]
-    record: Dict[str, MappingField]
-    
-class DefaultValues(BaseModel):
-    """Modelo para valores padrão configuráveis"""
-    cnes: str = "2560372"
-    orgao_emissor: str = "SECRETARIA MUNICIPAL DE SAUDE"
-    carater_atendimento: str = "01"
-    nacionalidade: str = "010"
-    origem: str = "BPA"
+def _conflict(e: ConfigConflict) -> HTTPException:
+    """Resposta para uma gravação sobre versão desatualizada"""
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"A configuração foi alterada por outra gravação (versão atual: {e.current})"
+    )
 
 # Rotas
 @router.get("/bpa-mapping", response_model=MappingConfig)
-async def get_bpa_mapping(settings: Settings = Depends(get_settings)):
+async def get_bpa_mapping(response: Response, settings: Settings = Depends(get_settings)):
     """
     Obtém a configuração atual de mapeamento BPA-I
     
+    A versão da configuração vai no cabeçalho ETag.
+    
     Returns:
-        Configuração de mapeamento atual
+        Configuração de mapeamento atual (a padrão sem arquivo válido)
     """
     try:
-        # Tenta ler a configuração do arquivo
-        try:
-            with open(settings.export_dir / "bpa_mapping.json", "r", encoding="utf-8") as file:
-                config = json.load(file)
-                return MappingConfig(**config)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Se o arquivo não existir ou for inválido, retorna a configuração padrão
-            return get_default_mapping(settings)
+        # Cópia em memória, relida apenas quando o arquivo muda
+        entry = get_config_store(settings).mapping.get()
+        _set_version(response, entry)
+        return entry.value
     except Exception as e:
         logger.error(f"Erro ao obter configuração de mapeamento BPA-I: {str(e)}")
         raise HTTPException(
@@ -73,6 +85,8 @@ async def get_bpa_mapping(settings: Settings = Depends(get_settings)):
 @router.post("/bpa-mapping", response_model=MappingConfig)
 async def save_bpa_mapping(
     config: MappingConfig,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     settings: Settings = Depends(get_settings)
 ):
     """
@@ -80,18 +94,22 @@ async def save_bpa_mapping(
     
     Args:
         config: Configuração de mapeamento a ser salva
+        if_match: Versão lida (ETag); se o arquivo mudou desde então, responde 412
         
     Returns:
-        Configuração de mapeamento salva
+        Configuração de mapeamento salva (nova versão no ETag)
     """
+    expected = _expected_version(if_match)
     try:
-        # Salva a configuração em arquivo
-        with open(settings.export_dir / "bpa_mapping.json", "w", encoding="utf-8") as file:
-            json.dump(config.dict(), file, ensure_ascii=False, indent=2)
+        # Gravação atômica (arquivo temporário + rename) com nova versão
+        entry = await asyncio.to_thread(get_config_store(settings).mapping.save, config, expected)
+        _set_version(response, entry)
         
-        logger.info(f"Configuração de mapeamento BPA-I salva com sucesso")
+        logger.info(f"Configuração de mapeamento BPA-I salva com sucesso (versão {entry.version})")
         
-        return config
+        return entry.value
+    except ConfigConflict as e:
+        raise _conflict(e)
     except Exception as e:
         logger.error(f"Erro ao salvar configuração de mapeamento BPA-I: {str(e)}")
         raise HTTPException(
@@ -100,28 +118,20 @@ async def save_bpa_mapping(
         )
 
 @router.get("/defaults", response_model=DefaultValues)
-async def get_defaults(settings: Settings = Depends(get_settings)):
+async def get_defaults(response: Response, settings: Settings = Depends(get_settings)):
     """
     Obtém os valores padrão configuráveis
     
+    A versão dos valores vai no cabeçalho ETag.
+    
     Returns:
-        Valores padrão configuráveis
+        Valores padrão configuráveis (os do ambiente sem arquivo válido)
     """
     try:
-        # Tenta ler os valores padrão do arquivo
-        try:
-            with open(settings.export_dir / "bpa_defaults.json", "r", encoding="utf-8") as file:
-                defaults = json.load(file)
-                return DefaultValues(**defaults)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Se o arquivo não existir ou for inválido, retorna os valores padrão
-            return DefaultValues(
-                cnes=settings.default_cnes,
-                orgao_emissor=settings.default_orgao_emissor,
-                carater_atendimento="01",
-                nacionalidade="010",
-                origem="BPA"
-            )
+        # Cópia em memória, relida apenas quando o arquivo muda
+        entry = get_config_store(settings).defaults.get()
+        _set_version(response, entry)
+        return entry.value
     except Exception as e:
         logger.error(f"Erro ao obter valores padrão: {str(e)}")
         raise HTTPException(
@@ -132,6 +142,8 @@ async def get_defaults(settings: Settings = Depends(get_settings)):
 @router.post("/defaults", response_model=DefaultValues)
 async def save_defaults(
     defaults: DefaultValues,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     settings: Settings = Depends(get_settings)
 ):
     """
@@ -139,18 +151,22 @@ async def save_defaults(
     
     Args:
         defaults: Valores padrão a serem salvos
+        if_match: Versão lida (ETag); se o arquivo mudou desde então, responde 412
         
     Returns:
-        Valores padrão salvos
+        Valores padrão salvos (nova versão no ETag)
     """
+    expected = _expected_version(if_match)
     try:
-        # Salva os valores padrão em arquivo
-        with open(settings.export_dir / "bpa_defaults.json", "w", encoding="utf-8") as file:
-            json.dump(defaults.dict(), file, ensure_ascii=False, indent=2)
+        # Gravação atômica (arquivo temporário + rename) com nova versão
+        entry = await asyncio.to_thread(get_config_store(settings).defaults.save, defaults, expected)
+        _set_version(response, entry)
         
-        logger.info(f"Valores padrão salvos com sucesso")
+        logger.info(f"Valores padrão salvos com sucesso (versão {entry.version})")
         
-        return defaults
+        return entry.value
+    except ConfigConflict as e:
+        raise _conflict(e)
     except Exception as e:
         logger.error(f"Erro ao salvar valores padrão: {str(e)}")
         raise HTTPException(
@@ -159,47 +175,46 @@ async def save_defaults(
         )
 
 @router.get("/database-schema")
-async def get_database_schema(db: Session = Depends(get_db)):
+async def get_database_schema(
+    busca: Optional[str] = Query(None, description="Termo buscado nos nomes (sem diferenciar maiúsculas)"),
+    modo: str = Query(MODO_PREFIXO, description="Modo da busca: prefixo ou substring"),
+    alvo: str = Query(ALVO_COLUNA, description="Onde procurar o termo: coluna, tabela ou ambos"),
+    tabela: Optional[str] = Query(None, description="Restringe a uma tabela"),
+    tipo: Optional[str] = Query(None, description="Restringe a um tipo de dado (ex.: integer)"),
+    pagina: Optional[int] = Query(None, ge=1, description="Página (a partir de 1)"),
+    por_pagina: int = Query(50, ge=1, le=500, description="Colunas por página"),
+    settings: Settings = Depends(get_settings)
+):
     """
     Obtém o esquema das tabelas do banco de dados
     
+    O esquema vem do catálogo offline (ver schema_catalog), sem consulta
+    ao banco. Sem filtros nem página, retorna as colunas das tabelas do
+    mapeamento BPA-I por tabela; com eles, uma página das colunas
+    encontradas.
+    
     Returns:
-        Esquema das tabelas do banco de dados
+        Esquema das tabelas do mapeamento, ou a página da busca
     """
     try:
-        # Consulta as tabelas do banco de dados
-        tables_query = """
-        SELECT 
-            table_name, 
-            column_name, 
-            data_type 
-        FROM 
-            information_schema.columns 
-        WHERE 
-            table_schema = 'sigh'
-            AND table_name IN ('ficha_amb_int', 'lancamentos', 'prestadores', 'pacientes')
-        ORDER BY 
-            table_name, 
-            ordinal_position
-        """
+        catalog = await asyncio.to_thread(get_schema_catalog, settings)
         
-        result = db.execute(tables_query)
-        rows = result.fetchall()
+        if busca is None and tabela is None and tipo is None and pagina is None:
+            return {
+                table: [{"name": column.name, "type": column.type} for column in columns]
+                for table, columns in catalog.table_columns(MAPPING_TABLES).items()
+            }
         
-        # Organiza os resultados por tabela
-        schema = {}
-        for row in rows:
-            table_name, column_name, data_type = row
-            
-            if table_name not in schema:
-                schema[table_name] = []
-            
-            schema[table_name].append({
-                "name": column_name,
-                "type": data_type
-            })
-        
-        return schema
+        pagina = pagina or 1
+        total, columns = catalog.search(busca or "", modo, alvo, tabela, tipo, (pagina - 1) * por_pagina, por_pagina)
+        return {
+            "total": total,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "colunas": [{"table": column.table, "name": column.name, "type": column.type} for column in columns]
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao obter esquema do banco de dados: {str(e)}")
         raise HTTPException(
@@ -207,36 +222,58 @@ async def get_database_schema(db: Session = Depends(get_db)):
             detail=f"Erro ao obter esquema do banco de dados: {str(e)}"
         )
 
-# Funções utilitárias
-def get_default_mapping(settings: Settings) -> MappingConfig:
+@router.get("/database-schema/tables")
+async def get_database_tables(
+    busca: Optional[str] = Query(None, description="Termo buscado no nome da tabela"),
+    modo: str = Query(MODO_PREFIXO, description="Modo da busca: prefixo ou substring"),
+    pagina: int = Query(1, ge=1, description="Página (a partir de 1)"),
+    por_pagina: int = Query(50, ge=1, le=500, description="Tabelas por página"),
+    settings: Settings = Depends(get_settings)
+):
     """
-    Obtém a configuração de mapeamento padrão
+    Lista as tabelas do catálogo do esquema
     
-    Args:
-        settings: Configurações da aplicação
-        
     Returns:
-        Configuração de mapeamento padrão
-    """
-    return MappingConfig(
-        header={
-            "cnes": MappingField(table="ficha_amb_int", field="cod_hospital", fixedValue=""),
-            "competencia": MappingField(table="calculated", field="from_data_atendimento", fixedValue=""),
-            "orgao_emissor": MappingField(table="fixed", field="", fixedValue=settings.default_orgao_emissor),
-        },
-        record={
-            "cns_paciente": MappingField(table="ficha_amb_int", field="matricula", fixedValue=""),
-            "cns_profissional": MappingField(table="prestadores", field="cns", fixedValue=""),
-            "cbo": MappingField(table="lancamentos", field="cod_cbo", fixedValue=""),
-            "data_atendimento": MappingField(table="ficha_amb_int", field="data_atendimento", fixedValue=""),
-            "procedimento": MappingField(table="lancamentos", field="cod_proc", fixedValue=""),
-            "quantidade": MappingField(table="lancamentos", field="quantidade", fixedValue=""),
-            "cid": MappingField(table="lancamentos", field="cod_cid", fixedValue=""),
-            "carater_atendimento": MappingField(table="fixed", field="", fixedValue="01"),
-            "sexo_paciente": MappingField(table="fixed", field="", fixedValue=""),
-            "nome_paciente": MappingField(table="fixed", field="", fixedValue=""),
-            "data_nascimento": MappingField(table="fixed", field="", fixedValue=""),
-            "tipo_atendimento": MappingField(table="calculated", field="from_tipo_atend", fixedValue=""),
-            "origem": MappingField(table="fixed", field="", fixedValue="BPA"),
+        Página das tabelas encontradas, com a quantidade de colunas de cada uma
+    """
+    try:
+        catalog = await asyncio.to_thread(get_schema_catalog, settings)
+        total, tables = catalog.search_tables(busca or "", modo, (pagina - 1) * por_pagina, por_pagina)
+        return {
+            "total": total,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "tabelas": [{"name": table, "columns": count} for table, count in tables]
         }
-    )
\ No newline at end of file
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao listar tabelas do esquema: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao listar tabelas do esquema: {str(e)}"
+        )
+
+@router.post("/database-schema/refresh")
+async def refresh_database_schema(
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Atualiza o catálogo do esquema a partir do banco
+    
+    Returns:
+        Arquivo gravado e quantidade de tabelas e colunas
+    """
+    try:
+        catalog = await asyncio.to_thread(refresh_catalog, db, settings)
+        return {
+            "origem": catalog.source,
+            "tabelas": len(catalog.tables()),
+            "colunas": len(catalog.columns)
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao atualizar o catálogo do esquema: {str(e)}"
+        )
\ No newline at end of file
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rotas da fila de exportações em segundo plano
+
+As rotas são síncronas: o FastAPI as executa no pool de threads, e as
+consultas ao SQLite dos jobs não bloqueiam o laço de eventos.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel, Field, validator
+
+from app.utils.config import get_settings, Settings
+from app.utils.downloads import artifact_response, media_type_for
+from app.services.job_service import (
+    JobStore, job_view, JOB_FORMATS, STATUS_DONE, STATUS_CANCELLED, FINAL_STATUSES
+)
+from app.services.artifact_cache import ArtifactCache
+from modules.duplicates import MODO_REPORTAR
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Router
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Modelos de dados
+class JobRequest(BaseModel):
+    """Modelo para enfileirar uma exportação"""
+    formato: str = Field(..., description="Formato: csv, xlsx, parquet ou bpa")
+    competencia: Optional[str] = Field(None, min_length=6, max_length=6, description="Competência (formato AAAAMM)")
+    cnes: Optional[str] = Field(None, min_length=1, max_length=7, description="Código CNES do estabelecimento (BPA-I)")
+    opcoes: Dict[str, Any] = Field(default_factory=dict, description="BPA-I: orgao_emissor, duplicidades, ignorar_incompatibilidades")
+
+    @validator("formato")
+    def validate_formato(cls, v):
+        if v not in JOB_FORMATS:
+            raise ValueError(f"Formato inválido: {v} (use {', '.join(JOB_FORMATS)})")
+        return v
+
+def _store(settings: Settings) -> JobStore:
+    """Banco de jobs configurado"""
+    return JobStore.from_settings(settings)
+
+# Rotas
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+def create_job(request: JobRequest, settings: Settings = Depends(get_settings)):
+    """
+    Enfileira uma exportação
+
+    Args:
+        request: Formato, competência, CNES e opções
+
+    Returns:
+        Identificador e situação do job
+    """
+    options = dict(request.opcoes)
+    if request.formato == "bpa":
+        if not request.competencia:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Competência obrigatória para BPA-I")
+        options.setdefault("orgao_emissor", settings.default_orgao_emissor)
+        options.setdefault("duplicidades", MODO_REPORTAR)
+        options.setdefault("ignorar_incompatibilidades", False)
+        cnes = request.cnes or settings.default_cnes
+    else:
+        cnes = None
+
+    try:
+        job_id = _store(settings).create(request.formato, request.competencia, cnes, options)
+        return {"id": job_id, "status": "fila", "url": f"/jobs/{job_id}"}
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar exportação: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao enfileirar exportação: {str(e)}"
+        )
+
+@router.get("")
+def list_jobs(
+    limite: int = Query(50, ge=1, le=500, description="Quantidade máxima de jobs"),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Lista os jobs mais recentes
+
+    Returns:
+        Jobs, do mais recente para o mais antigo
+    """
+    try:
+        return {"jobs": [job_view(job) for job in _store(settings).list(limite)]}
+    except Exception as e:
+        logger.error(f"Erro ao listar jobs: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao listar jobs: {str(e)}"
+        )
+
+@router.get("/{job_id}")
+def get_job(job_id: str, settings: Settings = Depends(get_settings)):
+    """
+    Situação de um job: etapa, registros processados e estimativa de término
+
+    Args:
+        job_id: Identificador do job
+
+    Returns:
+        Dados do job
+    """
+    job = _store(settings).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job não encontrado: {job_id}")
+    return job_view(job)
+
+@router.get("/{job_id}/download")
+def download_job(job_id: str, request: Request, settings: Settings = Depends(get_settings)):
+    """
+    Baixa o arquivo gerado por um job concluído
+
+    Args:
+        job_id: Identificador do job
+
+    Returns:
+        Arquivo exportado
+    """
+    job = _store(settings).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job não encontrado: {job_id}")
+    if job["status"] != STATUS_DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job ainda não concluído: {job['status']}")
+
+    view = job_view(job)
+    cache = ArtifactCache(settings)
+    artifact = cache.lookup_digest(view["resultado"]["chave"])
+    if artifact is None:
+        # Removido pela cota de disco depois da conclusão
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Arquivo do job não está mais disponível")
+    cache.pin_download(artifact)
+
+    headers = {}
+    if "duplicados" in artifact.metadata:
+        headers["X-BPA-Duplicados"] = str(artifact.metadata["duplicados"])
+    return artifact_response(request, artifact, media_type_for(artifact.filename), headers=headers, immutable=True)
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str, settings: Settings = Depends(get_settings)):
+    """
+    Cancela um job (em execução, para ao fim do lote atual)
+
+    Args:
+        job_id: Identificador do job
+
+    Returns:
+        Situação do job após o pedido
+    """
+    store = _store(settings)
+    result = store.cancel(job_id)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job não encontrado: {job_id}")
+    if result in FINAL_STATUSES and result != STATUS_CANCELLED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job já encerrado: {result}")
+    return {"id": job_id, "status": result, "cancelamento_pedido": True}
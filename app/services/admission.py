@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Controle de admissão das exportações da API
+
+Cada formato tem um número de vagas simultâneas (EXPORT_SLOTS) e todas as
+exportações dividem um orçamento de memória (EXPORT_MEMORY_BUDGET),
+reservado por uma estimativa a partir da quantidade de linhas: exportações
+que carregam todos os registros reservam linhas × bytes por linha; as que
+leem em lotes reservam apenas um lote.
+
+Quem não cabe espera em uma fila única, por ordem de chegada. Um pedido
+que espera vaga do seu formato não impede os de outros formatos; um que
+espera memória segura os seguintes, para que exportações grandes não
+fiquem para trás indefinidamente. Com a fila cheia, o pedido é recusado
+com uma estimativa de quando tentar de novo (429 + Retry-After na API).
+
+Gerações feitas em outras threads (itens de lote, jobs) usam
+``thread_admit``: com a fila cheia, tentam de novo após o Retry-After até
+EXPORT_ADMISSION_TIMEOUT segundos e desistem assim que o pedido é
+cancelado (cliente desconectado, job cancelado).
+"""
+
+import math
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.utils.config import Settings, get_settings
+from app.services.data_service import RECORDS_BATCH_SIZE
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Vagas simultâneas por formato (EXPORT_SLOTS sobrescreve formato a formato)
+DEFAULT_SLOTS = {
+    "csv": 4,
+    "xlsx": 1,
+    "parquet": 2,
+    "bpa": 2,
+    "records": 4,
+}
+
+# Memória estimada por registro carregado (bytes): dicionário com ~45
+# campos mais a estrutura do formato (o xlsxwriter guarda células e textos)
+ROW_BYTES = {
+    "csv": 3_000,
+    "xlsx": 6_000,
+    "parquet": 3_000,
+    "bpa": 4_000,
+    "records": 2_000,
+}
+DEFAULT_ROW_BYTES = 4_000
+
+# Duração presumida de uma exportação ainda sem histórico (segundos)
+DEFAULT_DURATION = 30.0
+
+# Limites do Retry-After (segundos)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 600
+
+# Intervalo entre verificações de cancelamento na espera de outras threads (segundos)
+CANCEL_POLL_SECONDS = 0.5
+
+
+class AdmissionRejected(Exception):
+    """Fila de admissão cheia"""
+
+    def __init__(self, format: str, retry_after: int):
+        super().__init__(f"Muitas exportações em andamento ({format}); tente novamente em {retry_after} s")
+        self.format = format
+        self.retry_after = retry_after
+
+
+class AdmissionCancelled(Exception):
+    """Pedido cancelado enquanto aguardava admissão"""
+
+
+@dataclass(eq=False)
+class AdmissionTicket:
+    """
+    Pedido de admissão
+
+    Atributos:
+        format (str): Formato da exportação
+        memory (int): Memória reservada (bytes)
+        created_at (float): Momento do pedido (monotônico)
+        granted_at (float): Momento da admissão (None enquanto na fila)
+    """
+    format: str
+    memory: int
+    created_at: float = field(default_factory=time.monotonic)
+    granted_at: Optional[float] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _future: Optional[asyncio.Future] = None
+
+    @property
+    def granted(self) -> bool:
+        """Indica se o pedido foi admitido"""
+        return self.granted_at is not None
+
+
+def _resolve(future: asyncio.Future) -> None:
+    """Libera quem aguarda a admissão (no laço de eventos do pedido)"""
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Vagas por formato, orçamento de memória e fila de espera das exportações
+    """
+
+    def __init__(self, slots: Dict[str, int], memory_budget: int, queue_limit: int):
+        """
+        Inicializa o controle
+
+        Args:
+            slots: Vagas simultâneas por formato
+            memory_budget: Orçamento de memória (bytes)
+            queue_limit: Máximo de pedidos aguardando
+        """
+        self.slots = {**DEFAULT_SLOTS, **slots}
+        self.memory_budget = memory_budget
+        self.queue_limit = queue_limit
+
+        self._lock = threading.Lock()
+        self._queue: Deque[AdmissionTicket] = deque()
+        self._active: Dict[str, int] = {}
+        self._memory = 0
+        self._durations: Dict[str, float] = {}
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionController":
+        """Controle configurado (EXPORT_SLOTS, EXPORT_MEMORY_BUDGET, EXPORT_QUEUE_LIMIT)"""
+        return cls(settings.export_slots, settings.export_memory_budget, settings.export_queue_limit)
+
+    def estimate_memory(self, format: str, rows: int, batched: bool = False) -> int:
+        """
+        Memória estimada de uma exportação
+
+        Args:
+            format: Formato da exportação
+            rows: Quantidade de registros
+            batched: Lê em lotes (apenas um lote em memória)
+
+        Returns:
+            Bytes a reservar
+        """
+        if batched:
+            rows = min(rows, RECORDS_BATCH_SIZE)
+        return rows * ROW_BYTES.get(format, DEFAULT_ROW_BYTES)
+
+    async def acquire(self, format: str, rows: int, batched: bool = False) -> AdmissionTicket:
+        """
+        Aguarda vaga e memória para uma exportação
+
+        Args:
+            format: Formato da exportação
+            rows: Quantidade estimada de registros
+            batched: Lê em lotes
+
+        Returns:
+            Pedido admitido (devolver com release)
+
+        Raises:
+            AdmissionRejected: Fila cheia
+        """
+        ticket = AdmissionTicket(format, self.estimate_memory(format, rows, batched))
+        ticket._loop = asyncio.get_running_loop()
+        ticket._future = ticket._loop.create_future()
+
+        with self._lock:
+            self._queue.append(ticket)
+            self._dispatch()
+            if not ticket.granted:
+                if len(self._queue) > self.queue_limit:
+                    self._queue.remove(ticket)
+                    self.rejected += 1
+                    retry_after = self._retry_after(format)
+                    logger.warning(f"Exportação recusada, fila de admissão cheia: {format} (Retry-After {retry_after} s)")
+                    raise AdmissionRejected(format, retry_after)
+                self.queued += 1
+                logger.info(f"Exportação aguardando admissão: {format}, {len(self._queue)} na fila")
+
+        try:
+            await ticket._future
+        except asyncio.CancelledError:
+            # Cliente desconectou: sai da fila ou devolve a vaga recebida
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+            if ticket.granted:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def acquire_from_thread(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        format: str,
+        rows: int,
+        batched: bool = False,
+        timeout: float = 300.0,
+        cancelled: Optional[Callable[[], bool]] = None
+    ) -> AdmissionTicket:
+        """
+        Aguarda vaga e memória a partir de uma thread fora do laço de eventos
+
+        Com a fila cheia, tenta de novo após o Retry-After; durante a espera
+        (na fila ou entre tentativas), consulta cancelled a cada
+        CANCEL_POLL_SECONDS.
+
+        Args:
+            loop: Laço de eventos da aplicação
+            format: Formato da exportação
+            rows: Quantidade estimada de registros
+            batched: Lê em lotes
+            timeout: Espera máxima (segundos)
+            cancelled: Indica se o pedido foi cancelado
+
+        Returns:
+            Pedido admitido (devolver com release)
+
+        Raises:
+            AdmissionRejected: Sem admissão em timeout segundos
+            AdmissionCancelled: Pedido cancelado durante a espera
+        """
+        deadline = time.monotonic() + timeout
+
+        def wait(seconds: float) -> None:
+            # Espera em passos curtos, desistindo no cancelamento
+            end = min(time.monotonic() + seconds, deadline)
+            while True:
+                if cancelled is not None and cancelled():
+                    raise AdmissionCancelled(f"Exportação cancelada aguardando admissão ({format})")
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return
+                time.sleep(min(CANCEL_POLL_SECONDS, remaining))
+
+        while True:
+            future = asyncio.run_coroutine_threadsafe(self.acquire(format, rows, batched), loop)
+            try:
+                while True:
+                    try:
+                        return future.result(CANCEL_POLL_SECONDS)
+                    except concurrent.futures.TimeoutError:
+                        wait(0)
+                        if time.monotonic() >= deadline:
+                            with self._lock:
+                                retry_after = self._retry_after(format)
+                            raise AdmissionRejected(format, retry_after)
+            except AdmissionRejected as e:
+                if future.done() and time.monotonic() + e.retry_after < deadline:
+                    # Fila cheia: nova tentativa após o Retry-After
+                    wait(e.retry_after)
+                    continue
+                self._abandon(future)
+                raise
+            except BaseException:
+                self._abandon(future)
+                raise
+
+    def _abandon(self, future: "concurrent.futures.Future") -> None:
+        """Desiste de um pedido feito por outra thread (sai da fila ou devolve a vaga)"""
+        if future.cancel():
+            return
+        try:
+            ticket = future.result(0)
+        except BaseException:
+            return
+        self.release(ticket)
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """
+        Devolve a vaga e a memória de um pedido admitido (pode ser chamada de outra thread)
+
+        Args:
+            ticket: Pedido admitido
+        """
+        with self._lock:
+            if not ticket.granted:
+                return
+            self._active[ticket.format] -= 1
+            self._memory -= ticket.memory
+
+            # Média móvel da duração, usada para estimar o Retry-After
+            duration = time.monotonic() - ticket.granted_at
+            previous = self._durations.get(ticket.format)
+            self._durations[ticket.format] = duration if previous is None else 0.8 * previous + 0.2 * duration
+
+            ticket.granted_at = None
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admite os pedidos da fila que cabem, por ordem de chegada (com o lock)"""
+        for ticket in list(self._queue):
+            if self._active.get(ticket.format, 0) >= self.slots.get(ticket.format, 1):
+                continue
+            # Um pedido maior que o orçamento inteiro roda sozinho
+            if self._memory and self._memory + ticket.memory > self.memory_budget:
+                break
+
+            self._queue.remove(ticket)
+            self._active[ticket.format] = self._active.get(ticket.format, 0) + 1
+            self._memory += ticket.memory
+            ticket.granted_at = time.monotonic()
+            self.admitted += 1
+            self.wait_seconds += ticket.granted_at - ticket.created_at
+            ticket._loop.call_soon_threadsafe(_resolve, ticket._future)
+
+    def saturated(self, format: str) -> Optional[int]:
+        """
+        Indica se a fila de admissão está cheia
+
+        Args:
+            format: Formato da exportação
+
+        Returns:
+            Retry-After estimado (segundos) com a fila cheia; None se ainda cabe um pedido
+        """
+        with self._lock:
+            if not self._queue or len(self._queue) < self.queue_limit:
+                return None
+            return self._retry_after(format)
+
+    def _retry_after(self, format: str) -> int:
+        """Estimativa de quando a fila terá espaço (com o lock)"""
+        duration = self._durations.get(format, DEFAULT_DURATION)
+        waiting = sum(1 for ticket in self._queue if ticket.format == format)
+        estimate = duration * (waiting / max(self.slots.get(format, 1), 1) + 1)
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Situação do controle de admissão
+
+        Returns:
+            Vagas, exportações em execução, memória reservada, fila e contadores
+        """
+        with self._lock:
+            return {
+                "vagas": dict(self.slots),
+                "em_execucao": {format: count for format, count in self._active.items() if count},
+                "memoria_reservada": self._memory,
+                "orcamento_memoria": self.memory_budget,
+                "fila": len(self._queue),
+                "limite_fila": self.queue_limit,
+                "admitidas": self.admitted,
+                "enfileiradas": self.queued,
+                "recusadas": self.rejected,
+                "espera_total_segundos": round(self.wait_seconds, 3),
+            }
+
+
+def thread_admit(
+    loop: asyncio.AbstractEventLoop,
+    cancelled: Optional[Callable[[], bool]] = None,
+    timeout: Optional[float] = None
+) -> Callable[[str, int, bool], Callable[[], None]]:
+    """
+    Controle de admissão para gerações feitas fora do laço de eventos (lotes, jobs)
+
+    Args:
+        loop: Laço de eventos da aplicação
+        cancelled: Indica se a geração foi cancelada (consultada durante a espera)
+        timeout: Espera máxima por vaga (padrão: EXPORT_ADMISSION_TIMEOUT)
+
+    Returns:
+        Função (formato, registros, em lotes) que aguarda a vaga e retorna a que a devolve
+    """
+    controller = get_admission_controller()
+    if timeout is None:
+        timeout = get_settings().export_admission_timeout
+
+    def admit(format: str, rows: int, batched: bool) -> Callable[[], None]:
+        ticket = controller.acquire_from_thread(loop, format, rows, batched, timeout, cancelled)
+        return lambda: controller.release(ticket)
+
+    return admit
+
+
+@lru_cache()
+def get_admission_controller() -> AdmissionController:
+    """
+    Obtém o controle de admissão do processo
+
+    Returns:
+        AdmissionController configurado
+    """
+    return AdmissionController.from_settings(get_settings())
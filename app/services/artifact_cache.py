@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache de artefatos de exportação endereçado por conteúdo
+
+Cada artefato é identificado por uma chave com o formato, a competência,
+o CNES, as opções da exportação, o hash da configuração de mapeamento e
+valores padrão e um token de atualização dos dados (ver
+DataService.get_freshness_token). Requisições idênticas sobre os mesmos
+dados reutilizam o arquivo já gerado.
+
+Os arquivos são gravados em um nome temporário exclusivo e só então
+renomeados (``os.replace``), de modo que requisições concorrentes nunca
+veem um arquivo parcial nem sobrescrevem o arquivo uma da outra. A busca
+é feita por um índice SQLite pequeno, ao lado dos artefatos, que também
+guarda tamanho, último acesso e fixação de cada arquivo para a política
+de retenção (ver retention_service).
+
+A fixação é manual (set_pinned) ou automática: o BPA-I baixado pela API ou
+gerado pela CLI é fixado como a versão atual do seu CNES e competência, e
+a versão fixada antes, automaticamente, é liberada. Fixações manuais só
+saem com set_pinned(..., False).
+"""
+
+import os
+import re
+import json
+import uuid
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from app.utils.config import Settings
+from app.services import metrics
+from app.services.config_store import get_config_store
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Nome do índice dentro do diretório do cache
+CACHE_INDEX = "index.sqlite3"
+
+# Formatos fixados ao serem baixados ou gerados pela CLI (arquivos enviados ao SIA)
+AUTO_PIN_FORMATS = ("bpa",)
+
+# Valores da coluna pinned: fixação à mão e fixação automática (versão atual)
+PIN_MANUAL = 1
+PIN_AUTO = 2
+
+# Nome dos BPA-I gerados pela CLI (BPAService.filename_for): CNES e competência
+BPA_FILENAME = re.compile(r"^BPA_I_(?P<cnes>\d+)_(?P<competencia>\d{6})\.txt$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    competencia TEXT NOT NULL,
+    cnes TEXT NOT NULL,
+    options TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    freshness TEXT NOT NULL,
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_access TEXT NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_UPSERT = """
+INSERT INTO artifacts (
+    key, format, competencia, cnes, options, config_hash, freshness,
+    path, filename, size, sha256, metadata, created_at, last_access
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    path = excluded.path,
+    filename = excluded.filename,
+    size = excluded.size,
+    sha256 = excluded.sha256,
+    metadata = excluded.metadata,
+    last_access = excluded.last_access
+"""
+
+
+class ArtifactKey(NamedTuple):
+    """Parâmetros que determinam o conteúdo de um artefato"""
+    format: str
+    competencia: str
+    cnes: str
+    options: str
+    config_hash: str
+    freshness: str
+
+    @property
+    def digest(self) -> str:
+        """Hash SHA-256 da chave (nome do artefato no cache)"""
+        return hashlib.sha256(json.dumps(list(self), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Artifact:
+    """
+    Artefato armazenado no cache
+
+    Atributos:
+        key (str): Hash da chave do artefato
+        path (Path): Caminho do arquivo no cache
+        filename (str): Nome do arquivo para download
+        size (int): Tamanho em bytes
+        sha256 (str): Hash do conteúdo
+        metadata (dict): Dados adicionais da geração (ex.: duplicidades)
+        cached (bool): Indica se o artefato veio do cache (não foi gerado agora)
+    """
+    key: str
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    cached: bool = False
+
+
+def normalize_options(**options: Any) -> str:
+    """
+    Representação canônica das opções de uma exportação
+
+    Args:
+        **options: Opções que alteram o conteúdo gerado
+
+    Returns:
+        Texto com as opções ordenadas
+    """
+    return json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def config_fingerprint(settings: Settings) -> str:
+    """
+    Hash da configuração de mapeamento e dos valores padrão
+
+    Args:
+        settings: Configurações da aplicação
+
+    Returns:
+        Hash SHA-256 dos arquivos de configuração e dos padrões do ambiente
+        (calculado sobre a cópia em memória, ver config_store)
+    """
+    return get_config_store(settings).snapshot().fingerprint
+
+
+def _file_sha256(path: Path) -> str:
+    """SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Cache de artefatos de exportação com índice SQLite
+    """
+
+    def __init__(self, settings: Settings):
+        """
+        Inicializa o cache no diretório configurado
+
+        Args:
+            settings: Configurações da aplicação
+        """
+        self.settings = settings
+        self.cache_dir = settings.cache_dir or settings.export_dir / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / CACHE_INDEX
+
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+            # Índices criados antes da política de retenção não têm a coluna pinned
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(artifacts)")}
+            if "pinned" not in columns:
+                conn.execute("ALTER TABLE artifacts ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre uma conexão com o índice, confirmando a transação ao final"""
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, format: str, competencia: Optional[str], freshness: str, cnes: str = "", **options: Any) -> ArtifactKey:
+        """
+        Monta a chave de um artefato com o hash da configuração atual
+
+        Args:
+            format: Formato da exportação (csv, xlsx, parquet, bpa)
+            competencia: Competência no formato AAAAMM (None = todas)
+            freshness: Token de atualização dos dados
+            cnes: CNES do estabelecimento (BPA-I)
+            **options: Demais opções que alteram o conteúdo
+
+        Returns:
+            Chave do artefato
+        """
+        return ArtifactKey(
+            format=format,
+            competencia=competencia or "",
+            cnes=cnes,
+            options=normalize_options(**options),
+            config_hash=config_fingerprint(self.settings),
+            freshness=freshness
+        )
+
+    def _artifact_path(self, key: ArtifactKey, extension: str) -> Path:
+        """Caminho do artefato: subdiretório pelos dois primeiros dígitos do hash"""
+        digest = key.digest
+        return self.cache_dir / digest[:2] / f"{digest}.{extension}"
+
+    def lookup(self, key: ArtifactKey) -> Optional[Artifact]:
+        """
+        Procura um artefato no índice
+
+        Args:
+            key: Chave do artefato
+
+        Returns:
+            Artefato em cache ou None (entradas cujo arquivo sumiu são removidas)
+        """
+        artifact = self.lookup_digest(key.digest)
+        metrics.record_cache_lookup(key.format, artifact is not None)
+        return artifact
+
+    def lookup_digest(self, digest: str) -> Optional[Artifact]:
+        """
+        Procura um artefato pelo hash da chave (ex.: guardado no resultado de um job)
+
+        Args:
+            digest: Hash da chave do artefato
+
+        Returns:
+            Artefato em cache ou None
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM artifacts WHERE key = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+
+            path = Path(row["path"])
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                size = None
+            if size != row["size"]:
+                logger.warning(f"Artefato do cache ausente ou alterado, descartando: {path}")
+                conn.execute("DELETE FROM artifacts WHERE key = ?", (digest,))
+                return None
+
+            conn.execute(
+                "UPDATE artifacts SET last_access = ? WHERE key = ?",
+                (datetime.now().isoformat(), digest)
+            )
+
+        logger.info(f"Artefato encontrado no cache: {row['filename']} ({row['format']}, {row['competencia'] or 'todas'})")
+        return Artifact(
+            key=digest,
+            path=path,
+            filename=row["filename"],
+            size=row["size"],
+            sha256=row["sha256"],
+            metadata=json.loads(row["metadata"]),
+            cached=True
+        )
+
+    def store(
+        self,
+        key: ArtifactKey,
+        filename: str,
+        build: Callable[[Path], Any],
+        metadata: Optional[Callable[[], Dict[str, Any]]] = None
+    ) -> Artifact:
+        """
+        Gera um artefato e o registra no cache de forma atômica
+
+        Args:
+            key: Chave do artefato
+            filename: Nome do arquivo para download
+            build: Função que grava o artefato no caminho recebido
+            metadata: Função chamada após a geração, com dados a guardar no índice
+
+        Returns:
+            Artefato armazenado
+        """
+        extension = filename.rsplit(".", 1)[-1]
+        path = self._artifact_path(key, extension)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+
+        try:
+            build(temp_path)
+            size = temp_path.stat().st_size
+            sha256 = _file_sha256(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+
+        extra = metadata() if metadata else {}
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                _UPSERT,
+                (
+                    key.digest, key.format, key.competencia, key.cnes, key.options,
+                    key.config_hash, key.freshness, str(path), filename, size, sha256,
+                    json.dumps(extra, ensure_ascii=False, default=str), now, now
+                )
+            )
+
+        logger.info(f"Artefato armazenado no cache: {filename} -> {path} ({size} bytes)")
+        return Artifact(key.digest, path, filename, size, sha256, extra)
+
+    def register_file(self, path: Path, format: str) -> bool:
+        """
+        Registra no índice um arquivo gerado fora do cache (CLI, cópias arquivadas)
+
+        Args:
+            path: Caminho do arquivo
+            format: Formato do arquivo
+
+        Returns:
+            True se o arquivo ainda não estava no índice
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = f"arquivo:{path}"
+        modified = datetime.fromtimestamp(stat.st_mtime).isoformat()
+        match = BPA_FILENAME.match(path.name) if format in AUTO_PIN_FORMATS else None
+        cnes, competencia = (match["cnes"], match["competencia"]) if match else ("", "")
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO artifacts "
+                "(key, format, competencia, cnes, options, config_hash, freshness, "
+                "path, filename, size, sha256, metadata, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, '{}', '', '', ?, ?, ?, '', '{}', ?, ?)",
+                (key, format, competencia, cnes, str(path), path.name, stat.st_size, modified, modified)
+            )
+            if cursor.rowcount == 0:
+                # Arquivo já conhecido: atualiza o tamanho caso tenha sido regravado
+                conn.execute("UPDATE artifacts SET size = ? WHERE key = ?", (stat.st_size, key))
+            elif format in AUTO_PIN_FORMATS:
+                # BPA-I gerados pela CLI são os arquivos enviados: entram como a versão atual
+                self._pin_current(conn, key)
+            return cursor.rowcount > 0
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Lista os artefatos do índice, do acesso mais antigo para o mais recente
+
+        Returns:
+            Lista de dicionários com chave, caminho, nome, tamanho, último acesso e fixação
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, format, competencia, cnes, path, filename, size, created_at, last_access, pinned "
+                "FROM artifacts ORDER BY last_access, created_at"
+            ).fetchall()
+        return [dict(row, pinned=bool(row["pinned"])) for row in rows]
+
+    def remove(self, key: str, delete_file: bool = True) -> None:
+        """
+        Remove um artefato do índice e, opcionalmente, o arquivo
+
+        Args:
+            key: Chave do artefato (hash)
+            delete_file: Apaga também o arquivo
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+            conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+        if row is not None and delete_file:
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+
+    def _pin_current(self, conn: sqlite3.Connection, key: str) -> bool:
+        """
+        Fixa automaticamente um BPA-I como a versão atual do seu CNES e competência
+
+        A versão fixada antes, automaticamente, é liberada (as fixadas à mão
+        ficam). Arquivos gerados com perfil de desempenho não são fixados.
+
+        Args:
+            conn: Conexão com o índice (na transação de quem chama)
+            key: Chave do artefato
+
+        Returns:
+            True se o artefato passou a ser a versão fixada
+        """
+        row = conn.execute(
+            "SELECT format, competencia, cnes, options, path, pinned FROM artifacts WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row["format"] not in AUTO_PIN_FORMATS or row["pinned"]:
+            return False
+        if "perfil" in json.loads(row["options"] or "{}"):
+            return False
+
+        released = conn.execute(
+            "SELECT path FROM artifacts WHERE pinned = ? AND format = ? AND competencia = ? AND cnes = ? AND key <> ?",
+            (PIN_AUTO, row["format"], row["competencia"], row["cnes"], key)
+        ).fetchall()
+        conn.execute(
+            "UPDATE artifacts SET pinned = 0 WHERE pinned = ? AND format = ? AND competencia = ? AND cnes = ? AND key <> ?",
+            (PIN_AUTO, row["format"], row["competencia"], row["cnes"], key)
+        )
+        conn.execute("UPDATE artifacts SET pinned = ? WHERE key = ?", (PIN_AUTO, key))
+        logger.info(f"Artefato fixado como versão atual: {row['path']}")
+        for previous in released:
+            logger.info(f"Versão anterior liberada da fixação: {previous['path']}")
+        return True
+
+    def pin_download(self, artifact: Artifact) -> None:
+        """
+        Fixa um artefato baixado como a versão atual, se o formato for de arquivo enviado (BPA-I)
+
+        Args:
+            artifact: Artefato servido para download
+        """
+        with self._connect() as conn:
+            self._pin_current(conn, artifact.key)
+
+    def set_pinned(self, reference: str, pinned: bool = True) -> Optional[str]:
+        """
+        Fixa à mão (ou libera) artefatos, protegendo-os da remoção por cota
+
+        Liberar vale também para a fixação automática da versão atual.
+
+        Args:
+            reference: Chave, caminho ou nome do arquivo (pelo nome, vale o mais recente)
+            pinned: True para fixar, False para liberar
+
+        Returns:
+            Caminho do artefato alterado ou None se não encontrado
+        """
+        resolved = str(Path(reference).resolve())
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT key, path FROM artifacts WHERE key = ? OR path = ? "
+                "UNION ALL "
+                "SELECT * FROM (SELECT key, path FROM artifacts WHERE filename = ? "
+                "ORDER BY created_at DESC LIMIT 1)",
+                (reference, resolved, reference)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE artifacts SET pinned = ? WHERE key = ?", (PIN_MANUAL if pinned else 0, row["key"]))
+        logger.info(f"Artefato {'fixado' if pinned else 'liberado'}: {row['path']}")
+        return row["path"]
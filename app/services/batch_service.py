@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Exportação em lote de várias competências
+
+Auditorias pedem 12 a 24 meses de uma vez. Em vez de uma execução por
+competência (cada uma pagando inicialização, reflexão das tabelas e
+conexão), o lote distribui os pares (formato, competência) por um
+conjunto de threads (BATCH_WORKERS) no mesmo processo: cada thread
+mantém uma sessão do pool de conexões para todos os seus itens, e as
+tabelas refletidas, a configuração em memória e o cache de artefatos são
+compartilhados. Cada item passa pelo mesmo caminho dos jobs
+(JobRunner.export), então arquivos já gerados saem direto do cache.
+
+Os arquivos são reunidos em um único ZIP, escrito em fluxo à medida que
+os itens terminam (``<competencia>/<arquivo>``), com um ``manifest.json``
+ao final: situação, tamanho, SHA-256 e tempo de cada item.
+"""
+
+import json
+import time
+import zipfile
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.utils.config import Settings
+from app.services.admission import AdmissionRejected
+from app.services.artifact_cache import Artifact, ArtifactCache
+from app.services.job_service import JOB_FORMATS, IncompatibleRecords, JobRunner, NoRecords, artifact_result
+from app.services import metrics, tracing
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Máximo de competências por lote
+MAX_BATCH_COMPETENCIAS = 60
+
+# Situações de um item do lote
+ITEM_DONE = "concluido"
+ITEM_EMPTY = "sem_registros"
+ITEM_FAILED = "erro"
+
+# Formatos já comprimidos (guardados sem nova compressão no ZIP)
+STORED_FORMATS = ("xlsx", "parquet")
+
+# Tamanho dos blocos copiados para o ZIP
+ARCHIVE_CHUNK_SIZE = 1 << 20
+
+# Nome do manifesto dentro do ZIP
+MANIFEST_NAME = "manifest.json"
+
+
+def competencia_range(start: str, end: str) -> List[str]:
+    """
+    Competências de um intervalo, inclusive
+
+    Args:
+        start: Competência inicial (AAAAMM)
+        end: Competência final (AAAAMM)
+
+    Returns:
+        Competências em ordem
+
+    Raises:
+        ValueError: Competência inválida, intervalo invertido ou longo demais
+    """
+    bounds = []
+    for value in (start, end):
+        if not value or len(value) != 6 or not value.isdigit() or not 1 <= int(value[4:]) <= 12:
+            raise ValueError(f"Competência inválida: {value} (use AAAAMM)")
+        bounds.append(int(value[:4]) * 12 + int(value[4:]) - 1)
+
+    if bounds[1] < bounds[0]:
+        raise ValueError(f"Competência final {end} anterior à inicial {start}")
+    if bounds[1] - bounds[0] + 1 > MAX_BATCH_COMPETENCIAS:
+        raise ValueError(f"Intervalo de {bounds[1] - bounds[0] + 1} competências (máximo {MAX_BATCH_COMPETENCIAS})")
+    return [f"{month // 12:04d}{month % 12 + 1:02d}" for month in range(bounds[0], bounds[1] + 1)]
+
+
+def parse_formats(formats: Iterable[str]) -> List[str]:
+    """
+    Formatos de um lote, sem repetição
+
+    Args:
+        formats: Formatos (itens ou textos separados por vírgula)
+
+    Returns:
+        Formatos na ordem informada
+
+    Raises:
+        ValueError: Formato inválido ou nenhum formato
+    """
+    result: List[str] = []
+    for item in formats:
+        for format in str(item).split(","):
+            format = format.strip().lower()
+            if not format:
+                continue
+            if format not in JOB_FORMATS:
+                raise ValueError(f"Formato inválido: {format} (use {', '.join(JOB_FORMATS)})")
+            if format not in result:
+                result.append(format)
+    if not result:
+        raise ValueError("Nenhum formato informado")
+    return result
+
+
+@dataclass
+class BatchItem:
+    """
+    Resultado de um item (formato, competência) do lote
+
+    Atributos:
+        format (str): Formato
+        competencia (str): Competência (AAAAMM)
+        status (str): concluido, sem_registros ou erro
+        artifact (Artifact): Arquivo gerado ou obtido do cache (itens concluídos)
+        error (str): Mensagem de erro
+        details (dict): Detalhes do erro (ex.: relatório de compatibilidade)
+        seconds (float): Duração do item
+    """
+    format: str
+    competencia: str
+    status: str = ITEM_DONE
+    artifact: Optional[Artifact] = None
+    error: Optional[str] = None
+    details: Dict[str, Any] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def archive_name(self) -> Optional[str]:
+        """Caminho do arquivo dentro do ZIP"""
+        return f"{self.competencia}/{self.artifact.filename}" if self.artifact else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Entrada do manifesto"""
+        item: Dict[str, Any] = {
+            "formato": self.format,
+            "competencia": self.competencia,
+            "situacao": self.status,
+            "segundos": round(self.seconds, 3),
+        }
+        if self.artifact is not None:
+            item.update(artifact_result(self.artifact))
+            item["arquivo"] = self.archive_name
+        if self.error:
+            item["erro"] = self.error
+        item.update(self.details)
+        return item
+
+
+class _BatchProgress:
+    """Progresso dos itens do lote (apenas no log, por etapa)"""
+
+    def __init__(self, format: str, competencia: str):
+        self.label = f"{format} {competencia}"
+
+    def stage(self, stage: str, rows_total: Optional[int] = None) -> None:
+        logger.debug(f"Lote {self.label}: etapa {stage}")
+
+    def __call__(self, rows_done: int) -> None:
+        pass
+
+
+class BatchExporter:
+    """
+    Executa os itens de um lote em um conjunto de threads
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: Callable[[], Any],
+        workers: Optional[int] = None,
+        admit: Optional[Callable[[str, int, bool], Callable[[], None]]] = None,
+        cancelled: Optional[threading.Event] = None
+    ):
+        """
+        Args:
+            settings: Configurações da aplicação
+            session_factory: Fábrica de sessões do banco (SessionLocal)
+            workers: Threads do lote (padrão: BATCH_WORKERS)
+            admit: Reserva vaga para cada geração (ver JobRunner.export)
+            cancelled: Sinalizado quando o lote termina ou é interrompido, para
+                que os itens à espera de vaga desistam (ver admission.thread_admit)
+        """
+        self.settings = settings
+        self.session_factory = session_factory
+        self.workers = max(1, workers or settings.batch_workers)
+        self.admit = admit
+        self.cancelled = cancelled
+        self.runner = JobRunner(settings, session_factory)
+
+    def run(
+        self,
+        competencias: List[str],
+        formats: List[str],
+        cnes: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Iterator[BatchItem]:
+        """
+        Executa o lote
+
+        Interromper a iteração cancela os itens ainda não iniciados; os que
+        estão em execução terminam (e ficam no cache).
+
+        Args:
+            competencias: Competências (AAAAMM)
+            formats: Formatos
+            cnes: CNES do estabelecimento (BPA-I)
+            options: Opções do BPA-I (orgao_emissor, duplicidades, ignorar_incompatibilidades)
+
+        Returns:
+            Itens na ordem em que terminam
+        """
+        options = options or {}
+        cache = ArtifactCache(self.settings)
+        local = threading.local()
+        sessions: List[Any] = []
+        sessions_lock = threading.Lock()
+
+        def session() -> Any:
+            # Uma sessão (e conexão) por thread, reaproveitada entre os itens
+            db = getattr(local, "db", None)
+            if db is None:
+                db = local.db = self.session_factory()
+                with sessions_lock:
+                    sessions.append(db)
+            return db
+
+        def execute(format: str, competencia: str) -> BatchItem:
+            item = BatchItem(format, competencia)
+            start = time.perf_counter()
+            db = session()
+            try:
+                with metrics.export_format(format), \
+                        tracing.span("batch.item", format=format, competencia=competencia):
+                    item.artifact = self.runner.export(
+                        format, competencia, cnes, options, db, _BatchProgress(format, competencia), cache, self.admit
+                    )
+            except NoRecords as e:
+                item.status = ITEM_EMPTY
+                item.error = str(e)
+            except Exception as e:
+                logger.error(f"Erro ao exportar {format} da competência {competencia} no lote: {str(e)}")
+                db.rollback()
+                item.status = ITEM_FAILED
+                item.error = str(e)
+                if isinstance(e, IncompatibleRecords):
+                    item.details = e.details
+                elif isinstance(e, AdmissionRejected):
+                    item.details = {"retry_after": e.retry_after}
+            item.seconds = time.perf_counter() - start
+            return item
+
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix="batch")
+        try:
+            # Cada item roda com uma cópia do contexto (span do lote, formato das métricas)
+            futures = [
+                pool.submit(contextvars.copy_context().run, execute, format, competencia)
+                for competencia in competencias for format in formats
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            if self.cancelled is not None:
+                self.cancelled.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            for db in sessions:
+                db.close()
+
+
+class _ArchiveSink:
+    """Destino sem posicionamento do ZIP: acumula os bytes até serem enviados"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+
+def stream_archive(items: Iterable[BatchItem], manifest: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Escreve os arquivos do lote em um ZIP, em fluxo, com o manifesto ao final
+
+    Args:
+        items: Itens do lote, na ordem em que terminam (BatchExporter.run)
+        manifest: Parâmetros do lote, completados com os itens e o resumo
+
+    Returns:
+        Pedaços do ZIP
+    """
+    sink = _ArchiveSink()
+    started = time.perf_counter()
+    entries: List[BatchItem] = []
+    try:
+        archive = zipfile.ZipFile(sink, "w", allowZip64=True)
+        for item in items:
+            if item.artifact is not None:
+                info = zipfile.ZipInfo(item.archive_name, datetime.now().timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED if item.format in STORED_FORMATS else zipfile.ZIP_DEFLATED
+                try:
+                    with open(item.artifact.path, "rb") as source, archive.open(info, "w", force_zip64=True) as target:
+                        for block in iter(lambda: source.read(ARCHIVE_CHUNK_SIZE), b""):
+                            target.write(block)
+                            yield from sink.drain()
+                except OSError as e:
+                    # Removido do cache (cota) entre a geração e o envio
+                    logger.error(f"Erro ao incluir {item.archive_name} no lote: {str(e)}")
+                    item.status, item.error, item.artifact = ITEM_FAILED, str(e), None
+            entries.append(item)
+            yield from sink.drain()
+    finally:
+        # Cliente desconectado: cancela os itens ainda não iniciados
+        close = getattr(items, "close", None)
+        if close is not None:
+            close()
+
+    entries.sort(key=lambda entry: (entry.competencia, entry.format))
+    summary = {status: sum(1 for entry in entries if entry.status == status) for status in (ITEM_DONE, ITEM_EMPTY, ITEM_FAILED)}
+    content = {
+        **manifest,
+        "resumo": summary,
+        "segundos": round(time.perf_counter() - started, 3),
+        "itens": [entry.to_dict() for entry in entries],
+    }
+    archive.writestr(MANIFEST_NAME, json.dumps(content, ensure_ascii=False, indent=2, default=str), zipfile.ZIP_DEFLATED)
+    archive.close()
+    yield from sink.drain()
+
+
+def batch_manifest(competencias: List[str], formats: List[str], cnes: Optional[str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parâmetros de um lote (início do manifesto)
+
+    Args:
+        competencias: Competências
+        formats: Formatos
+        cnes: CNES (BPA-I)
+        options: Opções do BPA-I
+
+    Returns:
+        Dados do manifesto
+    """
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "competencias": competencias,
+        "formatos": formats,
+        "cnes": cnes,
+        "opcoes": options,
+    }
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Comparação estrutural entre dois arquivos BPA-I
+
+As linhas são casadas por uma chave natural que não depende da folha nem
+da sequência (CNS do paciente, procedimento, data e profissional), de modo
+que uma linha que apenas mudou de posição não aparece como alterada.
+
+A comparação é feita por particionamento de hash: cada arquivo é lido uma
+vez e os números das linhas são distribuídos em partições pelo hash da
+chave (4 bytes por linha). Em seguida cada partição é casada isoladamente,
+o que mantém o dicionário de chaves limitado a uma fração do arquivo.
+"""
+
+import logging
+from array import array
+from operator import itemgetter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+from app.models.bpa_layout import RECORD_FIELDS
+from app.services.bpa_reader import BPAReader
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Campos que identificam um lançamento independentemente da folha/sequência
+DIFF_KEY_FIELDS = ("prd_cnspac", "prd_pa", "prd_dtaten", "prd_cnsmed")
+
+# Campos ignorados na comparação (dependem da posição da linha no arquivo)
+DIFF_IGNORED_FIELDS = ("prd_flh", "prd_seq")
+
+# Quantidade padrão de partições
+DEFAULT_PARTITIONS = 64
+
+
+@dataclass
+class BPADiffSummary:
+    """
+    Totais de uma comparação entre arquivos BPA-I
+
+    Atributos:
+        linhas_antigo (int): Linhas do arquivo antigo
+        linhas_novo (int): Linhas do arquivo novo
+        iguais (int): Linhas presentes nos dois arquivos sem alteração
+        adicionadas (int): Linhas presentes apenas no arquivo novo
+        removidas (int): Linhas presentes apenas no arquivo antigo
+        alteradas (int): Linhas com a mesma chave e campos diferentes
+        campos_alterados (dict): Quantidade de alterações por campo
+    """
+    linhas_antigo: int = 0
+    linhas_novo: int = 0
+    iguais: int = 0
+    adicionadas: int = 0
+    removidas: int = 0
+    alteradas: int = 0
+    campos_alterados: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converte os totais em dicionário
+
+        Returns:
+            Dicionário com os totais
+        """
+        return {
+            "linhas_antigo": self.linhas_antigo,
+            "linhas_novo": self.linhas_novo,
+            "iguais": self.iguais,
+            "adicionadas": self.adicionadas,
+            "removidas": self.removidas,
+            "alteradas": self.alteradas,
+            "campos_alterados": dict(self.campos_alterados),
+        }
+
+
+class BPADiff:
+    """
+    Compara dois arquivos BPA-I linha a linha por chave natural
+    """
+
+    def __init__(
+        self,
+        old_path: Union[str, Path],
+        new_path: Union[str, Path],
+        key_fields: Sequence[str] = DIFF_KEY_FIELDS,
+        partitions: int = DEFAULT_PARTITIONS
+    ):
+        """
+        Inicializa a comparação
+
+        Args:
+            old_path: Arquivo BPA-I antigo
+            new_path: Arquivo BPA-I novo
+            key_fields: Campos que compõem a chave natural
+            partitions: Quantidade de partições de hash
+        """
+        self.old_path = Path(old_path)
+        self.new_path = Path(new_path)
+        self.key_fields = tuple(key_fields)
+        self.partitions = max(1, partitions)
+        self.summary = BPADiffSummary()
+
+        # Campos comparados: todos do layout, exceto os posicionais
+        self.compare_fields = [
+            nome for nome in RECORD_FIELDS if nome not in DIFF_IGNORED_FIELDS
+        ]
+
+    def _key_getter(self, reader: BPAReader) -> Callable[[bytes], Any]:
+        """
+        Monta a função que extrai a chave natural de uma linha
+
+        Usa ``itemgetter`` com fatias, que devolve uma tupla de bytes
+        sem laço em Python por linha.
+        """
+        fatias = [
+            slice(inicio - 1, min(fim, reader.record_length))
+            for inicio, fim in (RECORD_FIELDS[nome] for nome in self.key_fields)
+        ]
+        if len(fatias) == 1:
+            # itemgetter com um único item não devolve tupla
+            fatias.append(slice(0, 0))
+        return itemgetter(*fatias)
+
+    def _partition(self, reader: BPAReader, chave: Callable[[bytes], Any]) -> List[array]:
+        """
+        Distribui os números das linhas em partições pelo hash da chave
+
+        Args:
+            reader: Leitor do arquivo
+            chave: Função que extrai a chave natural de uma linha
+
+        Returns:
+            Lista de arrays com os números das linhas de cada partição
+        """
+        particoes = [array("I") for _ in range(self.partitions)]
+        total = self.partitions
+        for linha, dados in enumerate(reader.iter_raw()):
+            particoes[hash(chave(dados)) % total].append(linha)
+        return particoes
+
+    def _field_values(self, reader: BPAReader, dados: bytes) -> Dict[str, str]:
+        """Valores dos campos comparáveis de uma linha"""
+        valores = {}
+        for nome in self.compare_fields:
+            inicio, fim = RECORD_FIELDS[nome]
+            valores[nome] = dados[inicio - 1:min(fim, reader.record_length)].decode("latin-1")
+        return valores
+
+    def _describe_key(self, reader: BPAReader, dados: bytes) -> Dict[str, str]:
+        """Campos da chave de uma linha, para exibição"""
+        return {
+            nome: dados[inicio - 1:fim].decode("latin-1").strip()
+            for nome, (inicio, fim) in ((n, RECORD_FIELDS[n]) for n in self.key_fields)
+        }
+
+    def run(self) -> Iterator[Dict[str, Any]]:
+        """
+        Executa a comparação
+
+        As diferenças são produzidas partição a partição (não em ordem de
+        linha). Os totais ficam disponíveis em ``summary`` ao final.
+
+        Yields:
+            Dicionário descrevendo cada linha adicionada, removida ou alterada
+        """
+        self.summary = BPADiffSummary()
+        resumo = self.summary
+
+        with BPAReader(self.old_path) as antigo, BPAReader(self.new_path) as novo:
+            for reader in (antigo, novo):
+                if not reader.uniform:
+                    raise ValueError(f"Arquivo BPA-I com linhas de tamanhos diferentes: {reader.path}")
+
+            resumo.linhas_antigo = antigo.total_linhas
+            resumo.linhas_novo = novo.total_linhas
+
+            # Trechos da linha comparados byte a byte (tudo menos folha/sequência)
+            trechos = []
+            pos = 0
+            for inicio, fim in sorted(RECORD_FIELDS[n] for n in DIFF_IGNORED_FIELDS):
+                trechos.append((pos, inicio - 1))
+                pos = fim
+            trechos.append((pos, None))
+
+            def iguais(a: bytes, b: bytes) -> bool:
+                return all(a[i:j] == b[i:j] for i, j in trechos)
+
+            chave_antigo = self._key_getter(antigo)
+            chave_novo = self._key_getter(novo)
+            particoes_antigo = self._partition(antigo, chave_antigo)
+            particoes_novo = self._partition(novo, chave_novo)
+
+            for p in range(self.partitions):
+                # Chave -> linhas do arquivo antigo (em ordem de ocorrência)
+                pendentes: Dict[Tuple[bytes, ...], List[int]] = {}
+                for linha in particoes_antigo[p]:
+                    chave = chave_antigo(antigo.raw(linha))
+                    pendentes.setdefault(chave, []).append(linha)
+                particoes_antigo[p] = None
+
+                for linha_nova in particoes_novo[p]:
+                    dados_novo = novo.raw(linha_nova)
+                    chave = chave_novo(dados_novo)
+                    candidatas = pendentes.get(chave)
+
+                    if not candidatas:
+                        resumo.adicionadas += 1
+                        yield {
+                            "tipo": "adicionada",
+                            "linha_antiga": None,
+                            "linha_nova": linha_nova + 1,
+                            "chave": self._describe_key(novo, dados_novo),
+                            "campos": {},
+                        }
+                        continue
+
+                    linha_antiga = candidatas.pop(0)
+                    dados_antigo = antigo.raw(linha_antiga)
+                    if iguais(dados_antigo, dados_novo):
+                        resumo.iguais += 1
+                        continue
+
+                    valores_antigo = self._field_values(antigo, dados_antigo)
+                    valores_novo = self._field_values(novo, dados_novo)
+                    campos = {
+                        nome: [valores_antigo[nome], valores_novo[nome]]
+                        for nome in self.compare_fields
+                        if valores_antigo[nome] != valores_novo[nome]
+                    }
+                    if not campos:
+                        # Diferença apenas no tamanho das linhas (campos vazios)
+                        resumo.iguais += 1
+                        continue
+
+                    resumo.alteradas += 1
+                    for nome in campos:
+                        resumo.campos_alterados[nome] = resumo.campos_alterados.get(nome, 0) + 1
+                    yield {
+                        "tipo": "alterada",
+                        "linha_antiga": linha_antiga + 1,
+                        "linha_nova": linha_nova + 1,
+                        "chave": self._describe_key(novo, dados_novo),
+                        "campos": campos,
+                    }
+
+                for linhas in pendentes.values():
+                    for linha_antiga in linhas:
+                        resumo.removidas += 1
+                        yield {
+                            "tipo": "removida",
+                            "linha_antiga": linha_antiga + 1,
+                            "linha_nova": None,
+                            "chave": self._describe_key(antigo, antigo.raw(linha_antiga)),
+                            "campos": {},
+                        }
+                particoes_novo[p] = None
+
+        logger.info(
+            f"Comparação BPA-I concluída: {resumo.adicionadas} adicionadas, "
+            f"{resumo.removidas} removidas, {resumo.alteradas} alteradas"
+        )
+
+
+def diff_bpa_files(
+    old_path: Union[str, Path],
+    new_path: Union[str, Path],
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Compara dois arquivos BPA-I e retorna totais e uma amostra das diferenças
+
+    Args:
+        old_path: Arquivo BPA-I antigo
+        new_path: Arquivo BPA-I novo
+        limit: Quantidade máxima de diferenças retornadas (todas, se omitido)
+
+    Returns:
+        Dicionário com "resumo" e "diferencas"
+    """
+    comparacao = BPADiff(old_path, new_path)
+    diferencas = []
+    for diferenca in comparacao.run():
+        if limit is None or len(diferencas) < limit:
+            diferencas.append(diferenca)
+    return {"resumo": comparacao.summary.to_dict(), "diferencas": diferencas}
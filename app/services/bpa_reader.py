@@ -0,0 +1,707 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Leitor de arquivos BPA-I já gerados
+
+Mapeia o arquivo em memória (mmap) e extrai campos de largura fixa sem
+copiar as linhas. A validação do cabeçalho trabalha por colunas: para
+cada posição de um campo é obtida uma fatia com passo igual ao tamanho
+da linha, o que permite somar dígitos de todas as linhas com
+``bytes.count`` em vez de percorrer o arquivo linha a linha.
+"""
+
+import os
+import json
+import mmap
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
+
+from app.models.bpa_layout import (
+    HEADER_FIELDS, RECORD_FIELDS, LINHAS_POR_FOLHA, TIPO_CABECALHO, TIPO_BPA_I,
+    calcular_controle, total_folhas
+)
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Dígitos em bytes, indexados pelo próprio valor
+_DIGITOS = [str(d).encode("ascii") for d in range(10)]
+
+# Campos usados como chave no índice auxiliar
+INDEX_FIELDS = ("prd_cnspac", "prd_pa")
+
+# Sufixo do arquivo de índice gravado ao lado do BPA-I
+INDEX_SUFFIX = ".idx"
+
+
+@dataclass
+class BPAValidationResult:
+    """
+    Resultado da validação estrutural de um arquivo BPA-I
+
+    Atributos:
+        arquivo (str): Caminho do arquivo validado
+        total_linhas (int): Linhas de produção encontradas no corpo
+        total_folhas (int): Folhas esperadas para o total de linhas
+        controle (int): Campo de controle calculado a partir do corpo
+        cabecalho (dict): Campos do cabeçalho lidos do arquivo
+        problemas (list): Divergências encontradas
+    """
+    arquivo: str
+    total_linhas: int = 0
+    total_folhas: int = 0
+    controle: int = 0
+    cabecalho: Dict[str, str] = field(default_factory=dict)
+    problemas: List[str] = field(default_factory=list)
+
+    @property
+    def valido(self) -> bool:
+        """Indica se o arquivo não apresentou divergências"""
+        return not self.problemas
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converte o resultado em dicionário
+
+        Returns:
+            Dicionário com os dados da validação
+        """
+        return {
+            "arquivo": self.arquivo,
+            "valido": self.valido,
+            "total_linhas": self.total_linhas,
+            "total_folhas": self.total_folhas,
+            "controle": self.controle,
+            "cabecalho": self.cabecalho,
+            "problemas": self.problemas,
+        }
+
+
+class BPAReader:
+    """
+    Leitor de arquivos BPA-I mapeado em memória
+
+    O arquivo é aberto somente para leitura. Use como gerenciador de
+    contexto ou chame ``close`` ao terminar.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Abre e mapeia o arquivo BPA-I
+
+        Args:
+            path: Caminho do arquivo BPA-I
+        """
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self.size = self.path.stat().st_size
+            if self.size == 0:
+                raise ValueError(f"Arquivo BPA-I vazio: {self.path}")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm)
+            self._scan_layout()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self) -> "BPAReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.total_linhas
+
+    def close(self) -> None:
+        """Libera o mapeamento e fecha o arquivo"""
+        view = getattr(self, "_view", None)
+        if view is not None:
+            view.release()
+            self._view = None
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+            self._mm = None
+        self._file.close()
+
+    def _scan_layout(self) -> None:
+        """
+        Determina o início do corpo, o tamanho das linhas e o terminador
+
+        O BPA-I tem largura fixa, então o tamanho da primeira linha de
+        produção (incluindo o terminador) vale para todas as demais.
+        """
+        mm = self._mm
+
+        # Cabeçalho: tudo até a primeira quebra de linha
+        fim_cabecalho = mm.find(b"\n")
+        if fim_cabecalho < 0:
+            fim_cabecalho = self.size
+        self.header_end = fim_cabecalho - self._terminator_length(fim_cabecalho)
+        self.body_start = min(fim_cabecalho + 1, self.size)
+
+        # Primeira linha de produção define o passo do arquivo
+        fim_primeira = mm.find(b"\n", self.body_start)
+        if fim_primeira < 0:
+            self.terminator = b""
+            self.record_length = self.size - self.body_start
+            self.stride = self.record_length
+        else:
+            tamanho_terminador = self._terminator_length(fim_primeira) + 1
+            self.terminator = mm[fim_primeira + 1 - tamanho_terminador:fim_primeira + 1]
+            self.stride = fim_primeira + 1 - self.body_start
+            self.record_length = self.stride - tamanho_terminador
+
+        corpo = self.size - self.body_start
+        self.uniform = True
+        if self.stride <= 0:
+            self.total_linhas = 0
+        elif corpo % self.stride == 0:
+            self.total_linhas = corpo // self.stride
+        elif (corpo + len(self.terminator)) % self.stride == 0:
+            # Última linha sem terminador
+            self.total_linhas = (corpo + len(self.terminator)) // self.stride
+        else:
+            self.uniform = False
+            self.total_linhas = mm[self.body_start:].count(b"\n") + (0 if mm[-1:] == b"\n" else 1)
+
+    def _terminator_length(self, pos_nl: int) -> int:
+        """Conta os '\\r' que antecedem a quebra de linha em pos_nl"""
+        n = 0
+        while pos_nl - n - 1 >= 0 and self._mm[pos_nl - n - 1] == 0x0D:
+            n += 1
+        return n
+
+    # ------------------------------------------------------------------
+    # Acesso a campos
+    # ------------------------------------------------------------------
+
+    def header_fields(self) -> Dict[str, str]:
+        """
+        Lê os campos do cabeçalho
+
+        Returns:
+            Dicionário com os campos do cabeçalho
+        """
+        linha = self._mm[:self.header_end]
+        return {
+            nome: linha[inicio - 1:fim].decode("latin-1")
+            for nome, (inicio, fim) in HEADER_FIELDS.items()
+        }
+
+    def _offset(self, linha: int) -> int:
+        if not self.uniform:
+            raise ValueError("Arquivo BPA-I com linhas de tamanhos diferentes")
+        if linha < 0 or linha >= self.total_linhas:
+            raise IndexError(f"Linha {linha} fora do intervalo (0-{self.total_linhas - 1})")
+        return self.body_start + linha * self.stride
+
+    def field_view(self, linha: int, nome: str) -> memoryview:
+        """
+        Retorna uma visão (sem cópia) de um campo de uma linha de produção
+
+        Args:
+            linha: Índice da linha no corpo (base 0)
+            nome: Nome do campo no layout (ex.: prd_cnspac)
+
+        Returns:
+            memoryview com os bytes do campo
+        """
+        inicio, fim = RECORD_FIELDS[nome]
+        fim = min(fim, self.record_length)
+        base = self._offset(linha)
+        return self._view[base + inicio - 1:base + fim]
+
+    def field(self, linha: int, nome: str) -> str:
+        """
+        Retorna o valor textual de um campo de uma linha de produção
+
+        Args:
+            linha: Índice da linha no corpo (base 0)
+            nome: Nome do campo no layout
+
+        Returns:
+            Valor do campo
+        """
+        return bytes(self.field_view(linha, nome)).decode("latin-1")
+
+    def raw(self, linha: int) -> bytes:
+        """
+        Retorna o conteúdo bruto de uma linha de produção, sem o terminador
+
+        Args:
+            linha: Índice da linha no corpo (base 0)
+
+        Returns:
+            Bytes da linha
+        """
+        base = self._offset(linha)
+        return self._mm[base:base + self.record_length]
+
+    def iter_raw(self) -> Iterator[bytes]:
+        """
+        Itera sequencialmente sobre o conteúdo bruto das linhas de produção
+
+        Yields:
+            Bytes de cada linha, sem o terminador
+        """
+        if not self.uniform:
+            raise ValueError("Arquivo BPA-I com linhas de tamanhos diferentes")
+        mm = self._mm
+        stride = self.stride
+        tamanho = self.record_length
+        pos = self.body_start
+        for _ in range(self.total_linhas):
+            yield mm[pos:pos + tamanho]
+            pos += stride
+
+    def record(self, linha: int) -> Dict[str, str]:
+        """
+        Decodifica todos os campos de uma linha de produção
+
+        Args:
+            linha: Índice da linha no corpo (base 0)
+
+        Returns:
+            Dicionário campo -> valor
+        """
+        base = self._offset(linha)
+        dados = self._mm[base:base + self.record_length]
+        return {
+            nome: dados[inicio - 1:fim].decode("latin-1")
+            for nome, (inicio, fim) in RECORD_FIELDS.items()
+            if inicio <= self.record_length
+        }
+
+    def records(self, linhas: Optional[List[int]] = None) -> Iterator[Dict[str, str]]:
+        """
+        Itera sobre as linhas de produção decodificadas
+
+        Args:
+            linhas: Índices das linhas desejadas (todas, se omitido)
+
+        Yields:
+            Dicionário campo -> valor de cada linha
+        """
+        indices = range(self.total_linhas) if linhas is None else linhas
+        for linha in indices:
+            yield self.record(linha)
+
+    def iter_field(self, nome: str) -> Iterator[bytes]:
+        """
+        Itera sobre os valores brutos de um campo em todas as linhas
+
+        Args:
+            nome: Nome do campo no layout
+
+        Yields:
+            Bytes do campo em cada linha
+        """
+        inicio, fim = RECORD_FIELDS[nome]
+        fim = min(fim, self.record_length)
+        mm = self._mm
+        stride = self.stride
+        pos = self.body_start + inicio - 1
+        largura = fim - inicio + 1
+        for _ in range(self.total_linhas):
+            yield mm[pos:pos + largura]
+            pos += stride
+
+    def _column(self, posicao: int) -> bytes:
+        """
+        Retorna o caractere de uma posição (base 1) em todas as linhas
+
+        Args:
+            posicao: Posição no layout da linha de produção
+
+        Returns:
+            Bytes com um caractere por linha
+        """
+        inicio = self.body_start + posicao - 1
+        return self._mm[inicio:inicio + self.total_linhas * self.stride:self.stride]
+
+    def _column_sum(self, nome: str) -> Tuple[int, int]:
+        """
+        Soma os valores numéricos de um campo em todas as linhas
+
+        Cada posição do campo é tratada como uma coluna de dígitos:
+        a soma do campo é a soma de cada coluna ponderada pela sua
+        casa decimal. Caracteres não numéricos valem zero.
+
+        Args:
+            nome: Nome do campo no layout
+
+        Returns:
+            Tupla (soma, linhas com caracteres não numéricos no campo)
+        """
+        inicio, fim = RECORD_FIELDS[nome]
+        soma = 0
+        invalidos = 0
+        for posicao in range(inicio, fim + 1):
+            coluna = self._column(posicao)
+            contagens = [coluna.count(d) for d in _DIGITOS]
+            soma_coluna = sum(d * c for d, c in enumerate(contagens))
+            soma += soma_coluna * 10 ** (fim - posicao)
+            invalidos = max(invalidos, len(coluna) - sum(contagens))
+        return soma, invalidos
+
+    # ------------------------------------------------------------------
+    # Validação
+    # ------------------------------------------------------------------
+
+    def validate(self) -> BPAValidationResult:
+        """
+        Valida o cabeçalho contra o corpo do arquivo
+
+        Verifica total de linhas, total de folhas, campo de controle
+        (soma de prd_pa + prd_qt % 1111 + 1111), tipo de registro,
+        competência e a numeração de folha/sequência das linhas.
+
+        Returns:
+            Resultado da validação
+        """
+        resultado = BPAValidationResult(arquivo=str(self.path))
+        problemas = resultado.problemas
+
+        cabecalho = self.header_fields()
+        resultado.cabecalho = cabecalho
+        resultado.total_linhas = self.total_linhas
+        resultado.total_folhas = total_folhas(self.total_linhas)
+
+        if cabecalho["cbc_hdr"] != TIPO_CABECALHO or cabecalho["cbc_hdr_id"] != "#BPA#":
+            problemas.append("Cabeçalho não inicia com '01#BPA#'")
+
+        if not self.uniform:
+            problemas.append(
+                "Linhas de produção com tamanhos diferentes; "
+                "validação por colunas não realizada"
+            )
+            return resultado
+
+        if self.total_linhas == 0:
+            problemas.append("Arquivo sem linhas de produção")
+            return resultado
+
+        _, fim_qt = RECORD_FIELDS["prd_qt"]
+        if self.record_length < fim_qt:
+            problemas.append(
+                f"Linhas de produção com {self.record_length} posições; "
+                f"esperado no mínimo {fim_qt}"
+            )
+            return resultado
+
+        n = self.total_linhas
+
+        # Terminadores no fim de cada linha completa
+        if self.terminator:
+            ultimo = self.stride - 1
+            com_terminador = self._column(ultimo + 1).count(b"\n")
+            esperado = n if self._mm[-1:] == b"\n" else n - 1
+            if com_terminador != esperado:
+                problemas.append(
+                    f"{esperado - com_terminador} linha(s) sem quebra de linha na posição esperada"
+                )
+
+        # Tipo de registro
+        tipo = TIPO_BPA_I.encode("ascii")
+        outros_tipos = max(n - self._column(1).count(tipo[:1]), n - self._column(2).count(tipo[1:]))
+        if outros_tipos:
+            problemas.append(f"{outros_tipos} linha(s) com tipo de registro diferente de '{TIPO_BPA_I}'")
+
+        # Total de linhas e folhas
+        if not cabecalho["cbc_lin"].isdigit() or int(cabecalho["cbc_lin"]) != n:
+            problemas.append(f"Total de linhas no cabeçalho ({cabecalho['cbc_lin']}) difere do corpo ({n})")
+
+        folhas = resultado.total_folhas
+        if not cabecalho["cbc_flh"].isdigit() or int(cabecalho["cbc_flh"]) != folhas:
+            problemas.append(f"Total de folhas no cabeçalho ({cabecalho['cbc_flh']}) difere do esperado ({folhas})")
+
+        # Campo de controle
+        soma_pa, invalidos_pa = self._column_sum("prd_pa")
+        soma_qt, invalidos_qt = self._column_sum("prd_qt")
+        resultado.controle = calcular_controle(soma_pa + soma_qt)
+        if invalidos_pa:
+            problemas.append(f"{invalidos_pa} linha(s) com código de procedimento não numérico")
+        if invalidos_qt:
+            problemas.append(f"{invalidos_qt} linha(s) com quantidade não numérica")
+        if not cabecalho["cbc_smt_vrf"].isdigit() or int(cabecalho["cbc_smt_vrf"]) != resultado.controle:
+            problemas.append(
+                f"Campo de controle no cabeçalho ({cabecalho['cbc_smt_vrf']}) "
+                f"difere do calculado ({resultado.controle:04d})"
+            )
+
+        # Competência das linhas igual à do cabeçalho
+        inicio_cmp, fim_cmp = RECORD_FIELDS["prd_cmp"]
+        competencia = cabecalho["cbc_mvm"].encode("latin-1")
+        for k, posicao in enumerate(range(inicio_cmp, fim_cmp + 1)):
+            if k >= len(competencia) or self._column(posicao).count(competencia[k:k + 1]) != n:
+                problemas.append(f"Linhas com competência diferente de {cabecalho['cbc_mvm']}")
+                break
+
+        # Numeração de folha e sequência
+        linha_divergente = self._check_sequencing()
+        if linha_divergente is not None:
+            problemas.append(
+                f"Numeração de folha/sequência inconsistente a partir da linha {linha_divergente + 1}"
+            )
+
+        return resultado
+
+    def _check_sequencing(self) -> Optional[int]:
+        """
+        Compara folha e sequência de todas as linhas com a numeração esperada
+
+        Returns:
+            Índice da primeira linha divergente ou None
+        """
+        n = self.total_linhas
+        folhas = total_folhas(n)
+        primeira = None
+
+        # Sequência: padrão 01..20 repetido
+        inicio_seq, fim_seq = RECORD_FIELDS["prd_seq"]
+        seqs = [b"%02d" % s for s in range(1, LINHAS_POR_FOLHA + 1)]
+        for k, posicao in enumerate(range(inicio_seq, fim_seq + 1)):
+            padrao = b"".join(s[k:k + 1] for s in seqs)
+            esperado = (padrao * (folhas + 1))[:n]
+            primeira = _first_difference(self._column(posicao), esperado, primeira)
+
+        # Folha: número da folha repetido em cada uma das 20 linhas
+        inicio_flh, fim_flh = RECORD_FIELDS["prd_flh"]
+        numeros = [b"%03d" % (f % 1000) for f in range(1, folhas + 1)]
+        for k, posicao in enumerate(range(inicio_flh, fim_flh + 1)):
+            esperado = b"".join(num[k:k + 1] * LINHAS_POR_FOLHA for num in numeros)[:n]
+            primeira = _first_difference(self._column(posicao), esperado, primeira)
+
+        return primeira
+
+    # ------------------------------------------------------------------
+    # Índice auxiliar
+    # ------------------------------------------------------------------
+
+    @property
+    def index_path(self) -> Path:
+        """Caminho do índice auxiliar gravado ao lado do arquivo"""
+        return self.path.with_name(self.path.name + INDEX_SUFFIX)
+
+    def build_index(self) -> "BPAIndex":
+        """
+        Constrói e grava o índice auxiliar por CNS do paciente e procedimento
+
+        Para cada campo indexado o arquivo guarda as chaves ordenadas
+        (largura fixa) e, na mesma ordem, os números das linhas, de modo
+        que a consulta é uma busca binária direto sobre o arquivo mapeado.
+
+        Returns:
+            Índice construído
+        """
+        stat = self.path.stat()
+        meta: Dict[str, Any] = {
+            "arquivo": self.path.name,
+            "tamanho": stat.st_size,
+            "mtime": stat.st_mtime,
+            "total_linhas": self.total_linhas,
+            "campos": {},
+        }
+        blocos: List[bytes] = []
+        deslocamento = 0
+        for nome in INDEX_FIELDS:
+            valores = list(self.iter_field(nome))
+            ordem = sorted(range(len(valores)), key=valores.__getitem__)
+            chaves = b"".join(valores[i] for i in ordem)
+            linhas = array("I", ordem).tobytes()
+            largura = len(valores[0]) if valores else 0
+            meta["campos"][nome] = {
+                "largura": largura,
+                "chaves": deslocamento,
+                "linhas": deslocamento + len(chaves),
+            }
+            blocos.extend((chaves, linhas))
+            deslocamento += len(chaves) + len(linhas)
+
+        # Grava em arquivo temporário e renomeia para não expor índice parcial
+        temporario = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(temporario, "wb") as file:
+            file.write(json.dumps(meta).encode("utf-8") + b"\n")
+            for bloco in blocos:
+                file.write(bloco)
+        os.replace(temporario, self.index_path)
+
+        logger.info(f"Índice do arquivo BPA-I gravado: {self.index_path}")
+        return BPAIndex(self.index_path)
+
+    def load_index(self, rebuild: bool = True) -> Optional["BPAIndex"]:
+        """
+        Abre o índice auxiliar, reconstruindo-o se estiver desatualizado
+
+        Args:
+            rebuild: Reconstrói o índice se ausente ou desatualizado
+
+        Returns:
+            Índice aberto ou None
+        """
+        stat = self.path.stat()
+        try:
+            indice = BPAIndex(self.index_path)
+            if indice.meta.get("tamanho") == stat.st_size and indice.meta.get("mtime") == stat.st_mtime:
+                return indice
+            indice.close()
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        if not rebuild:
+            return None
+        return self.build_index()
+
+    def lookup(self, cns_paciente: Optional[str] = None, procedimento: Optional[str] = None) -> List[int]:
+        """
+        Localiza linhas por CNS do paciente e/ou procedimento
+
+        Args:
+            cns_paciente: CNS do paciente
+            procedimento: Código do procedimento (10 dígitos)
+
+        Returns:
+            Índices das linhas encontradas (base 0), em ordem
+        """
+        with self.load_index() as indice:
+            resultado = None
+            for nome, valor in (("prd_cnspac", cns_paciente), ("prd_pa", procedimento)):
+                if valor is None:
+                    continue
+                linhas = set(indice.lookup(nome, valor))
+                resultado = linhas if resultado is None else resultado & linhas
+            return sorted(resultado or [])
+
+
+class _SortedKeys:
+    """Sequência de chaves de largura fixa sobre um bloco de bytes (para bisect)"""
+
+    def __init__(self, dados: bytes, inicio: int, largura: int, total: int):
+        self._dados = dados
+        self._inicio = inicio
+        self._largura = largura
+        self._total = total
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __getitem__(self, i: int) -> bytes:
+        pos = self._inicio + i * self._largura
+        return self._dados[pos:pos + self._largura]
+
+
+class BPAIndex:
+    """
+    Índice auxiliar de um arquivo BPA-I, mapeado em memória
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Abre o arquivo de índice
+
+        Args:
+            path: Caminho do arquivo de índice
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fim_meta = self._mm.find(b"\n")
+            if fim_meta < 0:
+                raise ValueError(f"Índice inválido: {self.path}")
+            self.meta = json.loads(self._mm[:fim_meta])
+            self._base = fim_meta + 1
+        except Exception:
+            self._mm.close()
+            raise
+
+    def __enter__(self) -> "BPAIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Fecha o mapeamento do índice"""
+        self._mm.close()
+
+    def lookup(self, nome: str, valor: str) -> List[int]:
+        """
+        Busca as linhas em que um campo tem o valor informado
+
+        Args:
+            nome: Campo indexado (prd_cnspac ou prd_pa)
+            valor: Valor procurado
+
+        Returns:
+            Índices das linhas (base 0), em ordem
+        """
+        campo = self.meta["campos"][nome]
+        largura = campo["largura"]
+        total = self.meta["total_linhas"]
+        chave = str(valor).strip().encode("latin-1")
+
+        # Completa a chave como o campo é gravado no BPA-I
+        if nome == "prd_pa":
+            chave = chave.zfill(largura)
+        else:
+            chave = chave.ljust(largura)
+
+        chaves = _SortedKeys(self._mm, self._base + campo["chaves"], largura, total)
+        inicio = bisect_left(chaves, chave)
+        fim = bisect_right(chaves, chave, lo=inicio)
+        if inicio == fim:
+            return []
+
+        pos = self._base + campo["linhas"] + inicio * 4
+        linhas = array("I")
+        linhas.frombytes(self._mm[pos:pos + (fim - inicio) * 4])
+        return sorted(linhas)
+
+
+def _first_difference(atual: bytes, esperado: bytes, primeira: Optional[int]) -> Optional[int]:
+    """
+    Localiza a primeira posição em que duas sequências de bytes diferem
+
+    Args:
+        atual: Bytes lidos do arquivo
+        esperado: Bytes esperados
+        primeira: Menor divergência já encontrada (limita a busca)
+
+    Returns:
+        Menor índice divergente entre o atual e o já conhecido
+    """
+    limite = len(atual) if primeira is None else primeira
+    if atual[:limite] == esperado[:limite]:
+        return primeira
+
+    # Busca binária pelo primeiro bloco divergente
+    inicio, fim = 0, limite
+    while fim - inicio > 1:
+        meio = (inicio + fim) // 2
+        if atual[inicio:meio] != esperado[inicio:meio]:
+            fim = meio
+        else:
+            inicio = meio
+    return inicio
+
+
+def validate_bpa_file(path: Union[str, Path]) -> BPAValidationResult:
+    """
+    Valida um arquivo BPA-I
+
+    Args:
+        path: Caminho do arquivo
+
+    Returns:
+        Resultado da validação
+    """
+    with BPAReader(path) as reader:
+        return reader.validate()
@@ -7,15 +7,23 @@ Serviço para geração de arquivos BPA-I
 import os
 import logging
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional
 
 from app.models.header import HeaderBPA
 from app.utils.config import Settings
+from app.services import tracing
+from app.services.metrics import ExportTimer
+from app.services.compatibility_service import CompatibilityReport
+from modules.duplicates import MODO_REPORTAR, DetectorDuplicidades, RelatorioDuplicidades, tratar_duplicidades
 
 # Logger
 logger = logging.getLogger(__name__)
 
+# Linhas entre duas chamadas do callback de progresso
+PROGRESS_INTERVAL = 10000
+
 class BPAService:
     """
     Serviço para geração de arquivos BPA-I
@@ -31,41 +39,61 @@ class BPAService:
         self.settings = settings
         self.export_dir = settings.export_dir
         
+        # Relatório de duplicidades da última geração
+        self.duplicate_report = None
+        
         # Garante que o diretório de exportação existe
         if not self.export_dir.exists():
             self.export_dir.mkdir(parents=True, exist_ok=True)
     
-    def generate_bpa(self, records: List[Dict[str, Any]], header: HeaderBPA) -> str:
+    def generate_bpa(
+        self,
+        records: List[Dict[str, Any]],
+        header: HeaderBPA,
+        duplicate_mode: str = MODO_REPORTAR,
+        filepath: Optional[Path] = None,
+        progress: Optional[Callable[[int], None]] = None,
+        duplicates: Optional[RelatorioDuplicidades] = None
+    ) -> str:
         """
         Gera um arquivo BPA-I
         
         Args:
             records: Lista de registros a serem exportados
             header: Dados do cabeçalho
+            duplicate_mode: Tratamento de lançamentos duplicados
+                (reportar, descartar ou somar as quantidades)
+            filepath: Caminho de saída (padrão: BPA_I_<cnes>_<competencia>.txt no diretório de exportação)
+            progress: Chamado a cada PROGRESS_INTERVAL linhas com o total de registros escritos
+            duplicates: Relatório de duplicidades pré-calculado (ver prepare_records)
             
         Returns:
             Caminho do arquivo BPA-I gerado
         """
         try:
             # Gera o nome do arquivo com competência
-            filename = f"BPA_I_{header.cnes}_{header.competencia}.txt"
-            filepath = self.export_dir / filename
+            if filepath is None:
+                filepath = self.export_dir / self.filename_for(header)
             
             # Verifica se há registros para exportar
             if not records:
                 logger.warning("Nenhum registro para exportar.")
                 return str(filepath)
             
-            # Preparação dos dados para o formato BPA-I
-            with open(filepath, 'w', encoding='utf-8') as file:
-                # Escreve o cabeçalho do arquivo (tipo 01)
-                header_line = self._format_header(header)
-                file.write(header_line + '\n')
+            with ExportTimer("bpa") as timer:
+                records = self.prepare_records(records, duplicate_mode, duplicates)
+                timer.rows = len(records)
                 
-                # Escreve os registros (tipo 03 - BPA-I individualizado)
-                for i, record in enumerate(records, 1):
-                    line = self._format_record_bpa_i(record, i, header)
-                    file.write(line + '\n')
+                # Preparação dos dados para o formato BPA-I, em lotes de PROGRESS_INTERVAL linhas
+                with timer.open(filepath, 'w', encoding='utf-8') as file:
+                    lines = enumerate(self.iter_lines(records, header))
+                    total_lines = len(records) + 1
+                    for start in range(0, total_lines, PROGRESS_INTERVAL):
+                        with tracing.span("format.batch", rows=min(PROGRESS_INTERVAL, total_lines - start)):
+                            for i, line in islice(lines, PROGRESS_INTERVAL):
+                                file.write(line + '\n')
+                                if progress and i and i % PROGRESS_INTERVAL == 0:
+                                    progress(i)
             
             logger.info(f"Arquivo BPA-I gerado com sucesso: {filepath}")
             
@@ -74,6 +102,153 @@ class BPAService:
             logger.error(f"Erro ao gerar arquivo BPA-I: {str(e)}")
             raise
     
+    def filename_for(self, header: HeaderBPA) -> str:
+        """
+        Nome do arquivo BPA-I de um cabeçalho
+        
+        Args:
+            header: Dados do cabeçalho
+            
+        Returns:
+            Nome do arquivo (BPA_I_<cnes>_<competencia>.txt)
+        """
+        return f"BPA_I_{header.cnes}_{header.competencia}.txt"
+    
+    def prepare_records(
+        self,
+        records: List[Dict[str, Any]],
+        duplicate_mode: str = MODO_REPORTAR,
+        duplicates: Optional[RelatorioDuplicidades] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Trata os lançamentos duplicados antes da geração
+        
+        Args:
+            records: Lista de registros
+            duplicate_mode: Tratamento de lançamentos duplicados
+            duplicates: Relatório pré-calculado dos mesmos registros (validação do
+                daemon); no modo reportar, dispensa a detecção
+            
+        Returns:
+            Registros a gerar (o relatório fica em duplicate_report)
+        """
+        if duplicates is not None and duplicate_mode == MODO_REPORTAR:
+            # O modo reportar não altera os registros: basta o relatório
+            self.duplicate_report = duplicates
+        else:
+            # Detecta lançamentos duplicados (CNS do paciente, procedimento, data e profissional)
+            with tracing.span("bpa.duplicates", rows=len(records), mode=duplicate_mode):
+                records, self.duplicate_report = tratar_duplicidades(records, duplicate_mode)
+        if self.duplicate_report.duplicados:
+            logger.warning(
+                f"{self.duplicate_report.duplicados} lançamentos duplicados encontrados "
+                f"(modo: {duplicate_mode})"
+            )
+        return records
+    
+    def iter_lines(self, records: List[Dict[str, Any]], header: HeaderBPA) -> Iterator[str]:
+        """
+        Gera as linhas do arquivo BPA-I, sem o terminador
+        
+        Args:
+            records: Registros a exportar
+            header: Dados do cabeçalho
+            
+        Returns:
+            Iterador com o cabeçalho (tipo 01) seguido das linhas tipo 03
+        """
+        yield self.header_line(header)
+        yield from self.record_lines(records, header)
+    
+    def iter_batch_lines(
+        self,
+        batches: Iterable[List[Dict[str, Any]]],
+        header: HeaderBPA,
+        duplicate_mode: str = MODO_REPORTAR,
+        compatibility: Optional[Any] = None,
+        ignore_incompatible: bool = False,
+        duplicates: Optional[RelatorioDuplicidades] = None
+    ) -> Iterator[str]:
+        """
+        Gera as linhas do arquivo BPA-I a partir dos registros em lotes
+
+        Cada lote é verificado, tem os duplicados tratados e é formatado antes
+        do próximo ser lido, como na geração retomável da CLI: só um lote fica
+        em memória. O modo 'somar' precisa de todos os registros (use
+        prepare_records e iter_lines).
+
+        Args:
+            batches: Lotes de registros na ordem da chave (DataService.stream_records)
+            header: Dados do cabeçalho
+            duplicate_mode: Tratamento de lançamentos duplicados (reportar ou descartar)
+            compatibility: Regras de compatibilidade dos procedimentos (None: sem verificação)
+            ignore_incompatible: Continua mesmo com lançamentos incompatíveis
+            duplicates: Relatório de duplicidades pré-calculado (ver prepare_records)
+
+        Returns:
+            Iterador com o cabeçalho seguido das linhas tipo 03 (o relatório de
+            duplicidades fica em duplicate_report, completo ao fim da iteração)
+
+        Raises:
+            ValueError: Lançamento incompatível sem ignore_incompatible
+        """
+        detector = None
+        if duplicates is not None and duplicate_mode == MODO_REPORTAR:
+            self.duplicate_report = duplicates
+        else:
+            detector = DetectorDuplicidades(duplicate_mode)
+            self.duplicate_report = detector.relatorio
+        report = CompatibilityReport()
+        
+        yield self.header_line(header)
+        written = 0
+        for batch in batches:
+            if not batch:
+                continue
+            records = compatibility.check_stream(batch, report) if compatibility is not None else batch
+            if detector is not None:
+                records = detector.filtrar(records)
+            with tracing.span("format.batch", rows=len(batch)):
+                lines = list(self.record_lines(records, header, written + 1))
+            if report.rejeitados and not ignore_incompatible:
+                raise ValueError(f"{report.rejeitados} registros incompatíveis com as regras de procedimento")
+            written += len(lines)
+            yield from lines
+        
+        if self.duplicate_report.duplicados:
+            logger.warning(
+                f"{self.duplicate_report.duplicados} lançamentos duplicados encontrados "
+                f"(modo: {duplicate_mode})"
+            )
+    
+    def header_line(self, header: HeaderBPA) -> str:
+        """
+        Linha de cabeçalho do arquivo BPA-I (tipo 01), sem o terminador
+        
+        Args:
+            header: Dados do cabeçalho
+            
+        Returns:
+            Linha de cabeçalho
+        """
+        return self._format_header(header)
+    
+    def record_lines(self, records: Iterable[Dict[str, Any]], header: HeaderBPA, start: int = 1) -> Iterator[str]:
+        """
+        Gera as linhas tipo 03 dos registros, sem o terminador
+        
+        Args:
+            records: Registros a exportar
+            header: Dados do cabeçalho
+            start: Número sequencial do primeiro registro (maior que 1 ao
+                continuar uma geração feita em lotes)
+            
+        Returns:
+            Iterador com as linhas tipo 03
+        """
+        for seq, record in enumerate(records, start):
+            yield self._format_record_bpa_i(record, seq, header)
+    
     def _format_header(self, header: HeaderBPA) -> str:
         """
         Formata a linha de cabeçalho do arquivo BPA-I (tipo 01)
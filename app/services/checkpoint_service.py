@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Geração do BPA-I retomável, com pontos de controle
+
+Competências grandes levam tempo suficiente para a exportação ser
+interrompida no meio (queda da conexão, reinício da máquina). A geração
+da CLI lê os registros em lotes na ordem da chave (id_fia, id_lancamento),
+escreve em ``<arquivo>.part`` e, a cada CHECKPOINT_INTERVAL registros
+lidos, grava um ponto de controle em ``<arquivo>.checkpoint`` com:
+
+- a posição da chave do último registro lido;
+- as linhas tipo 03 já escritas (de onde saem a folha e a sequência);
+- o tamanho do arquivo parcial e o CRC-32 desse conteúdo;
+- os relatórios de compatibilidade e de duplicidades acumulados.
+
+As impressões digitais da detecção de duplicidades (estáveis entre
+processos), com as chaves que as confirmam, vão para
+``<arquivo>.checkpoint.chaves``, apenas com acréscimos. O arquivo parcial e as chaves são sincronizados antes da
+gravação atômica do ponto de controle, que nunca aponta além do que está
+no disco.
+
+``run.py bpa --retomar`` confere os parâmetros, o token de atualização
+dos dados e o CRC-32 do trecho já escrito, descarta o que veio depois do
+ponto de controle e continua da posição gravada: o arquivo final é igual,
+byte a byte, ao de uma execução sem interrupção. O modo de duplicidades
+``somar`` precisa de todos os registros em memória e não é retomável.
+"""
+
+import os
+import json
+import zlib
+import logging
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.models.header import HeaderBPA
+from app.services import tracing
+from app.services.bpa_service import BPAService
+from app.services.compatibility_service import CompatibilityReport
+from app.services.metrics import ExportTimer
+from modules.duplicates import (
+    MODO_REPORTAR, MODO_SOMAR, DetectorDuplicidades, RelatorioDuplicidades, impressao_estavel
+)
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Versão do formato do ponto de controle
+CHECKPOINT_VERSION = 2
+
+# Registros lidos entre dois pontos de controle (padrão de CHECKPOINT_INTERVAL)
+CHECKPOINT_INTERVAL = 100000
+
+# Arquivos ao lado do BPA-I final durante a geração
+PARTIAL_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".checkpoint"
+KEYS_SUFFIX = ".checkpoint.chaves"
+
+# Tamanho dos blocos lidos na conferência do CRC-32
+CRC_CHUNK_SIZE = 1 << 20
+
+
+class CheckpointMismatch(ValueError):
+    """Ponto de controle ausente, de outra exportação ou inconsistente com os arquivos"""
+
+
+@dataclass
+class BPACheckpoint:
+    """
+    Estado gravado de uma geração do BPA-I
+
+    Atributos:
+        parametros (dict): Competência, CNES, órgão emissor e tratamentos pedidos
+        atualizacao (str): Token de atualização dos dados no início da geração
+        id_fia (int): Ficha do último registro lido
+        id_lancamento (int): Lançamento do último registro lido
+        registros (int): Registros lidos do banco
+        linhas (int): Linhas tipo 03 escritas
+        folha (int): Folha da última linha escrita
+        offset (int): Bytes do arquivo parcial cobertos pelo ponto de controle
+        crc32 (int): CRC-32 desses bytes
+        chaves (int): Bytes gravados no diário de duplicidades (impressões digitais e chaves)
+        compatibilidade (dict): Relatório de compatibilidade acumulado
+        duplicidades (dict): Relatório de duplicidades acumulado
+        versao (int): Versão do formato
+        atualizado_em (str): Data e hora da gravação
+    """
+    parametros: Dict[str, Any]
+    atualizacao: str = ""
+    id_fia: Optional[int] = None
+    id_lancamento: Optional[int] = None
+    registros: int = 0
+    linhas: int = 0
+    folha: int = 0
+    offset: int = 0
+    crc32: int = 0
+    chaves: int = 0
+    compatibilidade: Dict[str, Any] = field(default_factory=dict)
+    duplicidades: Dict[str, Any] = field(default_factory=dict)
+    versao: int = CHECKPOINT_VERSION
+    atualizado_em: str = ""
+
+    def save(self, path: Path) -> None:
+        """
+        Grava o ponto de controle de forma atômica
+
+        Args:
+            path: Arquivo do ponto de controle
+        """
+        self.atualizado_em = datetime.now().isoformat(timespec="seconds")
+        partial = path.with_name(path.name + PARTIAL_SUFFIX)
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump(asdict(self), file, ensure_ascii=False, indent=2, default=str)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BPACheckpoint":
+        """
+        Lê um ponto de controle
+
+        Args:
+            path: Arquivo do ponto de controle
+
+        Returns:
+            Estado gravado
+
+        Raises:
+            CheckpointMismatch: Arquivo ausente, ilegível ou de outra versão
+        """
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            raise CheckpointMismatch(f"Nenhum ponto de controle para retomar: {path}")
+        except ValueError as e:
+            raise CheckpointMismatch(f"Ponto de controle ilegível: {path} ({str(e)})")
+        if data.get("versao") != CHECKPOINT_VERSION:
+            raise CheckpointMismatch(f"Versão do ponto de controle não suportada: {data.get('versao')}")
+        return cls(**data)
+
+
+def file_crc32(path: Path, size: int) -> int:
+    """
+    CRC-32 dos primeiros bytes de um arquivo
+
+    Args:
+        path: Arquivo
+        size: Quantidade de bytes
+
+    Returns:
+        CRC-32 (como zlib.crc32)
+    """
+    crc = 0
+    with open(path, "rb") as file:
+        while size > 0:
+            block = file.read(min(CRC_CHUNK_SIZE, size))
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            size -= len(block)
+    return crc
+
+
+class ResumableBPAExport:
+    """
+    Gera o BPA-I em lotes, gravando pontos de controle para retomada
+    """
+
+    def __init__(
+        self,
+        bpa_service: BPAService,
+        header: HeaderBPA,
+        duplicate_mode: str = MODO_REPORTAR,
+        ignore_incompatible: bool = False,
+        interval: int = CHECKPOINT_INTERVAL,
+        filepath: Optional[Path] = None
+    ):
+        """
+        Args:
+            bpa_service: Serviço de formatação do BPA-I
+            header: Dados do cabeçalho
+            duplicate_mode: Tratamento de duplicados (reportar ou descartar)
+            ignore_incompatible: Gera o arquivo mesmo com lançamentos incompatíveis
+            interval: Registros lidos entre dois pontos de controle
+            filepath: Caminho de saída (padrão: BPA_I_<cnes>_<competencia>.txt no diretório de exportação)
+        """
+        if duplicate_mode == MODO_SOMAR:
+            raise ValueError("O modo 'somar' exige todos os registros em memória e não é retomável")
+        self.bpa_service = bpa_service
+        self.header = header
+        self.duplicate_mode = duplicate_mode
+        self.ignore_incompatible = ignore_incompatible
+        self.interval = max(1, interval)
+        self.path = Path(filepath) if filepath else bpa_service.export_dir / bpa_service.filename_for(header)
+        self.partial = self.path.with_name(self.path.name + PARTIAL_SUFFIX)
+        self.checkpoint_path = self.path.with_name(self.path.name + CHECKPOINT_SUFFIX)
+        self.keys_path = self.path.with_name(self.path.name + KEYS_SUFFIX)
+
+        # Resultado da última execução
+        self.compatibility_report = CompatibilityReport()
+        self.duplicate_report: Optional[RelatorioDuplicidades] = None
+        self.records_read = 0
+        self.resumed_at = 0
+
+    @property
+    def parameters(self) -> Dict[str, Any]:
+        """Parâmetros que um ponto de controle precisa repetir para ser retomado"""
+        return {
+            "competencia": self.header.competencia,
+            "cnes": self.header.cnes,
+            "orgao_emissor": self.header.orgao_emissor,
+            "duplicidades": self.duplicate_mode,
+            "ignorar_incompatibilidades": self.ignore_incompatible,
+        }
+
+    def discard(self) -> None:
+        """Remove o arquivo parcial, o ponto de controle e o diário de duplicidades"""
+        for path in (self.partial, self.checkpoint_path, self.keys_path):
+            path.unlink(missing_ok=True)
+
+    def _restore(self, freshness: str) -> Tuple[BPACheckpoint, bytearray]:
+        """Confere o ponto de controle e volta o arquivo parcial e o diário até ele"""
+        state = BPACheckpoint.load(self.checkpoint_path)
+        if state.parametros != self.parameters:
+            raise CheckpointMismatch(
+                f"O ponto de controle é de outra exportação: {state.parametros}"
+            )
+        if state.atualizacao != freshness:
+            raise CheckpointMismatch(
+                "Os dados da competência mudaram desde o ponto de controle; gere o arquivo desde o início"
+            )
+
+        try:
+            size = self.partial.stat().st_size
+        except FileNotFoundError:
+            raise CheckpointMismatch(f"Arquivo parcial não encontrado: {self.partial}")
+        if size < state.offset or file_crc32(self.partial, state.offset) != state.crc32:
+            raise CheckpointMismatch(f"O arquivo parcial não confere com o ponto de controle: {self.partial}")
+
+        try:
+            with open(self.keys_path, "rb") as file:
+                keys = bytearray(file.read(state.chaves))
+        except FileNotFoundError:
+            keys = bytearray()
+        if len(keys) != state.chaves:
+            raise CheckpointMismatch(f"Diário de duplicidades incompleto: {self.keys_path}")
+
+        # Descarta o que foi escrito depois do ponto de controle
+        os.truncate(self.partial, state.offset)
+        os.truncate(self.keys_path, len(keys))
+        return state, keys
+
+    def _save(
+        self,
+        state: BPACheckpoint,
+        file: Any,
+        keys: Any,
+        journal: bytearray,
+        detector: DetectorDuplicidades
+    ) -> None:
+        """Sincroniza o arquivo parcial e o diário e grava o ponto de controle"""
+        with tracing.span("bpa.checkpoint", rows=state.registros):
+            file.flush()
+            os.fsync(file.fileno())
+            keys.write(journal)
+            keys.flush()
+            os.fsync(keys.fileno())
+            state.chaves += len(journal)
+            del journal[:]
+
+            state.compatibilidade = self.compatibility_report.to_dict()
+            state.duplicidades = detector.relatorio.to_dict()
+            state.save(self.checkpoint_path)
+        logger.info(
+            f"Ponto de controle do BPA-I: {state.registros} registros lidos, "
+            f"{state.linhas} linhas escritas ({self.checkpoint_path})"
+        )
+
+    def run(self, data_service: Any, compatibility: Any, resume: bool = False) -> Optional[str]:
+        """
+        Gera o arquivo, do início ou a partir do último ponto de controle
+
+        Args:
+            data_service: Serviço de dados (DataService)
+            compatibility: Regras de compatibilidade dos procedimentos (ProcedureCompatibilityService)
+            resume: Retoma a geração interrompida
+
+        Returns:
+            Caminho do arquivo BPA-I gerado; None se não houver registros ou se
+            houver incompatibilidades sem ignore_incompatible (relatório em
+            compatibility_report)
+
+        Raises:
+            CheckpointMismatch: Retomada sem ponto de controle válido
+        """
+        try:
+            competencia = self.header.competencia
+            freshness = data_service.get_freshness_token(competencia)
+            if resume:
+                state, keys = self._restore(freshness)
+                self.compatibility_report = CompatibilityReport(**state.compatibilidade)
+                logger.info(f"Retomando o BPA-I após {state.registros} registros ({state.linhas} linhas)")
+            else:
+                self.discard()
+                state, keys = BPACheckpoint(self.parameters, freshness), bytearray()
+                self.compatibility_report = CompatibilityReport()
+
+            journal = bytearray()
+            detector = DetectorDuplicidades(
+                self.duplicate_mode, capacidade=max(state.registros, 1024), impressao=impressao_estavel, diario=journal
+            )
+            if resume:
+                try:
+                    detector.restaurar(keys, RelatorioDuplicidades.from_dict(state.duplicidades))
+                except ValueError as e:
+                    raise CheckpointMismatch(f"Diário de duplicidades inválido: {self.keys_path} ({str(e)})")
+            del keys
+            self.duplicate_report = detector.relatorio
+            self.resumed_at = self.records_read = state.registros
+
+            report = self.compatibility_report
+            blocked = bool(report.rejeitados) and not self.ignore_incompatible
+            saved = state.registros
+            newline = os.linesep
+
+            with ExportTimer("bpa") as timer, \
+                    timer.open(self.partial, "ab" if resume else "wb") as file, \
+                    open(self.keys_path, "ab" if resume else "wb") as keys_file:
+                if not resume:
+                    data = (self.bpa_service.header_line(self.header) + newline).encode("utf-8")
+                    file.write(data)
+                    state.offset, state.crc32 = len(data), zlib.crc32(data)
+
+                stream = data_service.stream_records(
+                    competencia, after_id_fia=state.id_fia, after_id_lancamento=state.id_lancamento
+                )
+                for batch in stream:
+                    if not batch:
+                        continue
+                    checked = compatibility.check_stream(batch, report)
+                    if blocked:
+                        # Apenas completa o relatório de incompatibilidades
+                        for _ in checked:
+                            pass
+                    else:
+                        with tracing.span("format.batch", rows=len(batch)):
+                            lines = list(self.bpa_service.record_lines(
+                                detector.filtrar(checked), self.header, state.linhas + 1
+                            ))
+                        blocked = bool(report.rejeitados) and not self.ignore_incompatible
+                        if not blocked and lines:
+                            data = (newline.join(lines) + newline).encode("utf-8")
+                            file.write(data)
+                            state.offset += len(data)
+                            state.crc32 = zlib.crc32(data, state.crc32)
+                            state.linhas += len(lines)
+                            state.folha = state.linhas % 999
+                            timer.rows += len(lines)
+
+                    last = batch[-1]
+                    state.id_fia, state.id_lancamento = last.get("numero"), last.get("id_lancamento")
+                    state.registros += len(batch)
+                    self.records_read = state.registros
+                    if not blocked and state.registros - saved >= self.interval:
+                        self._save(state, file, keys_file, journal, detector)
+                        saved = state.registros
+
+            if blocked or not state.registros:
+                self.discard()
+                return None
+
+            os.replace(self.partial, self.path)
+            self.checkpoint_path.unlink(missing_ok=True)
+            self.keys_path.unlink(missing_ok=True)
+
+            if self.duplicate_report.duplicados:
+                logger.warning(
+                    f"{self.duplicate_report.duplicados} lançamentos duplicados encontrados "
+                    f"(modo: {self.duplicate_mode})"
+                )
+            logger.info(f"Arquivo BPA-I gerado com sucesso: {self.path}")
+            return str(self.path)
+        except CheckpointMismatch:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao gerar arquivo BPA-I retomável: {str(e)}")
+            raise
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Agrupamento de requisições de exportação idênticas (single-flight)
+
+No fechamento da competência, várias pessoas pedem o mesmo arquivo em
+poucos segundos. Em vez de cada requisição refazer consulta e formatação,
+a primeira inicia a geração e as idênticas que chegam enquanto ela está em
+andamento aguardam o mesmo resultado (ou o mesmo erro).
+
+A geração roda em uma thread, fora do laço de eventos, e não é cancelada
+se o cliente que a iniciou desconectar: as demais requisições continuam
+aguardando, e o arquivo fica no cache de artefatos.
+
+O agrupamento vale dentro de um processo; entre workers do uvicorn, o
+cache de artefatos garante que gerações simultâneas não se sobrescrevam.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from app.services.artifact_cache import normalize_options
+
+# Logger
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def coalescing_key(format: str, competencia: Optional[str] = None, cnes: str = "", **options: Any) -> Tuple[str, str, str, str]:
+    """
+    Chave de agrupamento: parâmetros normalizados da exportação
+
+    Args:
+        format: Formato da exportação
+        competencia: Competência no formato AAAAMM (None = todas)
+        cnes: CNES do estabelecimento (BPA-I)
+        **options: Demais opções que alteram o conteúdo
+
+    Returns:
+        Chave da requisição
+    """
+    return (format, competencia or "", cnes, normalize_options(**options))
+
+
+class RequestCoalescer:
+    """
+    Executa uma única vez as gerações idênticas em andamento
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiting: Dict[Hashable, int] = {}
+        self._started: Dict[Hashable, float] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.wait_seconds = 0.0
+
+    async def run(self, key: Hashable, func: Callable[[], T]) -> T:
+        """
+        Executa func ou aguarda a execução idêntica em andamento
+
+        Args:
+            key: Chave da requisição (coalescing_key)
+            func: Função que produz o resultado: corrotina, ou função
+                síncrona executada em uma thread
+
+        Returns:
+            Resultado de func
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            work = func() if asyncio.iscoroutinefunction(func) else asyncio.to_thread(func)
+            task = asyncio.get_running_loop().create_task(work)
+            self._inflight[key] = task
+            self._started[key] = time.time()
+            task.add_done_callback(lambda done: self._release(key, done))
+        else:
+            self.coalesced += 1
+            logger.info(f"Requisição agrupada com a exportação em andamento: {key[0]} {key[1] or 'todas'}")
+
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        start = time.perf_counter()
+        try:
+            # shield: o cancelamento de uma requisição não interrompe as demais
+            return await asyncio.shield(task)
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+
+    def _release(self, key: Hashable, task: asyncio.Task) -> None:
+        """Retira a execução concluída; novas requisições iniciam outra"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._started[key]
+        if not task.cancelled():
+            # Marca a exceção como lida mesmo se todos os clientes desconectaram
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Contadores do agrupamento
+
+        Returns:
+            Execuções, requisições agrupadas, espera acumulada e gerações em andamento
+        """
+        return {
+            "execucoes": self.executions,
+            "agrupadas": self.coalesced,
+            "aguardando": sum(self._waiting.values()),
+            "espera_total_segundos": round(self.wait_seconds, 3),
+            "em_andamento": [
+                {
+                    "formato": key[0],
+                    "competencia": key[1] or None,
+                    "cnes": key[2] or None,
+                    "aguardando": self._waiting.get(key, 0),
+                    "segundos": round(time.time() - self._started[key], 1),
+                }
+                for key in self._inflight
+            ],
+        }
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serviço de compatibilidade entre lançamentos e regras de procedimento
+
+As regras de sexo, faixa etária e CBO de cada procedimento são carregadas
+uma única vez em um dicionário indexado pelo código do procedimento
+(10 dígitos), de modo que a verificação de cada linha é uma consulta O(1).
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, Any, FrozenSet, Iterable, Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Motivos de rejeição (bits)
+SEXO_INCOMPATIVEL = 1 << 0
+IDADE_INCOMPATIVEL = 1 << 1
+CBO_INCOMPATIVEL = 1 << 2
+PROCEDIMENTO_SEM_REGRA = 1 << 3
+
+MOTIVOS_REJEICAO = {
+    SEXO_INCOMPATIVEL: "Sexo do paciente incompatível com o procedimento",
+    IDADE_INCOMPATIVEL: "Idade do paciente fora da faixa etária do procedimento",
+    CBO_INCOMPATIVEL: "CBO do profissional não habilitado para o procedimento",
+    PROCEDIMENTO_SEM_REGRA: "Procedimento não encontrado na tabela de procedimentos",
+}
+
+# Códigos de sexo em sigh.procedimentos (demais valores: ambos)
+SEXO_PROCEDIMENTO = {1: "M", 2: "F"}
+
+# Códigos de sexo do paciente (demais valores: não informado)
+SEXO_PACIENTE = {1: "M", 2: "F"}
+
+# Faixa etária final a partir da qual não há limite superior
+IDADE_SEM_LIMITE = 999
+
+# Amostras de rejeição guardadas no relatório
+AMOSTRAS_PADRAO = 20
+
+
+@dataclass(frozen=True)
+class ProcedureRule:
+    """
+    Regras de compatibilidade de um procedimento
+
+    Atributos:
+        sexo (str): "M", "F" ou None (ambos)
+        idade_minima (int): Idade mínima em anos (None = sem limite)
+        idade_maxima (int): Idade máxima em anos (None = sem limite)
+        cbos (frozenset): CBOs habilitados (None = sem restrição)
+    """
+    sexo: Optional[str] = None
+    idade_minima: Optional[int] = None
+    idade_maxima: Optional[int] = None
+    cbos: Optional[FrozenSet[str]] = None
+
+
+@dataclass
+class CompatibilityReport:
+    """
+    Relatório de incompatibilidades encontradas
+
+    Atributos:
+        total_registros (int): Registros verificados
+        rejeitados (int): Registros com ao menos um motivo de rejeição
+        contagens (dict): Quantidade de registros por motivo
+        amostras (list): Primeiras rejeições encontradas
+    """
+    total_registros: int = 0
+    rejeitados: int = 0
+    contagens: Dict[str, int] = field(default_factory=dict)
+    amostras: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converte o relatório em dicionário
+
+        Returns:
+            Dicionário com os dados do relatório
+        """
+        return {
+            "total_registros": self.total_registros,
+            "rejeitados": self.rejeitados,
+            "contagens": dict(self.contagens),
+            "amostras": list(self.amostras),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompatibilityReport":
+        """
+        Reconstrói o relatório a partir de to_dict
+
+        Args:
+            data: Dicionário gerado por to_dict
+
+        Returns:
+            Relatório de incompatibilidades
+        """
+        return cls(
+            total_registros=data.get("total_registros", 0),
+            rejeitados=data.get("rejeitados", 0),
+            contagens=dict(data.get("contagens", {})),
+            amostras=list(data.get("amostras", [])),
+        )
+
+
+def normalize_procedure_code(codigo: Any) -> str:
+    """
+    Normaliza um código de procedimento para 10 dígitos
+
+    Args:
+        codigo: Código em qualquer formato (int, str com pontos/traços)
+
+    Returns:
+        Código com 10 dígitos ou "" se vazio
+    """
+    if codigo is None:
+        return ""
+    digitos = "".join(filter(str.isdigit, str(codigo)))
+    return digitos.zfill(10) if digitos else ""
+
+
+def _idade_em_anos(nascimento: Any, referencia: Any) -> Optional[int]:
+    """Calcula a idade em anos completos na data de referência"""
+    if isinstance(nascimento, datetime):
+        nascimento = nascimento.date()
+    if isinstance(referencia, datetime):
+        referencia = referencia.date()
+    if not isinstance(nascimento, date) or not isinstance(referencia, date):
+        return None
+    idade = referencia.year - nascimento.year
+    if (referencia.month, referencia.day) < (nascimento.month, nascimento.day):
+        idade -= 1
+    return max(idade, 0)
+
+
+class ProcedureCompatibilityService:
+    """
+    Verifica lançamentos contra as regras de sexo, idade e CBO dos procedimentos
+    """
+
+    def __init__(self, rules: Dict[str, ProcedureRule], report_unknown: bool = False):
+        """
+        Inicializa o serviço com as regras já indexadas
+
+        Args:
+            rules: Regras por código de procedimento (10 dígitos)
+            report_unknown: Rejeita procedimentos sem regra cadastrada
+        """
+        self.rules = rules
+        self.report_unknown = report_unknown
+
+    @classmethod
+    def from_database(cls, db: Session, competencia: Optional[str] = None, **kwargs) -> "ProcedureCompatibilityService":
+        """
+        Carrega as regras de sigh.procedimentos e da vigência de CBO por procedimento
+
+        Args:
+            db: Sessão do SQLAlchemy
+            competencia: Competência (AAAAMM) usada para filtrar a vigência dos CBOs
+
+        Returns:
+            Serviço com as regras carregadas
+        """
+        try:
+            query, cbo_query, params = cls._rules_queries(competencia)
+            procedimentos = db.execute(text(query))
+            cbos = db.execute(text(cbo_query), params)
+
+            service = cls.from_rows(procedimentos, cbos, **kwargs)
+            logger.info(f"Regras de compatibilidade carregadas para {len(service.rules)} procedimentos")
+            return service
+        except Exception as e:
+            logger.error(f"Erro ao carregar regras de compatibilidade: {str(e)}")
+            raise
+
+    @staticmethod
+    def _rules_queries(competencia: Optional[str] = None):
+        """Consultas das regras: (procedimentos, CBOs por procedimento, parâmetros)"""
+        query = """
+        SELECT
+            codigo_procedimento,
+            cod_sexo,
+            faixa_etaria_inicial,
+            faixa_etaria_final
+        FROM
+            sigh.procedimentos
+        WHERE
+            ativo = true
+            AND codigo_procedimento IS NOT NULL
+        """
+
+        cbo_query = """
+        SELECT DISTINCT
+            codigo_sus,
+            codigo_cbo,
+            cod_cbo
+        FROM
+            sigh.vw_prestador_cbo_procedimento_sus
+        WHERE
+            codigo_sus IS NOT NULL
+        """
+        params = {}
+        if competencia:
+            cbo_query += """
+            AND (inicio_vigencia IS NULL OR inicio_vigencia <= (to_date(:competencia, 'YYYYMM') + interval '1 month' - interval '1 day'))
+            AND (fim_vigencia IS NULL OR fim_vigencia >= to_date(:competencia, 'YYYYMM'))
+            """
+            params["competencia"] = competencia
+        return query, cbo_query, params
+
+    @classmethod
+    def rules_token(cls, db: Session, competencia: Optional[str] = None) -> str:
+        """
+        Obtém um token que muda sempre que as regras carregadas por from_database mudam
+
+        O hash é calculado no servidor sobre as mesmas linhas de from_database,
+        sem transferi-las: entra na chave do BPA-I em cache.
+
+        Args:
+            db: Sessão do SQLAlchemy
+            competencia: Competência (AAAAMM) usada para filtrar a vigência dos CBOs
+
+        Returns:
+            Token das regras (MD5)
+        """
+        try:
+            query, cbo_query, params = cls._rules_queries(competencia)
+            token_query = f"""
+            SELECT md5(COALESCE(string_agg(linha, E'\\n' ORDER BY linha), ''))
+            FROM (
+                SELECT 'p|' || r::text AS linha FROM ({query}) r
+                UNION ALL
+                SELECT 'c|' || c::text AS linha FROM ({cbo_query}) c
+            ) regras
+            """
+            return db.execute(text(token_query), params).scalar()
+        except Exception as e:
+            logger.error(f"Erro ao obter token das regras de compatibilidade: {str(e)}")
+            raise
+
+    @classmethod
+    def from_rows(cls, procedimentos: Iterable[Any], cbos: Iterable[Any] = (), **kwargs) -> "ProcedureCompatibilityService":
+        """
+        Monta o índice de regras a partir de linhas já consultadas
+
+        Args:
+            procedimentos: Linhas (codigo_procedimento, cod_sexo, faixa_etaria_inicial, faixa_etaria_final)
+            cbos: Linhas (codigo_procedimento, codigo_cbo, cod_cbo)
+
+        Returns:
+            Serviço com as regras indexadas
+        """
+        cbos_por_procedimento: Dict[str, set] = {}
+        for codigo, codigo_cbo, cod_cbo in cbos:
+            chave = normalize_procedure_code(codigo)
+            if not chave:
+                continue
+            permitidos = cbos_por_procedimento.setdefault(chave, set())
+            # Aceita tanto o código CBO quanto o identificador interno
+            for valor in (codigo_cbo, cod_cbo):
+                if valor not in (None, ""):
+                    permitidos.add(str(valor).strip())
+
+        rules: Dict[str, ProcedureRule] = {}
+        for codigo, cod_sexo, idade_inicial, idade_final in procedimentos:
+            chave = normalize_procedure_code(codigo)
+            if not chave:
+                continue
+            if idade_final is not None and idade_final >= IDADE_SEM_LIMITE:
+                idade_final = None
+            permitidos = cbos_por_procedimento.get(chave)
+            rules[chave] = ProcedureRule(
+                sexo=SEXO_PROCEDIMENTO.get(cod_sexo),
+                idade_minima=idade_inicial or None,
+                idade_maxima=idade_final,
+                cbos=frozenset(permitidos) if permitidos else None,
+            )
+
+        return cls(rules, **kwargs)
+
+    @staticmethod
+    def _sexo(record: Dict[str, Any]) -> Optional[str]:
+        """Sexo do paciente do registro ("M", "F" ou None)"""
+        sexo = record.get("sexo")
+        if sexo:
+            sexo = str(sexo).strip().upper()[:1]
+            return sexo if sexo in ("M", "F") else None
+        try:
+            return SEXO_PACIENTE.get(int(record.get("cod_sexo_paciente")))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _idade(record: Dict[str, Any]) -> Optional[int]:
+        """Idade do paciente (informada ou calculada na data do atendimento)"""
+        idade = record.get("idade")
+        if idade not in (None, ""):
+            digitos = "".join(filter(str.isdigit, str(idade)))
+            if digitos:
+                return int(digitos)
+        nascimento = record.get("data_nascimento") or record.get("data_nasc_paciente")
+        referencia = record.get("data_atendimento") or record.get("data")
+        return _idade_em_anos(nascimento, referencia)
+
+    @staticmethod
+    def _codigo(record: Dict[str, Any]) -> str:
+        """Código do procedimento do registro (10 dígitos)"""
+        return normalize_procedure_code(
+            record.get("codigo_procedimento") or record.get("cod_procedimento")
+        )
+
+    @staticmethod
+    def _cbo(record: Dict[str, Any]) -> Optional[str]:
+        """CBO do profissional do registro"""
+        for chave in ("cod_cbo_resp", "cod_cbo", "cbo"):
+            valor = record.get(chave)
+            if valor not in (None, ""):
+                return str(valor).strip()
+        return None
+
+    def check(self, record: Dict[str, Any]) -> int:
+        """
+        Verifica um registro contra as regras do seu procedimento
+
+        Args:
+            record: Registro a ser verificado
+
+        Returns:
+            Máscara com os motivos de rejeição (0 = compatível)
+        """
+        regra = self.rules.get(self._codigo(record))
+        if regra is None:
+            return PROCEDIMENTO_SEM_REGRA if self.report_unknown else 0
+
+        motivos = 0
+        if regra.sexo is not None:
+            sexo = self._sexo(record)
+            if sexo is not None and sexo != regra.sexo:
+                motivos |= SEXO_INCOMPATIVEL
+
+        if regra.idade_minima is not None or regra.idade_maxima is not None:
+            idade = self._idade(record)
+            if idade is not None:
+                if regra.idade_minima is not None and idade < regra.idade_minima:
+                    motivos |= IDADE_INCOMPATIVEL
+                elif regra.idade_maxima is not None and idade > regra.idade_maxima:
+                    motivos |= IDADE_INCOMPATIVEL
+
+        if regra.cbos is not None:
+            cbo = self._cbo(record)
+            if cbo is not None and cbo not in regra.cbos:
+                motivos |= CBO_INCOMPATIVEL
+
+        return motivos
+
+    def check_stream(
+        self,
+        records: Iterable[Dict[str, Any]],
+        report: CompatibilityReport,
+        max_samples: int = AMOSTRAS_PADRAO
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Verifica os registros à medida que passam, acumulando o relatório
+
+        Args:
+            records: Registros a verificar
+            report: Relatório atualizado durante a iteração
+            max_samples: Quantidade máxima de rejeições guardadas como amostra
+
+        Yields:
+            Os mesmos registros, sem alteração
+        """
+        check = self.check
+        for indice, record in enumerate(records, report.total_registros + 1):
+            motivos = check(record)
+            if motivos:
+                report.rejeitados += 1
+                descricoes = [texto for bit, texto in MOTIVOS_REJEICAO.items() if motivos & bit]
+                for descricao in descricoes:
+                    report.contagens[descricao] = report.contagens.get(descricao, 0) + 1
+                if len(report.amostras) < max_samples:
+                    report.amostras.append({
+                        "registro": indice,
+                        "id_lancamento": record.get("id_lancamento"),
+                        "procedimento": self._codigo(record),
+                        "motivos": descricoes,
+                    })
+            report.total_registros = indice
+            yield record
+
+    def check_records(self, records: Iterable[Dict[str, Any]], max_samples: int = AMOSTRAS_PADRAO) -> CompatibilityReport:
+        """
+        Verifica todos os registros e retorna o relatório de incompatibilidades
+
+        Args:
+            records: Registros a verificar
+            max_samples: Quantidade máxima de rejeições guardadas como amostra
+
+        Returns:
+            Relatório de incompatibilidades
+        """
+        report = CompatibilityReport()
+        for _ in self.check_stream(records, report, max_samples):
+            pass
+        if report.rejeitados:
+            logger.warning(
+                f"{report.rejeitados} de {report.total_registros} registros incompatíveis "
+                f"com as regras de procedimento: {report.contagens}"
+            )
+        return report
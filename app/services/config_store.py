@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Configuração de mapeamento e valores padrão mantida em memória
+
+Os arquivos ``bpa_mapping.json`` e ``bpa_defaults.json`` são lidos e
+validados uma única vez e ficam em memória. Alterações feitas fora do
+processo (edição manual, outro worker da API) são percebidas pela
+assinatura do arquivo (mtime, tamanho e inode), consultada no máximo a
+cada CONFIG_CHECK_INTERVAL segundos. Na API, uma tarefa de fundo faz essa
+consulta (watch_loop) e as leituras das rotas e das exportações não tocam
+o disco.
+
+A gravação é atômica: o conteúdo vai para um arquivo temporário no mesmo
+diretório, é sincronizado e substitui o anterior com ``os.replace``, sob
+um bloqueio que vale também entre processos (``fcntl``, quando
+disponível). Cada gravação incrementa o contador ``_version`` guardado no
+próprio arquivo; quem informa a versão que leu recebe ConfigConflict se
+outra gravação aconteceu no meio.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from app.models.config import DefaultValues, MappingConfig, get_default_mapping, get_default_values
+from app.utils.config import Settings, get_settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: apenas o bloqueio entre threads do processo
+    fcntl = None
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Arquivos de configuração (no diretório de exportação)
+MAPPING_FILE = "bpa_mapping.json"
+DEFAULTS_FILE = "bpa_defaults.json"
+
+# Chave do contador de gravações dentro do arquivo
+VERSION_KEY = "_version"
+
+# mtime (ns), tamanho e inode
+Signature = Tuple[int, int, int]
+
+
+class ConfigConflict(Exception):
+    """Gravação com versão esperada diferente da versão atual do arquivo"""
+
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"Versão esperada {expected}, versão atual {current}")
+        self.expected = expected
+        self.current = current
+
+
+@dataclass(frozen=True)
+class ConfigEntry:
+    """
+    Conteúdo de um arquivo de configuração em memória
+
+    Atributos:
+        value (BaseModel): Configuração validada (o padrão sem arquivo válido)
+        version (int): Contador de gravações (0 sem arquivo)
+        raw (bytes): Conteúdo do arquivo (vazio sem arquivo), base do hash
+        signature (tuple): Assinatura do arquivo lido (None sem arquivo)
+    """
+    value: BaseModel
+    version: int
+    raw: bytes
+    signature: Optional[Signature]
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Mapeamento e valores padrão de um mesmo momento
+
+    Atributos:
+        mapping (ConfigEntry): Configuração de mapeamento (MappingConfig)
+        defaults (ConfigEntry): Valores padrão (DefaultValues)
+        fingerprint (str): Hash da configuração (chave do cache de artefatos)
+    """
+    mapping: ConfigEntry
+    defaults: ConfigEntry
+    fingerprint: str
+
+
+def _signature(stat: os.stat_result) -> Signature:
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _stat_signature(path: Path) -> Optional[Signature]:
+    """Assinatura atual do arquivo (None se não existir)"""
+    try:
+        return _signature(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+class ConfigFile:
+    """
+    Um arquivo de configuração JSON validado por um modelo pydantic
+    """
+
+    def __init__(self, path: Path, model: type, default: Callable[[], BaseModel], check_interval: float):
+        """
+        Args:
+            path: Caminho do arquivo
+            model: Modelo pydantic do conteúdo
+            default: Configuração usada sem arquivo (ou com arquivo inválido)
+            check_interval: Intervalo mínimo entre consultas à assinatura (segundos)
+        """
+        self.path = path
+        self.model = model
+        self.default = default
+        self.check_interval = check_interval
+        # Com uma tarefa de fundo verificando o arquivo, get() não consulta o disco
+        self.watched = False
+        self._lock = threading.Lock()
+        self._entry: Optional[ConfigEntry] = None
+        self._checked = 0.0
+
+    def get(self) -> ConfigEntry:
+        """
+        Configuração atual, relida apenas se o arquivo mudou
+
+        Returns:
+            Conteúdo em memória
+        """
+        entry = self._entry
+        if entry is None or (not self.watched and time.monotonic() - self._checked >= self.check_interval):
+            entry = self.refresh()
+        return entry
+
+    def refresh(self) -> ConfigEntry:
+        """
+        Consulta a assinatura do arquivo e relê o conteúdo se ela mudou
+
+        Returns:
+            Conteúdo em memória
+        """
+        with self._lock:
+            signature = _stat_signature(self.path)
+            if self._entry is None or signature != self._entry.signature:
+                self._entry = self._load()
+                logger.info(f"Configuração carregada: {self.path.name} (versão {self._entry.version})")
+            self._checked = time.monotonic()
+            return self._entry
+
+    def _load(self) -> ConfigEntry:
+        """Lê e valida o arquivo"""
+        try:
+            with open(self.path, "rb") as file:
+                signature = _signature(os.fstat(file.fileno()))
+                raw = file.read()
+        except FileNotFoundError:
+            return ConfigEntry(self.default(), 0, b"", None)
+
+        try:
+            data = json.loads(raw)
+            version = int(data.pop(VERSION_KEY, 0))
+            value = self.model(**data)
+        except (ValueError, TypeError, AttributeError, ValidationError) as e:
+            logger.warning(f"Arquivo de configuração inválido, usando os valores padrão: {self.path} ({str(e)})")
+            return ConfigEntry(self.default(), 0, raw, signature)
+        return ConfigEntry(value, version, raw, signature)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Bloqueio exclusivo entre processos durante a gravação"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_name(f".{self.path.name}.lock"), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def save(self, value: BaseModel, expected_version: Optional[int] = None) -> ConfigEntry:
+        """
+        Grava a configuração de forma atômica, incrementando a versão
+
+        Args:
+            value: Nova configuração
+            expected_version: Versão lida pelo cliente (None grava sem conferir)
+
+        Returns:
+            Conteúdo gravado
+
+        Raises:
+            ConfigConflict: O arquivo está em outra versão
+        """
+        with self._lock, self._file_lock():
+            # A versão de referência é a do disco, não a da memória
+            current = self._load()
+            if expected_version is not None and expected_version != current.version:
+                self._entry = current
+                raise ConfigConflict(expected_version, current.version)
+
+            version = current.version + 1
+            content = {VERSION_KEY: version, **value.model_dump()}
+            raw = json.dumps(content, ensure_ascii=False, indent=2).encode("utf-8")
+
+            partial = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.part")
+            try:
+                with open(partial, "wb") as file:
+                    file.write(raw)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(partial, self.path)
+            except BaseException:
+                partial.unlink(missing_ok=True)
+                raise
+
+            self._entry = ConfigEntry(value.model_copy(deep=True), version, raw, _stat_signature(self.path))
+            self._checked = time.monotonic()
+            return self._entry
+
+
+class ConfigStore:
+    """
+    Configuração de mapeamento e valores padrão do diretório de exportação
+    """
+
+    def __init__(self, settings: Settings):
+        """
+        Args:
+            settings: Configurações da aplicação
+        """
+        self.settings = settings
+        interval = settings.config_check_interval
+        self.mapping = ConfigFile(
+            settings.export_dir / MAPPING_FILE, MappingConfig, lambda: get_default_mapping(settings), interval
+        )
+        self.defaults = ConfigFile(
+            settings.export_dir / DEFAULTS_FILE, DefaultValues, lambda: get_default_values(settings), interval
+        )
+        self._snapshot: Optional[ConfigSnapshot] = None
+
+    def _fingerprint(self, mapping: ConfigEntry, defaults: ConfigEntry) -> str:
+        """Hash SHA-256 dos arquivos de configuração e dos padrões do ambiente"""
+        digest = hashlib.sha256()
+        digest.update(f"{self.settings.default_cnes}|{self.settings.default_orgao_emissor}".encode("utf-8"))
+        for name, entry in ((MAPPING_FILE, mapping), (DEFAULTS_FILE, defaults)):
+            digest.update(b"\0" + name.encode("utf-8") + b"\0")
+            digest.update(entry.raw)
+        return digest.hexdigest()
+
+    def snapshot(self) -> ConfigSnapshot:
+        """
+        Configuração atual para uma exportação
+
+        Returns:
+            Mapeamento, valores padrão e hash, sem leitura do disco se nada mudou
+        """
+        mapping = self.mapping.get()
+        defaults = self.defaults.get()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.mapping is not mapping or snapshot.defaults is not defaults:
+            snapshot = ConfigSnapshot(mapping, defaults, self._fingerprint(mapping, defaults))
+            self._snapshot = snapshot
+        return snapshot
+
+    def refresh(self) -> None:
+        """Relê os arquivos alterados desde a última consulta"""
+        self.mapping.refresh()
+        self.defaults.refresh()
+
+    def set_watched(self, watched: bool) -> None:
+        """Indica se há uma tarefa de fundo verificando os arquivos"""
+        self.mapping.watched = watched
+        self.defaults.watched = watched
+
+
+_stores: Dict[Tuple[str, ...], ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(settings: Optional[Settings] = None) -> ConfigStore:
+    """
+    Obtém a configuração em memória do diretório de exportação
+
+    Args:
+        settings: Configurações da aplicação (padrão: get_settings())
+
+    Returns:
+        ConfigStore compartilhado pelo processo
+    """
+    settings = settings or get_settings()
+    key = (
+        str(Path(settings.export_dir).resolve()), settings.default_cnes,
+        settings.default_orgao_emissor, str(settings.config_check_interval)
+    )
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(settings)
+        return store
+
+
+async def watch_loop(store: ConfigStore, interval: float) -> None:
+    """
+    Tarefa de fundo da API: verifica os arquivos de configuração periodicamente
+
+    Args:
+        store: Configuração em memória
+        interval: Intervalo entre verificações (segundos, CONFIG_CHECK_INTERVAL)
+    """
+    store.set_watched(True)
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(store.refresh)
+            except Exception as e:
+                logger.warning(f"Erro ao verificar arquivos de configuração: {str(e)}")
+            await asyncio.sleep(interval)
+    finally:
+        store.set_watched(False)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Escrita de CSV em fluxo, sem pandas
+
+Gera exatamente os mesmos bytes que ``pd.DataFrame(records).to_csv(
+path, index=False, quoting=csv.QUOTE_ALL)``, mas escreve os registros em
+lotes diretamente pelo módulo ``csv``, sem montar o DataFrame.
+
+Para reproduzir o pandas, o tipo de cada coluna é inferido da mesma forma
+que o construtor do DataFrame faz (inteiros com nulos viram float64,
+datetimes sem fuso viram datetime64 etc.) e só as colunas cuja
+representação difere de ``str(valor)`` recebem um formatador.
+
+Os formatadores de data/hora não perdem informação quando recebem um
+valor fora do formato inferido (o que só acontece quando a inferência é
+feita sobre o primeiro lote de um fluxo): o valor sai com precisão total.
+"""
+
+import os
+import csv
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import chain, islice, repeat
+from math import isnan
+from operator import attrgetter, itemgetter, methodcaller
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TextIO
+
+from app.services import tracing
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Registros por lote de escrita
+CSV_BATCH_SIZE = 10000
+
+# Buffer do arquivo de saída (bytes)
+CSV_BUFFER_SIZE = 1 << 20
+
+# Limites do datetime64[ns] do pandas; fora deles a coluna fica como object
+_DATETIME64_MIN = datetime(1677, 9, 21, 0, 12, 43, 145225)
+_DATETIME64_MAX = datetime(2262, 4, 11, 23, 47, 16, 854775)
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+_NONE = type(None)
+
+# Tipos cuja conversão pelo pandas é reproduzida; outros usam o pandas
+_SUPPORTED_TYPES = frozenset({_NONE, bool, int, float, str, Decimal, date, datetime, time})
+
+Formatter = Callable[[Any], Any]
+
+# Callback de progresso: recebe o total de registros já escritos
+Progress = Callable[[int], None]
+
+
+def _is_na(valor: Any) -> bool:
+    """Indica se o valor é tratado como nulo pelo pandas"""
+    if valor is None:
+        return True
+    if valor.__class__ is float:
+        return valor != valor
+    if valor.__class__ is Decimal:
+        return valor.is_nan()
+    return False
+
+
+def _format_float(valor: Any) -> Any:
+    """Formata um valor de coluna float64 (inteiros ganham '.0', nulos ficam vazios)"""
+    if valor is None or valor != valor:
+        return None
+    return repr(float(valor))
+
+
+def _format_object(valor: Any) -> Any:
+    """Formata um valor de coluna object com NaN (float ou Decimal) tratado como vazio"""
+    if _is_na(valor):
+        return None
+    return valor
+
+
+def _fits_int64(ints: List[int]) -> bool:
+    """Indica se os inteiros cabem em int64 (fora disso a inferência do pandas depende da ordem)"""
+    return not ints or (min(ints) >= _INT64_MIN and max(ints) <= _INT64_MAX)
+
+
+def _datetime_formatter(valores: List[datetime]) -> Formatter:
+    """
+    Escolhe o formato de uma coluna datetime64 como o pandas faz:
+    só a data quando todos os horários são meia-noite e, nos demais
+    casos, frações de segundo com a menor precisão que represente
+    todos os valores da coluna
+    """
+    horarios = set(map(datetime.time, valores))
+    if horarios == {time()}:
+        return _format_date_only
+
+    microssegundos = {h.microsecond for h in horarios}
+    if any(us % 1000 for us in microssegundos):
+        return _format_microseconds
+    if any(microssegundos):
+        return _format_milliseconds
+    return _format_seconds
+
+
+def _format_date_only(v: Any) -> Any:
+    """Datetime de coluna só com datas (meia-noite)"""
+    if v.__class__ is not datetime:
+        return None
+    if v.hour or v.minute or v.second or v.microsecond:
+        return v.isoformat(" ", "microseconds" if v.microsecond else "seconds")
+    return v.date().isoformat()
+
+
+def _format_seconds(v: Any) -> Any:
+    """Datetime de coluna com precisão de segundos"""
+    if v.__class__ is not datetime:
+        return None
+    return v.isoformat(" ", "microseconds" if v.microsecond else "seconds")
+
+
+def _format_milliseconds(v: Any) -> Any:
+    """Datetime de coluna com precisão de milissegundos"""
+    if v.__class__ is not datetime:
+        return None
+    return v.isoformat(" ", "microseconds" if v.microsecond % 1000 else "milliseconds")
+
+
+def _format_microseconds(v: Any) -> Any:
+    """Datetime de coluna com precisão de microssegundos"""
+    return v.isoformat(" ", "microseconds") if v.__class__ is datetime else None
+
+
+def _record_shapes(records: List[Dict[str, Any]]) -> Dict[Tuple[tuple, tuple], None]:
+    """Formatos distintos de registro (chaves e tipos dos valores), na ordem da primeira aparição"""
+    keys = map(tuple, records)
+    types = map(tuple, map(map, repeat(type), map(dict.values, records)))
+    return dict.fromkeys(zip(keys, types))
+
+
+def _column_values(records: List[Dict[str, Any]], column: str, cls: type) -> List[Any]:
+    """Valores de uma coluna que são exatamente da classe informada"""
+    return [v for v in map(methodcaller("get", column), records) if v.__class__ is cls]
+
+
+def infer_csv_columns(records: List[Dict[str, Any]]) -> Optional[Tuple[List[str], Dict[int, Formatter]]]:
+    """
+    Infere as colunas e os formatadores necessários para reproduzir o CSV do pandas
+
+    Args:
+        records: Lista de registros
+
+    Returns:
+        Tupla (colunas, formatadores por índice de coluna) ou None quando
+        algum valor exige a conversão do próprio pandas (ex.: datetime com fuso)
+    """
+    # Registros vindos da mesma consulta têm poucos formatos distintos
+    shapes = _record_shapes(records)
+
+    # Mesma ordem de colunas do DataFrame: ordem da primeira aparição das chaves
+    columns = list(dict.fromkeys(chain.from_iterable(keys for keys, _ in shapes)))
+    column_types: Dict[str, set] = {column: set() for column in columns}
+    for keys, types in shapes:
+        for column, cls in zip(keys, types):
+            column_types[column].add(cls)
+        # Chaves ausentes viram NaN no pandas
+        if len(keys) < len(columns):
+            for column in column_types.keys() - set(keys):
+                column_types[column].add(_NONE)
+
+    formatters: Dict[int, Formatter] = {}
+    for index, column in enumerate(columns):
+        types = column_types[column]
+        if not types <= _SUPPORTED_TYPES:
+            return None
+
+        values = types - {_NONE}
+        if not values or values <= {bool} or values <= {str, date, time}:
+            # Sem conversão: str(valor), com None vazio
+            continue
+
+        if values <= {int, float}:
+            if values == {int} and _NONE not in types:
+                continue
+            # Inteiros com nulos ou com floats viram float64
+            if int in values and not _fits_int64(_column_values(records, column, int)):
+                return None
+            formatters[index] = _format_float
+            continue
+
+        if values == {datetime} or values == {datetime, float} and not any(
+            v == v for v in _column_values(records, column, float)
+        ):
+            # NaN também vira NaT em colunas de datetime
+            datetimes = _column_values(records, column, datetime)
+            if set(map(attrgetter("tzinfo"), datetimes)) != {None}:
+                return None
+            if min(datetimes) >= _DATETIME64_MIN and max(datetimes) <= _DATETIME64_MAX:
+                formatters[index] = _datetime_formatter(datetimes)
+            else:
+                formatters[index] = _format_object
+            continue
+
+        # Colunas object: NaN (float ou Decimal) é gravado vazio
+        if float in values and any(map(isnan, _column_values(records, column, float))):
+            formatters[index] = _format_object
+        elif Decimal in values and any(map(Decimal.is_nan, _column_values(records, column, Decimal))):
+            formatters[index] = _format_object
+
+    return columns, formatters
+
+
+class StreamingCSVWriter:
+    """
+    Escritor de CSV em lotes com a mesma formatação do pandas (QUOTE_ALL)
+    """
+
+    def __init__(self, stream: TextIO, columns: List[str], formatters: Optional[Dict[int, Formatter]] = None):
+        """
+        Inicializa o escritor
+
+        Args:
+            stream: Arquivo de texto aberto com newline=''
+            columns: Nomes das colunas, na ordem de saída
+            formatters: Formatadores por índice de coluna
+        """
+        self.columns = list(columns)
+        self.formatters = sorted((formatters or {}).items())
+        self.rows_written = 0
+        self._writer = csv.writer(stream, quoting=csv.QUOTE_ALL, lineterminator=os.linesep)
+        self._getter = itemgetter(*self.columns) if len(self.columns) > 1 else None
+        self._header_written = False
+
+    def write_header(self) -> None:
+        """Escreve a linha de cabeçalho"""
+        self._writer.writerow([str(c) for c in self.columns])
+        self._header_written = True
+
+    def _rows(self, batch: List[Dict[str, Any]]) -> Iterable[Any]:
+        """Converte um lote de registros em linhas"""
+        if self._getter is None:
+            column = self.columns[0]
+            rows = ([r.get(column)] for r in batch)
+        else:
+            try:
+                rows = list(map(self._getter, batch))
+            except KeyError:
+                columns = self.columns
+                rows = [[r.get(c) for c in columns] for r in batch]
+
+        if not self.formatters:
+            return rows
+
+        formatted = []
+        for row in rows:
+            row = list(row)
+            for index, formatter in self.formatters:
+                row[index] = formatter(row[index])
+            formatted.append(row)
+        return formatted
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        Escreve um lote de registros
+
+        Args:
+            batch: Registros do lote
+        """
+        with tracing.span("format.batch", rows=len(batch)):
+            if not self._header_written:
+                self.write_header()
+            self._writer.writerows(self._rows(batch))
+        self.rows_written += len(batch)
+
+    def write_records(
+        self,
+        records: Iterable[Dict[str, Any]],
+        batch_size: int = CSV_BATCH_SIZE,
+        progress: Optional[Progress] = None
+    ) -> int:
+        """
+        Escreve todos os registros de um iterável, em lotes
+
+        Args:
+            records: Registros a escrever
+            batch_size: Registros por lote
+            progress: Chamado após cada lote com o total escrito
+
+        Returns:
+            Total de registros escritos
+        """
+        iterator = iter(records)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            self.write_batch(batch)
+            if progress:
+                progress(self.rows_written)
+        if not self._header_written:
+            self.write_header()
+        return self.rows_written
+
+
+def write_csv(
+    path: Any,
+    records: List[Dict[str, Any]],
+    batch_size: int = CSV_BATCH_SIZE,
+    progress: Optional[Progress] = None
+) -> bool:
+    """
+    Grava os registros em CSV com a mesma saída do pandas
+
+    Args:
+        path: Caminho do arquivo ou arquivo de texto já aberto (com newline="")
+        records: Lista de registros
+        batch_size: Registros por lote
+        progress: Chamado após cada lote com o total escrito
+
+    Returns:
+        False quando os tipos dos registros exigem o pandas (nada é gravado)
+    """
+    inferred = infer_csv_columns(records)
+    if inferred is None:
+        return False
+
+    columns, formatters = inferred
+    if hasattr(path, "write"):
+        StreamingCSVWriter(path, columns, formatters).write_records(records, batch_size, progress)
+        return True
+
+    with open(path, "w", encoding="utf-8", newline="", buffering=CSV_BUFFER_SIZE) as stream:
+        writer = StreamingCSVWriter(stream, columns, formatters)
+        writer.write_records(records, batch_size, progress)
+    return True
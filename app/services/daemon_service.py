@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Modo daemon: pré-extração agendada antes do fechamento da competência
+
+``run.py daemon`` fica em execução e, nos horários de uma agenda no
+formato do cron (DAEMON_SCHEDULE, padrão ``0 1-5 * * *``: de hora em
+hora, da 01h às 05h), prepara as competências que serão exportadas:
+
+- atualiza a cópia pré-extraída dos registros (extraction_cache), lendo
+  do banco só os segmentos de fichas que mudaram desde a execução
+  anterior;
+- grava ``estatisticas.json`` (DataService.get_competencia_statistics);
+- grava ``validacao.json``: incompatibilidades com as regras dos
+  procedimentos e lançamentos duplicados, conferidos sobre a cópia, sem
+  nova leitura do banco.
+
+Os dois relatórios levam o token da cópia (e a validação, o das regras):
+enquanto a cópia estiver em dia, ``/stats``, ``run.py stats`` e a
+validação do BPA-I os usam no lugar de consultar e verificar de novo.
+
+As competências são a corrente e, até o dia DAEMON_CLOSE_DAYS do mês, a
+anterior, que está em fechamento. No fechamento, a exportação encontra
+os registros já extraídos e fica com a formatação e a gravação.
+"""
+
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from app.utils.config import Settings
+from app.services import tracing
+from app.services.compatibility_service import CompatibilityReport, ProcedureCompatibilityService
+from app.services.data_service import RECORDS_BATCH_SIZE, DataService
+from app.services.extraction_cache import STATS_FILE, VALIDATION_FILE, ExtractionCache, get_extraction_cache
+from modules.duplicates import DetectorDuplicidades, impressao_estavel
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Cópias não atualizadas há mais tempo que isto são removidas (segundos)
+EXTRACTION_MAX_AGE = 7 * 24 * 3600
+
+# Espera máxima entre duas verificações do relógio (segundos)
+WAKE_INTERVAL = 60.0
+
+# Campos da agenda: nome, mínimo e máximo
+_CRON_FIELDS = (
+    ("minuto", 0, 59),
+    ("hora", 0, 23),
+    ("dia", 1, 31),
+    ("mês", 1, 12),
+    ("dia da semana", 0, 7),
+)
+
+
+def _parse_field(value: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    """Valores de um campo do cron: *, listas, intervalos e passos (ex.: 1-5,*/15)"""
+    values = set()
+    for part in value.split(","):
+        part, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(bound) for bound in part.split("-", 1))
+            else:
+                start = end = int(part)
+                if step > 1:
+                    end = high
+        except ValueError:
+            raise ValueError(f"Agenda inválida no campo {name}: {value}")
+        if step < 1 or start > end or start < low or end > high:
+            raise ValueError(f"Agenda inválida no campo {name}: {value} ({low} a {high})")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """
+    Agenda no formato do cron: minuto, hora, dia do mês, mês e dia da semana
+    """
+
+    def __init__(self, expression: str):
+        """
+        Args:
+            expression: Cinco campos separados por espaço (ex.: "0 1-5 * * *")
+
+        Raises:
+            ValueError: Expressão inválida ou sem nenhum horário possível
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Agenda inválida: {expression} (use minuto hora dia mês dia-da-semana)")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(value, *spec) for value, spec in zip(fields, _CRON_FIELDS)
+        )
+        # 0 e 7 são domingo; em datetime.weekday(), segunda é 0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        # Como no cron: com dia do mês e dia da semana restritos, basta um dos dois
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+        self.next_after(datetime(2000, 1, 1))
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Próximo horário da agenda depois de um momento
+
+        Args:
+            moment: Momento de referência (hora local)
+
+        Returns:
+            Próximo horário, no início do minuto
+
+        Raises:
+            ValueError: Nenhum horário nos próximos anos (ex.: 31 de fevereiro)
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Agenda sem horário possível: {self.expression}")
+
+
+def target_competencias(now: datetime, close_days: int) -> List[str]:
+    """
+    Competências a pré-extrair em um momento
+
+    Args:
+        now: Momento da execução
+        close_days: Até este dia do mês, inclui a competência anterior (em fechamento)
+
+    Returns:
+        Competências (AAAAMM), da anterior para a corrente
+    """
+    current = f"{now.year:04d}{now.month:02d}"
+    if now.day > close_days:
+        return [current]
+    previous = now.replace(day=1) - timedelta(days=1)
+    return [f"{previous.year:04d}{previous.month:02d}", current]
+
+
+@dataclass
+class WarmResult:
+    """
+    Resultado da preparação de uma competência
+
+    Atributos:
+        competencia (str): Competência (AAAAMM)
+        extracao (dict): Resultado da atualização da cópia (ExtractionRefresh)
+        rejeitados (int): Registros incompatíveis com as regras dos procedimentos
+        duplicados (int): Lançamentos duplicados
+        segundos (float): Duração
+        erro (str): Mensagem de erro
+    """
+    competencia: str
+    extracao: Optional[Dict[str, Any]] = None
+    rejeitados: int = 0
+    duplicados: int = 0
+    segundos: float = 0.0
+    erro: Optional[str] = None
+
+
+class PrewarmDaemon:
+    """
+    Prepara as competências nos horários da agenda
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: Callable[[], Any],
+        schedule: Optional[CronSchedule] = None,
+        competencias: Optional[List[str]] = None,
+        extraction: Optional[ExtractionCache] = None
+    ):
+        """
+        Args:
+            settings: Configurações da aplicação
+            session_factory: Fábrica de sessões do banco (SessionLocal)
+            schedule: Agenda (padrão: DAEMON_SCHEDULE)
+            competencias: Competências fixas (padrão: a corrente e, no fechamento, a anterior)
+            extraction: Cópias pré-extraídas (padrão: a do diretório de exportação)
+        """
+        self.settings = settings
+        self.session_factory = session_factory
+        self.schedule = schedule or CronSchedule(settings.daemon_schedule)
+        self.competencias = competencias
+        self.extraction = extraction or get_extraction_cache(settings)
+
+    def targets(self, now: datetime) -> List[str]:
+        """Competências da execução"""
+        return list(self.competencias) if self.competencias else target_competencias(now, self.settings.daemon_close_days)
+
+    def warm(self, competencia: str, db: Any) -> WarmResult:
+        """
+        Atualiza a cópia, as estatísticas e o relatório de validação de uma competência
+
+        Args:
+            competencia: Competência (AAAAMM)
+            db: Sessão do banco
+
+        Returns:
+            Resultado da preparação
+        """
+        result = WarmResult(competencia)
+        start = time.perf_counter()
+        data_service = DataService(db)
+
+        refresh = self.extraction.refresh(data_service, competencia)
+        result.extracao = refresh.to_dict()
+
+        generated = datetime.now().isoformat(timespec="seconds")
+        stats = data_service.get_competencia_statistics(competencia)
+        self.extraction.write_report(competencia, STATS_FILE, {"gerado_em": generated, "estatisticas": stats})
+
+        # Validação sobre a cópia: regras dos procedimentos e duplicidades
+        with tracing.span("daemon.validation", competencia=competencia, rows=refresh.registros):
+            rules = ProcedureCompatibilityService.rules_token(db, competencia)
+            compatibility = ProcedureCompatibilityService.from_database(db, competencia)
+            report = CompatibilityReport()
+            detector = DetectorDuplicidades(capacidade=max(refresh.registros, 1), impressao=impressao_estavel)
+            for _ in detector.filtrar(compatibility.check_stream(
+                self.extraction.open(competencia, RECORDS_BATCH_SIZE).records(), report
+            )):
+                pass
+        self.extraction.write_report(competencia, VALIDATION_FILE, {
+            "gerado_em": generated,
+            "regras": rules,
+            "registros": refresh.registros,
+            "compatibilidade": report.to_dict(),
+            "duplicidades": detector.relatorio.to_dict(),
+        })
+
+        result.rejeitados = report.rejeitados
+        result.duplicados = detector.relatorio.duplicados
+        result.segundos = time.perf_counter() - start
+        return result
+
+    def run_once(self, now: Optional[datetime] = None) -> List[WarmResult]:
+        """
+        Prepara as competências da execução
+
+        Uma competência com erro não impede as demais.
+
+        Args:
+            now: Momento da execução (padrão: agora)
+
+        Returns:
+            Resultado de cada competência
+        """
+        results = []
+        db = self.session_factory()
+        try:
+            for competencia in self.targets(now or datetime.now()):
+                with tracing.span("daemon.warm", competencia=competencia):
+                    try:
+                        result = self.warm(competencia, db)
+                        logger.info(
+                            f"Competência {competencia} preparada: {result.extracao['registros']} registros "
+                            f"({result.extracao['extraidos']} segmentos extraídos), {result.rejeitados} incompatíveis, "
+                            f"{result.duplicados} duplicados, {result.segundos:.2f} s"
+                        )
+                    except Exception as e:
+                        logger.error(f"Erro ao preparar a competência {competencia}: {str(e)}")
+                        db.rollback()
+                        result = WarmResult(competencia, erro=str(e))
+                results.append(result)
+        finally:
+            db.close()
+        self.extraction.prune(EXTRACTION_MAX_AGE)
+        return results
+
+    def run(self, stop: threading.Event) -> None:
+        """
+        Executa nos horários da agenda até stop ser sinalizado
+
+        Args:
+            stop: Evento de parada
+        """
+        while not stop.is_set():
+            due = self.schedule.next_after(datetime.now())
+            logger.info(f"Próxima pré-extração: {due:%Y-%m-%d %H:%M} ({self.schedule.expression})")
+
+            # Espera em intervalos curtos: ajustes do relógio e suspensão da máquina não atrasam a execução
+            while not stop.is_set() and datetime.now() < due:
+                stop.wait(min(WAKE_INTERVAL, max((due - datetime.now()).total_seconds(), 0.0)))
+            if stop.is_set():
+                break
+            self.run_once(due)
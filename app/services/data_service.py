@@ -4,16 +4,165 @@
 Serviço de acesso aos dados do banco de dados
 """
 
+import time
 import logging
-from typing import List, Dict, Any, Optional
-from sqlalchemy import func, select, join, text
+import threading
+from contextlib import closing
+from typing import Iterator, List, Dict, Any, NamedTuple, Optional, Tuple
+from sqlalchemy import bindparam, func, select, join, text
 from sqlalchemy.orm import Session
 
 from app.database.connection import reflect_table
+from app.utils.config import get_settings
+from app.services import metrics, tracing
+from app.services.compatibility_service import CompatibilityReport, ProcedureCompatibilityService
+from modules.duplicates import RelatorioDuplicidades
 
 # Logger
 logger = logging.getLogger(__name__)
 
+# Registros por lote na leitura em fluxo
+RECORDS_BATCH_SIZE = 10000
+
+# Tabelas da consulta de exportação (contadores de alteração em pg_stat_user_tables)
+FRESHNESS_TABLES = ("ficha_amb_int", "lancamentos", "procedimentos", "pacientes")
+
+
+def freshness_row_count(token: str) -> int:
+    """
+    Quantidade de registros contida no token de atualização
+
+    Args:
+        token: Token de DataService.get_freshness_token
+
+    Returns:
+        Quantidade de registros da consulta
+    """
+    return int(token.split("-", 1)[0])
+
+
+class TokenCache:
+    """
+    Tokens de atualização já calculados, reaproveitados enquanto o contador de
+    alterações das tabelas não muda e por no máximo max_age segundos
+    
+    O contador (pg_stat_user_tables) é uma consulta de poucas linhas; o token
+    completo lê todas as linhas da competência. O limite de idade cobre o
+    atraso das estatísticas e as tabelas fora do contador (ex.: a vigência
+    de CBO das regras).
+    """
+    
+    def __init__(self):
+        """Inicializa o cache vazio"""
+        self._lock = threading.Lock()
+        self._tokens: Dict[Any, Tuple[Optional[int], str, float]] = {}
+    
+    def get(self, name: Any, counter: Optional[int], compute, max_age: float) -> str:
+        """
+        Obtém o token guardado ou o calcula
+        
+        Args:
+            name: Identificação do token (ex.: ("dados", competência))
+            counter: Contador de alterações atual (None: só o limite de idade vale)
+            compute: Função sem argumentos que calcula o token
+            max_age: Idade máxima do token guardado (segundos; 0 sempre calcula)
+            
+        Returns:
+            Token de atualização
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._tokens.get(name)
+        if cached is not None and max_age > 0 and cached[0] == counter and now - cached[2] < max_age:
+            return cached[1]
+        
+        token = compute()
+        with self._lock:
+            self._tokens[name] = (counter, token, now)
+        return token
+    
+    def clear(self) -> None:
+        """Descarta os tokens guardados"""
+        with self._lock:
+            self._tokens.clear()
+
+
+# Tokens reaproveitados entre requisições do processo
+_token_cache = TokenCache()
+
+
+class ColumnDescription(NamedTuple):
+    """Descrição de uma coluna do resultado (conforme cursor.description do DBAPI)"""
+    name: str
+    type_code: Any
+    precision: Optional[int]
+    scale: Optional[int]
+
+
+class RecordStream:
+    """
+    Registros de uma consulta lidos em lotes, com a descrição das colunas
+    """
+    
+    def __init__(self, result, batch_size: int = RECORDS_BATCH_SIZE):
+        """
+        Inicializa o fluxo a partir de um resultado do SQLAlchemy
+        
+        Args:
+            result: Resultado da consulta (CursorResult)
+            batch_size: Registros por lote
+        """
+        self._result = result
+        self.batch_size = batch_size
+        self.rows_read = 0
+        self.fetch_seconds = 0.0
+        self._format = metrics.current_format()
+        self._closed = False
+        
+        description = result.cursor.description if result.cursor is not None else None
+        if description:
+            self.columns = [
+                ColumnDescription(d[0], d[1], d[4], d[5]) for d in description
+            ]
+        else:
+            self.columns = [ColumnDescription(name, None, None, None) for name in result.keys()]
+    
+    @property
+    def column_names(self) -> List[str]:
+        """Nomes das colunas, na ordem da consulta"""
+        return [c.name for c in self.columns]
+    
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        """Percorre os lotes de registros (listas de dicionários)"""
+        partitions = self._result.mappings().partitions(self.batch_size)
+        try:
+            while True:
+                start = time.perf_counter()
+                with tracing.span("db.fetch") as fetch:
+                    partition = next(partitions, None)
+                    if partition is None:
+                        break
+                    batch = [dict(row) for row in partition]
+                    fetch.set(rows=len(batch))
+                self.fetch_seconds += time.perf_counter() - start
+                self.rows_read += len(batch)
+                yield batch
+        finally:
+            self.close()
+    
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Percorre os registros um a um"""
+        for batch in self:
+            yield from batch
+    
+    def close(self) -> None:
+        """Libera o cursor no servidor"""
+        self._result.close()
+        if not self._closed:
+            self._closed = True
+            metrics.observe_stage("fetch", self.fetch_seconds, self.rows_read, self._format)
+
+
 class DataService:
     """
     Serviço para acesso aos dados no banco de dados
@@ -29,71 +178,332 @@ class DataService:
         self.db = db
         
         # Reflete as tabelas
-        self.ficha_amb_int = reflect_table("ficha_amb_int")
-        self.lancamentos = reflect_table("lancamentos")
+        with tracing.span("db.reflection", tables=2):
+            self.ficha_amb_int = reflect_table("ficha_amb_int")
+            self.lancamentos = reflect_table("lancamentos")
     
-    def get_records(self, competencia: Optional[str] = None) -> List[Dict[str, Any]]:
+    def _records_query(
+        self,
+        competencia: Optional[str] = None,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None,
+        before_id_fia: Optional[int] = None
+    ) -> Tuple[str, Dict[str, Any]]:
         """
-        Obtém os registros para exportação, combinando dados das tabelas ficha_amb_int e lancamentos
+        Monta a consulta dos registros de exportação
         
         Args:
             competencia: Competência no formato AAAAMM (opcional)
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
+            before_id_fia: Só registros de fichas anteriores a esta
             
         Returns:
-            Lista de registros (como dicionários)
+            Tupla (consulta SQL, parâmetros)
+        """
+        # Monta a consulta SQL como string para maior flexibilidade
+        # Seleciona campos específicos relevantes para o BPA-I de ambas as tabelas
+        query = """
+        SELECT 
+            f.id_fia AS numero,
+            f.cod_paciente,
+            f.cod_convenio,
+            f.cod_tp_sus,
+            f.cod_grupo_sus,
+            f.cod_esp_sus,
+            f.data_atendimento,
+            f.cod_especialidade,
+            l.cod_cid AS cid,
+            f.cod_hospital AS cnes,
+            f.urgente_eletivo,
+            f.tipo_atend,
+            f.matricula AS cns_paciente,
+            f.cod_medico,
+            NULL AS cns_profissional,
+            l.cod_cbo AS cbo,
+            l.id_lancamento,
+            l.cod_proc AS procedimento,
+            l.quantidade,
+            l.cod_cbo,
+            l.tipo_operacao,
+            '1' AS carater_atendimento,  -- Valor fixo '1' já que a coluna não existe
+            l.data,
+            proc.codigo_procedimento,
+            pac.cod_sexo AS cod_sexo_paciente,
+            pac.data_nasc AS data_nasc_paciente,
+            EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') AS competencia
+        """
+        
+        # Tabelas e filtros (compartilhados com o token de atualização)
+        source, params = self._records_source(competencia)
+        query += source
+        
+        # Cursor por chave (keyset) na mesma ordem da consulta
+        if after_id_fia is not None and after_id_lancamento is not None:
+            query += " AND (f.id_fia, l.id_lancamento) > (:after_id_fia, :after_id_lancamento)"
+            params["after_id_fia"] = after_id_fia
+            params["after_id_lancamento"] = after_id_lancamento
+        elif after_id_fia is not None:
+            query += " AND f.id_fia > :after_id_fia"
+            params["after_id_fia"] = after_id_fia
+        if before_id_fia is not None:
+            query += " AND f.id_fia < :before_id_fia"
+            params["before_id_fia"] = before_id_fia
+        
+        # Adiciona ordenação para facilitar o processamento
+        query += " ORDER BY f.id_fia, l.id_lancamento"
+        
+        if limit is not None:
+            query += " LIMIT :limit"
+            params["limit"] = limit
+        
+        return query, params
+    
+    def _records_source(self, competencia: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Monta as cláusulas FROM/WHERE dos registros de exportação
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            
+        Returns:
+            Tupla (trecho SQL, parâmetros)
+        """
+        source = """
+        FROM 
+            sigh.ficha_amb_int f
+        JOIN 
+            sigh.lancamentos l ON f.id_fia = l.cod_conta
+        LEFT JOIN
+            sigh.procedimentos proc ON proc.id_procedimento = l.cod_proc
+        LEFT JOIN
+            sigh.pacientes pac ON pac.id_paciente = f.cod_paciente
+        WHERE
+            l.ativo = true
+            AND f.ativo = true
+        """
+        
+        # Adiciona filtro por competência, se fornecido
+        params = {}
+        if competencia:
+            source += " AND EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') = :competencia"
+            params["competencia"] = competencia
+        
+        return source, params
+    
+    def get_freshness_token(self, competencia: Optional[str] = None) -> str:
+        """
+        Obtém um token que muda sempre que os dados de exportação mudam
+        
+        O token combina a quantidade de linhas com a soma dos xmin (id da
+        transação que gravou cada versão da linha) das tabelas da consulta:
+        inclusões, alterações e inativações mudam o valor, sem ler as colunas.
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            
+        Returns:
+            Token de atualização dos dados
         """
         try:
-            # Monta a consulta SQL como string para maior flexibilidade
-            # Seleciona campos específicos relevantes para o BPA-I de ambas as tabelas
+            source, params = self._records_source(competencia)
             query = """
-            SELECT 
-                f.id_fia AS numero,
-                f.cod_paciente,
-                f.cod_convenio,
-                f.cod_tp_sus,
-                f.cod_grupo_sus,
-                f.cod_esp_sus,
-                f.data_atendimento,
-                f.cod_especialidade,
-                l.cod_cid AS cid,
-                f.cod_hospital AS cnes,
-                f.urgente_eletivo,
-                f.tipo_atend,
-                f.matricula AS cns_paciente,
-                f.cod_medico,
-                NULL AS cns_profissional,
-                l.cod_cbo AS cbo,
-                l.id_lancamento,
-                l.cod_proc AS procedimento,
-                l.quantidade,
-                l.cod_cbo,
-                l.tipo_operacao,
-                '1' AS carater_atendimento,  -- Valor fixo '1' já que a coluna não existe
-                l.data,
-                EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') AS competencia
-            FROM 
-                sigh.ficha_amb_int f
-            JOIN 
-                sigh.lancamentos l ON f.id_fia = l.cod_conta
-            WHERE
-                l.ativo = true
-                AND f.ativo = true
-            """
+            SELECT
+                COUNT(*) AS total,
+                COALESCE(SUM(f.xmin::text::bigint), 0) AS f_xmin,
+                COALESCE(SUM(l.xmin::text::bigint), 0) AS l_xmin,
+                COALESCE(SUM(proc.xmin::text::bigint), 0) AS proc_xmin,
+                COALESCE(SUM(pac.xmin::text::bigint), 0) AS pac_xmin
+            """ + source
             
-            # Adiciona filtro por competência, se fornecido
-            params = {}
-            if competencia:
-                query += " AND EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') = :competencia"
-                params["competencia"] = competencia
+            with tracing.span("db.freshness") as freshness:
+                row = self.db.execute(text(query), params).one()
+                freshness.set(rows=row[0])
+            return "-".join(str(value) for value in row)
+        except Exception as e:
+            logger.error(f"Erro ao obter token de atualização dos dados: {str(e)}")
+            raise
+    
+    def get_change_counter(self) -> Optional[int]:
+        """
+        Obtém o total de inclusões, alterações e exclusões nas tabelas da exportação
+        
+        Lê pg_stat_user_tables (sem tocar nas tabelas): qualquer gravação muda o
+        valor, em qualquer competência, com o atraso das estatísticas do servidor.
+        
+        Returns:
+            Contador de alterações; None se as estatísticas não estiverem disponíveis
+        """
+        query = """
+        SELECT
+            COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+        FROM
+            pg_stat_user_tables
+        WHERE
+            schemaname = 'sigh'
+            AND relname IN :tables
+        """
+        try:
+            statement = text(query).bindparams(bindparam("tables", expanding=True))
+            return int(self.db.execute(statement, {"tables": list(FRESHNESS_TABLES)}).scalar())
+        except Exception as e:
+            logger.warning(f"Contadores de alteração indisponíveis: {str(e)}")
+            self.db.rollback()
+            return None
+    
+    def get_cached_token(self, name: Any, compute, max_age: float) -> str:
+        """
+        Obtém um token de atualização guardado no processo ou o calcula
+        
+        Args:
+            name: Identificação do token
+            compute: Função sem argumentos que calcula o token
+            max_age: Idade máxima do token guardado (segundos; 0 sempre calcula)
             
-            # Adiciona ordenação para facilitar o processamento
-            query += " ORDER BY f.id_fia, l.id_lancamento"
+        Returns:
+            Token de atualização
+        """
+        counter = self.get_change_counter() if max_age > 0 else None
+        return _token_cache.get(name, counter, compute, max_age)
+    
+    def get_cached_freshness_token(self, competencia: Optional[str], max_age: float) -> str:
+        """
+        Como get_freshness_token, reaproveitando o token enquanto as tabelas não mudam
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            max_age: Idade máxima do token guardado (segundos; 0 sempre calcula)
+            
+        Returns:
+            Token de atualização dos dados
+        """
+        return self.get_cached_token(("dados", competencia), lambda: self.get_freshness_token(competencia), max_age)
+    
+    def get_segment_tokens(self, competencia: str, segment_size: int) -> Dict[int, str]:
+        """
+        Obtém o token de atualização de cada segmento de fichas da competência
+        
+        Mesma composição de get_freshness_token, agrupada por segmento
+        (id_fia // segment_size): a pré-extração só lê de novo os segmentos
+        cujo token mudou.
+        
+        Args:
+            competencia: Competência no formato AAAAMM
+            segment_size: Fichas por segmento
+            
+        Returns:
+            Token de cada segmento com registros
+        """
+        try:
+            source, params = self._records_source(competencia)
+            query = """
+            SELECT
+                DIV(f.id_fia, :segment_size)::bigint AS segmento,
+                COUNT(*) AS total,
+                COALESCE(SUM(f.xmin::text::bigint), 0) AS f_xmin,
+                COALESCE(SUM(l.xmin::text::bigint), 0) AS l_xmin,
+                COALESCE(SUM(proc.xmin::text::bigint), 0) AS proc_xmin,
+                COALESCE(SUM(pac.xmin::text::bigint), 0) AS pac_xmin
+            """ + source + " GROUP BY 1 ORDER BY 1"
+            params["segment_size"] = segment_size
+            
+            with tracing.span("db.freshness", segments=True) as freshness:
+                rows = self.db.execute(text(query), params).fetchall()
+                freshness.set(rows=len(rows))
+            return {int(row[0]): "-".join(str(value) for value in row[1:]) for row in rows}
+        except Exception as e:
+            logger.error(f"Erro ao obter tokens de atualização dos segmentos: {str(e)}")
+            raise
+    
+    def _extraction(self, competencia: Optional[str]) -> Optional[Any]:
+        """Cópia pré-extraída da competência (run.py daemon), se houver"""
+        if not competencia:
+            return None
+        from app.services.extraction_cache import get_extraction_cache
+        
+        settings = get_settings()
+        if not settings.extraction_cache:
+            return None
+        extraction = get_extraction_cache(settings)
+        return extraction if extraction.has(competencia) else None
+    
+    def _prewarmed_report(self, competencia: Optional[str], name: str) -> Optional[Dict[str, Any]]:
+        """Relatório do daemon gravado junto da cópia da competência, se ela estiver em dia"""
+        extraction = self._extraction(competencia)
+        return extraction.report(self, competencia, name) if extraction is not None else None
+    
+    def get_prewarmed_validation(
+        self,
+        competencia: Optional[str]
+    ) -> Optional[Tuple[CompatibilityReport, RelatorioDuplicidades]]:
+        """
+        Obtém a validação da competência pré-calculada pelo daemon (validacao.json)
+        
+        Vale enquanto a cópia estiver em dia com o banco (mesmo token de
+        atualização) e as regras de compatibilidade forem as mesmas da
+        validação.
+        
+        Args:
+            competencia: Competência no formato AAAAMM
+            
+        Returns:
+            Relatórios de incompatibilidades e de duplicidades (modo reportar);
+            None se não houver validação em dia
+        """
+        from app.services.extraction_cache import VALIDATION_FILE
+        
+        report = self._prewarmed_report(competencia, VALIDATION_FILE)
+        if report is None:
+            return None
+        rules = self.get_cached_token(
+            ("regras", competencia),
+            lambda: ProcedureCompatibilityService.rules_token(self.db, competencia),
+            get_settings().freshness_ttl
+        )
+        if report.get("regras") != rules:
+            return None
+        return (
+            CompatibilityReport.from_dict(report["compatibilidade"]),
+            RelatorioDuplicidades.from_dict(report["duplicidades"])
+        )
+    
+    def get_records(self, competencia: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Obtém os registros para exportação, combinando dados das tabelas ficha_amb_int e lancamentos
+        
+        Competências pré-extraídas vêm da cópia local (ver stream_records).
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            
+        Returns:
+            Lista de registros (como dicionários)
+        """
+        extraction = self._extraction(competencia)
+        stream = extraction.read(self, competencia, RECORDS_BATCH_SIZE) if extraction is not None else None
+        if stream is not None:
+            with closing(stream):
+                records = list(stream.records())
+            logger.info(f"Encontrados {len(records)} registros para exportação (pré-extraídos)")
+            return records
+        
+        try:
+            query, params = self._records_query(competencia)
             
             # Executa a consulta
-            result = self.db.execute(text(query), params)
+            start = time.perf_counter()
+            with tracing.span("db.query", competencia=competencia):
+                result = self.db.execute(text(query), params)
+            fetch_start = time.perf_counter()
+            metrics.observe_stage("query", fetch_start - start)
             
             # Converte o resultado para lista de dicionários
-            records = [dict(row._mapping) for row in result]
+            with tracing.span("db.fetch") as fetch:
+                records = [dict(row._mapping) for row in result]
+                fetch.set(rows=len(records))
+            metrics.observe_stage("fetch", time.perf_counter() - fetch_start, len(records))
             
             logger.info(f"Encontrados {len(records)} registros para exportação")
             
@@ -102,52 +512,146 @@ class DataService:
             logger.error(f"Erro ao obter registros: {str(e)}")
             raise
     
-    def get_statistics(self, competencia: Optional[str] = None) -> Dict[str, Any]:
+    def stream_records(
+        self,
+        competencia: Optional[str] = None,
+        batch_size: int = RECORDS_BATCH_SIZE,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> "RecordStream":
         """
-        Obtém estatísticas sobre os dados
+        Obtém os registros para exportação em lotes
+        
+        Com a competência pré-extraída (run.py daemon) e a cópia local em dia
+        com o banco, os registros vêm dela (ver extraction_cache); caso
+        contrário, são lidos do banco (query_records).
         
         Args:
             competencia: Competência no formato AAAAMM (opcional)
+            batch_size: Registros por lote
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
             
         Returns:
-            Dicionário com estatísticas
+            Fluxo de registros com a descrição das colunas da consulta
+        """
+        extraction = self._extraction(competencia)
+        if extraction is not None:
+            stream = extraction.read(self, competencia, batch_size, after_id_fia, after_id_lancamento, limit)
+            if stream is not None:
+                return stream
+        return self.query_records(competencia, batch_size, after_id_fia, after_id_lancamento, limit)
+    
+    def query_records(
+        self,
+        competencia: Optional[str] = None,
+        batch_size: int = RECORDS_BATCH_SIZE,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None,
+        before_id_fia: Optional[int] = None
+    ) -> "RecordStream":
+        """
+        Lê os registros para exportação do banco em lotes, com cursor no servidor
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            batch_size: Registros por lote
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
+            before_id_fia: Só registros de fichas anteriores a esta
+            
+        Returns:
+            Fluxo de registros com a descrição das colunas da consulta
         """
         try:
-            # Consulta SQL para estatísticas
-            query = """
-            SELECT 
-                EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') AS competencia,
-                COUNT(DISTINCT f.id_fia) AS total_fichas,
-                COUNT(l.id_lancamento) AS total_lancamentos,
-                COUNT(DISTINCT f.cod_paciente) AS total_pacientes,
-                COUNT(DISTINCT f.cod_medico) AS total_medicos,
-                COUNT(DISTINCT l.cod_proc) AS total_procedimentos
-            FROM 
-                sigh.ficha_amb_int f
-            JOIN 
-                sigh.lancamentos l ON f.id_fia = l.cod_conta
-            WHERE
-                l.ativo = true
-                AND f.ativo = true
-            """
+            query, params = self._records_query(competencia, after_id_fia, after_id_lancamento, limit, before_id_fia)
             
-            # Adiciona agrupamento por competência
-            query += " GROUP BY competencia"
+            # Cursor no servidor: o banco envia os registros conforme são consumidos
+            start = time.perf_counter()
+            with tracing.span("db.query", competencia=competencia, stream=True):
+                result = self.db.execute(
+                    text(query),
+                    params,
+                    execution_options={"stream_results": True, "yield_per": batch_size}
+                )
+            metrics.observe_stage("query", time.perf_counter() - start)
             
-            # Adiciona filtro por competência, se fornecido
-            params = {}
-            if competencia:
-                query += " HAVING EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') = :competencia"
-                params["competencia"] = competencia
+            return RecordStream(result, batch_size)
+        except Exception as e:
+            logger.error(f"Erro ao obter registros em lotes: {str(e)}")
+            raise
+    
+    def get_competencia_statistics(self, competencia: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Consulta as estatísticas agrupadas por competência
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
             
-            # Adiciona ordenação
-            query += " ORDER BY competencia DESC"
+        Returns:
+            Estatísticas de cada competência, da mais recente para a mais antiga
+        """
+        # Consulta SQL para estatísticas
+        query = """
+        SELECT 
+            EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') AS competencia,
+            COUNT(DISTINCT f.id_fia) AS total_fichas,
+            COUNT(l.id_lancamento) AS total_lancamentos,
+            COUNT(DISTINCT f.cod_paciente) AS total_pacientes,
+            COUNT(DISTINCT f.cod_medico) AS total_medicos,
+            COUNT(DISTINCT l.cod_proc) AS total_procedimentos
+        FROM 
+            sigh.ficha_amb_int f
+        JOIN 
+            sigh.lancamentos l ON f.id_fia = l.cod_conta
+        WHERE
+            l.ativo = true
+            AND f.ativo = true
+        """
+        
+        # Adiciona agrupamento por competência
+        query += " GROUP BY competencia"
+        
+        # Adiciona filtro por competência, se fornecido
+        params = {}
+        if competencia:
+            query += " HAVING EXTRACT(YEAR FROM f.data_atendimento) || LPAD(EXTRACT(MONTH FROM f.data_atendimento)::text, 2, '0') = :competencia"
+            params["competencia"] = competencia
+        
+        # Adiciona ordenação
+        query += " ORDER BY competencia DESC"
+        
+        # Executa a consulta e converte o resultado em lista de dicionários
+        result = self.db.execute(text(query), params)
+        return [dict(row._mapping) for row in result]
+    
+    def get_statistics(self, competencia: Optional[str] = None, prewarmed: bool = True) -> Dict[str, Any]:
+        """
+        Obtém estatísticas sobre os dados
+        
+        As estatísticas de uma competência pré-extraída vêm do relatório do
+        daemon (estatisticas.json) enquanto a cópia estiver em dia com o
+        banco; a lista de competências disponíveis é sempre consultada.
+        
+        Args:
+            competencia: Competência no formato AAAAMM (opcional)
+            prewarmed: Usa as estatísticas pré-calculadas pelo daemon, se em dia
             
-            # Executa a consulta
-            result = self.db.execute(text(query), params)
+        Returns:
+            Dicionário com estatísticas
+        """
+        try:
+            from app.services.extraction_cache import STATS_FILE
             
-            # Converte o resultado em lista de dicionários
-            stats_by_competencia = [dict(row._mapping) for row in result]
+            report = self._prewarmed_report(competencia, STATS_FILE) if prewarmed else None
+            if report is not None:
+                stats_by_competencia = report["estatisticas"]
+            else:
+                stats_by_competencia = self.get_competencia_statistics(competencia)
             
             # Obtenção da lista de competências disponíveis
             comp_query = """
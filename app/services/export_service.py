@@ -9,15 +9,29 @@ import csv
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
-
-import pandas as pd
+from typing import Callable, List, Dict, Any, Optional
 
 from app.utils.config import Settings
+from app.services.csv_writer import CSV_BUFFER_SIZE, write_csv
+from app.services.data_service import RecordStream
+from app.services.metrics import ExportTimer
 
 # Logger
 logger = logging.getLogger(__name__)
 
+def export_filename(extension: str) -> str:
+    """
+    Nome de um arquivo de exportação, com timestamp
+    
+    Args:
+        extension: Extensão do arquivo (csv, xlsx, parquet)
+        
+    Returns:
+        Nome do arquivo (bpa_export_<timestamp>.<extensão>)
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"bpa_export_{timestamp}.{extension}"
+
 class ExportService:
     """
     Serviço para exportação de dados para diferentes formatos
@@ -37,30 +51,43 @@ class ExportService:
         if not self.export_dir.exists():
             self.export_dir.mkdir(parents=True, exist_ok=True)
     
-    def export_to_csv(self, records: List[Dict[str, Any]]) -> str:
+    def export_to_csv(
+        self,
+        records: List[Dict[str, Any]],
+        filepath: Optional[Path] = None,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> str:
         """
         Exporta os dados para um arquivo CSV
         
         Args:
             records: Lista de registros a serem exportados
+            filepath: Caminho de saída (padrão: nome com timestamp no diretório de exportação)
+            progress: Chamado durante a gravação com o total de registros escritos
             
         Returns:
             Caminho do arquivo CSV gerado
         """
         try:
             # Gera o nome do arquivo com timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"bpa_export_{timestamp}.csv"
-            filepath = self.export_dir / filename
+            if filepath is None:
+                filepath = self.export_dir / export_filename("csv")
             
             # Verifica se há registros para exportar
             if not records:
                 logger.warning("Nenhum registro para exportar.")
                 return str(filepath)
             
-            # Cria o DataFrame e exporta para CSV
-            df = pd.DataFrame(records)
-            df.to_csv(filepath, index=False, encoding='utf-8', quoting=csv.QUOTE_ALL)
+            # Grava em lotes pelo módulo csv; tipos que só o pandas converte de forma idêntica usam o DataFrame
+            with ExportTimer("csv") as timer, \
+                    timer.open(filepath, "w", CSV_BUFFER_SIZE, encoding="utf-8", newline="") as output:
+                timer.rows = len(records)
+                if not write_csv(output, records, progress=progress):
+                    import pandas as pd
+                    
+                    logger.info("Tipos de dados não suportados pelo escritor em fluxo; usando pandas.")
+                    df = pd.DataFrame(records)
+                    df.to_csv(output, index=False, quoting=csv.QUOTE_ALL)
             
             logger.info(f"Exportação para CSV concluída: {filepath}")
             
@@ -69,53 +96,82 @@ class ExportService:
             logger.error(f"Erro ao exportar para CSV: {str(e)}")
             raise
     
-    def export_to_xlsx(self, records: List[Dict[str, Any]]) -> str:
+    def export_to_xlsx(
+        self,
+        records: List[Dict[str, Any]],
+        filepath: Optional[Path] = None,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> str:
         """
         Exporta os dados para um arquivo XLSX
         
         Args:
             records: Lista de registros a serem exportados
+            filepath: Caminho de saída (padrão: nome com timestamp no diretório de exportação)
+            progress: Chamado durante a gravação com o total de registros escritos
             
         Returns:
             Caminho do arquivo XLSX gerado
         """
         try:
             # Gera o nome do arquivo com timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"bpa_export_{timestamp}.xlsx"
-            filepath = self.export_dir / filename
+            if filepath is None:
+                filepath = self.export_dir / export_filename("xlsx")
             
             # Verifica se há registros para exportar
             if not records:
                 logger.warning("Nenhum registro para exportar.")
                 return str(filepath)
             
-            # Cria o DataFrame e exporta para XLSX
-            df = pd.DataFrame(records)
+            # Grava linha a linha com memória constante; as larguras das colunas
+            # são calculadas durante a escrita e, acima do limite de linhas do
+            # Excel, os registros continuam em novas planilhas
+            # (xlsxwriter é importado apenas quando o formato é usado)
+            from app.services.xlsx_writer import write_xlsx
+            with ExportTimer("xlsx") as timer, timer.open(filepath, "wb") as output:
+                timer.rows = len(records)
+                sheets = write_xlsx(output, records, sheet_name='BPA_Export', progress=progress)
             
-            # Cria o escritor de Excel com o pandas
-            writer = pd.ExcelWriter(filepath, engine='openpyxl')
+            logger.info(f"Exportação para XLSX concluída: {filepath} ({len(sheets)} planilha(s))")
             
-            # Escreve os dados na planilha
-            df.to_excel(writer, index=False, sheet_name='BPA_Export')
+            return str(filepath)
+        except Exception as e:
+            logger.error(f"Erro ao exportar para XLSX: {str(e)}")
+            raise
+    
+    def export_to_parquet(
+        self,
+        stream: RecordStream,
+        filepath: Optional[Path] = None,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> str:
+        """
+        Exporta os dados para um arquivo Parquet, lendo os registros em lotes
+        
+        Args:
+            stream: Fluxo de registros com a descrição das colunas da consulta
+            filepath: Caminho de saída (padrão: nome com timestamp no diretório de exportação)
+            progress: Chamado após cada lote com o total de registros gravados
             
-            # Ajusta as colunas para melhor visualização
-            worksheet = writer.sheets['BPA_Export']
-            for i, col in enumerate(df.columns):
-                max_width = max(
-                    df[col].astype(str).map(len).max(),  # Largura máxima do conteúdo
-                    len(str(col))  # Largura do nome da coluna
-                ) + 2  # Adiciona um pouco de espaço extra
-                
-                # Define a largura da coluna
-                worksheet.column_dimensions[worksheet.cell(row=1, column=i+1).column_letter].width = max_width
+        Returns:
+            Caminho do arquivo Parquet gerado
+        """
+        try:
+            # Gera o nome do arquivo com timestamp
+            if filepath is None:
+                filepath = self.export_dir / export_filename("parquet")
             
-            # Salva o arquivo
-            writer.close()
+            # Esquema derivado dos tipos da consulta; cada row group é gravado assim que completo
+            # (a leitura dos lotes, feita durante a gravação, não entra no tempo de formatação);
+            # o pyarrow é importado apenas quando o formato é usado
+            from app.services.parquet_writer import write_parquet
+            with ExportTimer("parquet") as timer, timer.open(filepath, "wb") as output:
+                total = write_parquet(output, stream.columns, stream, progress=progress)
+                timer.rows = total
             
-            logger.info(f"Exportação para XLSX concluída: {filepath}")
+            logger.info(f"Exportação para Parquet concluída: {filepath} ({total} registros)")
             
             return str(filepath)
         except Exception as e:
-            logger.error(f"Erro ao exportar para XLSX: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Erro ao exportar para Parquet: {str(e)}")
+            raise
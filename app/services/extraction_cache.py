@@ -0,0 +1,724 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cópia local pré-extraída dos registros de uma competência
+
+As exportações do fechamento se concentram nos primeiros dias úteis do
+mês, quando o banco está mais ocupado. ``run.py daemon`` extrai antes,
+em horários de pouco movimento, os registros da competência para
+``<export_dir>/extracao/<competencia>/``, divididos em segmentos de
+EXTRACTION_SEGMENT_SIZE fichas (``id_fia // tamanho``).
+
+Cada segmento guarda o seu token de atualização (quantidade de linhas e
+soma dos xmin, como DataService.get_freshness_token, agrupado por
+segmento). A atualização (``refresh``, feita pelo daemon) consulta apenas
+os tokens e extrai de novo só os segmentos que mudaram; segmentos sem
+registros saem do manifesto, que guarda também o token da competência
+inteira (a soma dos tokens dos segmentos).
+
+Com a competência pré-extraída, DataService.stream_records e get_records
+leem da cópia (``read``) sem extrair nada: se ela foi conferida há menos
+de FRESHNESS_TTL segundos, direto; senão, comparando o token da
+competência inteira (reaproveitado entre requisições, ver
+DataService.get_cached_freshness_token). Cópia desatualizada é lida do
+banco, e a atualização dos segmentos segue em segundo plano: a exportação
+do fechamento fica com a formatação e a gravação.
+
+O daemon grava também, junto da cópia, as estatísticas e a validação da
+competência (STATS_FILE e VALIDATION_FILE), com o token da cópia de que
+foram calculadas. ``report`` só os devolve enquanto a cópia estiver em dia
+(mesma verificação de ``read``): DataService.get_statistics e a validação
+do BPA-I os usam no lugar de uma nova consulta ou verificação.
+
+Os segmentos são arquivos Parquet (só dados, nunca código), com nome novo
+a cada extração. Decimais (``numeric``) são gravados como texto e voltam
+como Decimal com a mesma escala: a exportação a partir da cópia é idêntica
+à feita a partir do banco; o ``manifest.json`` é substituído atomicamente. Leituras
+em andamento mantêm um bloqueio compartilhado em ``.leitura``: os
+segmentos que deixaram de ser referenciados e as cópias abandonadas só são
+removidos quando nenhuma leitura está aberta.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.utils.config import Settings, get_settings
+from app.services import metrics, tracing
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: apenas o bloqueio entre threads do processo
+    fcntl = None
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Diretório da cópia (no diretório de exportação) e manifesto de cada competência
+EXTRACTION_DIR = "extracao"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 3
+
+# Relatórios gravados pelo daemon junto da cópia de cada competência
+STATS_FILE = "estatisticas.json"
+VALIDATION_FILE = "validacao.json"
+
+# Metadado do Parquet com as colunas decimais gravadas como texto
+DECIMAL_COLUMNS_KEY = b"colunas_decimais"
+
+# Bloqueio compartilhado das leituras em andamento
+READERS_LOCK = ".leitura"
+
+# Sem fcntl (Windows), idade mínima para remover segmentos substituídos (segundos)
+STALE_SEGMENT_SECONDS = 3600
+
+
+def _combine_tokens(tokens: Iterator[str]) -> str:
+    """Token da competência inteira: soma, campo a campo, dos tokens dos segmentos"""
+    total = [0] * 5
+    for token in tokens:
+        total = [a + int(b) for a, b in zip(total, token.split("-"))]
+    return "-".join(str(value) for value in total)
+
+
+def _encode_segment(records: List[Dict[str, Any]]) -> bytes:
+    """
+    Serializa os registros de um segmento em Parquet
+
+    O decimal do Arrow tem uma escala por coluna (Decimal('2.5') voltaria
+    como 2.50): as colunas decimais são gravadas como texto, que preserva
+    o valor e a escala de cada registro, e listadas nos metadados.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    decimals = sorted({
+        name for record in records for name, value in record.items() if isinstance(value, Decimal)
+    })
+    if decimals:
+        records = [
+            {
+                **record,
+                **{name: str(record[name]) if record.get(name) is not None else None for name in decimals}
+            }
+            for record in records
+        ]
+    table = pa.Table.from_pylist(records)
+    if decimals:
+        table = table.replace_schema_metadata({DECIMAL_COLUMNS_KEY: json.dumps(decimals).encode()})
+
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def _decode_segment(path: Path) -> List[Dict[str, Any]]:
+    """Lê os registros de um segmento Parquet (decimais voltam como Decimal)"""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    records = table.to_pylist()
+    decimals = json.loads((table.schema.metadata or {}).get(DECIMAL_COLUMNS_KEY, b"[]"))
+    for record in records:
+        for name in decimals:
+            value = record.get(name)
+            if value is not None:
+                record[name] = Decimal(value)
+    return records
+
+
+@dataclass
+class ExtractionRefresh:
+    """
+    Resultado de uma atualização da cópia de uma competência
+
+    Atributos:
+        competencia (str): Competência (AAAAMM)
+        segmentos (int): Segmentos com registros
+        extraidos (int): Segmentos extraídos de novo (novos ou alterados)
+        removidos (int): Segmentos que deixaram de ter registros
+        registros (int): Registros da competência
+        registros_extraidos (int): Registros lidos do banco nesta atualização
+        segundos (float): Duração
+    """
+    competencia: str
+    segmentos: int = 0
+    extraidos: int = 0
+    removidos: int = 0
+    registros: int = 0
+    registros_extraidos: int = 0
+    segundos: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte o resultado em dicionário"""
+        return {
+            "competencia": self.competencia,
+            "segmentos": self.segmentos,
+            "extraidos": self.extraidos,
+            "removidos": self.removidos,
+            "registros": self.registros,
+            "registros_extraidos": self.registros_extraidos,
+            "segundos": round(self.segundos, 3),
+        }
+
+
+class ExtractedRecordStream:
+    """
+    Registros da cópia local em lotes, com a mesma interface de RecordStream
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        manifest: Dict[str, Any],
+        batch_size: int,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None,
+        readers: Optional[Any] = None
+    ):
+        """
+        Args:
+            directory: Diretório da competência
+            manifest: Manifesto da cópia
+            batch_size: Registros por lote
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
+            readers: Arquivo com o bloqueio compartilhado de leitura (liberado em close)
+        """
+        from app.services.data_service import ColumnDescription
+
+        self.directory = directory
+        self.batch_size = batch_size
+        self.rows_read = 0
+        self.fetch_seconds = 0.0
+        self.columns = [ColumnDescription(*column) for column in manifest.get("colunas", [])]
+        self._segments = [
+            manifest["segmentos"][key] for key in sorted(manifest["segmentos"], key=int)
+        ]
+        self._segment_size = manifest["tamanho_segmento"]
+        self._after_id_fia = after_id_fia
+        self._after_id_lancamento = after_id_lancamento
+        self._limit = limit
+        self._format = metrics.current_format()
+        self._readers = readers
+        self._closed = False
+
+    @property
+    def column_names(self) -> List[str]:
+        """Nomes das colunas, na ordem da consulta"""
+        return [c.name for c in self.columns]
+
+    def _segment_records(self) -> Iterator[Dict[str, Any]]:
+        """Registros dos segmentos, na ordem da consulta, a partir do cursor"""
+        after_id_fia, after_id_lancamento = self._after_id_fia, self._after_id_lancamento
+        for segment in self._segments:
+            if after_id_fia is not None and (segment["segmento"] + 1) * self._segment_size - 1 < after_id_fia:
+                continue
+            start = time.perf_counter()
+            with tracing.span("extraction.read", segment=segment["segmento"]) as read:
+                records = _decode_segment(self.directory / segment["arquivo"])
+                read.set(rows=len(records))
+            self.fetch_seconds += time.perf_counter() - start
+
+            if after_id_fia is not None:
+                if after_id_lancamento is not None:
+                    records = [
+                        r for r in records if (r["numero"], r["id_lancamento"]) > (after_id_fia, after_id_lancamento)
+                    ]
+                else:
+                    records = [r for r in records if r["numero"] > after_id_fia]
+            yield from records
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        """Percorre os lotes de registros (listas de dicionários)"""
+        batch: List[Dict[str, Any]] = []
+        remaining = self._limit
+        try:
+            for record in self._segment_records():
+                if remaining is not None:
+                    if remaining <= 0:
+                        break
+                    remaining -= 1
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self.rows_read += len(batch)
+                    yield batch
+                    batch = []
+            if batch:
+                self.rows_read += len(batch)
+                yield batch
+        finally:
+            self.close()
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Percorre os registros um a um"""
+        for batch in self:
+            yield from batch
+
+    def close(self) -> None:
+        """Registra o tempo de leitura e libera o bloqueio de leitura"""
+        if not self._closed:
+            self._closed = True
+            metrics.observe_stage("fetch", self.fetch_seconds, self.rows_read, self._format)
+            if self._readers is not None:
+                self._readers.close()
+                self._readers = None
+
+
+class ExtractionCache:
+    """
+    Cópias pré-extraídas das competências no diretório de exportação
+    """
+
+    def __init__(self, settings: Settings):
+        """
+        Args:
+            settings: Configurações da aplicação
+        """
+        self.settings = settings
+        self.root = Path(settings.export_dir) / EXTRACTION_DIR
+        self.segment_size = max(1, settings.extraction_segment_size)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._background: set = set()
+
+    def directory(self, competencia: str) -> Path:
+        """Diretório da cópia de uma competência"""
+        return self.root / competencia
+
+    def has(self, competencia: Optional[str]) -> bool:
+        """Indica se a competência foi pré-extraída"""
+        return bool(competencia) and (self.directory(competencia) / MANIFEST_FILE).exists()
+
+    def competencias(self) -> List[str]:
+        """Competências pré-extraídas"""
+        if not self.root.exists():
+            return []
+        return sorted(path.parent.name for path in self.root.glob(f"*/{MANIFEST_FILE}"))
+
+    def manifest(self, competencia: str) -> Optional[Dict[str, Any]]:
+        """
+        Manifesto da cópia de uma competência
+
+        Args:
+            competencia: Competência (AAAAMM)
+
+        Returns:
+            Manifesto (None se a competência não foi pré-extraída ou o manifesto é ilegível)
+        """
+        try:
+            with open(self.directory(competencia) / MANIFEST_FILE, encoding="utf-8") as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Manifesto da pré-extração ilegível, ignorado: {competencia} ({str(e)})")
+            return None
+        if manifest.get("versao") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    @contextmanager
+    def _lock(self, competencia: str) -> Iterator[None]:
+        """Bloqueio exclusivo da atualização de uma competência, entre threads e processos"""
+        with self._locks_lock:
+            lock = self._locks.setdefault(competencia, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.directory(competencia) / ".lock", "a") as file:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def _open_readers(self, competencia: str) -> Optional[Any]:
+        """Abre o arquivo de leituras com bloqueio compartilhado (None sem fcntl)"""
+        if fcntl is None:
+            return None
+        file = open(self.directory(competencia) / READERS_LOCK, "a")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+        except BaseException:
+            file.close()
+            raise
+        return file
+
+    @contextmanager
+    def _no_readers(self, competencia: str) -> Iterator[bool]:
+        """Bloqueio exclusivo das leituras, sem esperar: True se nenhuma leitura está aberta"""
+        if fcntl is None:
+            yield False
+            return
+        with open(self.directory(competencia) / READERS_LOCK, "a") as file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        """Grava um arquivo de forma atômica"""
+        partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(partial, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(partial, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def _save_manifest(self, competencia: str, manifest: Dict[str, Any]) -> None:
+        manifest["verificado_em"] = datetime.now().isoformat(timespec="seconds")
+        data = json.dumps(manifest, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+        self._write(self.directory(competencia) / MANIFEST_FILE, data)
+
+    def _remove_unreferenced(self, competencia: str, manifest: Dict[str, Any]) -> None:
+        """Remove os segmentos substituídos, se nenhuma leitura estiver aberta"""
+        referenced = {segment["arquivo"] for segment in manifest["segmentos"].values()}
+        with self._no_readers(competencia) as idle:
+            if fcntl is not None and not idle:
+                return
+            # Sem fcntl, vale a idade do arquivo
+            limit = time.time() if idle else time.time() - STALE_SEGMENT_SECONDS
+            for path in self.directory(competencia).glob("segmento_*"):
+                try:
+                    if path.name not in referenced and path.stat().st_mtime < limit:
+                        path.unlink()
+                except FileNotFoundError:
+                    continue
+
+    def refresh(self, data_service: Any, competencia: str) -> ExtractionRefresh:
+        """
+        Extrai os segmentos novos ou alterados de uma competência
+
+        Na primeira chamada, a competência passa a ser pré-extraída. Chamado
+        pelo daemon e pela atualização em segundo plano, nunca no caminho de
+        uma requisição.
+
+        Args:
+            data_service: Serviço de dados (DataService)
+            competencia: Competência (AAAAMM)
+
+        Returns:
+            Resultado da atualização
+        """
+        result = ExtractionRefresh(competencia)
+        start = time.perf_counter()
+        try:
+            self.directory(competencia).mkdir(parents=True, exist_ok=True)
+            with self._lock(competencia), tracing.span("extraction.refresh", competencia=competencia) as span:
+                tokens = data_service.get_segment_tokens(competencia, self.segment_size)
+
+                manifest = self.manifest(competencia)
+                if manifest is None or manifest.get("tamanho_segmento") != self.segment_size:
+                    manifest = {
+                        "versao": MANIFEST_VERSION,
+                        "competencia": competencia,
+                        "tamanho_segmento": self.segment_size,
+                        "colunas": [],
+                        "segmentos": {},
+                    }
+                segments = manifest["segmentos"]
+
+                for key in [key for key in segments if int(key) not in tokens]:
+                    del segments[key]
+                    result.removidos += 1
+
+                for segment, token in sorted(tokens.items()):
+                    entry = segments.get(str(segment))
+                    if entry is not None and entry["token"] == token:
+                        continue
+
+                    # Extrai o segmento [segmento * tamanho, (segmento + 1) * tamanho)
+                    stream = data_service.query_records(
+                        competencia,
+                        after_id_fia=segment * self.segment_size - 1,
+                        before_id_fia=(segment + 1) * self.segment_size
+                    )
+                    records = list(stream.records())
+                    if stream.columns:
+                        manifest["colunas"] = [list(column) for column in stream.columns]
+
+                    name = f"segmento_{segment}_{uuid.uuid4().hex[:8]}.parquet"
+                    self._write(self.directory(competencia) / name, _encode_segment(records))
+                    segments[str(segment)] = {
+                        "segmento": segment,
+                        "token": token,
+                        "registros": len(records),
+                        "arquivo": name,
+                    }
+                    result.extraidos += 1
+                    result.registros_extraidos += len(records)
+
+                    # Progresso gravado a cada segmento: uma interrupção não perde o que já foi extraído
+                    # (sem o token da competência, a cópia parcial não é lida pelas exportações)
+                    manifest.pop("token", None)
+                    self._save_manifest(competencia, manifest)
+
+                manifest["token"] = _combine_tokens(tokens[int(key)] for key in segments)
+                self._save_manifest(competencia, manifest)
+                self._remove_unreferenced(competencia, manifest)
+
+                result.segmentos = len(segments)
+                result.registros = sum(entry["registros"] for entry in segments.values())
+                span.set(rows=result.registros, extracted=result.registros_extraidos, segments=result.extraidos)
+
+            result.segundos = time.perf_counter() - start
+            if result.extraidos or result.removidos:
+                logger.info(
+                    f"Pré-extração da competência {competencia}: {result.extraidos} de {result.segmentos} segmentos "
+                    f"extraídos ({result.registros_extraidos} registros), {result.removidos} removidos, "
+                    f"{result.segundos:.2f} s"
+                )
+            return result
+        except Exception as e:
+            logger.error(f"Erro ao atualizar a pré-extração da competência {competencia}: {str(e)}")
+            raise
+
+    def refresh_in_background(self, competencia: str) -> bool:
+        """
+        Atualiza a cópia em uma thread própria, com sessão própria do banco
+
+        Args:
+            competencia: Competência (AAAAMM)
+
+        Returns:
+            False se já havia uma atualização da competência em andamento neste processo
+        """
+        with self._locks_lock:
+            if competencia in self._background:
+                return False
+            self._background.add(competencia)
+
+        def run():
+            from app.database.connection import SessionLocal
+            from app.services.data_service import DataService
+
+            db = SessionLocal()
+            try:
+                self.refresh(DataService(db), competencia)
+            except Exception:
+                # O erro já foi registrado; o daemon tenta de novo no próximo horário
+                pass
+            finally:
+                db.close()
+                with self._locks_lock:
+                    self._background.discard(competencia)
+
+        threading.Thread(target=run, name=f"extraction-refresh-{competencia}", daemon=True).start()
+        return True
+
+    def _current(self, data_service: Any, competencia: str, manifest: Optional[Dict[str, Any]]) -> bool:
+        """A cópia está em dia: conferida há menos de FRESHNESS_TTL segundos ou com o token do banco"""
+        # Sem token, a cópia é de outra versão ou a extração foi interrompida
+        if manifest is None or "token" not in manifest:
+            return False
+        ttl = self.settings.freshness_ttl
+        verified = datetime.fromisoformat(manifest["verificado_em"])
+        return (
+            verified >= datetime.now() - timedelta(seconds=ttl)
+            or data_service.get_cached_freshness_token(competencia, ttl) == manifest["token"]
+        )
+
+    def read(
+        self,
+        data_service: Any,
+        competencia: str,
+        batch_size: int,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> Optional[ExtractedRecordStream]:
+        """
+        Lê os registros da cópia, se ela estiver em dia com o banco
+
+        Não extrai nada: a cópia conferida há menos de FRESHNESS_TTL segundos
+        é lida direto; senão, o token da competência inteira é comparado com o
+        do manifesto. Se a cópia estiver desatualizada, a atualização segue em
+        segundo plano e os registros devem ser lidos do banco.
+
+        Args:
+            data_service: Serviço de dados (DataService)
+            competencia: Competência (AAAAMM)
+            batch_size: Registros por lote
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
+
+        Returns:
+            Fluxo de registros da cópia; None se ela não estiver em dia
+        """
+        if not self.has(competencia):
+            return None
+        # Bloqueio antes do manifesto: os segmentos lidos dele não são removidos durante a leitura
+        readers = self._open_readers(competencia)
+        try:
+            manifest = self.manifest(competencia)
+            stale = not self._current(data_service, competencia, manifest)
+        except BaseException:
+            if readers is not None:
+                readers.close()
+            raise
+
+        if stale:
+            if readers is not None:
+                readers.close()
+            logger.info(f"Pré-extração da competência {competencia} desatualizada: leitura do banco")
+            self.refresh_in_background(competencia)
+            return None
+        return ExtractedRecordStream(
+            self.directory(competencia), manifest, batch_size, after_id_fia, after_id_lancamento, limit, readers
+        )
+
+    def open(
+        self,
+        competencia: str,
+        batch_size: int,
+        after_id_fia: Optional[int] = None,
+        after_id_lancamento: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> ExtractedRecordStream:
+        """
+        Lê os registros da cópia, sem atualizá-la
+
+        Args:
+            competencia: Competência (AAAAMM)
+            batch_size: Registros por lote
+            after_id_fia: Cursor: só registros após esta ficha
+            after_id_lancamento: Cursor: com after_id_fia, só lançamentos após este na mesma ficha
+            limit: Quantidade máxima de registros
+
+        Returns:
+            Fluxo de registros com a descrição das colunas
+
+        Raises:
+            FileNotFoundError: Competência não pré-extraída
+        """
+        readers = self._open_readers(competencia)
+        manifest = self.manifest(competencia)
+        if manifest is None:
+            if readers is not None:
+                readers.close()
+            raise FileNotFoundError(f"Competência {competencia} não pré-extraída")
+        return ExtractedRecordStream(
+            self.directory(competencia), manifest, batch_size, after_id_fia, after_id_lancamento, limit, readers
+        )
+
+    def write_report(self, competencia: str, name: str, content: Dict[str, Any]) -> Path:
+        """
+        Grava um relatório JSON junto da cópia (estatísticas, validação)
+
+        O relatório leva o token da cópia (``token``): ``report`` só o
+        devolve enquanto a cópia for a mesma e estiver em dia.
+
+        Args:
+            competencia: Competência (AAAAMM)
+            name: Nome do arquivo
+            content: Conteúdo
+
+        Returns:
+            Caminho do relatório
+        """
+        manifest = self.manifest(competencia) or {}
+        content = {**content, "token": manifest.get("token")}
+        path = self.directory(competencia) / name
+        self._write(path, json.dumps(content, ensure_ascii=False, indent=2, default=str).encode("utf-8"))
+        return path
+
+    def report(self, data_service: Any, competencia: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Relatório gravado por write_report, se a cópia de que foi calculado estiver em dia
+
+        Args:
+            data_service: Serviço de dados (DataService)
+            competencia: Competência (AAAAMM)
+            name: Nome do arquivo
+
+        Returns:
+            Conteúdo do relatório; None se não houver relatório ou se os dados mudaram
+        """
+        try:
+            with open(self.directory(competencia) / name, encoding="utf-8") as file:
+                content = json.load(file)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Relatório da pré-extração ilegível, ignorado: {competencia}/{name} ({str(e)})")
+            return None
+
+        manifest = self.manifest(competencia)
+        if manifest is None or content.get("token") != manifest.get("token"):
+            return None
+        return content if self._current(data_service, competencia, manifest) else None
+
+    def prune(self, max_age: float) -> List[str]:
+        """
+        Remove as cópias não atualizadas há mais de max_age segundos
+
+        Args:
+            max_age: Idade máxima do manifesto (segundos)
+
+        Returns:
+            Competências removidas
+        """
+        limit = time.time() - max_age
+        removed = []
+        for competencia in self.competencias():
+            directory = self.directory(competencia)
+            try:
+                if (directory / MANIFEST_FILE).stat().st_mtime >= limit:
+                    continue
+            except FileNotFoundError:
+                continue
+            with self._lock(competencia), self._no_readers(competencia) as idle:
+                if fcntl is not None and not idle:
+                    continue
+                shutil.rmtree(directory, ignore_errors=True)
+            removed.append(competencia)
+            logger.info(f"Pré-extração da competência {competencia} removida (sem atualização)")
+        return removed
+
+
+_caches: Dict[str, ExtractionCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_extraction_cache(settings: Optional[Settings] = None) -> ExtractionCache:
+    """
+    Obtém a cópia pré-extraída do diretório de exportação
+
+    Args:
+        settings: Configurações da aplicação (padrão: get_settings())
+
+    Returns:
+        ExtractionCache compartilhado pelo processo
+    """
+    settings = settings or get_settings()
+    key = f"{Path(settings.export_dir).resolve()}|{settings.extraction_segment_size}"
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ExtractionCache(settings)
+        return cache
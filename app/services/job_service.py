@@ -0,0 +1,827 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fila de exportações em segundo plano
+
+As exportações longas deixam de rodar dentro da requisição HTTP: ``POST
+/jobs`` grava o pedido em um banco SQLite local e um conjunto limitado de
+threads o executa, registrando etapa, registros processados e batimentos
+(heartbeat). Como o estado fica no SQLite, ele sobrevive a reinícios e é
+compartilhado por vários workers do uvicorn: a reserva de um job é
+atômica, e jobs cujo worker parou de bater são devolvidos à fila. Cada
+reserva é identificada pelo worker e pela tentativa: um worker lento cujo
+job foi devolvido à fila e assumido por outro não grava mais progresso
+nem resultado (JobLost) e abandona a execução.
+
+O resultado é guardado no cache de artefatos, com a mesma chave usada
+pelos endpoints ``/export/*``: um job sobre dados já exportados termina
+imediatamente, e o arquivo gerado por um job também serve as requisições
+diretas. As gerações passam pelo mesmo controle de admissão da API
+(admission.thread_admit), então uma rajada de jobs não ultrapassa as
+vagas por formato nem o orçamento de memória.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.config import Settings
+from app.models.header import HeaderBPA
+from app.services.admission import AdmissionCancelled, thread_admit
+from app.services.artifact_cache import Artifact, ArtifactCache, ArtifactKey
+from app.services.bpa_service import BPAService
+from app.services.compatibility_service import ProcedureCompatibilityService
+from app.services.data_service import DataService, freshness_row_count
+from app.services.export_service import ExportService, export_filename
+from app.services import metrics, tracing
+from modules.duplicates import MODO_REPORTAR
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Formatos aceitos
+JOB_FORMATS = ("csv", "xlsx", "parquet", "bpa")
+
+# Situações de um job
+STATUS_QUEUED = "fila"
+STATUS_RUNNING = "executando"
+STATUS_DONE = "concluido"
+STATUS_FAILED = "erro"
+STATUS_CANCELLED = "cancelado"
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+# Intervalo entre consultas à fila por worker ocioso (segundos)
+JOB_POLL_SECONDS = 1.0
+
+# Intervalo dos batimentos dos jobs em execução (segundos)
+JOB_HEARTBEAT_SECONDS = 15.0
+
+# Sem batimento por este tempo, o job volta para a fila (segundos)
+JOB_STALE_SECONDS = 90.0
+
+# Tentativas antes de o job ser dado como perdido
+JOB_MAX_ATTEMPTS = 3
+
+# Intervalo mínimo entre duas gravações de progresso (segundos)
+PROGRESS_WRITE_SECONDS = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    competencia TEXT,
+    cnes TEXT,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    rows_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    stage_started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+)
+"""
+
+
+class NoRecords(ValueError):
+    """Consulta sem registros para exportar"""
+
+
+class JobCancelled(Exception):
+    """Cancelamento pedido durante a execução de um job"""
+
+
+class JobLost(Exception):
+    """O job foi devolvido à fila e reservado de novo: esta execução não vale mais"""
+
+
+class IncompatibleRecords(ValueError):
+    """Registros incompatíveis com as regras de procedimento, com o relatório"""
+
+    def __init__(self, report: Any):
+        """
+        Args:
+            report: Relatório de compatibilidade (CompatibilityReport)
+        """
+        super().__init__(f"{report.rejeitados} registros incompatíveis com as regras de procedimento")
+        self.report = report
+
+    @property
+    def details(self) -> Dict[str, Any]:
+        """Detalhes para o resultado do job ou do item do lote"""
+        return {"compatibilidade": self.report.to_dict()}
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    """Data/hora ISO de um timestamp (ou None)"""
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp else None
+
+
+class JobStore:
+    """
+    Estado dos jobs em SQLite
+    """
+
+    def __init__(self, path: Path):
+        """
+        Abre (ou cria) o banco de jobs
+
+        Args:
+            path: Caminho do arquivo SQLite
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "JobStore":
+        """Banco de jobs configurado (JOBS_DB, padrão: <export_dir>/jobs.sqlite3)"""
+        return cls(settings.jobs_db or settings.export_dir / "jobs.sqlite3")
+
+    @contextmanager
+    def _connect(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Abre uma conexão; immediate reserva a escrita desde o início da transação"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def create(self, format: str, competencia: Optional[str], cnes: Optional[str], options: Dict[str, Any]) -> str:
+        """
+        Enfileira um job
+
+        Args:
+            format: Formato da exportação
+            competencia: Competência no formato AAAAMM
+            cnes: CNES do estabelecimento (BPA-I)
+            options: Demais opções da exportação
+
+        Returns:
+            Identificador do job
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, format, competencia, cnes, options, status, stage, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, format, competencia, cnes, json.dumps(options, ensure_ascii=False),
+                 STATUS_QUEUED, STATUS_QUEUED, time.time())
+            )
+        logger.info(f"Job {job_id} enfileirado: {format} {competencia or 'todas'}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém um job
+
+        Args:
+            job_id: Identificador do job
+
+        Returns:
+            Dados do job ou None
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Lista os jobs mais recentes
+
+        Args:
+            limit: Quantidade máxima
+
+        Returns:
+            Jobs, do mais recente para o mais antigo
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Reserva o job mais antigo da fila
+
+        Args:
+            worker: Identificação do worker
+
+        Returns:
+            Job reservado ou None se a fila estiver vazia
+        """
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, "
+                "heartbeat_at = ?, stage_started_at = ?, rows_done = 0 WHERE id = ?",
+                (STATUS_RUNNING, worker, now, now, now, row["id"])
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        return dict(job)
+
+    @staticmethod
+    def _lease(job_id: str, worker: Optional[str], attempt: Optional[int]):
+        """Condição das gravações de uma execução: o job ainda é da reserva (worker, tentativa)"""
+        if worker is None:
+            return "id = ?", (job_id,)
+        return "id = ? AND worker = ? AND attempts = ? AND status = ?", (job_id, worker, attempt, STATUS_RUNNING)
+
+    def set_stage(
+        self,
+        job_id: str,
+        stage: str,
+        rows_total: Optional[int] = None,
+        worker: Optional[str] = None,
+        attempt: Optional[int] = None
+    ) -> None:
+        """
+        Inicia uma etapa do job, zerando o progresso da etapa
+
+        Raises:
+            JobLost: O job não é mais da reserva (worker, tentativa)
+        """
+        now = time.time()
+        condition, params = self._lease(job_id, worker, attempt)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET stage = ?, rows_done = 0, rows_total = COALESCE(?, rows_total), "
+                f"stage_started_at = ?, heartbeat_at = ? WHERE {condition}",
+                (stage, rows_total, now, now, *params)
+            )
+        if cursor.rowcount == 0:
+            raise JobLost(f"Job {job_id} reservado por outro worker")
+
+    def set_progress(
+        self,
+        job_id: str,
+        rows_done: int,
+        worker: Optional[str] = None,
+        attempt: Optional[int] = None
+    ) -> bool:
+        """
+        Registra o progresso da etapa atual
+
+        Args:
+            job_id: Identificador do job
+            rows_done: Registros processados na etapa
+            worker: Worker da reserva (None: não confere a reserva)
+            attempt: Tentativa da reserva
+
+        Returns:
+            True se o cancelamento foi pedido
+
+        Raises:
+            JobLost: O job não é mais da reserva (worker, tentativa)
+        """
+        condition, params = self._lease(job_id, worker, attempt)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET rows_done = ?, heartbeat_at = ? WHERE {condition}",
+                (rows_done, time.time(), *params)
+            )
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if cursor.rowcount == 0:
+            raise JobLost(f"Job {job_id} reservado por outro worker")
+        return bool(row and row["cancel_requested"])
+
+    def heartbeat(self, leases: List[Tuple[str, str, int]]) -> None:
+        """Renova o batimento dos jobs em execução (id, worker, tentativa)"""
+        if not leases:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND attempts = ? AND status = ?",
+                [(time.time(), job_id, worker, attempt, STATUS_RUNNING) for job_id, worker, attempt in leases]
+            )
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        error: Optional[str] = None,
+        result: Optional[Dict[str, Any]] = None,
+        worker: Optional[str] = None,
+        attempt: Optional[int] = None
+    ) -> bool:
+        """
+        Encerra um job
+
+        Args:
+            job_id: Identificador do job
+            status: Situação final
+            error: Mensagem de erro
+            result: Resultado (arquivo, metadados)
+            worker: Worker da reserva (None: não confere a reserva)
+            attempt: Tentativa da reserva
+
+        Returns:
+            False se o job não é mais da reserva (nada é gravado)
+        """
+        condition, params = self._lease(job_id, worker, attempt)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, error = ?, result = ?, finished_at = ?, "
+                f"rows_done = CASE WHEN ? = ? THEN COALESCE(rows_total, rows_done) ELSE rows_done END WHERE {condition}",
+                (status, status, error,
+                 json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 time.time(), status, STATUS_DONE, *params)
+            )
+        return cursor.rowcount > 0
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancela um job: na fila, sai imediatamente; em execução, para no próximo lote
+
+        Args:
+            job_id: Identificador do job
+
+        Returns:
+            Situação do job após o pedido ou None se não existir
+        """
+        with self._connect(immediate=True) as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == STATUS_QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (STATUS_CANCELLED, STATUS_CANCELLED, time.time(), job_id)
+                )
+                return STATUS_CANCELLED
+            if row["status"] == STATUS_RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+
+    def requeue_stale(self, max_age: float = JOB_STALE_SECONDS) -> int:
+        """
+        Devolve à fila os jobs cujo worker parou de bater (processo encerrado)
+
+        Args:
+            max_age: Idade máxima do último batimento, em segundos
+
+        Returns:
+            Quantidade de jobs devolvidos à fila (ou encerrados por excesso de tentativas)
+        """
+        limit = time.time() - max_age
+        with self._connect(immediate=True) as conn:
+            rows = conn.execute(
+                "SELECT id, attempts, cancel_requested FROM jobs WHERE status = ? AND heartbeat_at < ?",
+                (STATUS_RUNNING, limit)
+            ).fetchall()
+            for row in rows:
+                if row["cancel_requested"]:
+                    status, error = STATUS_CANCELLED, None
+                elif row["attempts"] >= JOB_MAX_ATTEMPTS:
+                    status, error = STATUS_FAILED, "Worker interrompido repetidas vezes"
+                else:
+                    status, error = STATUS_QUEUED, None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = ?, error = ?, worker = NULL, "
+                    "finished_at = CASE WHEN ? = ? THEN NULL ELSE ? END WHERE id = ?",
+                    (status, status, error, status, STATUS_QUEUED, time.time(), row["id"])
+                )
+                logger.warning(f"Job {row['id']} sem batimento do worker: {status}")
+        return len(rows)
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Representação pública de um job, com percentual e estimativa de término
+
+    A estimativa usa a taxa de registros da etapa atual.
+
+    Args:
+        job: Dados do job (JobStore.get)
+
+    Returns:
+        Dicionário para a resposta da API
+    """
+    rows_done = job["rows_done"] or 0
+    rows_total = job["rows_total"]
+    percent = None
+    eta = None
+    if rows_total:
+        percent = round(min(rows_done / rows_total, 1.0) * 100, 1)
+        elapsed = time.time() - (job["stage_started_at"] or time.time())
+        if job["status"] == STATUS_RUNNING and rows_done and elapsed > 0:
+            eta = round(max(rows_total - rows_done, 0) / (rows_done / elapsed), 1)
+
+    return {
+        "id": job["id"],
+        "formato": job["format"],
+        "competencia": job["competencia"],
+        "cnes": job["cnes"],
+        "opcoes": json.loads(job["options"]),
+        "status": job["status"],
+        "etapa": job["stage"],
+        "registros_processados": rows_done,
+        "registros_total": rows_total,
+        "percentual": percent,
+        "eta_segundos": eta,
+        "tentativas": job["attempts"],
+        "criado_em": _iso(job["created_at"]),
+        "iniciado_em": _iso(job["started_at"]),
+        "concluido_em": _iso(job["finished_at"]),
+        "erro": job["error"],
+        "resultado": json.loads(job["result"]) if job["result"] else None,
+    }
+
+
+class JobProgress:
+    """
+    Callback de progresso de um job: grava no máximo uma vez por segundo e
+    interrompe a execução quando o cancelamento é pedido ou quando o job
+    foi reservado por outro worker (JobLost)
+    """
+
+    def __init__(self, store: JobStore, job_id: str, worker: Optional[str] = None, attempt: Optional[int] = None):
+        self.store = store
+        self.job_id = job_id
+        self.worker = worker
+        self.attempt = attempt
+        self._last = 0.0
+
+    def stage(self, stage: str, rows_total: Optional[int] = None) -> None:
+        """Inicia uma etapa"""
+        self.store.set_stage(self.job_id, stage, rows_total, self.worker, self.attempt)
+        self._last = time.monotonic()
+        logger.info(f"Job {self.job_id}: etapa {stage}")
+
+    def __call__(self, rows_done: int) -> None:
+        now = time.monotonic()
+        if now - self._last < PROGRESS_WRITE_SECONDS:
+            return
+        self._last = now
+        if self.store.set_progress(self.job_id, rows_done, self.worker, self.attempt):
+            raise JobCancelled(f"Job {self.job_id} cancelado")
+
+    def cancelled(self) -> bool:
+        """Indica se o job foi cancelado ou reservado por outro worker (consultado na espera por vaga)"""
+        job = self.store.get(self.job_id)
+        if job is None or job["cancel_requested"]:
+            return True
+        return self.worker is not None and (job["worker"], job["attempts"]) != (self.worker, self.attempt)
+
+
+def artifact_result(artifact: Artifact) -> Dict[str, Any]:
+    """
+    Resultado de uma exportação concluída
+
+    Args:
+        artifact: Artefato gerado ou obtido do cache
+
+    Returns:
+        Arquivo, chave, tamanho, hash, origem (cache) e metadados da geração
+    """
+    return {
+        "arquivo": artifact.filename,
+        "chave": artifact.key,
+        "tamanho": artifact.size,
+        "sha256": artifact.sha256,
+        "cache": artifact.cached,
+        **artifact.metadata,
+    }
+
+
+class JobRunner:
+    """
+    Executa um job de exportação, gravando o resultado no cache de artefatos
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: Callable[[], Any],
+        loop: Optional[asyncio.AbstractEventLoop] = None
+    ):
+        """
+        Inicializa o executor
+
+        Args:
+            settings: Configurações da aplicação
+            session_factory: Fábrica de sessões do banco (SessionLocal)
+            loop: Laço de eventos da API, para o controle de admissão dos jobs
+                (None: jobs sem admissão, ex.: fora da API)
+        """
+        self.settings = settings
+        self.session_factory = session_factory
+        self.loop = loop
+
+    def _read(self, data_service: DataService, competencia: Optional[str], progress: JobProgress) -> List[Dict[str, Any]]:
+        """Lê os registros em lotes, informando o progresso"""
+        records: List[Dict[str, Any]] = []
+        for batch in data_service.stream_records(competencia):
+            records.extend(batch)
+            progress(len(records))
+        return records
+
+    def run(self, job: Dict[str, Any], store: JobStore) -> None:
+        """
+        Executa o job e registra a situação final
+
+        Args:
+            job: Job reservado (JobStore.claim)
+            store: Banco de jobs
+        """
+        job_id = job["id"]
+        lease = dict(worker=job["worker"], attempt=job["attempts"])
+        progress = JobProgress(store, job_id, **lease)
+        db = self.session_factory()
+        try:
+            with metrics.export_format(job["format"]), \
+                    tracing.span("job", job=job_id, format=job["format"], competencia=job["competencia"]):
+                result = self._execute(job, db, progress)
+            if store.finish(job_id, STATUS_DONE, result=result, **lease):
+                logger.info(f"Job {job_id} concluído: {result['arquivo']}")
+            else:
+                logger.warning(f"Job {job_id} reservado por outro worker; resultado desta execução descartado")
+        except JobLost as e:
+            logger.warning(f"{str(e)}; execução abandonada")
+        except (JobCancelled, AdmissionCancelled):
+            store.finish(job_id, STATUS_CANCELLED, **lease)
+            logger.info(f"Job {job_id} cancelado")
+        except Exception as e:
+            logger.error(f"Erro ao executar o job {job_id}: {str(e)}")
+            details = e.details if isinstance(e, IncompatibleRecords) else None
+            store.finish(job_id, STATUS_FAILED, error=str(e), result=details, **lease)
+        finally:
+            db.close()
+
+    def _execute(self, job: Dict[str, Any], db: Any, progress: JobProgress) -> Dict[str, Any]:
+        """Executa as etapas do job e retorna o resultado"""
+        # Aguarda vaga como as requisições da API, desistindo se o job for cancelado
+        admit = thread_admit(self.loop, progress.cancelled) if self.loop is not None else None
+        artifact = self.export(
+            job["format"], job["competencia"], job["cnes"], json.loads(job["options"]), db, progress, admit=admit
+        )
+        return artifact_result(artifact)
+
+    def export(
+        self,
+        format: str,
+        competencia: Optional[str],
+        cnes: Optional[str],
+        options: Dict[str, Any],
+        db: Any,
+        progress: Any,
+        cache: Optional[ArtifactCache] = None,
+        admit: Optional[Callable[[str, int, bool], Callable[[], None]]] = None
+    ) -> Artifact:
+        """
+        Obtém do cache ou gera o artefato de um formato e competência
+
+        Args:
+            format: Formato (csv, xlsx, parquet ou bpa)
+            competencia: Competência no formato AAAAMM (opcional, exceto BPA-I)
+            cnes: CNES do estabelecimento (BPA-I)
+            options: Opções do BPA-I (orgao_emissor, duplicidades, ignorar_incompatibilidades)
+            db: Sessão do banco
+            progress: Etapas e registros processados (stage e chamada com o total)
+            cache: Cache de artefatos (padrão: um novo, no diretório configurado)
+            admit: Reserva vaga para a geração (formato, registros, em lotes) e
+                retorna a função que a devolve; não é chamada para artefatos em cache
+
+        Returns:
+            Artefato gerado ou obtido do cache
+
+        Raises:
+            NoRecords: Nenhum registro na competência
+        """
+        data_service = DataService(db)
+        export_service = ExportService(self.settings)
+        cache = cache or ArtifactCache(self.settings)
+
+        progress.stage("consulta")
+        freshness = data_service.get_cached_freshness_token(competencia, self.settings.freshness_ttl)
+        rows_total = freshness_row_count(freshness)
+        if rows_total == 0:
+            raise NoRecords("Nenhum registro encontrado para exportação")
+
+        header = None
+        if format == "bpa":
+            header = HeaderBPA.from_competencia(
+                cnes=cnes,
+                competencia=competencia,
+                orgao_emissor=options["orgao_emissor"]
+            )
+            # As regras de compatibilidade também mudam o BPA-I
+            freshness += "-" + data_service.get_cached_token(
+                ("regras", header.competencia),
+                lambda: ProcedureCompatibilityService.rules_token(db, header.competencia),
+                self.settings.freshness_ttl
+            )
+            key = cache.make_key(
+                "bpa",
+                header.competencia,
+                freshness,
+                cnes=header.cnes,
+                orgao_emissor=header.orgao_emissor,
+                duplicidades=options.get("duplicidades", MODO_REPORTAR),
+                ignorar_incompatibilidades=options.get("ignorar_incompatibilidades", False)
+            )
+        else:
+            key = cache.make_key(format, competencia, freshness)
+
+        artifact = cache.lookup(key)
+        if artifact is not None:
+            return artifact
+
+        release = admit(format, rows_total, format == "parquet") if admit else None
+        try:
+            if format == "parquet":
+                progress.stage("gravacao", rows_total)
+                return cache.store(
+                    key,
+                    export_filename("parquet"),
+                    lambda path: export_service.export_to_parquet(data_service.stream_records(competencia), path, progress)
+                )
+            if format in ("csv", "xlsx"):
+                progress.stage("leitura", rows_total)
+                records = self._read(data_service, competencia, progress)
+                progress.stage("gravacao", len(records))
+                export = export_service.export_to_csv if format == "csv" else export_service.export_to_xlsx
+                return cache.store(key, export_filename(format), lambda path: export(records, path, progress))
+            return self._build_bpa(options, header, key, cache, db, data_service, progress, rows_total)
+        finally:
+            if release is not None:
+                release()
+
+    def _build_bpa(
+        self,
+        options: Dict[str, Any],
+        header: HeaderBPA,
+        key: ArtifactKey,
+        cache: ArtifactCache,
+        db: Any,
+        data_service: DataService,
+        progress: Any,
+        rows_total: int
+    ) -> Artifact:
+        """
+        Lê, valida e gera o BPA-I, gravando-o no cache de artefatos
+
+        Com a validação do daemon em dia (DataService.get_prewarmed_validation),
+        os registros não são verificados de novo.
+
+        Args:
+            options: Opções do BPA-I (orgao_emissor, duplicidades, ignorar_incompatibilidades)
+            header: Cabeçalho do arquivo (CNES, competência, órgão emissor)
+            key: Chave do artefato no cache
+            cache: Cache de artefatos
+            db: Sessão do banco (regras de compatibilidade)
+            data_service: Serviço de dados da sessão
+            progress: Etapas e registros processados (stage e chamada com o total)
+            rows_total: Quantidade estimada de registros (token de atualização)
+
+        Returns:
+            Artefato gerado
+
+        Raises:
+            IncompatibleRecords: Lançamentos incompatíveis com as regras, sem ignorar_incompatibilidades
+        """
+        bpa_service = BPAService(self.settings)
+        ignore_incompatible = options.get("ignorar_incompatibilidades", False)
+
+        # Validação do daemon em dia: incompatibilidades recusadas antes da leitura
+        prewarmed = data_service.get_prewarmed_validation(header.competencia)
+        if prewarmed is not None and prewarmed[0].rejeitados and not ignore_incompatible:
+            raise IncompatibleRecords(prewarmed[0])
+
+        progress.stage("leitura", rows_total)
+        records = self._read(data_service, header.competencia, progress)
+
+        duplicates = None
+        if prewarmed is not None:
+            duplicates = prewarmed[1]
+        else:
+            # Verifica sexo, faixa etária e CBO contra as regras dos procedimentos
+            progress.stage("validacao", len(records))
+            compatibility = ProcedureCompatibilityService.from_database(db, header.competencia)
+            report = compatibility.check_records(records)
+            if report.rejeitados and not ignore_incompatible:
+                raise IncompatibleRecords(report)
+
+        progress.stage("gravacao", len(records))
+        return cache.store(
+            key,
+            bpa_service.filename_for(header),
+            lambda path: bpa_service.generate_bpa(
+                records, header, options.get("duplicidades", MODO_REPORTAR), path, progress, duplicates
+            ),
+            metadata=lambda: {"duplicados": bpa_service.duplicate_report.duplicados}
+        )
+
+
+class JobWorkerPool:
+    """
+    Conjunto limitado de threads que executam os jobs da fila
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: Callable[[], Any],
+        workers: Optional[int] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None
+    ):
+        """
+        Inicializa o conjunto
+
+        Args:
+            settings: Configurações da aplicação
+            session_factory: Fábrica de sessões do banco (SessionLocal)
+            workers: Quantidade de threads (padrão: JOB_WORKERS)
+            loop: Laço de eventos da API, para o controle de admissão dos jobs
+        """
+        self.store = JobStore.from_settings(settings)
+        self.runner = JobRunner(settings, session_factory, loop)
+        self.workers = settings.job_workers if workers is None else workers
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Inicia as threads de execução e a de batimentos"""
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{self.name}:{index}",), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Fila de jobs iniciada com {self.workers} worker(s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Sinaliza a parada; jobs interrompidos voltam à fila por falta de batimento"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def running(self) -> int:
+        """Quantidade de jobs em execução nesta instância"""
+        with self._lock:
+            return len(self._running)
+
+    def _work(self, worker: str) -> None:
+        """Laço de uma thread: reserva e executa jobs"""
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(worker)
+            except Exception as e:
+                logger.error(f"Erro ao consultar a fila de jobs: {str(e)}")
+                job = None
+            if job is None:
+                self._stop.wait(JOB_POLL_SECONDS)
+                continue
+
+            with self._lock:
+                self._running[job["id"]] = (worker, job["attempts"])
+            try:
+                self.runner.run(job, self.store)
+            finally:
+                with self._lock:
+                    self._running.pop(job["id"], None)
+
+    def _beat(self) -> None:
+        """Renova os batimentos dos jobs desta instância e recupera jobs abandonados"""
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with self._lock:
+                    running = [(job_id, *lease) for job_id, lease in self._running.items()]
+                self.store.heartbeat(running)
+                self.store.requeue_stale()
+            except Exception as e:
+                logger.error(f"Erro ao renovar batimentos dos jobs: {str(e)}")
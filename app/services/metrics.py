@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Métricas da aplicação no formato de exposição do Prometheus
+
+Registro próprio e mínimo (contadores, medidores e histogramas com
+rótulos), sem dependência externa. As medições são feitas por chamada de
+serviço, por lote ou por descarga do buffer de arquivo, nunca por
+registro, para que o custo fique bem abaixo de 1% da exportação.
+
+Etapas medidas (histograma ``bpa_export_stage_seconds``):
+
+- ``query``: execução da consulta até o primeiro resultado (DataService)
+- ``fetch``: leitura das linhas e montagem dos dicionários (DataService)
+- ``format``: conversão dos registros para o formato de saída
+  (ExportService, BPAService), descontados leitura e gravação
+- ``write``: gravação no disco, medida nas descargas do buffer do arquivo
+
+O formato da exportação em andamento é propagado por uma variável de
+contexto, para que as etapas do DataService saiam com o rótulo certo.
+"""
+
+import io
+import math
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.services import tracing
+
+# Limites dos histogramas de duração (segundos)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Tipo de conteúdo do formato de exposição
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Buffer dos arquivos de saída (cada descarga é uma escrita medida)
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Rótulo de formato fora de uma exportação
+NO_FORMAT = "none"
+
+_export_format: contextvars.ContextVar[str] = contextvars.ContextVar("export_format", default=NO_FORMAT)
+_export_timer: contextvars.ContextVar[Optional["ExportTimer"]] = contextvars.ContextVar("export_timer", default=None)
+
+
+def _escape(value: Any) -> str:
+    """Escapa o valor de um rótulo"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    """Texto dos rótulos de uma amostra"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    """Valor numérico no formato de exposição"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base das métricas: nome, ajuda, rótulos e valores por combinação de rótulos"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> Dict[Tuple[str, ...], Any]:
+        """Cópia dos valores atuais"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Medidor (valor que sobe e desce)"""
+
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Histograma cumulativo com limites fixos"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas expostas em /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, collected: Iterable[_Metric] = ()) -> str:
+        """
+        Texto no formato de exposição do Prometheus
+
+        Args:
+            collected: Métricas calculadas no momento da coleta (pool, filas)
+
+        Returns:
+            Texto das métricas
+        """
+        lines: List[str] = []
+        for metric in [*self._metrics, *collected]:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bpa_export_stage_seconds", "Duração das etapas da exportação (query, fetch, format, write)", ("format", "stage")
+))
+ROWS = REGISTRY.register(Counter(
+    "bpa_export_rows_total", "Registros processados por etapa", ("format", "stage")
+))
+BYTES_WRITTEN = REGISTRY.register(Counter(
+    "bpa_export_bytes_written_total", "Bytes gravados ou enviados pelas exportações", ("format",)
+))
+ROWS_PER_SECOND = REGISTRY.register(Gauge(
+    "bpa_export_rows_per_second", "Vazão da última exportação (formatação e gravação)", ("format",)
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "bpa_artifact_cache_lookups_total", "Consultas ao cache de artefatos", ("format", "result")
+))
+
+
+def current_format() -> str:
+    """Formato da exportação em andamento (ou 'none')"""
+    return _export_format.get()
+
+
+@contextmanager
+def export_format(format: str) -> Iterator[None]:
+    """
+    Rotula as medições feitas dentro do bloco com o formato da exportação
+
+    Args:
+        format: Formato da exportação
+    """
+    token = _export_format.set(format)
+    try:
+        yield
+    finally:
+        _export_format.reset(token)
+
+
+def observe_stage(stage: str, seconds: float, rows: Optional[int] = None, format: Optional[str] = None) -> None:
+    """
+    Registra a duração de uma etapa
+
+    A leitura feita durante uma formatação (fluxo de lotes do Parquet) é
+    descontada do tempo de formatação.
+
+    Args:
+        stage: Etapa (query, fetch, format, write)
+        seconds: Duração em segundos
+        rows: Registros processados na etapa
+        format: Formato (padrão: o da exportação em andamento)
+    """
+    format = format or _export_format.get()
+    STAGE_SECONDS.observe(seconds, format, stage)
+    if rows:
+        ROWS.inc(rows, format, stage)
+    if stage in ("query", "fetch"):
+        timer = _export_timer.get()
+        if timer is not None:
+            timer.nested_seconds += seconds
+
+
+def record_cache_lookup(format: str, hit: bool) -> None:
+    """Registra uma consulta ao cache de artefatos"""
+    CACHE_LOOKUPS.inc(1, format, "hit" if hit else "miss")
+
+
+def record_bytes(format: str, size: int) -> None:
+    """Registra bytes gravados ou enviados"""
+    if size:
+        BYTES_WRITTEN.inc(size, format)
+
+
+class _TimedFileIO(io.FileIO):
+    """Arquivo sem buffer que mede o tempo de cada escrita (descargas do buffer acima dele)"""
+
+    def __init__(self, path: Any, timer: "ExportTimer", mode: str = "w"):
+        super().__init__(path, mode)
+        self._timer = timer
+
+    def write(self, data) -> int:
+        start = time.perf_counter()
+        with tracing.span("file.write", bytes=len(data)):
+            written = super().write(data)
+        self._timer.write_seconds += time.perf_counter() - start
+        self._timer.bytes_written += written or 0
+        return written
+
+
+class ExportTimer:
+    """
+    Mede formatação e gravação de uma exportação
+
+    A gravação é o tempo das escritas nos arquivos abertos com open(); a
+    formatação é o restante do bloco, descontadas as leituras do banco
+    feitas dentro dele.
+    """
+
+    def __init__(self, format: str):
+        self.format = format
+        self.rows = 0
+        self.write_seconds = 0.0
+        self.nested_seconds = 0.0
+        self.bytes_written = 0
+        self._start = 0.0
+        self._token = None
+        self._span = None
+
+    def open(self, path: Any, mode: str = "w", buffering: int = -1, encoding: Optional[str] = None, newline: Optional[str] = None):
+        """
+        Abre um arquivo de saída com a gravação medida (modos "w", "wb" e "ab")
+
+        Args:
+            path: Caminho do arquivo
+            mode: "w" (texto), "wb" (binário) ou "ab" (binário, acrescentando ao final)
+            buffering: Tamanho do buffer (WRITE_BUFFER_SIZE se <= 0)
+            encoding: Codificação (modo texto)
+            newline: Tradução de fim de linha (modo texto, como em open())
+
+        Returns:
+            Arquivo aberto
+        """
+        buffered = io.BufferedWriter(_TimedFileIO(path, self, "a" if "a" in mode else "w"), buffering if buffering > 0 else WRITE_BUFFER_SIZE)
+        if "b" in mode:
+            return buffered
+        return io.TextIOWrapper(buffered, encoding=encoding, newline=newline)
+
+    def __enter__(self) -> "ExportTimer":
+        self._token = _export_timer.set(self)
+        self._span = tracing.span("export.file", format=self.format)
+        self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        elapsed = time.perf_counter() - self._start
+        self._span.set(rows=self.rows, bytes=self.bytes_written, write_seconds=round(self.write_seconds, 6))
+        self._span.__exit__(exc_type, exc, traceback)
+        _export_timer.reset(self._token)
+        if exc_type is not None:
+            return
+
+        format_seconds = max(elapsed - self.write_seconds - self.nested_seconds, 0.0)
+        observe_stage("format", format_seconds, self.rows, self.format)
+        observe_stage("write", self.write_seconds, self.rows, self.format)
+        record_bytes(self.format, self.bytes_written)
+        if self.rows and format_seconds + self.write_seconds > 0:
+            ROWS_PER_SECOND.set(self.rows / (format_seconds + self.write_seconds), self.format)
+
+
+def collected(
+    kind: type,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str],
+    samples: Iterable[Tuple[Sequence[Any], float]]
+) -> _Metric:
+    """
+    Contador ou medidor calculado no momento da coleta (pool, filas, jobs)
+
+    Args:
+        kind: Counter ou Gauge
+        name: Nome da métrica
+        documentation: Descrição
+        labelnames: Nomes dos rótulos
+        samples: Pares (valores dos rótulos, valor)
+
+    Returns:
+        Métrica preenchida (fora do registro)
+    """
+    metric = kind(name, documentation, labelnames)
+    for labels, value in samples:
+        metric._values[tuple(str(label) for label in labels)] = value
+    return metric
+
+
+def cache_hit_ratios() -> List[Tuple[Tuple[str], float]]:
+    """Proporção de acertos do cache de artefatos por formato"""
+    totals: Dict[str, List[float]] = {}
+    for (format, result), count in CACHE_LOOKUPS.samples().items():
+        totals.setdefault(format, [0, 0])[0 if result == "hit" else 1] += count
+    return [((format,), hits / (hits + misses)) for format, (hits, misses) in sorted(totals.items()) if hits + misses]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serialização de registros em NDJSON (um objeto JSON por linha)
+
+Usa o orjson, que serializa direto para bytes e entende datas e horas
+nativamente (ISO 8601). Decimais (``numeric`` do banco) saem como
+números: inteiros quando não têm parte fracionária.
+"""
+
+import logging
+from decimal import Decimal
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Sequence
+
+import orjson
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Campos sempre incluídos em uma projeção: formam o cursor da próxima página
+CURSOR_FIELDS = ("numero", "id_lancamento")
+
+_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """Converte os tipos que o orjson não serializa nativamente"""
+    if isinstance(value, Decimal):
+        if value.is_finite() and value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def projection(fields: Sequence[str], available: Sequence[str]) -> List[str]:
+    """
+    Valida uma projeção de campos e acrescenta os campos do cursor
+
+    Args:
+        fields: Campos pedidos, na ordem de saída
+        available: Colunas da consulta
+
+    Returns:
+        Campos da projeção (os do cursor ao final, se não pedidos)
+
+    Raises:
+        ValueError: Campo inexistente na consulta
+    """
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError(f"Campos inexistentes: {', '.join(unknown)}")
+    selected = list(dict.fromkeys(fields))
+    return selected + [f for f in CURSOR_FIELDS if f in available and f not in selected]
+
+
+def encode_batch(batch: List[Dict[str, Any]], fields: Optional[List[str]] = None) -> bytes:
+    """
+    Serializa um lote de registros em NDJSON
+
+    Args:
+        batch: Registros do lote
+        fields: Campos a incluir (None = todos)
+
+    Returns:
+        Linhas JSON terminadas por '\\n'
+    """
+    dumps = orjson.dumps
+    if not fields:
+        return b"".join([dumps(record, default=_default, option=_OPTIONS) for record in batch])
+
+    if len(fields) == 1:
+        field = fields[0]
+        return b"".join([dumps({field: record.get(field)}, default=_default, option=_OPTIONS) for record in batch])
+
+    getter = itemgetter(*fields)
+    return b"".join([
+        dumps(dict(zip(fields, getter(record))), default=_default, option=_OPTIONS)
+        for record in batch
+    ])
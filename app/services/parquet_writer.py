@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Exportação para Parquet (Apache Arrow)
+
+O esquema é derivado dos tipos das colunas da consulta (OIDs do
+PostgreSQL em ``cursor.description``), de modo que datas, números e
+quantidades chegam tipados ao consumidor. Os lotes do fluxo de registros
+são acumulados até formar um grupo de linhas (row group), gravado com
+codificação de dicionário e compressão.
+"""
+
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.services import tracing
+from app.services.data_service import ColumnDescription
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Linhas por row group
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# Compressão das páginas
+PARQUET_COMPRESSION = "zstd"
+
+# Maior precisão do decimal128
+_DECIMAL_MAX_PRECISION = 38
+
+# Tipos do PostgreSQL (OID) -> tipos Arrow
+PG_ARROW_TYPES: Dict[int, pa.DataType] = {
+    16: pa.bool_(),                      # bool
+    20: pa.int64(),                      # int8
+    21: pa.int16(),                      # int2
+    23: pa.int32(),                      # int4
+    26: pa.int64(),                      # oid
+    700: pa.float32(),                   # float4
+    701: pa.float64(),                   # float8
+    1082: pa.date32(),                   # date
+    1083: pa.time64("us"),               # time
+    1114: pa.timestamp("us"),            # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+    18: pa.string(),                     # char
+    19: pa.string(),                     # name
+    25: pa.string(),                     # text
+    705: pa.string(),                    # unknown (literais)
+    1042: pa.string(),                   # bpchar
+    1043: pa.string(),                   # varchar
+}
+
+# OID do numeric
+PG_NUMERIC = 1700
+
+# Tipos Python -> tipos Arrow, quando o banco não informa o tipo da coluna
+PYTHON_ARROW_TYPES: Dict[type, pa.DataType] = {
+    bool: pa.bool_(),
+    int: pa.int64(),
+    float: pa.float64(),
+    Decimal: pa.float64(),
+    date: pa.date32(),
+    datetime: pa.timestamp("us"),
+    time: pa.time64("us"),
+    str: pa.string(),
+}
+
+
+def arrow_type(column: ColumnDescription, sample: Iterable[Any] = ()) -> pa.DataType:
+    """
+    Tipo Arrow de uma coluna
+
+    Args:
+        column: Descrição da coluna da consulta
+        sample: Valores de amostra, usados quando o tipo do banco é desconhecido
+
+    Returns:
+        Tipo Arrow da coluna
+    """
+    if column.type_code == PG_NUMERIC:
+        # numeric(p, s) vira decimal exato; numeric sem precisão vira float64
+        if column.precision and 0 < column.precision <= _DECIMAL_MAX_PRECISION and column.scale is not None:
+            return pa.decimal128(column.precision, column.scale)
+        return pa.float64()
+
+    if column.type_code in PG_ARROW_TYPES:
+        return PG_ARROW_TYPES[column.type_code]
+
+    types = {type(v) for v in sample if v is not None}
+    if len(types) == 1:
+        return PYTHON_ARROW_TYPES.get(types.pop(), pa.string())
+    if types and types <= {int, float, Decimal}:
+        return pa.float64()
+    return pa.string()
+
+
+def arrow_schema(columns: List[ColumnDescription], sample: Optional[List[Dict[str, Any]]] = None) -> pa.Schema:
+    """
+    Esquema Arrow a partir das colunas da consulta
+
+    Args:
+        columns: Descrição das colunas
+        sample: Lote de registros de amostra (para colunas sem tipo informado)
+
+    Returns:
+        Esquema Arrow
+    """
+    sample = sample or []
+    return pa.schema([
+        pa.field(c.name, arrow_type(c, (r.get(c.name) for r in sample)))
+        for c in columns
+    ])
+
+
+def _to_array(values: List[Any], data_type: pa.DataType) -> pa.Array:
+    """Converte os valores de uma coluna em um array Arrow do tipo informado"""
+    if pa.types.is_floating(data_type):
+        values = [None if v is None else float(v) for v in values]
+    try:
+        return pa.array(values, type=data_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not pa.types.is_string(data_type):
+            raise
+        return pa.array([None if v is None else str(v) for v in values], type=data_type)
+
+
+class ParquetExporter:
+    """
+    Gravação de lotes de registros em Parquet, em row groups
+    """
+
+    def __init__(
+        self,
+        sink: Any,
+        schema: pa.Schema,
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = PARQUET_COMPRESSION
+    ):
+        """
+        Abre o arquivo Parquet
+
+        Args:
+            sink: Caminho ou arquivo binário de saída
+            schema: Esquema Arrow
+            row_group_size: Linhas por row group
+            compression: Compressão (zstd, snappy, gzip, ...)
+        """
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self.row_groups = 0
+        self._getter = itemgetter(*schema.names) if len(schema.names) > 1 else None
+        self._pending: List[pa.RecordBatch] = []
+        self._pending_rows = 0
+        self._writer = pq.ParquetWriter(
+            sink,
+            schema,
+            compression=compression,
+            use_dictionary=True,
+            write_statistics=True
+        )
+
+    def __enter__(self) -> "ParquetExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _record_batch(self, batch: List[Dict[str, Any]]) -> pa.RecordBatch:
+        """Converte um lote de registros em RecordBatch, coluna a coluna"""
+        if self._getter is None:
+            columns = [[r.get(self.schema.names[0]) for r in batch]]
+        else:
+            columns = zip(*map(self._getter, batch))
+        arrays = [_to_array(list(values), field.type) for values, field in zip(columns, self.schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _flush(self) -> None:
+        """Grava os lotes pendentes como um row group"""
+        if not self._pending:
+            return
+        table = pa.Table.from_batches(self._pending, schema=self.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.row_groups += 1
+        self._pending = []
+        self._pending_rows = 0
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        Acrescenta um lote de registros
+
+        Args:
+            batch: Registros do lote
+        """
+        if not batch:
+            return
+        with tracing.span("format.batch", rows=len(batch)):
+            self._pending.append(self._record_batch(batch))
+            self._pending_rows += len(batch)
+            self.rows_written += len(batch)
+            if self._pending_rows >= self.row_group_size:
+                self._flush()
+
+    def close(self) -> None:
+        """Grava o último row group e fecha o arquivo"""
+        if self._writer is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+
+def write_parquet(
+    sink: Any,
+    columns: List[ColumnDescription],
+    batches: Iterable[List[Dict[str, Any]]],
+    row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Grava lotes de registros em Parquet
+
+    Args:
+        sink: Caminho ou arquivo binário de saída
+        columns: Descrição das colunas da consulta
+        batches: Lotes de registros
+        row_group_size: Linhas por row group
+        progress: Chamado após cada lote com o total gravado
+
+    Returns:
+        Total de registros gravados
+    """
+    iterator = iter(batches)
+    first = next(iterator, [])
+
+    with ParquetExporter(sink, arrow_schema(columns, first), row_group_size) as exporter:
+        exporter.write_batch(first)
+        if progress and first:
+            progress(exporter.rows_written)
+        for batch in iterator:
+            exporter.write_batch(batch)
+            if progress:
+                progress(exporter.rows_written)
+
+    return exporter.rows_written
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Perfil de desempenho de uma exportação, sob demanda
+
+Três modos, escolhidos por ``--perfil`` (CLI) ou pelo parâmetro
+``perfil`` / cabeçalho ``X-Perfil`` (API, com PROFILING_ENABLED):
+
+- cprofile: perfil determinístico (todas as chamadas) da thread que gera o
+  arquivo; grava o ``.pstats`` (``python -m pstats``, snakeviz) e um resumo
+  pelo tempo acumulado;
+- sampling: amostra as pilhas a cada SAMPLE_INTERVAL segundos, com custo
+  baixo e sem alterar as proporções; grava as pilhas no formato
+  "collapsed" (``flamegraph.pl``, speedscope) e as funções com mais
+  amostras;
+- memory: tracemalloc durante a exportação; grava o pico e as linhas que
+  mais alocavam perto do pico.
+
+Em todos os modos, o pico de RSS do processo durante a exportação é
+acompanhado (amostras de ``/proc/self/statm``, custo desprezível) e vai
+para o resumo, junto do pico do tracemalloc no modo memory.
+
+Os relatórios ficam junto do arquivo gerado (``<arquivo>.perfil.*``),
+com um ``<arquivo>.perfil.json`` que resume a execução; assim uma
+exportação lenta em produção já traz o próprio diagnóstico.
+
+Só um perfil roda por vez no processo (ProfilerBusy): o tracemalloc é
+global e, a partir do Python 3.12, um segundo cProfile ativo não inicia.
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem o pico de memória do processo
+    resource = None
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Modos de perfil
+PERFIL_CPROFILE = "cprofile"
+PERFIL_SAMPLING = "sampling"
+PERFIL_MEMORY = "memory"
+MODOS_PERFIL = (PERFIL_CPROFILE, PERFIL_SAMPLING, PERFIL_MEMORY)
+
+# Sufixo dos relatórios gravados junto do arquivo gerado
+PROFILE_SUFFIX = ".perfil"
+
+# Intervalo entre amostras das pilhas (segundos)
+SAMPLE_INTERVAL = 0.005
+
+# Linhas dos resumos (funções, linhas que alocam)
+TOP_N = 30
+
+# Quadros guardados por alocação e intervalo de verificação do pico (tracemalloc);
+# cada quadro a mais encarece todas as alocações, então só a linha é guardada
+MEMORY_FRAMES = 1
+MEMORY_CHECK_INTERVAL = 0.05
+
+# Crescimento da memória rastreada que dispara um novo instantâneo
+MEMORY_SNAPSHOT_GROWTH = 1.25
+
+# Tamanho da página, para o RSS de /proc/self/statm
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+# Perfil em andamento no processo
+_active = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Já há um perfil de desempenho em andamento no processo"""
+
+
+def parse_profile_mode(value: Optional[str]) -> Optional[str]:
+    """
+    Valida o modo de perfil pedido
+
+    Args:
+        value: cprofile, sampling ou memory (vazio ou None: sem perfil)
+
+    Returns:
+        Modo normalizado ou None
+
+    Raises:
+        ValueError: Modo desconhecido
+    """
+    if value is None or not value.strip():
+        return None
+    mode = value.strip().lower()
+    if mode not in MODOS_PERFIL:
+        raise ValueError(f"Modo de perfil inválido: {value} (use {', '.join(MODOS_PERFIL)})")
+    return mode
+
+
+def report_base(path: Path) -> Path:
+    """Prefixo dos relatórios de um arquivo gerado (<arquivo>.perfil)"""
+    return path.with_name(path.name + PROFILE_SUFFIX)
+
+
+def report_files(path: Path) -> List[Path]:
+    """
+    Relatórios de perfil gravados junto de um arquivo
+
+    Args:
+        path: Arquivo gerado
+
+    Returns:
+        Arquivos <arquivo>.perfil.* existentes
+    """
+    base = report_base(path)
+    return sorted(path.parent.glob(base.name + ".*"))
+
+
+def is_report_file(path: Path) -> bool:
+    """Indica se o arquivo é um relatório de perfil (<arquivo>.perfil.*)"""
+    return f"{PROFILE_SUFFIX}." in path.name
+
+
+def _frame_label(code) -> str:
+    """Nome de um quadro nas pilhas: função (arquivo:linha da definição)"""
+    filename = code.co_filename
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class _StackSampler(threading.Thread):
+    """Amostra periodicamente as pilhas das threads acompanhadas"""
+
+    def __init__(self, thread_ids: Optional[Set[int]], interval: float):
+        super().__init__(name="perfil-amostragem", daemon=True)
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        labels: Dict[Any, str] = {}
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class _MemoryMonitor(threading.Thread):
+    """Guarda um instantâneo do tracemalloc a cada novo patamar da memória rastreada"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="perfil-memoria", daemon=True)
+        self.interval = interval
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_size = 0
+        self._stop_event = threading.Event()
+
+    def check(self) -> None:
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.snapshot_size * MEMORY_SNAPSHOT_GROWTH:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.check()
+
+
+def _current_rss() -> Optional[int]:
+    """RSS atual do processo em bytes (None fora do Linux)"""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_rss() -> Optional[int]:
+    """Pico de RSS do processo desde o início, em bytes (ru_maxrss, em KB no Linux)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _RssMonitor(threading.Thread):
+    """Acompanha o pico de RSS do processo durante o perfil"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="perfil-rss", daemon=True)
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self._max_rss_start = _max_rss()
+        self._stop_event = threading.Event()
+
+    def check(self) -> None:
+        current = _current_rss()
+        if current is not None and (self.peak is None or current > self.peak):
+            self.peak = current
+
+    def run(self) -> None:
+        self.check()
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.check()
+        # Um novo pico do processo durante o perfil é exato, mesmo entre duas amostras
+        max_rss = _max_rss()
+        if max_rss is not None and self._max_rss_start is not None and max_rss > self._max_rss_start:
+            self.peak = max(self.peak or 0, max_rss)
+
+
+class Profiler:
+    """
+    Perfil de um trecho de código (gerenciador de contexto)
+    """
+
+    def __init__(self, mode: str, all_threads: bool = False, interval: float = SAMPLE_INTERVAL, top: int = TOP_N):
+        """
+        Args:
+            mode: cprofile, sampling ou memory
+            all_threads: Na amostragem, acompanha todas as threads (ex.: lote da CLI),
+                e não só a que entrou no contexto
+            interval: Intervalo entre amostras (segundos)
+            top: Linhas dos resumos
+        """
+        self.mode = parse_profile_mode(mode)
+        if self.mode is None:
+            raise ValueError("Modo de perfil não informado")
+        self.all_threads = all_threads
+        self.interval = interval
+        self.top = top
+        self.started_at: Optional[datetime] = None
+        self.seconds = 0.0
+        self.memory_peak: Optional[int] = None
+        self.rss_peak: Optional[int] = None
+        self._start = 0.0
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+        self._monitor: Optional[_MemoryMonitor] = None
+        self._rss: Optional[_RssMonitor] = None
+        self._owns_tracemalloc = False
+
+    def __enter__(self) -> "Profiler":
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("Outro perfil de desempenho em andamento; tente novamente ao fim dele")
+        try:
+            self.started_at = datetime.now()
+            self._rss = _RssMonitor(MEMORY_CHECK_INTERVAL)
+            self._rss.start()
+            if self.mode == PERFIL_CPROFILE:
+                self._profile = cProfile.Profile()
+            elif self.mode == PERFIL_SAMPLING:
+                self._sampler = _StackSampler(None if self.all_threads else {threading.get_ident()}, self.interval)
+                self._sampler.start()
+            else:
+                self._owns_tracemalloc = not tracemalloc.is_tracing()
+                if self._owns_tracemalloc:
+                    tracemalloc.start(MEMORY_FRAMES)
+                tracemalloc.reset_peak()
+                self._monitor = _MemoryMonitor(MEMORY_CHECK_INTERVAL)
+                self._monitor.start()
+
+            self._start = time.perf_counter()
+            if self._profile is not None:
+                self._profile.enable()
+        except BaseException:
+            if self._rss is not None:
+                self._rss.stop()
+            _active.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if self._profile is not None:
+                self._profile.disable()
+            self.seconds = time.perf_counter() - self._start
+            if self._sampler is not None:
+                self._sampler.stop()
+            if self._monitor is not None:
+                self._monitor.stop()
+                self.memory_peak = tracemalloc.get_traced_memory()[1]
+                if self._owns_tracemalloc:
+                    tracemalloc.stop()
+            if self._rss is not None:
+                self._rss.stop()
+                self.rss_peak = self._rss.peak
+        finally:
+            _active.release()
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumo da execução (conteúdo do <arquivo>.perfil.json)"""
+        summary: Dict[str, Any] = {
+            "modo": self.mode,
+            "inicio": self.started_at.isoformat(timespec="seconds") if self.started_at else None,
+            "segundos": round(self.seconds, 3),
+        }
+        if self._sampler is not None:
+            summary["amostras"] = self._sampler.samples
+            summary["intervalo_amostragem"] = self.interval
+        if self.memory_peak is not None:
+            summary["pico_memoria_rastreada_bytes"] = self.memory_peak
+        if self.rss_peak is not None:
+            summary["pico_rss_perfil_bytes"] = self.rss_peak
+        max_rss = _max_rss()
+        if max_rss is not None:
+            summary["pico_rss_processo_bytes"] = max_rss
+        return summary
+
+    def write_reports(self, path: Path) -> List[Path]:
+        """
+        Grava os relatórios junto de um arquivo
+
+        Args:
+            path: Arquivo gerado (ou prefixo, para comandos sem arquivo)
+
+        Returns:
+            Relatórios gravados
+        """
+        try:
+            base = report_base(Path(path))
+            files: List[Path] = []
+
+            if self._profile is not None:
+                stats_file = base.with_name(base.name + ".pstats")
+                self._profile.dump_stats(str(stats_file))
+                files.append(stats_file)
+                with open(base.with_name(base.name + ".txt"), "w", encoding="utf-8") as output:
+                    stats = pstats.Stats(self._profile, stream=output)
+                    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+                    stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+                files.append(Path(output.name))
+
+            if self._sampler is not None:
+                collapsed = base.with_name(base.name + ".collapsed")
+                with open(collapsed, "w", encoding="utf-8") as output:
+                    for stack, count in sorted(self._sampler.stacks.items()):
+                        output.write(f"{stack} {count}\n")
+                files.append(collapsed)
+                files.append(self._write_sampling_summary(base.with_name(base.name + ".txt")))
+
+            if self._monitor is not None:
+                files.append(self._write_memory_summary(base.with_name(base.name + ".txt")))
+
+            summary_file = base.with_name(base.name + ".json")
+            summary = {**self.summary(), "relatorios": [file.name for file in files]}
+            with open(summary_file, "w", encoding="utf-8") as output:
+                json.dump(summary, output, ensure_ascii=False, indent=2)
+            files.append(summary_file)
+
+            logger.info(f"Perfil {self.mode} gravado: {', '.join(str(file) for file in files)}")
+            return files
+        except Exception as e:
+            logger.error(f"Erro ao gravar o perfil de desempenho: {str(e)}")
+            raise
+
+    def _write_sampling_summary(self, path: Path) -> Path:
+        """Funções com mais amostras: próprias (no topo da pilha) e acumuladas"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self._sampler.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+        samples = sum(self._sampler.stacks.values()) or 1
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(f"Amostragem a cada {self.interval * 1000:.1f} ms: {self._sampler.samples} amostras em {self.seconds:.2f} s\n")
+            for title, counter in (("Tempo próprio", own), ("Tempo acumulado", total)):
+                output.write(f"\n{title} (% das pilhas amostradas)\n")
+                for frame, count in counter.most_common(self.top):
+                    output.write(f"{count / samples * 100:7.2f}% {count:>9}  {frame}\n")
+        return path
+
+    def _write_memory_summary(self, path: Path) -> Path:
+        """Pico da memória rastreada e linhas que mais alocavam no maior instantâneo"""
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(f"Pico da memória rastreada (tracemalloc): {self.memory_peak / 1024 ** 2:.1f} MB em {self.seconds:.2f} s\n")
+            snapshot = self._monitor.snapshot
+            if snapshot is None:
+                return path
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, threading.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            output.write(f"\nLinhas que mais alocavam com {self._monitor.snapshot_size / 1024 ** 2:.1f} MB rastreados\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                output.write(f"{stat.size / 1024 ** 2:10.2f} MB {stat.count:>10} blocos  {frame.filename}:{frame.lineno}\n")
+            output.write("\nArquivos que mais alocavam\n")
+            for stat in snapshot.statistics("filename")[:self.top]:
+                output.write(f"{stat.size / 1024 ** 2:10.2f} MB {stat.count:>10} blocos  {stat.traceback[0].filename}\n")
+        return path
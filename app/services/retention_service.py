@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Retenção e cota de disco do diretório de exportação
+
+Todos os arquivos de exportação ficam no índice do cache de artefatos,
+com tamanho, último acesso e fixação: os gerados pela API já entram no
+índice ao serem armazenados, e os gerados fora dela (CLI, cópias
+arquivadas do modo fluxo) são registrados na varredura. Quando o total
+passa da cota, os arquivos não fixados são removidos do acesso mais
+antigo para o mais recente (LRU). Arquivos fixados nunca são removidos:
+a versão atual de cada BPA-I (CNES e competência), baixada pela API ou
+gerada pela CLI, é fixada automaticamente, liberando a versão anterior,
+e os demais podem ser fixados à mão. Arquivos
+acessados há menos de RECENT_ACCESS_SECONDS também ficam, para não
+sumirem entre a busca no cache e o envio da resposta.
+"""
+
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.utils.config import Settings
+from app.services.artifact_cache import ArtifactCache
+from app.services.bpa_reader import INDEX_SUFFIX
+from app.services.profiling import is_report_file, report_files
+from app.services.checkpoint_service import CHECKPOINT_SUFFIX, KEYS_SUFFIX, PARTIAL_SUFFIX
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Arquivos gerados fora do cache, no diretório de exportação, e seus formatos
+LOOSE_PATTERNS = {
+    "bpa_export_*.csv": "csv",
+    "bpa_export_*.xlsx": "xlsx",
+    "bpa_export_*.parquet": "parquet",
+    "BPA_I_*.txt": "bpa",
+}
+
+# Idade mínima para remover arquivos temporários abandonados (segundos)
+STALE_TEMP_SECONDS = 6 * 3600
+
+# Idade mínima para remover gerações do BPA-I retomáveis abandonadas (segundos)
+STALE_CHECKPOINT_SECONDS = 7 * 24 * 3600
+
+# Arquivos acessados há menos tempo que isto não são removidos pela cota (segundos)
+RECENT_ACCESS_SECONDS = 300
+
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(value: str) -> int:
+    """
+    Converte um tamanho como "500M" ou "10G" em bytes
+
+    Args:
+        value: Tamanho em bytes, com sufixo opcional K, M, G ou T
+
+    Returns:
+        Tamanho em bytes
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Tamanho inválido: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(size: int) -> str:
+    """Tamanho legível (ex.: 1.5 GB)"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+@dataclass
+class RetentionReport:
+    """
+    Resultado de uma execução da política de retenção
+
+    Atributos:
+        cota (int): Cota em bytes
+        total_antes (int): Bytes ocupados antes da remoção
+        total_depois (int): Bytes ocupados após a remoção
+        fixados (int): Bytes ocupados por arquivos fixados
+        registrados (int): Arquivos encontrados fora do índice e registrados
+        ausentes (int): Entradas do índice cujo arquivo não existe mais
+        temporarios (int): Arquivos temporários abandonados removidos
+        removidos (list): Caminhos dos arquivos removidos pela cota
+        simulacao (bool): Indica se nada foi de fato removido
+    """
+    cota: int
+    total_antes: int = 0
+    total_depois: int = 0
+    fixados: int = 0
+    registrados: int = 0
+    ausentes: int = 0
+    temporarios: int = 0
+    removidos: List[str] = field(default_factory=list)
+    simulacao: bool = False
+
+    @property
+    def liberados(self) -> int:
+        """Bytes liberados pela cota"""
+        return self.total_antes - self.total_depois
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converte o resultado em dicionário
+
+        Returns:
+            Dicionário com os dados da execução
+        """
+        return {
+            "cota": self.cota,
+            "total_antes": self.total_antes,
+            "total_depois": self.total_depois,
+            "liberados": self.liberados,
+            "fixados": self.fixados,
+            "registrados": self.registrados,
+            "ausentes": self.ausentes,
+            "temporarios": self.temporarios,
+            "removidos": self.removidos,
+            "simulacao": self.simulacao,
+        }
+
+
+class RetentionManager:
+    """
+    Aplica a cota de disco ao diretório de exportação
+    """
+
+    def __init__(self, settings: Settings, cache: Optional[ArtifactCache] = None):
+        """
+        Inicializa o gerenciador
+
+        Args:
+            settings: Configurações da aplicação
+            cache: Cache de artefatos (cujo índice guarda os arquivos)
+        """
+        self.settings = settings
+        self.export_dir = settings.export_dir
+        self.cache = cache or ArtifactCache(settings)
+
+    def scan(self) -> int:
+        """
+        Registra no índice os arquivos de exportação gerados fora do cache
+
+        Returns:
+            Quantidade de arquivos novos registrados
+        """
+        registered = 0
+        for pattern, format in LOOSE_PATTERNS.items():
+            for path in self.export_dir.glob(pattern):
+                # Relatórios de perfil (BPA_I_*.txt.perfil.txt) acompanham o arquivo gerado
+                if is_report_file(path):
+                    continue
+                if path.is_file() and self.cache.register_file(path, format):
+                    registered += 1
+        return registered
+
+    def _remove_stale_temp_files(self, dry_run: bool) -> int:
+        """Remove arquivos temporários abandonados por gerações interrompidas"""
+        limit = time.time() - STALE_TEMP_SECONDS
+        candidates = list(self.cache.cache_dir.glob("*/.*.tmp"))
+        for path in self.export_dir.glob("*" + PARTIAL_SUFFIX):
+            # Arquivos parciais com ponto de controle aguardam run.py bpa --retomar
+            checkpoint = path.with_name(path.name[:-len(PARTIAL_SUFFIX)] + CHECKPOINT_SUFFIX)
+            if not checkpoint.exists():
+                candidates.append(path)
+
+        checkpoint_limit = time.time() - STALE_CHECKPOINT_SECONDS
+        for checkpoint in self.export_dir.glob("*" + CHECKPOINT_SUFFIX):
+            try:
+                if checkpoint.stat().st_mtime < checkpoint_limit:
+                    base = checkpoint.name[:-len(CHECKPOINT_SUFFIX)]
+                    candidates += [
+                        checkpoint,
+                        checkpoint.with_name(base + PARTIAL_SUFFIX),
+                        checkpoint.with_name(base + KEYS_SUFFIX),
+                    ]
+            except FileNotFoundError:
+                continue
+
+        removed = 0
+        for path in candidates:
+            try:
+                if path.stat().st_mtime < limit:
+                    if not dry_run:
+                        path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def collect(self, quota_bytes: Optional[int] = None, dry_run: bool = False) -> RetentionReport:
+        """
+        Aplica a cota, removendo os arquivos não fixados menos acessados
+
+        Args:
+            quota_bytes: Cota em bytes (padrão: EXPORT_QUOTA_BYTES)
+            dry_run: Apenas informa o que seria removido
+
+        Returns:
+            Resultado da execução
+        """
+        try:
+            quota = self.settings.export_quota_bytes if quota_bytes is None else quota_bytes
+            report = RetentionReport(cota=quota, simulacao=dry_run)
+
+            report.registrados = self.scan()
+            report.temporarios = self._remove_stale_temp_files(dry_run)
+
+            # Entradas cujo arquivo foi apagado por fora saem do índice
+            entries = []
+            for entry in self.cache.entries():
+                path = Path(entry["path"])
+                if not path.is_file():
+                    report.ausentes += 1
+                    if not dry_run:
+                        self.cache.remove(entry["key"], delete_file=False)
+                    continue
+                entries.append(entry)
+
+            total = sum(entry["size"] for entry in entries)
+            report.total_antes = total
+            report.fixados = sum(entry["size"] for entry in entries if entry["pinned"])
+
+            # Do acesso mais antigo para o mais recente, pulando os fixados e os
+            # recém-acessados (downloads entre a busca no cache e a resposta)
+            recent = (datetime.now() - timedelta(seconds=RECENT_ACCESS_SECONDS)).isoformat()
+            for entry in entries:
+                if total <= quota:
+                    break
+                if entry["pinned"] or entry["last_access"] >= recent:
+                    continue
+                if not dry_run:
+                    self.cache.remove(entry["key"])
+                    sidecar = Path(entry["path"] + INDEX_SUFFIX)
+                    if sidecar.exists():
+                        sidecar.unlink()
+                    for profile_report in report_files(Path(entry["path"])):
+                        profile_report.unlink(missing_ok=True)
+                total -= entry["size"]
+                report.removidos.append(entry["path"])
+
+            report.total_depois = total
+            if total > quota:
+                logger.warning(
+                    f"Cota de exportação excedida por arquivos fixados ou acessados recentemente: "
+                    f"{format_size(total)} ocupados, cota de {format_size(quota)}"
+                )
+            if report.removidos or report.ausentes or report.temporarios:
+                logger.info(
+                    f"Retenção{' (simulação)' if dry_run else ''}: {len(report.removidos)} arquivos removidos "
+                    f"({format_size(report.liberados)}), {report.ausentes} entradas ausentes, "
+                    f"{report.temporarios} temporários"
+                )
+            return report
+        except Exception as e:
+            logger.error(f"Erro ao aplicar a retenção do diretório de exportação: {str(e)}")
+            raise
+
+
+async def retention_loop(settings: Settings) -> None:
+    """
+    Tarefa de fundo da API: aplica a cota periodicamente
+
+    Args:
+        settings: Configurações da aplicação (intervalo em RETENTION_INTERVAL)
+    """
+    manager = RetentionManager(settings)
+    while True:
+        try:
+            await asyncio.to_thread(manager.collect)
+        except Exception:
+            # O erro já foi registrado; tenta de novo no próximo ciclo
+            pass
+        await asyncio.sleep(settings.retention_interval)
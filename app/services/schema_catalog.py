@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Catálogo offline do esquema ``sigh`` para a tela de mapeamento
+
+O catálogo vem do dump ``schema_sigh.sql`` distribuído com o projeto
+(linhas ``"tabela";"coluna";"tipo"``, na ordem das colunas) ou do
+instantâneo do banco gravado por ``python run.py schema-refresh`` (ou
+``POST /config/database-schema/refresh``) em
+``<export_dir>/schema_catalog.sql``, que tem precedência. Assim a busca
+de tabelas e colunas não consulta ``information_schema`` a cada chamada.
+
+Índices montados na carga (cerca de 24 mil colunas em 1.100 tabelas):
+
+- prefixo: nomes em minúsculas ordenados, com busca binária;
+- substring: trigramas das colunas; a busca intersecta as listas dos
+  trigramas do termo, da menor para a maior, e confirma cada candidata.
+  Termos com menos de três caracteres e nomes de tabela (poucos) são
+  percorridos diretamente.
+"""
+
+import os
+import csv
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.utils.config import BASE_DIR, Settings
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Dump distribuído com o projeto e instantâneo gravado pela atualização
+DUMP_FILE = BASE_DIR / "schema_sigh.sql"
+SNAPSHOT_FILE = "schema_catalog.sql"
+
+# Modos de busca e onde procurar o termo
+MODO_PREFIXO = "prefixo"
+MODO_SUBSTRING = "substring"
+MODOS_BUSCA = (MODO_PREFIXO, MODO_SUBSTRING)
+ALVO_COLUNA = "coluna"
+ALVO_TABELA = "tabela"
+ALVO_AMBOS = "ambos"
+ALVOS_BUSCA = (ALVO_COLUNA, ALVO_TABELA, ALVO_AMBOS)
+
+# Tabelas usadas pelo mapeamento do BPA-I (resposta sem filtros)
+MAPPING_TABLES = ("ficha_amb_int", "lancamentos", "prestadores", "pacientes")
+
+# Colunas do esquema na ordem das tabelas e das posições
+CATALOG_QUERY = """
+SELECT
+    table_name,
+    column_name,
+    data_type
+FROM
+    information_schema.columns
+WHERE
+    table_schema = 'sigh'
+ORDER BY
+    table_name,
+    ordinal_position
+"""
+
+
+class SchemaColumn(NamedTuple):
+    """Coluna do catálogo"""
+    table: str
+    name: str
+    type: str
+
+
+def _trigrams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class SchemaCatalog:
+    """
+    Colunas do esquema com índices de prefixo e substring
+    """
+
+    def __init__(self, columns: List[SchemaColumn], source: str = ""):
+        """
+        Args:
+            columns: Colunas na ordem do esquema (tabela, posição)
+            source: Arquivo de origem
+        """
+        self.columns = columns
+        self.source = source
+
+        self._names = [column.name.lower() for column in columns]
+        self._by_name = sorted((name, i) for i, name in enumerate(self._names))
+        self._tables: Dict[str, array] = {}
+        self._types: Dict[str, array] = {}
+        self._trigrams: Dict[str, array] = {}
+        for i, column in enumerate(columns):
+            self._tables.setdefault(column.table.lower(), array("I")).append(i)
+            self._types.setdefault(column.type.lower(), array("I")).append(i)
+            for gram in _trigrams(self._names[i]):
+                self._trigrams.setdefault(gram, array("I")).append(i)
+        self._table_names = sorted(self._tables)
+        self._table_labels = {column.table.lower(): column.table for column in columns}
+
+    @classmethod
+    def load(cls, path: Path) -> "SchemaCatalog":
+        """
+        Lê um dump "tabela";"coluna";"tipo"
+
+        Args:
+            path: Arquivo do dump
+
+        Returns:
+            Catálogo indexado
+        """
+        with open(path, newline="", encoding="utf-8") as file:
+            columns = [SchemaColumn(*row[:3]) for row in csv.reader(file, delimiter=";") if len(row) >= 3]
+        catalog = cls(columns, str(path))
+        logger.info(f"Catálogo do esquema carregado: {len(catalog.tables())} tabelas, {len(columns)} colunas ({path})")
+        return catalog
+
+    def tables(self) -> List[str]:
+        """Nomes das tabelas, em ordem alfabética"""
+        return [self._table_labels[name] for name in self._table_names]
+
+    def _match_names(self, term: str, mode: str) -> Set[int]:
+        """Colunas cujo nome casa com o termo (em minúsculas)"""
+        if mode == MODO_PREFIXO:
+            matches = set()
+            for name, i in self._by_name[bisect_left(self._by_name, (term, -1)):]:
+                if not name.startswith(term):
+                    break
+                matches.add(i)
+            return matches
+        if len(term) < 3:
+            return {i for i, name in enumerate(self._names) if term in name}
+
+        postings = sorted((self._trigrams.get(gram, ()) for gram in _trigrams(term)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(posting)
+        return {i for i in candidates if term in self._names[i]}
+
+    def _match_tables(self, term: str, mode: str) -> List[str]:
+        """Tabelas cujo nome casa com o termo (em minúsculas)"""
+        if mode == MODO_PREFIXO:
+            start = bisect_left(self._table_names, term)
+            matches = []
+            for name in self._table_names[start:]:
+                if not name.startswith(term):
+                    break
+                matches.append(name)
+            return matches
+        return [name for name in self._table_names if term in name]
+
+    def search(
+        self,
+        term: str = "",
+        mode: str = MODO_PREFIXO,
+        target: str = ALVO_COLUNA,
+        table: Optional[str] = None,
+        type: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50
+    ) -> Tuple[int, List[SchemaColumn]]:
+        """
+        Busca colunas por nome de coluna e/ou de tabela
+
+        Args:
+            term: Termo buscado (sem diferenciar maiúsculas)
+            mode: prefixo ou substring
+            target: Onde procurar o termo (coluna, tabela ou ambos)
+            table: Restringe a uma tabela (nome exato)
+            type: Restringe a um tipo de dado (ex.: integer, character varying)
+            offset: Colunas a pular
+            limit: Quantidade máxima de colunas
+
+        Returns:
+            Total de colunas encontradas e a página pedida, na ordem do esquema
+        """
+        if mode not in MODOS_BUSCA:
+            raise ValueError(f"Modo de busca inválido: {mode} (use {', '.join(MODOS_BUSCA)})")
+        if target not in ALVOS_BUSCA:
+            raise ValueError(f"Alvo de busca inválido: {target} (use {', '.join(ALVOS_BUSCA)})")
+
+        selected: Optional[Set[int]] = None
+        term = (term or "").strip().lower()
+        if term:
+            selected = set()
+            if target in (ALVO_COLUNA, ALVO_AMBOS):
+                selected |= self._match_names(term, mode)
+            if target in (ALVO_TABELA, ALVO_AMBOS):
+                for name in self._match_tables(term, mode):
+                    selected.update(self._tables[name])
+
+        for index, value in ((self._tables, table), (self._types, type)):
+            if value:
+                ids = index.get(value.strip().lower(), ())
+                selected = set(ids) if selected is None else selected.intersection(ids)
+
+        ids = range(len(self.columns)) if selected is None else sorted(selected)
+        page = [self.columns[i] for i in ids[offset:offset + limit]]
+        return len(ids), page
+
+    def search_tables(
+        self,
+        term: str = "",
+        mode: str = MODO_PREFIXO,
+        offset: int = 0,
+        limit: int = 50
+    ) -> Tuple[int, List[Tuple[str, int]]]:
+        """
+        Busca tabelas pelo nome
+
+        Args:
+            term: Termo buscado (sem diferenciar maiúsculas)
+            mode: prefixo ou substring
+            offset: Tabelas a pular
+            limit: Quantidade máxima de tabelas
+
+        Returns:
+            Total de tabelas encontradas e a página pedida: (tabela, quantidade de colunas)
+        """
+        if mode not in MODOS_BUSCA:
+            raise ValueError(f"Modo de busca inválido: {mode} (use {', '.join(MODOS_BUSCA)})")
+        term = (term or "").strip().lower()
+        names = self._match_tables(term, mode) if term else self._table_names
+        page = [(self._table_labels[name], len(self._tables[name])) for name in names[offset:offset + limit]]
+        return len(names), page
+
+    def table_columns(self, tables: Iterable[str]) -> Dict[str, List[SchemaColumn]]:
+        """
+        Colunas de algumas tabelas
+
+        Args:
+            tables: Nomes das tabelas
+
+        Returns:
+            Colunas por tabela (tabelas ausentes do catálogo ficam de fora)
+        """
+        return {
+            table: [self.columns[i] for i in self._tables[table.lower()]]
+            for table in tables if table.lower() in self._tables
+        }
+
+
+def catalog_path(settings: Settings) -> Path:
+    """
+    Arquivo do catálogo em uso
+
+    Args:
+        settings: Configurações da aplicação
+
+    Returns:
+        Instantâneo do banco, se já houver um, ou o dump do projeto
+    """
+    snapshot = settings.export_dir / SNAPSHOT_FILE
+    return snapshot if snapshot.exists() else DUMP_FILE
+
+
+_catalogs: Dict[Path, Tuple[Tuple[int, int], SchemaCatalog]] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_schema_catalog(settings: Settings) -> SchemaCatalog:
+    """
+    Obtém o catálogo do esquema, carregado uma vez por arquivo
+
+    O catálogo é recarregado quando o arquivo muda (nova atualização, em
+    qualquer processo).
+
+    Args:
+        settings: Configurações da aplicação
+
+    Returns:
+        Catálogo indexado
+    """
+    path = catalog_path(settings)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _catalogs_lock:
+        cached = _catalogs.get(path)
+        if cached is None or cached[0] != signature:
+            cached = _catalogs[path] = (signature, SchemaCatalog.load(path))
+        return cached[1]
+
+
+def refresh_catalog(db: Session, settings: Settings) -> SchemaCatalog:
+    """
+    Grava um instantâneo do esquema atual do banco e passa a usá-lo
+
+    Args:
+        db: Sessão do banco de dados
+        settings: Configurações da aplicação
+
+    Returns:
+        Catálogo do instantâneo
+    """
+    try:
+        rows = db.execute(text(CATALOG_QUERY)).fetchall()
+        if not rows:
+            raise ValueError("O esquema sigh não tem colunas (banco ou permissões incorretos?)")
+
+        path = settings.export_dir / SNAPSHOT_FILE
+        partial = path.with_name(path.name + ".part")
+        with open(partial, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file, delimiter=";", quoting=csv.QUOTE_ALL, lineterminator="\n")
+            writer.writerows((table, column, type) for table, column, type in rows)
+        os.replace(partial, path)
+
+        logger.info(f"Instantâneo do esquema gravado: {len(rows)} colunas ({path})")
+        return get_schema_catalog(settings)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar o catálogo do esquema: {str(e)}")
+        raise
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Exportação em fluxo para respostas HTTP
+
+Leitura do banco, formatação e corpo da resposta formam um único
+pipeline: cada lote lido do cursor é formatado em memória e entregue ao
+cliente antes do próximo ser buscado. Como o StreamingResponse só pede o
+próximo pedaço quando o anterior foi enviado, um cliente lento segura a
+leitura do banco (contrapressão) e nada é gravado no servidor.
+
+Opcionalmente, os mesmos bytes são copiados para o diretório de
+exportação (arquivamento): o arquivo é escrito como ``.part`` e só
+recebe o nome final quando a resposta termina; se a transferência for
+interrompida, o parcial é removido.
+
+Limitações por formato:
+
+- CSV: os formatadores são inferidos do primeiro lote; valores posteriores
+  que não cabem no formato inferido saem com precisão total
+- Parquet: cada lote vira um row group, para o primeiro byte sair cedo
+- XLSX: o zip só é montado ao fechar a pasta de trabalho, então os bytes
+  saem ao final e o xlsxwriter ainda usa arquivos temporários
+- BPA-I: as linhas vêm de BPAService.iter_batch_lines (um lote verificado
+  e formatado por vez); no modo 'somar', de iter_lines sobre todos os
+  registros
+"""
+
+import io
+import os
+import logging
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.utils.config import Settings
+from app.services import metrics, tracing
+from app.services.csv_writer import CSV_BUFFER_SIZE, StreamingCSVWriter, infer_csv_columns
+from app.services.ndjson_writer import encode_batch
+from app.services.data_service import RECORDS_BATCH_SIZE, ColumnDescription
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de cada pedaço entregue à resposta (bytes)
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Linhas do BPA-I por pedaço
+BPA_LINES_PER_CHUNK = 5000
+
+Batch = List[Dict[str, Any]]
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Destino binário em memória: acumula os bytes escritos até serem drenados
+    """
+
+    def __init__(self, tee: Optional[io.BufferedWriter] = None):
+        """
+        Inicializa o destino
+
+        Args:
+            tee: Arquivo que recebe uma cópia de tudo o que for escrito
+        """
+        super().__init__()
+        self.position = 0
+        self._chunks: List[bytes] = []
+        self._tee = tee
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self.position += len(data)
+        if self._tee is not None:
+            self._tee.write(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        """Retorna e descarta os bytes acumulados"""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _slices(data: bytes, size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Divide um bloco grande em pedaços de até size bytes"""
+    if len(data) <= size:
+        if data:
+            yield data
+        return
+    view = memoryview(data)
+    for start in range(0, len(data), size):
+        yield bytes(view[start:start + size])
+
+
+class StreamingExportService:
+    """
+    Serviço de exportação em fluxo (sem arquivo no servidor, salvo arquivamento)
+    """
+
+    def __init__(self, settings: Settings, archive: bool = False):
+        """
+        Inicializa o serviço com as configurações da aplicação
+
+        Args:
+            settings: Configurações da aplicação
+            archive: Copia os bytes enviados para o diretório de exportação
+        """
+        self.settings = settings
+        self.export_dir = settings.export_dir
+        self.archive = archive
+        self.bytes_sent = 0
+
+        # Garante que o diretório de exportação existe
+        if archive and not self.export_dir.exists():
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+
+    def _pipeline(self, format: str, filename: str, produce: Callable[[ChunkSink], Iterator[None]]) -> Iterator[bytes]:
+        """
+        Executa um produtor que escreve no destino e entrega os bytes a cada passo
+
+        A leitura e a formatação de cada lote ficam dentro do span
+        ``response.stream`` (rastreamento).
+
+        Args:
+            format: Formato da exportação (métricas)
+            filename: Nome do arquivo (usado no arquivamento)
+            produce: Gerador que escreve no destino e cede a cada lote
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        return tracing.traced_iterator(
+            self._chunks(format, filename, produce), "response.stream", format=format, filename=filename
+        )
+
+    def _chunks(self, format: str, filename: str, produce: Callable[[ChunkSink], Iterator[None]]) -> Iterator[bytes]:
+        """Gerador de _pipeline"""
+        filepath: Optional[Path] = self.export_dir / filename if self.archive else None
+        partial = filepath.with_name(filepath.name + ".part") if filepath else None
+        tee = open(partial, "wb") if partial else None
+        sink = ChunkSink(tee)
+        completed = False
+        try:
+            for _ in produce(sink):
+                for chunk in _slices(sink.drain()):
+                    self.bytes_sent += len(chunk)
+                    yield chunk
+            for chunk in _slices(sink.drain()):
+                self.bytes_sent += len(chunk)
+                yield chunk
+            completed = True
+            logger.info(f"Exportação em fluxo concluída: {filename} ({self.bytes_sent} bytes)")
+        except GeneratorExit:
+            logger.warning(f"Exportação em fluxo interrompida pelo cliente: {filename}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro na exportação em fluxo {filename}: {str(e)}")
+            raise
+        finally:
+            metrics.record_bytes(format, self.bytes_sent)
+            if tee is not None:
+                tee.close()
+                if completed:
+                    os.replace(partial, filepath)
+                    logger.info(f"Cópia arquivada: {filepath}")
+                else:
+                    os.remove(partial)
+
+    def stream_csv(self, filename: str, first: Batch, batches: Iterable[Batch]) -> Iterator[bytes]:
+        """
+        CSV em fluxo, com a formatação do ExportService
+
+        Args:
+            filename: Nome do arquivo
+            first: Primeiro lote (já lido, usado para inferir os formatadores)
+            batches: Lotes restantes
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        def produce(sink: ChunkSink) -> Iterator[None]:
+            inferred = infer_csv_columns(first)
+            if inferred is None:
+                columns, formatters = list(first[0]), {}
+            else:
+                columns, formatters = inferred
+
+            text = io.TextIOWrapper(
+                io.BufferedWriter(sink, CSV_BUFFER_SIZE), encoding="utf-8", newline=""
+            )
+            writer = StreamingCSVWriter(text, columns, formatters)
+            writer.write_header()
+            text.flush()
+            yield
+
+            writer.write_batch(first)
+            text.flush()
+            yield
+            for batch in batches:
+                writer.write_batch(batch)
+                text.flush()
+                yield
+            text.flush()
+
+        return self._pipeline("csv", filename, produce)
+
+    def stream_xlsx(self, filename: str, columns: List[str], first: Batch, batches: Iterable[Batch]) -> Iterator[bytes]:
+        """
+        XLSX em fluxo (os bytes saem ao fechar a pasta de trabalho)
+
+        Args:
+            filename: Nome do arquivo
+            columns: Nomes das colunas
+            first: Primeiro lote
+            batches: Lotes restantes
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        from app.services.xlsx_writer import StreamingXLSXWriter
+
+        def produce(sink: ChunkSink) -> Iterator[None]:
+            with StreamingXLSXWriter(sink, columns, sheet_name="BPA_Export") as writer:
+                writer.write_records(first)
+                for batch in batches:
+                    writer.write_records(batch)
+            yield
+
+        return self._pipeline("xlsx", filename, produce)
+
+    def stream_parquet(
+        self,
+        filename: str,
+        columns: List[ColumnDescription],
+        first: Batch,
+        batches: Iterable[Batch]
+    ) -> Iterator[bytes]:
+        """
+        Parquet em fluxo, um row group por lote
+
+        Args:
+            filename: Nome do arquivo
+            columns: Descrição das colunas da consulta
+            first: Primeiro lote (amostra para colunas sem tipo informado)
+            batches: Lotes restantes
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        from app.services.parquet_writer import ParquetExporter, arrow_schema
+
+        def produce(sink: ChunkSink) -> Iterator[None]:
+            with ParquetExporter(sink, arrow_schema(columns, first), row_group_size=RECORDS_BATCH_SIZE) as exporter:
+                exporter.write_batch(first)
+                yield
+                for batch in batches:
+                    exporter.write_batch(batch)
+                    yield
+
+        return self._pipeline("parquet", filename, produce)
+
+    def stream_ndjson(self, filename: str, first: Batch, batches: Iterable[Batch], fields: Optional[List[str]] = None) -> Iterator[bytes]:
+        """
+        NDJSON em fluxo, um objeto JSON por registro
+
+        Args:
+            filename: Nome do arquivo
+            first: Primeiro lote (pode ser vazio)
+            batches: Lotes restantes
+            fields: Campos a incluir (None = todos)
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        def produce(sink: ChunkSink) -> Iterator[None]:
+            with tracing.span("format.batch", rows=len(first)):
+                sink.write(encode_batch(first, fields))
+            yield
+            for batch in batches:
+                with tracing.span("format.batch", rows=len(batch)):
+                    sink.write(encode_batch(batch, fields))
+                yield
+
+        return self._pipeline("records", filename, produce)
+
+    def stream_bpa(self, filename: str, lines: Iterable[str]) -> Iterator[bytes]:
+        """
+        BPA-I em fluxo, com os mesmos bytes de BPAService.generate_bpa
+
+        Args:
+            filename: Nome do arquivo
+            lines: Linhas do arquivo, sem terminador (BPAService.iter_lines)
+
+        Returns:
+            Iterador de pedaços do corpo da resposta
+        """
+        def produce(sink: ChunkSink) -> Iterator[None]:
+            iterator = iter(lines)
+            while True:
+                # As linhas são formatadas ao serem consumidas
+                with tracing.span("format.batch") as batch:
+                    pending = list(islice(iterator, BPA_LINES_PER_CHUNK))
+                    if pending:
+                        sink.write((os.linesep.join(pending) + os.linesep).encode("utf-8"))
+                    batch.set(rows=len(pending))
+                if len(pending) < BPA_LINES_PER_CHUNK:
+                    break
+                yield
+
+        return self._pipeline("bpa", filename, produce)
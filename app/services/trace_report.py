@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resumo dos spans gravados pelo rastreamento (caminho crítico)
+
+O caminho crítico de um trace é a sequência de etapas que determinou a
+sua duração: partindo do fim do span raiz, escolhe-se o filho que terminou
+por último, desce-se nele e repete-se a partir do início dele; o tempo do
+pai não coberto por filhos conta como tempo próprio do pai. Filhos que
+rodaram em paralelo a um já escolhido ficam fora do caminho.
+
+Somando o caminho por nome de etapa, fica claro para onde foi o tempo:
+banco (``db.query``, ``db.fetch``), formatação (``format.batch``), disco
+(``file.write``) ou envio (``http.response``).
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Logger
+logger = logging.getLogger(__name__)
+
+Span = Dict[str, Any]
+
+
+@dataclass
+class TraceSummary:
+    """
+    Resumo de um trace
+
+    Atributos:
+        trace_id (str): Identificador do trace
+        root (dict): Span raiz
+        duration_ns (int): Duração do span raiz
+        critical_path (list): Etapas do caminho crítico, da mais demorada:
+            (nome, tempo em ns, quantidade de spans)
+        stages (dict): Por nome de etapa: spans, duração somada e registros
+        errors (list): Spans com erro (nome e mensagem)
+        spans (int): Quantidade de spans do trace
+    """
+    trace_id: str
+    root: Span
+    duration_ns: int
+    critical_path: List[Tuple[str, int, int]] = field(default_factory=list)
+    stages: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+    spans: int = 0
+
+
+def load_traces(path: Path) -> Dict[str, List[Span]]:
+    """
+    Lê um arquivo JSON Lines de spans, agrupando por trace
+
+    Args:
+        path: Arquivo gravado pelo exportador jsonl ou pelo coletor
+
+    Returns:
+        Spans por trace, na ordem do arquivo
+    """
+    traces: Dict[str, List[Span]] = {}
+    with open(path, encoding="utf-8") as source:
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                # Linha truncada (processo encerrado durante a gravação)
+                logger.warning(f"Linha {number} inválida em {path}")
+                continue
+            traces.setdefault(item["trace_id"], []).append(item)
+    return traces
+
+
+def find_root(spans: List[Span]) -> Span:
+    """
+    Span raiz de um trace
+
+    Sem a raiz no arquivo (trace incompleto), usa o span mais longo entre
+    os que não têm o pai presente.
+
+    Args:
+        spans: Spans do trace
+
+    Returns:
+        Span raiz
+    """
+    ids = {span["span_id"] for span in spans}
+    candidates = [span for span in spans if span["parent_id"] is None] or \
+        [span for span in spans if span["parent_id"] not in ids]
+    return max(candidates, key=lambda span: span["end_ns"] - span["start_ns"])
+
+
+def _walk(span: Span, end: int, children: Dict[str, List[Span]], segments: List[Tuple[Span, int]]) -> None:
+    """Acrescenta os trechos do caminho crítico de um span (do fim para o início)"""
+    cursor = end
+    for child in sorted(children.get(span["span_id"], ()), key=lambda c: c["end_ns"], reverse=True):
+        # Começou depois do início do filho já escolhido: rodou em paralelo
+        if child["start_ns"] >= cursor or child["end_ns"] <= span["start_ns"]:
+            continue
+        child_end = min(child["end_ns"], cursor)
+        if cursor > child_end:
+            segments.append((span, cursor - child_end))
+        _walk(child, child_end, children, segments)
+        cursor = max(child["start_ns"], span["start_ns"])
+    if cursor > span["start_ns"]:
+        segments.append((span, cursor - span["start_ns"]))
+
+
+def critical_path(spans: List[Span], root: Optional[Span] = None) -> List[Tuple[Span, int]]:
+    """
+    Caminho crítico de um trace
+
+    Args:
+        spans: Spans do trace
+        root: Span raiz (padrão: find_root)
+
+    Returns:
+        Trechos (span, tempo próprio em ns) em ordem cronológica
+    """
+    root = root or find_root(spans)
+    children: Dict[str, List[Span]] = {}
+    for span in spans:
+        if span["parent_id"] is not None:
+            children.setdefault(span["parent_id"], []).append(span)
+
+    segments: List[Tuple[Span, int]] = []
+    _walk(root, root["end_ns"], children, segments)
+    segments.reverse()
+    return segments
+
+
+def summarize(trace_id: str, spans: List[Span]) -> TraceSummary:
+    """
+    Resume um trace: caminho crítico por etapa, totais e erros
+
+    Args:
+        trace_id: Identificador do trace
+        spans: Spans do trace
+
+    Returns:
+        Resumo do trace
+    """
+    root = find_root(spans)
+    summary = TraceSummary(trace_id, root, root["end_ns"] - root["start_ns"], spans=len(spans))
+
+    path: Dict[str, List[int]] = {}
+    seen: Dict[str, set] = {}
+    for span, elapsed in critical_path(spans, root):
+        path.setdefault(span["name"], [0, 0])[0] += elapsed
+        if span["span_id"] not in seen.setdefault(span["name"], set()):
+            seen[span["name"]].add(span["span_id"])
+            path[span["name"]][1] += 1
+    summary.critical_path = sorted(
+        ((name, elapsed, count) for name, (elapsed, count) in path.items()),
+        key=lambda item: -item[1]
+    )
+
+    for span in spans:
+        stage = summary.stages.setdefault(span["name"], {"spans": 0, "duration_ns": 0, "rows": 0})
+        stage["spans"] += 1
+        stage["duration_ns"] += span["end_ns"] - span["start_ns"]
+        rows = span["attributes"].get("rows")
+        if isinstance(rows, int):
+            stage["rows"] += rows
+        if span.get("error"):
+            summary.errors.append((span["name"], span["error"]))
+    return summary
+
+
+def select_traces(
+    traces: Dict[str, List[Span]],
+    trace_id: Optional[str] = None,
+    root_name: Optional[str] = None,
+    last: int = 1
+) -> Iterator[TraceSummary]:
+    """
+    Resume os traces escolhidos
+
+    Args:
+        traces: Spans por trace (load_traces)
+        trace_id: Identificador ou prefixo do trace
+        root_name: Nome do span raiz (ex.: http.request, job, cli.bpa)
+        last: Quantidade de traces mais recentes (sem trace_id)
+
+    Returns:
+        Resumos, do mais antigo ao mais recente
+    """
+    if trace_id:
+        chosen = [(tid, spans) for tid, spans in traces.items() if tid.startswith(trace_id)]
+    else:
+        roots = [(find_root(spans), tid, spans) for tid, spans in traces.items()]
+        if root_name:
+            roots = [item for item in roots if item[0]["name"] == root_name]
+        roots.sort(key=lambda item: item[0]["start_ns"])
+        chosen = [(tid, spans) for _, tid, spans in roots[-last:]] if last > 0 else []
+    for tid, spans in chosen:
+        yield summarize(tid, spans)
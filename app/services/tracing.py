@@ -0,0 +1,645 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rastreamento leve das etapas da exportação (spans)
+
+Cada exportação gera uma árvore de spans com início, fim e atributos
+(ex.: quantidade de registros):
+
+- raiz: ``http.request`` (API), ``job`` (fila de jobs) ou ``cli.<comando>``
+- ``db.reflection``, ``db.freshness``, ``db.query`` e ``db.fetch`` (um por lote)
+- ``export.file``: geração do arquivo, com ``format.batch`` por lote
+  formatado e ``file.write`` por descarga do buffer no disco
+- ``http.response``: envio do arquivo; no modo fluxo, ``response.stream``,
+  com a leitura e a formatação de cada lote dentro dele
+
+Os spans terminados vão para um arquivo JSON Lines (TRACE_EXPORTER=jsonl)
+ou para um coletor OTLP/HTTP com corpo JSON (TRACE_EXPORTER=otlp); o
+``run.py trace-collector`` faz as vezes de coletor local e grava o mesmo
+JSON Lines, lido pelo ``run.py trace-report``.
+
+Desativado (padrão), ``span()`` devolve um span vazio compartilhado: o
+custo é a leitura de uma variável global por lote ou descarga de buffer.
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Destinos dos spans (TRACE_EXPORTER)
+EXPORTERS = ("none", "jsonl", "otlp")
+
+# Nome do serviço nos spans OTLP
+SERVICE_NAME = "bpa-exporter"
+
+# Spans acumulados antes de uma gravação/envio, mesmo sem o fim da raiz
+FLUSH_SPANS = 512
+
+# Tempo máximo de envio ao coletor OTLP (segundos)
+OTLP_TIMEOUT = 5
+
+# Lotes aguardando envio ao coletor (acima disso são descartados)
+OTLP_QUEUE_SIZE = 64
+
+# Caminhos da API rastreados pelo middleware
+TRACED_PATHS = ("/export", "/records", "/jobs", "/artifacts")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+_tracer: Optional["Tracer"] = None
+_END = object()
+
+
+class Span:
+    """
+    Etapa rastreada
+
+    Usado como gerenciador de contexto, passa a ser o span atual (pai dos
+    spans abertos dentro do bloco) e termina ao sair, registrando a exceção.
+    """
+
+    __slots__ = (
+        "tracer", "name", "trace_id", "span_id", "parent_id", "attributes",
+        "start_ns", "end_ns", "error", "_perf_ns", "_token"
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self._perf_ns = time.perf_counter_ns()
+        self._token = None
+
+    def set(self, **attributes: Any) -> None:
+        """Acrescenta atributos ao span"""
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """
+        Termina o span e o entrega ao exportador (apenas na primeira chamada)
+
+        Args:
+            error: Exceção que interrompeu a etapa
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._perf_ns)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        _current.reset(self._token)
+        self.end(exc if exc_type is not None and exc_type is not GeneratorExit else None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Span no formato das linhas JSON"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Span vazio usado com o rastreamento desativado"""
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _BufferedExporter:
+    """
+    Acumula os spans e os entrega em lotes: ao terminar um span raiz ou ao
+    atingir FLUSH_SPANS
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._pending.append(span)
+            if span.parent_id is not None and len(self._pending) < FLUSH_SPANS:
+                return
+            spans, self._pending = self._pending, []
+        self._write(spans)
+
+    def flush(self) -> None:
+        """Entrega os spans pendentes"""
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if spans:
+            self._write(spans)
+
+    def shutdown(self) -> None:
+        """Entrega os pendentes e libera os recursos"""
+        self.flush()
+
+    def _write(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+
+class JsonLinesExporter(_BufferedExporter):
+    """
+    Grava os spans em um arquivo JSON Lines
+
+    Cada lote é acrescentado com uma única escrita em modo append, para que
+    vários processos (workers do uvicorn) possam gravar no mesmo arquivo.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Inicializa o exportador
+
+        Args:
+            path: Arquivo de saída (criado se não existir)
+        """
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _write(self, spans: List[Span]) -> None:
+        data = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+class OTLPExporter(_BufferedExporter):
+    """
+    Envia os spans a um coletor OTLP/HTTP (corpo JSON, POST /v1/traces)
+
+    O envio é feito por uma thread, fora do caminho da exportação; com o
+    coletor fora do ar, os lotes são descartados com um aviso.
+    """
+
+    def __init__(self, endpoint: str, service_name: str = SERVICE_NAME):
+        """
+        Inicializa o exportador
+
+        Args:
+            endpoint: URL do coletor (ex.: http://localhost:4318/v1/traces)
+            service_name: Nome do serviço (atributo service.name)
+        """
+        super().__init__()
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(OTLP_QUEUE_SIZE)
+        self._failures = 0
+        self._thread = threading.Thread(target=self._send_loop, name="trace-otlp", daemon=True)
+        self._thread.start()
+
+    def _write(self, spans: List[Span]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning(f"Fila de envio de spans cheia; {len(spans)} spans descartados")
+
+    def _send_loop(self) -> None:
+        """Envia os lotes da fila até receber None"""
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                return
+            try:
+                self._post(spans)
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                # Evita um aviso por lote com o coletor fora do ar
+                if self._failures == 1 or self._failures % 100 == 0:
+                    logger.warning(f"Erro ao enviar spans ao coletor {self.endpoint}: {str(e)}")
+
+    def _post(self, spans: List[Span]) -> None:
+        payload = otlp_payload([span.to_dict() for span in spans], self.service_name)
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=OTLP_TIMEOUT) as response:
+            response.read()
+
+    def shutdown(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(OTLP_TIMEOUT)
+
+
+class Tracer:
+    """
+    Cria os spans e os entrega ao exportador
+    """
+
+    def __init__(self, exporter: _BufferedExporter):
+        self.exporter = exporter
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+        """Abre um span (sem torná-lo o span atual)"""
+        return Span(self, name, parent, attributes)
+
+    def export(self, span: Span) -> None:
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning(f"Erro ao exportar span {span.name}: {str(e)}")
+
+    def shutdown(self) -> None:
+        try:
+            self.exporter.shutdown()
+        except Exception as e:
+            logger.warning(f"Erro ao encerrar o exportador de spans: {str(e)}")
+
+
+def default_trace_file(settings: Any) -> Path:
+    """Arquivo JSON Lines dos spans (TRACE_FILE ou <export_dir>/traces.jsonl)"""
+    return settings.trace_file or settings.export_dir / "traces.jsonl"
+
+
+def configure(exporter: Optional[_BufferedExporter]) -> None:
+    """
+    Ativa o rastreamento com um exportador (None desativa)
+
+    Args:
+        exporter: Destino dos spans
+    """
+    global _tracer
+    previous, _tracer = _tracer, Tracer(exporter) if exporter is not None else None
+    if previous is not None:
+        previous.shutdown()
+
+
+def configure_from_settings(settings: Any) -> None:
+    """
+    Ativa o rastreamento conforme TRACE_EXPORTER (none, jsonl ou otlp)
+
+    Args:
+        settings: Configurações da aplicação
+    """
+    name = settings.trace_exporter.lower()
+    if name == "jsonl":
+        configure(JsonLinesExporter(default_trace_file(settings)))
+        logger.info(f"Rastreamento ativado: {default_trace_file(settings)}")
+    elif name == "otlp":
+        configure(OTLPExporter(settings.trace_otlp_endpoint))
+        logger.info(f"Rastreamento ativado: {settings.trace_otlp_endpoint}")
+    elif name == "none":
+        configure(None)
+    else:
+        raise ValueError(f"TRACE_EXPORTER inválido: {settings.trace_exporter} (use {', '.join(EXPORTERS)})")
+
+
+def shutdown() -> None:
+    """Entrega os spans pendentes e desativa o rastreamento"""
+    configure(None)
+
+
+def enabled() -> bool:
+    """Indica se o rastreamento está ativo"""
+    return _tracer is not None
+
+
+def current_span() -> Optional[Span]:
+    """Span atual do contexto"""
+    return _current.get()
+
+
+def span(name: str, **attributes: Any):
+    """
+    Abre um span filho do span atual; usar com ``with``
+
+    Args:
+        name: Nome da etapa
+        **attributes: Atributos (ex.: rows=1000)
+
+    Returns:
+        Span (ou span vazio, com o rastreamento desativado)
+    """
+    tracer = _tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, _current.get(), **attributes)
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes: Any):
+    """
+    Abre um span sem torná-lo o atual; terminar com ``end()``
+
+    Args:
+        name: Nome da etapa
+        parent: Span pai (padrão: o span atual)
+        **attributes: Atributos
+
+    Returns:
+        Span (ou span vazio, com o rastreamento desativado)
+    """
+    tracer = _tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, parent if parent is not None else _current.get(), **attributes)
+
+
+@contextmanager
+def activate(active: Optional[Span]) -> Iterator[None]:
+    """Torna um span o atual dentro do bloco, sem terminá-lo"""
+    token = _current.set(active)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def traced_iterator(iterator: Iterator[Any], name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Rastreia o consumo de um iterador (ex.: corpo de uma resposta em fluxo)
+
+    O span começa no primeiro item pedido e termina quando o iterador acaba
+    ou é fechado; a cada item, o trabalho do iterador (leitura e formatação
+    do lote) fica dentro do span, mesmo executado em threads diferentes.
+    O span atual na chamada é marcado com ``streamed``.
+
+    Args:
+        iterator: Iterador a rastrear
+        name: Nome do span
+        **attributes: Atributos
+
+    Returns:
+        Iterador com os mesmos itens
+    """
+    tracer = _tracer
+    if tracer is None:
+        return iterator
+    parent = _current.get()
+    if parent is not None:
+        parent.set(streamed=True)
+    return _traced(tracer, iterator, name, parent, attributes)
+
+
+def _traced(tracer: Tracer, iterator: Iterator[Any], name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Iterator[Any]:
+    """Gerador de traced_iterator"""
+    traced = tracer.start_span(name, parent, **attributes)
+    items = 0
+    size = 0
+    error = None
+    try:
+        while True:
+            token = _current.set(traced)
+            try:
+                item = next(iterator, _END)
+            finally:
+                _current.reset(token)
+            if item is _END:
+                break
+            items += 1
+            if isinstance(item, (bytes, bytearray, memoryview)):
+                size += len(item)
+            yield item
+    except GeneratorExit:
+        traced.set(interrupted=True)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        traced.set(chunks=items, bytes=size)
+        traced.end(error)
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre o span raiz das requisições de exportação
+
+    O span ``http.response`` mede o envio do corpo (do início da resposta ao
+    último pedaço); respostas em fluxo já têm o seu (``response.stream``).
+    """
+
+    def __init__(self, app: Any, paths: Sequence[str] = TRACED_PATHS):
+        self.app = app
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if _tracer is None or scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        root = span(
+            "http.request",
+            method=scope["method"],
+            path=scope["path"],
+            query=scope.get("query_string", b"").decode("latin-1")
+        )
+        response = None
+        size = 0
+
+        async def traced_send(message: Dict[str, Any]) -> None:
+            nonlocal response, size
+            if message["type"] == "http.response.start":
+                root.set(status=message["status"])
+                if not root.attributes.get("streamed"):
+                    response = start_span("http.response", root)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+            if response is not None and message["type"] == "http.response.body" and not message.get("more_body", False):
+                response.set(bytes=size)
+                response.end()
+
+        with root:
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                root.set(bytes=size)
+                if response is not None:
+                    response.end()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Valor de atributo no formato OTLP/JSON"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: Dict[str, Any]) -> Any:
+    """Valor de atributo OTLP/JSON convertido para Python"""
+    if "boolValue" in value:
+        return value["boolValue"]
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    return value.get("stringValue")
+
+
+def otlp_payload(spans: List[Dict[str, Any]], service_name: str = SERVICE_NAME) -> Dict[str, Any]:
+    """
+    Corpo de uma requisição OTLP/HTTP (JSON) com os spans
+
+    Args:
+        spans: Spans no formato das linhas JSON (Span.to_dict)
+        service_name: Nome do serviço
+
+    Returns:
+        ExportTraceServiceRequest em JSON
+    """
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": span["trace_id"],
+                        "spanId": span["span_id"],
+                        "parentSpanId": span["parent_id"] or "",
+                        "name": span["name"],
+                        "kind": 2 if span["parent_id"] is None else 1,
+                        "startTimeUnixNano": str(span["start_ns"]),
+                        "endTimeUnixNano": str(span["end_ns"]),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)}
+                            for key, value in span["attributes"].items() if value is not None
+                        ],
+                        "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+                    }
+                    for span in spans
+                ],
+            }],
+        }]
+    }
+
+
+def spans_from_otlp(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Spans de uma requisição OTLP/HTTP (JSON) no formato das linhas JSON
+
+    Args:
+        payload: ExportTraceServiceRequest em JSON
+
+    Returns:
+        Spans (Span.to_dict)
+    """
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for item in scope_spans.get("spans", []):
+                start_ns = int(item["startTimeUnixNano"])
+                end_ns = int(item["endTimeUnixNano"])
+                status = item.get("status") or {}
+                spans.append({
+                    "trace_id": item["traceId"],
+                    "span_id": item["spanId"],
+                    "parent_id": item.get("parentSpanId") or None,
+                    "name": item["name"],
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    "attributes": {a["key"]: _from_otlp_value(a.get("value", {})) for a in item.get("attributes", [])},
+                    "error": status.get("message") or ("erro" if status.get("code") == 2 else None),
+                })
+    return spans
+
+
+def run_collector(path: Path, host: str = "127.0.0.1", port: int = 4318) -> None:
+    """
+    Coletor OTLP/HTTP local: recebe POST /v1/traces (JSON) e grava os spans
+    em JSON Lines, no mesmo formato do exportador jsonl
+
+    Args:
+        path: Arquivo de saída
+        host: Endereço de escuta
+        port: Porta (4318 é a porta padrão do OTLP/HTTP)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/v1/traces":
+                self._reply(404, {"message": "use POST /v1/traces"})
+                return
+            if "json" not in self.headers.get("Content-Type", ""):
+                self._reply(415, {"message": "apenas OTLP/HTTP com corpo JSON"})
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                spans = spans_from_otlp(json.loads(body))
+            except Exception as e:
+                self._reply(400, {"message": str(e)})
+                return
+            with lock, open(path, "a", encoding="utf-8") as output:
+                for item in spans:
+                    output.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self._reply(200, {})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(f"Coletor de spans: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logger.info(f"Coletor de spans em http://{host}:{port}/v1/traces gravando em {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
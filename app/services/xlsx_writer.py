@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Escrita de XLSX em fluxo, com memória constante
+
+Usa o modo ``constant_memory`` do xlsxwriter: cada linha vai para um
+arquivo temporário assim que a seguinte começa, de modo que a memória não
+cresce com o número de registros. As larguras das colunas são calculadas
+durante a escrita, a partir do maior texto visto em cada coluna, e uma
+nova planilha é aberta quando o limite de linhas do Excel é atingido.
+"""
+
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import xlsxwriter
+
+from app.services import tracing
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Limite de linhas de uma planilha do Excel (inclui o cabeçalho)
+EXCEL_MAX_ROWS = 1048576
+
+# Largura máxima de coluna aceita pelo Excel
+EXCEL_MAX_COLUMN_WIDTH = 255
+
+# Formatos de data no padrão do pandas
+DATE_FORMAT = "yyyy-mm-dd"
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+TIME_FORMAT = "hh:mm:ss"
+
+# Registros entre duas chamadas do callback de progresso
+PROGRESS_INTERVAL = 10000
+
+# Largura exibida dos valores de data/hora com os formatos acima
+_DATE_WIDTHS = {date: len(DATE_FORMAT), datetime: len(DATETIME_FORMAT), time: len(TIME_FORMAT)}
+
+
+def _number_width(value: Any) -> int:
+    """Largura de um número no formato Geral do Excel (até 11 dígitos significativos)"""
+    if value.__class__ is int:
+        return len(str(value))
+    return len(format(value, ".11g"))
+
+
+class StreamingXLSXWriter:
+    """
+    Escritor de XLSX em fluxo, com larguras de coluna calculadas durante a escrita
+    """
+
+    def __init__(
+        self,
+        path: Any,
+        columns: List[str],
+        sheet_name: str = "BPA_Export",
+        max_rows: int = EXCEL_MAX_ROWS
+    ):
+        """
+        Inicializa o escritor e abre a primeira planilha
+
+        Args:
+            path: Caminho do arquivo XLSX ou arquivo binário de saída
+            columns: Nomes das colunas, na ordem de saída
+            sheet_name: Nome base das planilhas (as seguintes recebem _2, _3, ...)
+            max_rows: Linhas por planilha, incluindo o cabeçalho
+        """
+        self.columns = list(columns)
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.rows_written = 0
+        self.sheets: List[str] = []
+
+        self._workbook = xlsxwriter.Workbook(path if hasattr(path, "write") else str(path), {
+            "constant_memory": True,
+            "strings_to_numbers": False,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+            "remove_timezone": True,
+            "nan_inf_to_errors": True,
+        })
+        self._header_format = self._workbook.add_format({
+            "bold": True, "border": 1, "align": "center", "valign": "top"
+        })
+        self._date_formats = {
+            date: self._workbook.add_format({"num_format": DATE_FORMAT}),
+            datetime: self._workbook.add_format({"num_format": DATETIME_FORMAT}),
+            time: self._workbook.add_format({"num_format": TIME_FORMAT}),
+        }
+        self._worksheet = None
+        self._row = 0
+        self._new_sheet()
+
+    def __enter__(self) -> "StreamingXLSXWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _new_sheet(self) -> None:
+        """Fecha a planilha atual (se houver) e abre a próxima, com cabeçalho"""
+        if self._worksheet is not None:
+            self._apply_widths()
+
+        name = self.sheet_name if not self.sheets else f"{self.sheet_name}_{len(self.sheets) + 1}"
+        self._worksheet = self._workbook.add_worksheet(name)
+        self.sheets.append(name)
+
+        # Estatísticas de largura da planilha: texto mais longo e extremos numéricos
+        self._widths = [len(str(c)) for c in self.columns]
+        self._min_numbers: List[Optional[Any]] = [None] * len(self.columns)
+        self._max_numbers: List[Optional[Any]] = [None] * len(self.columns)
+
+        for col, column in enumerate(self.columns):
+            self._worksheet.write_string(0, col, str(column), self._header_format)
+        self._row = 1
+
+    def _apply_widths(self) -> None:
+        """Define a largura de cada coluna da planilha atual"""
+        for col, width in enumerate(self._widths):
+            if self._max_numbers[col] is not None:
+                width = max(width, _number_width(self._max_numbers[col]), _number_width(self._min_numbers[col]))
+            self._worksheet.set_column(col, col, min(width + 2, EXCEL_MAX_COLUMN_WIDTH))
+
+    def write_row(self, values: Iterable[Any]) -> None:
+        """
+        Escreve uma linha de valores, na ordem das colunas
+
+        Args:
+            values: Valores da linha
+        """
+        if self._row >= self.max_rows:
+            self._new_sheet()
+
+        worksheet = self._worksheet
+        widths = self._widths
+        row = self._row
+        for col, value in enumerate(values):
+            cls = value.__class__
+            if cls is str:
+                if value:
+                    worksheet.write_string(row, col, value)
+                    if len(value) > widths[col]:
+                        widths[col] = len(value)
+            elif value is None:
+                continue
+            elif cls is int or cls is float or cls is Decimal:
+                # NaN fica em branco, como o na_rep do pandas
+                if value != value:
+                    continue
+                worksheet.write_number(row, col, value)
+                if self._max_numbers[col] is None:
+                    self._min_numbers[col] = self._max_numbers[col] = value
+                elif value > self._max_numbers[col]:
+                    self._max_numbers[col] = value
+                elif value < self._min_numbers[col]:
+                    self._min_numbers[col] = value
+            elif cls is bool:
+                worksheet.write_boolean(row, col, value)
+                if widths[col] < 5:
+                    widths[col] = 5
+            elif cls in _DATE_WIDTHS:
+                worksheet.write_datetime(row, col, value, self._date_formats[cls])
+                if widths[col] < _DATE_WIDTHS[cls]:
+                    widths[col] = _DATE_WIDTHS[cls]
+            else:
+                text = str(value)
+                worksheet.write_string(row, col, text)
+                if len(text) > widths[col]:
+                    widths[col] = len(text)
+
+        self._row = row + 1
+        self.rows_written += 1
+
+    def write_records(
+        self,
+        records: Iterable[Dict[str, Any]],
+        progress: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Escreve todos os registros de um iterável
+
+        Args:
+            records: Registros a escrever
+            progress: Chamado a cada PROGRESS_INTERVAL registros com o total escrito
+
+        Returns:
+            Total de registros escritos
+        """
+        columns = self.columns
+        iterator = iter(records)
+        while True:
+            batch = list(islice(iterator, PROGRESS_INTERVAL))
+            if not batch:
+                break
+            with tracing.span("format.batch", rows=len(batch)):
+                for record in batch:
+                    self.write_row([record.get(c) for c in columns])
+                    if progress and self.rows_written % PROGRESS_INTERVAL == 0:
+                        progress(self.rows_written)
+        return self.rows_written
+
+    def close(self) -> None:
+        """Aplica as larguras da última planilha e grava o arquivo"""
+        if self._workbook is None:
+            return
+        self._apply_widths()
+        self._workbook.close()
+        self._workbook = None
+
+
+def write_xlsx(
+    path: Any,
+    records: List[Dict[str, Any]],
+    sheet_name: str = "BPA_Export",
+    progress: Optional[Callable[[int], None]] = None
+) -> List[str]:
+    """
+    Grava os registros em XLSX com memória constante
+
+    Args:
+        path: Caminho do arquivo
+        records: Lista de registros
+        sheet_name: Nome base das planilhas
+        progress: Chamado a cada PROGRESS_INTERVAL registros com o total escrito
+
+    Returns:
+        Nomes das planilhas geradas
+    """
+    # Mesma ordem de colunas do DataFrame: ordem da primeira aparição das chaves
+    columns = list(dict.fromkeys(chain.from_iterable(records)))
+    with StreamingXLSXWriter(path, columns, sheet_name) as writer:
+        writer.write_records(records, progress)
+    return writer.sheets
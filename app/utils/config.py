@@ -7,11 +7,13 @@ Configurações da aplicação utilizando Pydantic para validação
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from pydantic import PostgresDsn, validator, Field
 from pydantic_settings import BaseSettings
 
+from app.utils.logs import DEFAULT_LOG_FILE
+
 # Diretório base da aplicação
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -36,10 +38,63 @@ class Settings(BaseSettings):
     # Configurações de exportação
     export_dir: Path = Field(BASE_DIR / "exports", env="EXPORT_DIR")
     
+    # Cache de artefatos (padrão: <export_dir>/cache)
+    cache_dir: Optional[Path] = Field(None, env="CACHE_DIR")
+    
+    # Tokens de atualização da API reaproveitados enquanto os contadores de alteração das
+    # tabelas (pg_stat_user_tables) não mudam, por no máximo estes segundos (0: sempre recalcula)
+    freshness_ttl: int = Field(300, env="FRESHNESS_TTL")
+    
+    # Retenção: cota de disco das exportações (bytes) e intervalo da limpeza (segundos, 0 desativa)
+    export_quota_bytes: int = Field(10 * 1024 ** 3, env="EXPORT_QUOTA_BYTES")
+    retention_interval: int = Field(900, env="RETENTION_INTERVAL")
+    
+    # Fila de jobs: banco SQLite (padrão: <export_dir>/jobs.sqlite3) e threads por processo (0 desativa)
+    jobs_db: Optional[Path] = Field(None, env="JOBS_DB")
+    job_workers: int = Field(2, env="JOB_WORKERS")
+    
+    # Exportação em lote: threads por lote (cada uma com uma conexão do pool)
+    batch_workers: int = Field(4, env="BATCH_WORKERS")
+    
+    # Admissão das exportações da API: vagas por formato (JSON, ex.: {"xlsx": 2}),
+    # orçamento de memória (bytes), máximo de pedidos na fila e espera máxima
+    # dos lotes e jobs por uma vaga (segundos)
+    export_slots: Dict[str, int] = Field(default_factory=dict, env="EXPORT_SLOTS")
+    export_memory_budget: int = Field(2 * 1024 ** 3, env="EXPORT_MEMORY_BUDGET")
+    export_queue_limit: int = Field(20, env="EXPORT_QUEUE_LIMIT")
+    export_admission_timeout: int = Field(300, env="EXPORT_ADMISSION_TIMEOUT")
+    
+    # Rastreamento das etapas: destino dos spans (none, jsonl ou otlp), arquivo
+    # JSON Lines (padrão: <export_dir>/traces.jsonl) e coletor OTLP/HTTP
+    trace_exporter: str = Field("none", env="TRACE_EXPORTER")
+    trace_file: Optional[Path] = Field(None, env="TRACE_FILE")
+    trace_otlp_endpoint: str = Field("http://localhost:4318/v1/traces", env="TRACE_OTLP_ENDPOINT")
+    
+    # Configuração de mapeamento e valores padrão: intervalo (segundos) entre as
+    # verificações de alteração dos arquivos (0 verifica a cada leitura)
+    config_check_interval: float = Field(2.0, env="CONFIG_CHECK_INTERVAL")
+    
     # Configurações do BPA-I
     default_cnes: str = Field("2560372", env="DEFAULT_CNES")
     default_orgao_emissor: str = Field("SESAU", env="DEFAULT_ORGAO_EMISSOR")
     
+    # BPA-I retomável da CLI: registros lidos entre dois pontos de controle
+    checkpoint_interval: int = Field(100000, env="CHECKPOINT_INTERVAL")
+    
+    # Pré-extração (run.py daemon): leitura das competências pré-extraídas pela cópia
+    # local (false lê sempre do banco), fichas por segmento, agenda cron e dias do mês
+    # em que a competência anterior (em fechamento) também é pré-extraída
+    extraction_cache: bool = Field(True, env="EXTRACTION_CACHE")
+    extraction_segment_size: int = Field(5000, env="EXTRACTION_SEGMENT_SIZE")
+    daemon_schedule: str = Field("0 1-5 * * *", env="DAEMON_SCHEDULE")
+    daemon_close_days: int = Field(10, env="DAEMON_CLOSE_DAYS")
+    
+    # Perfil de desempenho sob demanda na API (parâmetro perfil / cabeçalho X-Perfil)
+    profiling_enabled: bool = Field(False, env="PROFILING_ENABLED")
+    
+    # Arquivo de log (vazio: apenas console)
+    log_file: str = Field(DEFAULT_LOG_FILE, env="LOG_FILE")
+    
     # Outras configurações
     app_name: str = Field("BPA Exporter", env="APP_NAME")
     app_version: str = Field("2.0.0", env="APP_VERSION")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Respostas de download dos arquivos exportados
+
+Os arquivos do cache de artefatos são imutáveis: a chave inclui o token de
+atualização dos dados e o hash da configuração, e o conteúdo tem hash
+SHA-256 conhecido. Isso permite:
+
+- ETag forte (hash do conteúdo + hash da chave);
+- ``304 Not Modified`` quando o cliente já tem a versão (If-None-Match),
+  sem reenviar o arquivo;
+- ``Range`` para retomar downloads interrompidos (``206 Partial Content``),
+  com ``If-Range`` para não emendar pedaços de versões diferentes.
+
+O Starlette desta versão não trata Range no FileResponse, por isso o
+trecho pedido é enviado por um StreamingResponse.
+"""
+
+import re
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.services.artifact_cache import Artifact
+
+# Tamanho dos pedaços lidos do arquivo em respostas parciais
+RANGE_CHUNK_SIZE = 1 << 20
+
+# Tipos de conteúdo pela extensão dos arquivos exportados
+MEDIA_TYPES = {
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".parquet": "application/vnd.apache.parquet",
+    ".txt": "application/octet-stream",
+}
+
+_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+
+
+def artifact_etag(artifact: Artifact) -> str:
+    """
+    ETag forte de um artefato: hash do conteúdo e da chave (dados e configuração)
+
+    Args:
+        artifact: Artefato do cache
+
+    Returns:
+        ETag entre aspas
+    """
+    return f'"{artifact.sha256[:32]}-{artifact.key[:16]}"'
+
+
+def media_type_for(filename: str) -> str:
+    """Tipo de conteúdo de um arquivo exportado"""
+    for extension, media_type in MEDIA_TYPES.items():
+        if filename.endswith(extension):
+            return media_type
+    return "application/octet-stream"
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """
+    Verifica se um If-None-Match/If-Range contém a ETag
+
+    Args:
+        header: Valor do cabeçalho
+        etag: ETag atual
+        weak: Comparação fraca (ignora o prefixo W/), usada no If-None-Match
+
+    Returns:
+        True se alguma das ETags informadas corresponde
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta um cabeçalho Range de um único intervalo
+
+    Args:
+        header: Valor do cabeçalho (ex.: "bytes=1000-", "bytes=-500")
+        size: Tamanho do arquivo
+
+    Returns:
+        Tupla (início, fim inclusivo) ou None se o cabeçalho deve ser
+        ignorado (inválido ou com vários intervalos: envia o arquivo inteiro)
+
+    Raises:
+        ValueError: Intervalo fora do arquivo (416)
+    """
+    match = _RANGE.match(header)
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Sufixo: os últimos N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Intervalo vazio")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Início do intervalo além do fim do arquivo")
+    return start, end
+
+
+def _file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    """Lê um trecho do arquivo em pedaços"""
+    remaining = end - start + 1
+    with open(path, "rb") as file:
+        file.seek(start)
+        while remaining > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _content_disposition(filename: str) -> str:
+    """Content-Disposition de download (como o do FileResponse)"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def artifact_response(
+    request: Request,
+    artifact: Artifact,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    immutable: bool = False
+) -> Response:
+    """
+    Resposta de download de um artefato com ETag, 304 e Range
+
+    If-None-Match e Range só valem para GET e HEAD; nos demais métodos
+    (ex.: POST /export/bpa) o arquivo é enviado inteiro, com a ETag.
+
+    Args:
+        request: Requisição (If-None-Match, Range, If-Range)
+        artifact: Artefato do cache
+        media_type: Tipo de conteúdo
+        headers: Cabeçalhos adicionais
+        immutable: A URL identifica sempre o mesmo conteúdo (pode ficar em
+            cache no cliente); senão, o cliente revalida a cada uso
+
+    Returns:
+        200 (arquivo inteiro), 206 (trecho), 304 ou 416
+    """
+    etag = artifact_etag(artifact)
+    common = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable" if immutable else "private, no-cache",
+        **(headers or {}),
+    }
+
+    conditional = request.method in ("GET", "HEAD")
+
+    # O cliente já tem esta versão
+    if conditional and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=common)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if conditional and range_header and (if_range is None or etag_matches(if_range, etag, weak=False)):
+        try:
+            byte_range = parse_range(range_header, artifact.size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**common, "Content-Range": f"bytes */{artifact.size}"}
+            )
+
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                _file_range(str(artifact.path), start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers={
+                    **common,
+                    "Content-Range": f"bytes {start}-{end}/{artifact.size}",
+                    "Content-Length": str(end - start + 1),
+                    "Content-Disposition": _content_disposition(artifact.filename),
+                }
+            )
+
+    return FileResponse(
+        path=artifact.path,
+        filename=artifact.filename,
+        media_type=media_type,
+        headers=common
+    )
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Configuração do logging da aplicação
+
+Chamada explicitamente pelos pontos de entrada (inicialização da API e
+``run.py``), e não na importação dos módulos: importar ``main`` ou
+``run`` (testes, ferramentas, ``--help``) não cria nem abre o arquivo de
+log.
+"""
+
+import logging
+from typing import List, Optional
+
+# Formato das mensagens e arquivo padrão (LOG_FILE)
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+DEFAULT_LOG_FILE = "bpa_exporter.log"
+
+
+def configure_logging(log_file: Optional[str] = None, level: int = logging.INFO) -> None:
+    """
+    Configura o logging no console e, opcionalmente, em arquivo
+
+    Não faz nada se o logging já foi configurado (ex.: pelo servidor ou
+    por uma chamada anterior).
+
+    Args:
+        log_file: Arquivo de log (None ou vazio: apenas console)
+        level: Nível mínimo das mensagens
+    """
+    if logging.getLogger().handlers:
+        return
+
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da exportação CSV: pandas x escritor em fluxo
+
+Gera registros sintéticos com as mesmas colunas e tipos de
+DataService.get_records e mede, em processos separados, o tempo e o pico
+de memória (RSS) de cada caminho:
+
+- pandas: pd.DataFrame(records).to_csv(QUOTE_ALL), como antes
+- fluxo: write_csv sobre a lista de registros
+- gerador: StreamingCSVWriter alimentado por um gerador, sem lista
+
+Ao final confere se os arquivos gerados por pandas e fluxo são idênticos.
+
+Uso:
+    python benchmarks/bench_csv_export.py --linhas 1000000 10000000
+    python benchmarks/bench_csv_export.py --linhas 10000000 --variantes gerador
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.csv_writer import (  # noqa: E402
+    CSV_BUFFER_SIZE, StreamingCSVWriter, infer_csv_columns, write_csv
+)
+
+VARIANTES = ("pandas", "fluxo", "gerador")
+
+
+def gerar_registros(total):
+    """Gera registros sintéticos no formato de DataService.get_records"""
+    for i in range(total):
+        yield {
+            "numero": 1000000 + i // 3,
+            "cod_paciente": 500000 + i % 70000,
+            "cod_convenio": 1,
+            "cod_tp_sus": None,
+            "cod_grupo_sus": 3,
+            "cod_esp_sus": None,
+            "data_atendimento": date(2025, 1, 1 + i % 28),
+            "cod_especialidade": 40 + i % 12,
+            "cid": "Z000" if i % 5 else None,
+            "cnes": "2560372",
+            "urgente_eletivo": "E",
+            "tipo_atend": "AMB",
+            "cns_paciente": str(898001160000000 + i % 70000),
+            "cod_medico": 300 + i % 150,
+            "cns_profissional": None,
+            "cbo": "225125",
+            "id_lancamento": 9000000 + i,
+            "procedimento": 301010072 + i % 40,
+            "quantidade": Decimal(1 + i % 3),
+            "cod_cbo": "225125",
+            "tipo_operacao": "I",
+            "carater_atendimento": "1",
+            "data": datetime(2025, 1, 1 + i % 28, 8 + i % 10, i % 60),
+            "codigo_procedimento": f"03010100{72 + i % 20}",
+            "cod_sexo_paciente": 1 + i % 2,
+            "data_nasc_paciente": date(1950 + i % 60, 1 + i % 12, 1 + i % 28),
+            "competencia": "202501",
+        }
+
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo, em MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def executar_variante(variante, linhas, saida):
+    """Executa uma variante e retorna as medições"""
+    inicio = time.perf_counter()
+    if variante == "gerador":
+        # Tipos inferidos de uma amostra; o gerador é homogêneo
+        colunas, formatadores = infer_csv_columns(list(gerar_registros(1000)))
+        with open(saida, "w", encoding="utf-8", newline="", buffering=CSV_BUFFER_SIZE) as stream:
+            StreamingCSVWriter(stream, colunas, formatadores).write_records(gerar_registros(linhas))
+        preparo = 0.0
+    else:
+        registros = list(gerar_registros(linhas))
+        preparo = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        if variante == "pandas":
+            import pandas as pd
+
+            pd.DataFrame(registros).to_csv(saida, index=False, encoding="utf-8", quoting=csv.QUOTE_ALL)
+        else:
+            write_csv(saida, registros)
+
+    return {
+        "variante": variante,
+        "linhas": linhas,
+        "preparo_s": round(preparo, 2),
+        "escrita_s": round(time.perf_counter() - inicio, 2),
+        "pico_mb": round(pico_memoria_mb()),
+        "bytes": os.path.getsize(saida),
+    }
+
+
+def resumo_arquivo(caminho):
+    """SHA-256 do arquivo"""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def main():
+    """Executa o benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark da exportação CSV")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--variantes", nargs="+", choices=VARIANTES, default=list(VARIANTES))
+    parser.add_argument("--executar", choices=VARIANTES, help=argparse.SUPPRESS)
+    parser.add_argument("--saida", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        print(json.dumps(executar_variante(args.executar, args.linhas[0], args.saida)))
+        return
+
+    pasta = tempfile.mkdtemp(prefix="bench_csv_")
+    print(f"{'variante':<10}{'linhas':>12}{'preparo (s)':>14}{'escrita (s)':>14}{'pico (MB)':>12}{'bytes':>16}")
+    for linhas in args.linhas:
+        arquivos = {}
+        for variante in args.variantes:
+            saida = os.path.join(pasta, f"{variante}_{linhas}.csv")
+            processo = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--executar", variante,
+                 "--linhas", str(linhas), "--saida", saida],
+                capture_output=True, text=True
+            )
+            if processo.returncode != 0:
+                motivo = processo.stderr.strip().splitlines()[-1:] or [f"código {processo.returncode}"]
+                print(f"{variante:<10}{linhas:>12}  falhou: {motivo[0]}")
+                continue
+            r = json.loads(processo.stdout)
+            print(f"{variante:<10}{linhas:>12}{r['preparo_s']:>14}{r['escrita_s']:>14}{r['pico_mb']:>12}{r['bytes']:>16}")
+            arquivos[variante] = saida
+
+        hashes = {v: resumo_arquivo(p) for v, p in arquivos.items()}
+        if len(set(hashes.values())) > 1:
+            print(f"  ATENÇÃO: arquivos diferentes para {linhas} linhas: {hashes}")
+        elif len(hashes) > 1:
+            print(f"  Saídas idênticas ({', '.join(hashes)})")
+        for caminho in arquivos.values():
+            os.remove(caminho)
+
+    os.rmdir(pasta)
+
+
+if __name__ == "__main__":
+    main()
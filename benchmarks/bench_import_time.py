@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do tempo de inicialização: importação de run.py (e main.py)
+
+Executa ``python -X importtime`` em processos novos, várias vezes, e
+compara a mediana do tempo acumulado de importação do módulo com um
+orçamento. Também confere que a importação não carrega dependências
+pesadas dos formatos (pandas, pyarrow, xlsxwriter, openpyxl, numpy), não
+cria o engine do banco (nem carrega o driver) e não configura o logging
+(arquivo de log). Sai com código 1 se algo falhar, para uso na
+integração contínua.
+
+Uso:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --modulos run main --orcamento 800 --repeticoes 9
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que só podem ser carregados quando o formato (ou o banco) é usado
+PROIBIDOS = ("pandas", "pyarrow", "xlsxwriter", "openpyxl", "numpy", "psycopg2")
+
+# Código executado em cada processo, após a importação
+VERIFICACAO = """
+import json, logging, sys
+import {modulo}
+from app.database import connection
+print(json.dumps({{
+    "carregados": [m for m in {proibidos!r} if m in sys.modules],
+    "engine": connection._engine is not None,
+    "logging": bool(logging.getLogger().handlers),
+}}))
+"""
+
+
+def medir(modulo):
+    """Importa o módulo em um processo novo e retorna as medições"""
+    # Credenciais fictícias: a importação não deve conectar nem validar o banco
+    ambiente = {"DB_NAME": "bench", "DB_USER": "bench", "DB_PASSWORD": "bench", **os.environ}
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", VERIFICACAO.format(modulo=modulo, proibidos=PROIBIDOS)],
+        capture_output=True, text=True, cwd=RAIZ, env=ambiente
+    )
+    if processo.returncode != 0:
+        motivo = processo.stderr.strip().splitlines()[-1:] or [f"código {processo.returncode}"]
+        raise RuntimeError(f"falha ao importar {modulo}: {motivo[0]}")
+
+    # Linhas "import time: <próprio> | <acumulado> | <módulo>" (microssegundos), com os
+    # módulos importados indentados antes de quem os importou
+    total, diretos, pendentes = 0, [], []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        _, acumulado, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome.rstrip()) - len(nome.strip()) - 1) // 2
+        if nivel == 0:
+            if nome.strip() == modulo:
+                total, diretos = int(acumulado), pendentes
+            pendentes = []
+        elif nivel == 1:
+            pendentes.append((nome.strip(), int(acumulado)))
+
+    return total, diretos, json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+def main():
+    """Executa o benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark do tempo de importação")
+    parser.add_argument("--modulos", nargs="+", default=["run"], help="Módulos importados (padrão: run)")
+    parser.add_argument("--orcamento", type=float, default=1000.0, help="Tempo máximo de importação, em ms (padrão: 1000)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Processos por módulo (padrão: 5)")
+    parser.add_argument("--top", type=int, default=10, help="Pacotes mais lentos exibidos (padrão: 10)")
+    args = parser.parse_args()
+
+    falhas = []
+    for modulo in args.modulos:
+        try:
+            medicoes = sorted((medir(modulo) for _ in range(max(1, args.repeticoes))), key=lambda medicao: medicao[0])
+        except RuntimeError as e:
+            falhas.append(str(e))
+            continue
+        totais = [total / 1000 for total, _, _ in medicoes]
+        mediana = statistics.median(totais)
+
+        # Importações diretas do módulo na execução mediana, pelo tempo acumulado
+        _, diretos, estado = medicoes[len(medicoes) // 2]
+        print(f"{modulo}: mediana {mediana:.0f} ms (mín. {min(totais):.0f}, máx. {max(totais):.0f}, orçamento {args.orcamento:.0f})")
+        for nome, acumulado in sorted(diretos, key=lambda item: -item[1])[:args.top]:
+            print(f"  {nome:<40}{acumulado / 1000:>10.1f} ms")
+
+        if mediana > args.orcamento:
+            falhas.append(f"{modulo}: {mediana:.0f} ms acima do orçamento de {args.orcamento:.0f} ms")
+        if estado["carregados"]:
+            falhas.append(f"{modulo}: importa {', '.join(estado['carregados'])} na inicialização")
+        if estado["engine"]:
+            falhas.append(f"{modulo}: cria o engine do banco na importação")
+        if estado["logging"]:
+            falhas.append(f"{modulo}: configura o logging na importação")
+
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,35 +8,44 @@ Substitui a versão anterior em Flask, oferecendo melhor desempenho e organizaç
 """
 
 import os
+import json
+import asyncio
 import logging
+import threading
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from itertools import chain
+from typing import List, Optional, Dict, Any, Tuple
 
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, Query, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.database.connection import get_db
+from app.database.connection import SessionLocal, get_engine, get_db
 from app.models.header import HeaderBPA
-from app.services.export_service import ExportService
+from app.services.export_service import ExportService, export_filename
+from app.services.artifact_cache import ArtifactCache, normalize_options
 from app.services.bpa_service import BPAService
-from app.services.data_service import DataService
+from app.services.data_service import DataService, RECORDS_BATCH_SIZE, freshness_row_count
+from app.services.compatibility_service import CompatibilityReport, ProcedureCompatibilityService
+from app.services.stream_service import StreamingExportService
+from app.services.ndjson_writer import projection
+from app.services.coalescing import RequestCoalescer, coalescing_key
+from app.services.admission import AdmissionRejected, AdmissionTicket, get_admission_controller, thread_admit
+from app.services import metrics, profiling, tracing
+from modules.duplicates import MODO_REPORTAR, MODO_SOMAR, RelatorioDuplicidades
 from app.utils.config import Settings, get_settings
-from app.routes import config_routes
-
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bpa_exporter.log"),
-        logging.StreamHandler()
-    ]
-)
+from app.utils.logs import configure_logging
+from app.utils.downloads import artifact_response
+from app.services.retention_service import retention_loop
+from app.services.config_store import get_config_store, watch_loop
+from app.services.job_service import JobWorkerPool
+from app.services.batch_service import BatchExporter, batch_manifest, competencia_range, parse_formats, stream_archive
+from app.routes import config_routes, artifact_routes, job_routes
+
 logger = logging.getLogger(__name__)
 
 # Inicialização da aplicação FastAPI
@@ -55,8 +64,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Span raiz das requisições de exportação (com TRACE_EXPORTER ativo)
+app.add_middleware(tracing.TracingMiddleware)
+
 # Rotas de configuração
 app.include_router(config_routes.router)
+app.include_router(artifact_routes.router)
+app.include_router(job_routes.router)
+
+# Logging (configurado na inicialização, não na importação do módulo)
+@app.on_event("startup")
+async def start_logging():
+    """Configura o logging no console e em LOG_FILE"""
+    configure_logging(get_settings().log_file)
+
+# Retenção do diretório de exportação em segundo plano
+@app.on_event("startup")
+async def start_retention():
+    """Inicia a aplicação periódica da cota de disco das exportações"""
+    settings = get_settings()
+    if settings.retention_interval > 0:
+        app.state.retention_task = asyncio.create_task(retention_loop(settings))
+
+@app.on_event("shutdown")
+async def stop_retention():
+    """Interrompe a tarefa de retenção"""
+    task = getattr(app.state, "retention_task", None)
+    if task is not None:
+        task.cancel()
+
+# Verificação dos arquivos de configuração em segundo plano
+@app.on_event("startup")
+async def start_config_watch():
+    """Carrega a configuração de mapeamento e padrões e acompanha as alterações"""
+    settings = get_settings()
+    store = get_config_store(settings)
+    await asyncio.to_thread(store.refresh)
+    if settings.config_check_interval > 0:
+        app.state.config_watch_task = asyncio.create_task(watch_loop(store, settings.config_check_interval))
+
+@app.on_event("shutdown")
+async def stop_config_watch():
+    """Interrompe a verificação dos arquivos de configuração"""
+    task = getattr(app.state, "config_watch_task", None)
+    if task is not None:
+        task.cancel()
+
+# Fila de jobs de exportação
+@app.on_event("startup")
+async def start_job_workers():
+    """Inicia as threads que executam os jobs da fila"""
+    settings = get_settings()
+    if settings.job_workers > 0:
+        app.state.job_pool = JobWorkerPool(settings, SessionLocal, loop=asyncio.get_running_loop())
+        app.state.job_pool.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Interrompe as threads da fila (jobs em execução voltam à fila)"""
+    pool = getattr(app.state, "job_pool", None)
+    if pool is not None:
+        await asyncio.to_thread(pool.stop)
+
+# Rastreamento das etapas das exportações
+@app.on_event("startup")
+async def start_tracing():
+    """Ativa o rastreamento conforme TRACE_EXPORTER"""
+    tracing.configure_from_settings(get_settings())
+
+@app.on_event("shutdown")
+async def stop_tracing():
+    """Grava os spans pendentes"""
+    await asyncio.to_thread(tracing.shutdown)
+
+# Gerações em andamento, compartilhadas por requisições idênticas
+coalescer = RequestCoalescer()
 
 # Modelos de entrada
 class HeaderData(BaseModel):
@@ -64,6 +146,325 @@ class HeaderData(BaseModel):
     cnes: str = Field(..., min_length=1, max_length=7, description="Código CNES do estabelecimento")
     competencia: str = Field(..., min_length=6, max_length=6, description="Competência (formato AAAAMM)")
     orgao_emissor: str = Field(..., description="Órgão emissor")
+    ignorar_incompatibilidades: bool = Field(False, description="Gera o arquivo mesmo com lançamentos incompatíveis com as regras de procedimento")
+    duplicidades: str = Field(MODO_REPORTAR, pattern="^(reportar|descartar|somar)$", description="Tratamento de lançamentos duplicados: reportar, descartar ou somar")
+
+class BatchRequest(BaseModel):
+    """Modelo para a exportação em lote"""
+    competencia_inicial: str = Field(..., min_length=6, max_length=6, description="Primeira competência (formato AAAAMM)")
+    competencia_final: str = Field(..., min_length=6, max_length=6, description="Última competência (formato AAAAMM)")
+    formatos: List[str] = Field(["bpa"], description="Formatos: csv, xlsx, parquet e/ou bpa")
+    cnes: Optional[str] = Field(None, min_length=1, max_length=7, description="Código CNES do estabelecimento (BPA-I; padrão: DEFAULT_CNES)")
+    orgao_emissor: Optional[str] = Field(None, description="Órgão emissor (BPA-I; padrão: DEFAULT_ORGAO_EMISSOR)")
+    ignorar_incompatibilidades: bool = Field(False, description="Gera o BPA-I mesmo com lançamentos incompatíveis com as regras de procedimento")
+    duplicidades: str = Field(MODO_REPORTAR, pattern="^(reportar|descartar|somar)$", description="Tratamento de lançamentos duplicados: reportar, descartar ou somar")
+
+# Geração dos arquivos
+async def _admit(format: str, rows: int, batched: bool = False) -> AdmissionTicket:
+    """
+    Aguarda vaga e memória para uma exportação
+    
+    Args:
+        format: Formato da exportação
+        rows: Quantidade estimada de registros
+        batched: Lê os registros em lotes (apenas um lote em memória)
+        
+    Returns:
+        Pedido admitido (devolvido com release ao terminar)
+    """
+    try:
+        return await get_admission_controller().acquire(format, rows, batched)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def _cached_artifact(
+    settings: Settings,
+    key,
+    format: str,
+    competencia: Optional[str],
+    make_key,
+    generate,
+    batched: bool = False,
+    profile: Optional[str] = None,
+    rules: bool = False
+):
+    """
+    Obtém o artefato do cache ou o gera, uma única vez para requisições idênticas
+    
+    O token de atualização é reaproveitado enquanto as tabelas não mudam
+    (FRESHNESS_TTL), de modo que um artefato em cache não custa uma leitura
+    da competência. O token e a geração rodam em threads, com sessão própria:
+    a de get_db é fechada se o cliente desconectar, mas a geração continua
+    para as demais requisições agrupadas. Só a geração passa pelo controle
+    de admissão; arquivos em cache são servidos direto.
+    
+    Com perfil, o arquivo é sempre gerado de novo (o diagnóstico é o da
+    geração), sem agrupar com outras requisições, e guardado com uma chave
+    própria (a opção perfil): não substitui o artefato servido às demais
+    requisições, e os relatórios ficam junto dele. Um perfil por vez no
+    processo; os demais recebem 409.
+    
+    Args:
+        settings: Configurações da aplicação
+        key: Chave de agrupamento (parâmetros normalizados)
+        format: Formato da exportação (vagas e memória da admissão)
+        competencia: Competência no formato AAAAMM (opcional)
+        make_key: Função (cache, token) que monta a chave do artefato
+        generate: Função (sessão, cache, chave) que gera o artefato
+        batched: A geração lê os registros em lotes
+        profile: Modo de perfil da geração (cprofile, sampling ou memory)
+        rules: O token inclui a versão das regras de compatibilidade (BPA-I)
+        
+    Returns:
+        Artefato gerado ou obtido do cache
+    """
+    def freshness_token(db):
+        data_service = DataService(db)
+        token = data_service.get_cached_freshness_token(competencia, settings.freshness_ttl)
+        if rules:
+            token += "-" + data_service.get_cached_token(
+                ("regras", competencia),
+                lambda: ProcedureCompatibilityService.rules_token(db, competencia),
+                settings.freshness_ttl
+            )
+        return token
+    
+    def profiled(db, cache, artifact_key):
+        profiler = profiling.Profiler(profile)
+        with profiler:
+            artifact = generate(db, cache, artifact_key)
+        profiler.write_reports(artifact.path)
+        return artifact
+    
+    async def run():
+        db = SessionLocal()
+        # As threads herdam o contexto: medições da consulta e da geração saem com o formato
+        with metrics.export_format(format):
+            try:
+                cache = ArtifactCache(settings)
+                freshness = await asyncio.to_thread(freshness_token, db)
+                artifact_key = make_key(cache, freshness)
+                if profile is None:
+                    artifact = await asyncio.to_thread(cache.lookup, artifact_key)
+                    if artifact is not None:
+                        return artifact
+                else:
+                    options = json.loads(artifact_key.options)
+                    artifact_key = artifact_key._replace(options=normalize_options(**options, perfil=profile))
+                
+                ticket = await _admit(format, freshness_row_count(freshness), batched)
+                try:
+                    return await asyncio.to_thread(profiled if profile else generate, db, cache, artifact_key)
+                except profiling.ProfilerBusy as e:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+                finally:
+                    get_admission_controller().release(ticket)
+            finally:
+                db.close()
+    
+    if profile is not None:
+        return await run()
+    return await coalescer.run(key, run)
+
+def _validated_bpa_records(
+    db: Session,
+    header_data: "HeaderData"
+) -> Tuple[List[Dict[str, Any]], Optional[RelatorioDuplicidades]]:
+    """
+    Obtém os registros da competência e verifica a compatibilidade com as regras de procedimento
+    
+    Com a validação do daemon em dia (DataService.get_prewarmed_validation),
+    os registros não são verificados de novo.
+    
+    Args:
+        db: Sessão do banco
+        header_data: Dados do cabeçalho do BPA-I
+        
+    Returns:
+        Registros da competência e o relatório de duplicidades pré-calculado (None sem validação em dia)
+    """
+    data_service = DataService(db)
+    prewarmed = data_service.get_prewarmed_validation(header_data.competencia)
+    if prewarmed is not None and not header_data.ignorar_incompatibilidades:
+        _raise_incompatible(prewarmed[0])
+    
+    records = data_service.get_records(header_data.competencia)
+    
+    if not records:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Nenhum registro encontrado para a competência {header_data.competencia}"
+        )
+    
+    if prewarmed is not None:
+        return records, prewarmed[1]
+    
+    # Verifica sexo, faixa etária e CBO contra as regras dos procedimentos
+    with tracing.span("bpa.validation", rows=len(records)):
+        compatibility = ProcedureCompatibilityService.from_database(db, header_data.competencia)
+        report = compatibility.check_records(records)
+    if not header_data.ignorar_incompatibilidades:
+        _raise_incompatible(report)
+    return records, None
+
+def _check_bpa_stream(db: Session, competencia: str, compatibility: ProcedureCompatibilityService) -> CompatibilityReport:
+    """
+    Verifica a compatibilidade dos registros lendo-os em lotes (apenas um lote em memória)
+    
+    Args:
+        db: Sessão do banco
+        competencia: Competência no formato AAAAMM
+        compatibility: Regras de compatibilidade dos procedimentos
+        
+    Returns:
+        Relatório de incompatibilidades
+    """
+    report = CompatibilityReport()
+    with metrics.export_format("bpa"), tracing.span("bpa.validation") as span:
+        stream = DataService(db).stream_records(competencia)
+        try:
+            for batch in stream:
+                for _ in compatibility.check_stream(batch, report):
+                    pass
+        finally:
+            stream.close()
+        span.set(rows=report.total_registros)
+    return report
+
+def _raise_incompatible(report: CompatibilityReport) -> None:
+    """Recusa a exportação (422) se houver registros incompatíveis"""
+    if report.rejeitados:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": f"{report.rejeitados} registros incompatíveis com as regras de procedimento",
+                "compatibilidade": report.to_dict()
+            }
+        )
+
+def _artifact_headers(artifact, profile: Optional[str] = None) -> Dict[str, str]:
+    """
+    Endereço fixo do artefato, para retomar o download com Range (ex.: após POST),
+    e, com perfil, os relatórios gravados junto dele
+    """
+    headers = {"Content-Location": f"/artifacts/{artifact.key}/download"}
+    if profile:
+        headers["X-Perfil-Relatorios"] = ", ".join(str(path) for path in profiling.report_files(artifact.path))
+    return headers
+
+def _profile_mode(
+    perfil: Optional[str] = Query(None, description="Perfil de desempenho da geração: cprofile, sampling ou memory (PROFILING_ENABLED)"),
+    x_perfil: Optional[str] = Header(None, alias="X-Perfil", description="Alternativa ao parâmetro perfil"),
+    fluxo: bool = Query(False),
+    settings: Settings = Depends(get_settings)
+) -> Optional[str]:
+    """
+    Modo de perfil pedido pelo parâmetro perfil ou pelo cabeçalho X-Perfil
+    
+    Returns:
+        cprofile, sampling, memory ou None
+    """
+    try:
+        mode = profiling.parse_profile_mode(perfil or x_perfil)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if mode is None:
+        return None
+    if not settings.profiling_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Perfil de desempenho desativado (PROFILING_ENABLED)"
+        )
+    if fluxo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Perfil de desempenho disponível apenas sem o modo fluxo"
+        )
+    return mode
+
+# Respostas em fluxo
+async def _open_record_stream(format: str, competencia: Optional[str], allow_empty: bool = False, **options):
+    """
+    Reserva vaga de admissão, abre uma sessão própria e lê o primeiro lote dos registros
+    
+    A sessão de get_db é fechada antes do corpo de um StreamingResponse ser
+    enviado, por isso o fluxo usa uma sessão que só é fechada ao final.
+    
+    Args:
+        format: Formato da exportação (vagas da admissão; um lote em memória)
+        competencia: Competência no formato AAAAMM (opcional)
+        allow_empty: Aceita consulta sem registros (senão, 404)
+        **options: Demais argumentos de DataService.stream_records (cursor, limite)
+        
+    Returns:
+        Tupla (sessão, fluxo, primeiro lote, lotes restantes, pedido de admissão)
+    """
+    def open_stream():
+        with metrics.export_format(format):
+            stream = DataService(db).stream_records(competencia, **options)
+        batches = iter(stream)
+        return stream, batches, next(batches, None)
+    
+    ticket = await _admit(format, RECORDS_BATCH_SIZE, batched=True)
+    db = SessionLocal()
+    try:
+        # A consulta e o primeiro lote rodam fora do event loop
+        stream, batches, first = await asyncio.to_thread(open_stream)
+        
+        if not first and not allow_empty:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Nenhum registro encontrado para exportação"
+            )
+    except BaseException:
+        db.close()
+        get_admission_controller().release(ticket)
+        raise
+    
+    return db, stream, first or [], batches, ticket
+
+def _streaming_response(
+    chunks,
+    filename: str,
+    media_type: str,
+    db: Optional[Session] = None,
+    headers: Optional[Dict[str, str]] = None,
+    ticket: Optional[AdmissionTicket] = None
+):
+    """
+    Resposta em fluxo que fecha a sessão do banco e devolve a vaga de
+    admissão ao terminar (ou ao ser interrompida)
+    
+    Args:
+        chunks: Iterador de pedaços do corpo
+        filename: Nome do arquivo para download
+        media_type: Tipo de conteúdo
+        db: Sessão a fechar ao final
+        headers: Cabeçalhos adicionais
+        ticket: Pedido de admissão a devolver ao final
+        
+    Returns:
+        StreamingResponse
+    """
+    def body():
+        try:
+            yield from chunks
+        finally:
+            chunks.close()
+            if db is not None:
+                db.close()
+            if ticket is not None:
+                get_admission_controller().release(ticket)
+    
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})}
+    )
 
 # Rotas
 @app.get("/")
@@ -83,10 +484,89 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/export/inflight")
+async def export_inflight():
+    """
+    Gerações em andamento, agrupamento de requisições idênticas e controle de admissão
+    
+    Returns:
+        Execuções, requisições agrupadas e aguardando, gerações em andamento,
+        vagas, memória reservada e fila de admissão
+    """
+    return {**coalescer.stats(), "admissao": get_admission_controller().stats()}
+
+def _pool_samples():
+    """Conexões do pool do SQLAlchemy (em uso, excedentes e tamanho)"""
+    pool = get_engine().pool
+    samples = []
+    for state, read in (("checked_out", "checkedout"), ("overflow", "overflow"), ("size", "size")):
+        if hasattr(pool, read):
+            # overflow() é negativo enquanto o pool não está cheio
+            samples.append(((state,), max(getattr(pool, read)(), 0)))
+    return samples
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Métricas no formato de exposição do Prometheus
+    
+    Returns:
+        Duração das etapas por formato, vazão, bytes gravados, pool de conexões,
+        exportações em andamento e acertos do cache de artefatos
+    """
+    admission = get_admission_controller().stats()
+    inflight = coalescer.stats()
+    job_pool = getattr(app.state, "job_pool", None)
+    
+    collected = [
+        metrics.collected(
+            metrics.Gauge, "bpa_db_pool_connections", "Conexões do pool do SQLAlchemy", ("state",), _pool_samples()
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_exports_in_progress", "Exportações em execução (admitidas) por formato", ("format",),
+            [((format,), admission["em_execucao"].get(format, 0)) for format in admission["vagas"]]
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_export_slots", "Vagas simultâneas por formato", ("format",),
+            [((format,), slots) for format, slots in admission["vagas"].items()]
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_export_admission_queue", "Exportações aguardando admissão", (), [((), admission["fila"])]
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_export_memory_reserved_bytes", "Memória reservada pelas exportações admitidas", (),
+            [((), admission["memoria_reservada"])]
+        ),
+        metrics.collected(
+            metrics.Counter, "bpa_export_admission_rejected_total", "Exportações recusadas com a fila cheia", (),
+            [((), admission["recusadas"])]
+        ),
+        metrics.collected(
+            metrics.Counter, "bpa_export_generations_total", "Gerações iniciadas (requisições não agrupadas)", (),
+            [((), inflight["execucoes"])]
+        ),
+        metrics.collected(
+            metrics.Counter, "bpa_export_coalesced_total", "Requisições agrupadas a uma geração em andamento", (),
+            [((), inflight["agrupadas"])]
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_jobs_running", "Jobs de exportação em execução nesta instância", (),
+            [((), job_pool.running() if job_pool is not None else 0)]
+        ),
+        metrics.collected(
+            metrics.Gauge, "bpa_artifact_cache_hit_ratio", "Proporção de acertos do cache de artefatos", ("format",),
+            metrics.cache_hit_ratios()
+        ),
+    ]
+    return PlainTextResponse(metrics.REGISTRY.render(collected), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/export/csv")
 async def export_csv(
-    db: Session = Depends(get_db),
+    request: Request,
     competencia: Optional[str] = Query(None, description="Competência no formato AAAAMM"),
+    fluxo: bool = Query(False, description="Envia o arquivo enquanto os registros são lidos, sem gravar no servidor"),
+    arquivar: bool = Query(False, description="No modo fluxo, grava também uma cópia no diretório de exportação"),
+    perfil: Optional[str] = Depends(_profile_mode),
     settings: Settings = Depends(get_settings)
 ):
     """
@@ -94,34 +574,56 @@ async def export_csv(
     
     Args:
         competencia: Competência no formato AAAAMM (opcional)
+        fluxo: Resposta em fluxo (sem arquivo no servidor)
+        arquivar: Copia o fluxo para o diretório de exportação
+        perfil: Perfil de desempenho da geração (parâmetro perfil ou cabeçalho X-Perfil)
         
     Returns:
         Arquivo CSV para download
     """
     try:
-        # Inicializa serviços
-        data_service = DataService(db)
-        export_service = ExportService(settings)
-        
-        # Obtém os dados
-        records = data_service.get_records(competencia)
+        if fluxo:
+            stream_db, stream, first, batches, ticket = await _open_record_stream("csv", competencia)
+            stream_service = StreamingExportService(settings, archive=arquivar)
+            filename = export_filename("csv")
+            chunks = stream_service.stream_csv(filename, first, batches)
+            return _streaming_response(chunks, filename, "text/csv", stream_db, ticket=ticket)
         
-        if not records:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Nenhum registro encontrado para exportação"
+        def generate(db, cache, key):
+            # Obtém os dados
+            records = DataService(db).get_records(competencia)
+            
+            if not records:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Nenhum registro encontrado para exportação"
+                )
+            
+            # Exporta para CSV
+            artifact = cache.store(
+                key,
+                export_filename("csv"),
+                lambda path: ExportService(settings).export_to_csv(records, path)
             )
+            
+            logger.info(f"Arquivo CSV gerado com sucesso: {artifact.path}")
+            return artifact
         
-        # Exporta para CSV
-        csv_path = export_service.export_to_csv(records)
-        
-        logger.info(f"Arquivo CSV gerado com sucesso: {csv_path}")
-        
-        return FileResponse(
-            path=csv_path,
-            filename=os.path.basename(csv_path),
-            media_type="text/csv"
+        # Reutiliza o arquivo já gerado se os dados e a configuração não mudaram;
+        # requisições idênticas em andamento aguardam a mesma geração
+        artifact = await _cached_artifact(
+            settings,
+            coalescing_key("csv", competencia),
+            "csv",
+            competencia,
+            lambda cache, freshness: cache.make_key("csv", competencia, freshness),
+            generate,
+            profile=perfil
         )
+        
+        return artifact_response(request, artifact, "text/csv", headers=_artifact_headers(artifact, perfil))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao exportar para CSV: {str(e)}")
         raise HTTPException(
@@ -131,8 +633,11 @@ async def export_csv(
 
 @app.get("/export/xlsx")
 async def export_xlsx(
-    db: Session = Depends(get_db),
+    request: Request,
     competencia: Optional[str] = Query(None, description="Competência no formato AAAAMM"),
+    fluxo: bool = Query(False, description="Envia o arquivo enquanto os registros são lidos, sem gravar no servidor"),
+    arquivar: bool = Query(False, description="No modo fluxo, grava também uma cópia no diretório de exportação"),
+    perfil: Optional[str] = Depends(_profile_mode),
     settings: Settings = Depends(get_settings)
 ):
     """
@@ -140,34 +645,56 @@ async def export_xlsx(
     
     Args:
         competencia: Competência no formato AAAAMM (opcional)
+        fluxo: Resposta em fluxo (sem arquivo no servidor)
+        arquivar: Copia o fluxo para o diretório de exportação
+        perfil: Perfil de desempenho da geração (parâmetro perfil ou cabeçalho X-Perfil)
         
     Returns:
         Arquivo XLSX para download
     """
     try:
-        # Inicializa serviços
-        data_service = DataService(db)
-        export_service = ExportService(settings)
+        if fluxo:
+            stream_db, stream, first, batches, ticket = await _open_record_stream("xlsx", competencia)
+            stream_service = StreamingExportService(settings, archive=arquivar)
+            filename = export_filename("xlsx")
+            chunks = stream_service.stream_xlsx(filename, stream.column_names, first, batches)
+            return _streaming_response(chunks, filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", stream_db, ticket=ticket)
         
-        # Obtém os dados
-        records = data_service.get_records(competencia)
-        
-        if not records:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Nenhum registro encontrado para exportação"
+        def generate(db, cache, key):
+            # Obtém os dados
+            records = DataService(db).get_records(competencia)
+            
+            if not records:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Nenhum registro encontrado para exportação"
+                )
+            
+            # Exporta para XLSX
+            artifact = cache.store(
+                key,
+                export_filename("xlsx"),
+                lambda path: ExportService(settings).export_to_xlsx(records, path)
             )
+            
+            logger.info(f"Arquivo XLSX gerado com sucesso: {artifact.path}")
+            return artifact
         
-        # Exporta para XLSX
-        xlsx_path = export_service.export_to_xlsx(records)
-        
-        logger.info(f"Arquivo XLSX gerado com sucesso: {xlsx_path}")
-        
-        return FileResponse(
-            path=xlsx_path,
-            filename=os.path.basename(xlsx_path),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # Reutiliza o arquivo já gerado se os dados e a configuração não mudaram;
+        # requisições idênticas em andamento aguardam a mesma geração
+        artifact = await _cached_artifact(
+            settings,
+            coalescing_key("xlsx", competencia),
+            "xlsx",
+            competencia,
+            lambda cache, freshness: cache.make_key("xlsx", competencia, freshness),
+            generate,
+            profile=perfil
         )
+        
+        return artifact_response(request, artifact, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers=_artifact_headers(artifact, perfil))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao exportar para XLSX: {str(e)}")
         raise HTTPException(
@@ -175,10 +702,84 @@ async def export_xlsx(
             detail=f"Erro ao exportar para XLSX: {str(e)}"
         )
 
+@app.get("/export/parquet")
+async def export_parquet(
+    request: Request,
+    competencia: Optional[str] = Query(None, description="Competência no formato AAAAMM"),
+    fluxo: bool = Query(False, description="Envia o arquivo enquanto os registros são lidos, sem gravar no servidor"),
+    arquivar: bool = Query(False, description="No modo fluxo, grava também uma cópia no diretório de exportação"),
+    perfil: Optional[str] = Depends(_profile_mode),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Exporta os dados para formato Parquet, com tipos derivados da consulta
+    
+    Args:
+        competencia: Competência no formato AAAAMM (opcional)
+        fluxo: Resposta em fluxo (sem arquivo no servidor)
+        arquivar: Copia o fluxo para o diretório de exportação
+        perfil: Perfil de desempenho da geração (parâmetro perfil ou cabeçalho X-Perfil)
+        
+    Returns:
+        Arquivo Parquet para download
+    """
+    try:
+        if fluxo:
+            stream_db, stream, first, batches, ticket = await _open_record_stream("parquet", competencia)
+            stream_service = StreamingExportService(settings, archive=arquivar)
+            filename = export_filename("parquet")
+            chunks = stream_service.stream_parquet(filename, stream.columns, first, batches)
+            return _streaming_response(chunks, filename, "application/vnd.apache.parquet", stream_db, ticket=ticket)
+        
+        def generate(db, cache, key):
+            def write(path):
+                # Lê os registros em lotes e grava em row groups
+                stream = DataService(db).stream_records(competencia)
+                ExportService(settings).export_to_parquet(stream, path)
+                
+                # Sem registros, o arquivo temporário é descartado pelo cache
+                if stream.rows_read == 0:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Nenhum registro encontrado para exportação"
+                    )
+            
+            artifact = cache.store(key, export_filename("parquet"), write)
+            
+            logger.info(f"Arquivo Parquet gerado com sucesso: {artifact.path}")
+            return artifact
+        
+        # Reutiliza o arquivo já gerado se os dados e a configuração não mudaram;
+        # requisições idênticas em andamento aguardam a mesma geração
+        artifact = await _cached_artifact(
+            settings,
+            coalescing_key("parquet", competencia),
+            "parquet",
+            competencia,
+            lambda cache, freshness: cache.make_key("parquet", competencia, freshness),
+            generate,
+            batched=True,
+            profile=perfil
+        )
+        
+        return artifact_response(request, artifact, "application/vnd.apache.parquet", headers=_artifact_headers(artifact, perfil))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao exportar para Parquet: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao exportar para Parquet: {str(e)}"
+        )
+
 @app.post("/export/bpa")
 async def export_bpa(
+    request: Request,
     header_data: HeaderData,
     db: Session = Depends(get_db),
+    fluxo: bool = Query(False, description="Envia o arquivo enquanto as linhas são formatadas, sem gravar no servidor"),
+    arquivar: bool = Query(False, description="No modo fluxo, grava também uma cópia no diretório de exportação"),
+    perfil: Optional[str] = Depends(_profile_mode),
     settings: Settings = Depends(get_settings)
 ):
     """
@@ -186,15 +787,14 @@ async def export_bpa(
     
     Args:
         header_data: Dados do cabeçalho do BPA-I
+        fluxo: Resposta em fluxo (sem arquivo no servidor)
+        arquivar: Copia o fluxo para o diretório de exportação
+        perfil: Perfil de desempenho da geração (parâmetro perfil ou cabeçalho X-Perfil)
         
     Returns:
         Arquivo BPA-I para download
     """
     try:
-        # Inicializa serviços
-        data_service = DataService(db)
-        bpa_service = BPAService(settings)
-        
         # Cria o objeto de cabeçalho usando o método da classe
         header = HeaderBPA.from_competencia(
             cnes=header_data.cnes,
@@ -202,25 +802,134 @@ async def export_bpa(
             orgao_emissor=header_data.orgao_emissor
         )
         
-        # Obtém os dados da competência especificada
-        records = data_service.get_records(header_data.competencia)
+        if fluxo and header_data.duplicidades != MODO_SOMAR:
+            # Com a validação do daemon em dia, os registros não são verificados de
+            # novo. Senão, regras de compatibilidade e, sem ignorar_incompatibilidades,
+            # uma verificação prévia em lotes. Em ambos os casos, incompatibilidades
+            # saem como 422 antes do primeiro byte; depois, cada lote é verificado,
+            # tem os duplicados tratados e é formatado à medida que o cliente consome
+            # a resposta.
+            prewarmed = await asyncio.to_thread(DataService(db).get_prewarmed_validation, header.competencia)
+            if prewarmed is not None:
+                report, duplicates = prewarmed
+                compatibility = None
+                if not header_data.ignorar_incompatibilidades:
+                    _raise_incompatible(report)
+            else:
+                duplicates = None
+                compatibility = await asyncio.to_thread(
+                    ProcedureCompatibilityService.from_database, db, header.competencia
+                )
+                if not header_data.ignorar_incompatibilidades:
+                    ticket = await _admit("bpa", RECORDS_BATCH_SIZE, batched=True)
+                    try:
+                        report = await asyncio.to_thread(_check_bpa_stream, db, header.competencia, compatibility)
+                    finally:
+                        get_admission_controller().release(ticket)
+                    _raise_incompatible(report)
+            
+            stream_db, stream, first, batches, ticket = await _open_record_stream("bpa", header.competencia)
+            bpa_service = BPAService(settings)
+            filename = bpa_service.filename_for(header)
+            lines = bpa_service.iter_batch_lines(
+                chain([first], batches),
+                header,
+                header_data.duplicidades,
+                compatibility,
+                header_data.ignorar_incompatibilidades,
+                duplicates
+            )
+            # O total de duplicados só é conhecido antes do envio com a validação do daemon
+            headers = None
+            if duplicates is not None and header_data.duplicidades == MODO_REPORTAR:
+                headers = {"X-BPA-Duplicados": str(duplicates.duplicados)}
+            chunks = StreamingExportService(settings, archive=arquivar).stream_bpa(filename, lines)
+            return _streaming_response(
+                chunks, filename, "application/octet-stream", stream_db, headers=headers, ticket=ticket
+            )
         
-        if not records:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Nenhum registro encontrado para a competência {header_data.competencia}"
+        if fluxo:
+            # O modo 'somar' precisa de todos os registros (reservados na admissão);
+            # só a formatação das linhas acompanha o envio
+            # As consultas, a validação e as duplicidades rodam fora do event loop
+            freshness = await asyncio.to_thread(
+                DataService(db).get_cached_freshness_token, header.competencia, settings.freshness_ttl
+            )
+            ticket = await _admit("bpa", freshness_row_count(freshness))
+            try:
+                bpa_service = BPAService(settings)
+                
+                def prepare():
+                    with metrics.export_format("bpa"):
+                        records, duplicates = _validated_bpa_records(db, header_data)
+                    return bpa_service.prepare_records(records, header_data.duplicidades, duplicates)
+                
+                records = await asyncio.to_thread(prepare)
+                filename = bpa_service.filename_for(header)
+                chunks = StreamingExportService(settings, archive=arquivar).stream_bpa(
+                    filename, bpa_service.iter_lines(records, header)
+                )
+            except BaseException:
+                get_admission_controller().release(ticket)
+                raise
+            return _streaming_response(
+                chunks,
+                filename,
+                "application/octet-stream",
+                headers={"X-BPA-Duplicados": str(bpa_service.duplicate_report.duplicados)},
+                ticket=ticket
             )
         
-        # Gera o arquivo BPA-I
-        bpa_path = bpa_service.generate_bpa(records, header)
+        def generate(db, cache, key):
+            bpa_service = BPAService(settings)
+            records, duplicates = _validated_bpa_records(db, header_data)
+            
+            # Gera o arquivo BPA-I
+            artifact = cache.store(
+                key,
+                bpa_service.filename_for(header),
+                lambda path: bpa_service.generate_bpa(
+                    records, header, header_data.duplicidades, path, duplicates=duplicates
+                ),
+                metadata=lambda: {"duplicados": bpa_service.duplicate_report.duplicados}
+            )
+            
+            logger.info(f"Arquivo BPA-I gerado com sucesso: {artifact.path}")
+            return artifact
         
-        logger.info(f"Arquivo BPA-I gerado com sucesso: {bpa_path}")
+        # Reutiliza o arquivo já gerado se os dados e a configuração não mudaram
+        # (a validação já foi feita quando ele foi gerado); requisições idênticas
+        # em andamento aguardam a mesma geração
+        options = dict(
+            orgao_emissor=header.orgao_emissor,
+            duplicidades=header_data.duplicidades,
+            ignorar_incompatibilidades=header_data.ignorar_incompatibilidades
+        )
+        artifact = await _cached_artifact(
+            settings,
+            coalescing_key("bpa", header.competencia, header.cnes, **options),
+            "bpa",
+            header.competencia,
+            lambda cache, freshness: cache.make_key("bpa", header.competencia, freshness, cnes=header.cnes, **options),
+            generate,
+            profile=perfil,
+            rules=True
+        )
+        # O BPA-I baixado é o enviado ao SIA: fica protegido da cota
+        if perfil is None:
+            await asyncio.to_thread(ArtifactCache(settings).pin_download, artifact)
         
-        return FileResponse(
-            path=bpa_path,
-            filename=os.path.basename(bpa_path),
-            media_type="application/octet-stream"
+        return artifact_response(
+            request,
+            artifact,
+            "application/octet-stream",
+            headers={
+                **_artifact_headers(artifact, perfil),
+                "X-BPA-Duplicados": str(artifact.metadata.get("duplicados", 0))
+            }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao exportar para BPA-I: {str(e)}")
         raise HTTPException(
@@ -228,6 +937,134 @@ async def export_bpa(
             detail=f"Erro ao exportar para BPA-I: {str(e)}"
         )
 
+@app.post("/export/batch")
+async def export_batch(request: BatchRequest, settings: Settings = Depends(get_settings)):
+    """
+    Exporta várias competências e formatos em um único ZIP
+    
+    Os itens (formato, competência) rodam em paralelo em BATCH_WORKERS
+    threads, passando pelo cache de artefatos e pelo controle de admissão;
+    o ZIP é enviado à medida que os itens terminam, com manifest.json ao final.
+    
+    Args:
+        request: Intervalo de competências, formatos e opções do BPA-I
+        
+    Returns:
+        Arquivo ZIP em fluxo
+    """
+    try:
+        competencias = competencia_range(request.competencia_inicial, request.competencia_final)
+        formats = parse_formats(request.formatos)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # Com a fila de admissão já cheia, o lote nem começa
+    controller = get_admission_controller()
+    retry_after = max((controller.saturated(format) or 0) for format in formats)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Muitas exportações em andamento; tente novamente em {retry_after} s",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    try:
+        cnes = request.cnes or settings.default_cnes
+        options = dict(
+            orgao_emissor=request.orgao_emissor or settings.default_orgao_emissor,
+            duplicidades=request.duplicidades,
+            ignorar_incompatibilidades=request.ignorar_incompatibilidades
+        )
+        # Itens à espera de vaga desistem quando o cliente desconecta (ou após EXPORT_ADMISSION_TIMEOUT)
+        cancelled = threading.Event()
+        exporter = BatchExporter(
+            settings,
+            SessionLocal,
+            admit=thread_admit(asyncio.get_running_loop(), cancelled.is_set),
+            cancelled=cancelled
+        )
+        
+        # Os itens começam no primeiro pedaço pedido, dentro do span do envio
+        items = exporter.run(competencias, formats, cnes, options)
+        chunks = tracing.traced_iterator(
+            stream_archive(items, batch_manifest(competencias, formats, cnes, options)),
+            "response.stream",
+            competencias=len(competencias),
+            formats=",".join(formats)
+        )
+        filename = f"bpa_lote_{competencias[0]}_{competencias[-1]}.zip"
+        logger.info(f"Exportação em lote iniciada: {len(competencias)} competência(s), formatos {', '.join(formats)}")
+        return _streaming_response(chunks, filename, "application/zip")
+    except Exception as e:
+        logger.error(f"Erro ao exportar em lote: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao exportar em lote: {str(e)}"
+        )
+
+@app.get("/records")
+async def get_records_ndjson(
+    competencia: Optional[str] = Query(None, description="Competência no formato AAAAMM"),
+    after_id_fia: Optional[int] = Query(None, description="Cursor: registros após esta ficha (campo numero)"),
+    after_id_lancamento: Optional[int] = Query(None, description="Cursor: com after_id_fia, lançamentos após este na mesma ficha"),
+    limit: Optional[int] = Query(None, ge=1, description="Quantidade máxima de registros (padrão: até o fim)"),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (numero e id_lancamento são sempre incluídos)"),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Registros em NDJSON (um objeto JSON por linha), em fluxo
+    
+    Para paginar, repita a consulta com after_id_fia/after_id_lancamento
+    iguais a numero/id_lancamento da última linha recebida; uma página
+    vazia indica o fim.
+    
+    Args:
+        competencia: Competência no formato AAAAMM (opcional)
+        after_id_fia: Cursor por ficha
+        after_id_lancamento: Cursor por lançamento (exige after_id_fia)
+        limit: Tamanho da página
+        fields: Projeção de campos
+        
+    Returns:
+        Fluxo application/x-ndjson
+    """
+    try:
+        if after_id_lancamento is not None and after_id_fia is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="after_id_lancamento exige after_id_fia"
+            )
+        
+        stream_db, stream, first, batches, ticket = await _open_record_stream(
+            "records",
+            competencia,
+            allow_empty=True,
+            after_id_fia=after_id_fia,
+            after_id_lancamento=after_id_lancamento,
+            limit=limit
+        )
+        
+        selected = None
+        if fields:
+            try:
+                selected = projection([f.strip() for f in fields.split(",") if f.strip()], stream.column_names)
+            except ValueError as e:
+                stream_db.close()
+                get_admission_controller().release(ticket)
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        
+        filename = f"registros_{competencia or 'todas'}.ndjson"
+        chunks = StreamingExportService(settings).stream_ndjson(filename, first, batches, selected)
+        return _streaming_response(chunks, filename, "application/x-ndjson", stream_db, ticket=ticket)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao obter registros em NDJSON: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao obter registros em NDJSON: {str(e)}"
+        )
+
 @app.get("/stats")
 async def get_stats(
     db: Session = Depends(get_db),
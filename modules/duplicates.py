@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de detecção de lançamentos duplicados para o Exportador BPA-I.
+
+Um lançamento é duplicado quando repete a chave natural de outro:
+CNS do paciente, procedimento, data do atendimento e profissional.
+
+Cada chave vira uma impressão digital de 64 bits em uma tabela hash
+compacta (endereçamento aberto sobre ``array('Q')``), junto com a
+posição da primeira ocorrência: cerca de 48 bytes por chave distinta,
+contando a folga da tabela e a cópia durante o redimensionamento. Uma
+coincidência de impressão digital é sempre confirmada com a chave real
+da primeira ocorrência, de modo que colisões não geram falsos
+duplicados: sobre uma lista, a chave é recalculada do registro; em
+fluxo, as chaves das primeiras ocorrências ficam em bytes contíguos
+(``ChavesCompactas``, cerca de 70 bytes a mais por chave distinta).
+
+Exportações retomáveis usam ``impressao_estavel`` (igual em qualquer
+processo) e um diário das impressões e chaves inseridas, com o qual a
+tabela é reconstruída na retomada (``restaurar``).
+"""
+
+import bisect
+import datetime
+import hashlib
+import struct
+from array import array
+
+# Modos de tratamento
+MODO_REPORTAR = "reportar"    # mantém todas as linhas e apenas conta as duplicadas
+MODO_DESCARTAR = "descartar"  # mantém só a primeira ocorrência de cada chave
+MODO_SOMAR = "somar"          # mantém a primeira ocorrência com as quantidades somadas
+MODOS_DUPLICIDADE = (MODO_REPORTAR, MODO_DESCARTAR, MODO_SOMAR)
+
+# Campos da chave natural (primeira chave preenchida de cada grupo)
+CHAVE_DUPLICIDADE = (
+    ("cns_paciente",),
+    ("cod_procedimento", "codigo_procedimento", "procedimento"),
+    ("data_atendimento", "data_lancamento", "data"),
+    ("cns_profissional", "cod_medico"),
+)
+
+# Amostras de duplicidade guardadas no relatório
+AMOSTRAS_PADRAO = 20
+
+_MASCARA_64 = (1 << 64) - 1
+_VAZIO = 0
+
+# Entrada do diário: impressão digital, posição e tamanho da chave, seguidos da chave
+_ENTRADA_DIARIO = struct.Struct("<QQI")
+
+def chave_natural(reg, campos=CHAVE_DUPLICIDADE):
+    """Monta a chave natural de um registro (tupla de textos normalizados)."""
+    chave = []
+    for grupo in campos:
+        valor = None
+        for nome in grupo:
+            valor = reg.get(nome)
+            if valor is not None and valor != "":
+                break
+        if valor is None:
+            chave.append("")
+        elif isinstance(valor, datetime.datetime):
+            chave.append(valor.date().isoformat())
+        else:
+            chave.append(str(valor).strip())
+    return tuple(chave)
+
+def impressao_digital(chave):
+    """Converte uma chave em um inteiro de 64 bits diferente de zero."""
+    h = hash(chave) & _MASCARA_64
+    return h or 1
+
+def serializar_chave(chave):
+    """Converte uma chave natural em bytes (campos separados por \\x1f)."""
+    return "\x1f".join(chave).encode("utf-8")
+
+def impressao_estavel(chave):
+    """Como impressao_digital, mas sem depender da semente de hash do processo (BLAKE2b)."""
+    h = int.from_bytes(hashlib.blake2b(serializar_chave(chave), digest_size=8).digest(), "little")
+    return h or 1
+
+def ler_diario(dados):
+    """Percorre um diário de duplicidades, gerando (impressão, posição, chave serializada)."""
+    inicio = 0
+    while inicio + _ENTRADA_DIARIO.size <= len(dados):
+        h, posicao, tamanho = _ENTRADA_DIARIO.unpack_from(dados, inicio)
+        inicio += _ENTRADA_DIARIO.size
+        if inicio + tamanho > len(dados):
+            raise ValueError("Diário de duplicidades truncado")
+        yield h, posicao, bytes(dados[inicio:inicio + tamanho])
+        inicio += tamanho
+    if inicio != len(dados):
+        raise ValueError("Diário de duplicidades truncado")
+
+class ConjuntoHashCompacto:
+    """Tabela hash de impressões digitais de 64 bits com a posição da primeira ocorrência."""
+
+    def __init__(self, capacidade=1024):
+        """Cria a tabela com capacidade inicial (potência de 2)."""
+        tamanho = 1
+        while tamanho < capacidade * 2:
+            tamanho <<= 1
+        self._alocar(tamanho)
+        self.total = 0
+
+    def _alocar(self, tamanho):
+        self._mascara = tamanho - 1
+        self._chaves = array("Q", bytes(8 * tamanho))
+        self._posicoes = array("I", bytes(4 * tamanho))
+
+    def _redimensionar(self):
+        chaves, posicoes = self._chaves, self._posicoes
+        self._alocar(len(chaves) * 2)
+        for h, pos in zip(chaves, posicoes):
+            if h != _VAZIO:
+                self._inserir_novo(h, pos)
+
+    def _inserir_novo(self, h, posicao):
+        mascara = self._mascara
+        chaves = self._chaves
+        i = h & mascara
+        while chaves[i] != _VAZIO:
+            i = (i + 1) & mascara
+        chaves[i] = h
+        self._posicoes[i] = posicao
+
+    def buscar_ou_inserir(self, h, posicao):
+        """Retorna a posição da primeira ocorrência de h ou insere e retorna None."""
+        mascara = self._mascara
+        chaves = self._chaves
+        i = h & mascara
+        while True:
+            atual = chaves[i]
+            if atual == _VAZIO:
+                break
+            if atual == h:
+                return self._posicoes[i]
+            i = (i + 1) & mascara
+
+        chaves[i] = h
+        self._posicoes[i] = posicao
+        self.total += 1
+        if self.total * 10 > len(chaves) * 7:
+            self._redimensionar()
+        return None
+
+    def bytes_utilizados(self):
+        """Memória ocupada pela tabela, em bytes."""
+        return self._chaves.itemsize * len(self._chaves) + self._posicoes.itemsize * len(self._posicoes)
+
+class ChavesCompactas:
+    """Chaves serializadas das primeiras ocorrências, em bytes contíguos, indexadas pela posição."""
+
+    def __init__(self):
+        """Cria o armazenamento vazio."""
+        self._dados = bytearray()
+        self._posicoes = array("Q")
+        self._inicios = array("Q")
+
+    def adicionar(self, posicao, chave):
+        """Guarda a chave serializada da posição (posições sempre crescentes)."""
+        self._posicoes.append(posicao)
+        self._inicios.append(len(self._dados))
+        self._dados += chave
+
+    def obter(self, posicao):
+        """Retorna a chave serializada da posição (None se não guardada)."""
+        i = bisect.bisect_left(self._posicoes, posicao)
+        if i == len(self._posicoes) or self._posicoes[i] != posicao:
+            return None
+        fim = self._inicios[i + 1] if i + 1 < len(self._inicios) else len(self._dados)
+        return bytes(self._dados[self._inicios[i]:fim])
+
+    def bytes_utilizados(self):
+        """Memória ocupada pelas chaves e índices, em bytes."""
+        return len(self._dados) + self._posicoes.itemsize * (len(self._posicoes) + len(self._inicios))
+
+class RelatorioDuplicidades:
+    """Totais e amostras das duplicidades encontradas."""
+
+    def __init__(self, modo):
+        """Inicializa o relatório vazio para o modo informado."""
+        self.modo = modo
+        self.total_registros = 0
+        self.duplicados = 0
+        self.descartados = 0
+        self.somados = 0
+        self.colisoes = 0
+        self.amostras = []
+
+    def to_dict(self):
+        """Converte o relatório em dicionário."""
+        return {
+            "modo": self.modo,
+            "total_registros": self.total_registros,
+            "duplicados": self.duplicados,
+            "descartados": self.descartados,
+            "somados": self.somados,
+            "amostras": list(self.amostras),
+        }
+
+    @classmethod
+    def from_dict(cls, dados):
+        """Reconstrói o relatório a partir de to_dict."""
+        rel = cls(dados["modo"])
+        for nome in ("total_registros", "duplicados", "descartados", "somados"):
+            setattr(rel, nome, dados.get(nome, 0))
+        rel.amostras = list(dados.get("amostras", []))
+        return rel
+
+class DetectorDuplicidades:
+    """Detecta lançamentos duplicados pela chave natural, em fluxo ou sobre listas."""
+
+    def __init__(self, modo=MODO_REPORTAR, campos=CHAVE_DUPLICIDADE, max_amostras=AMOSTRAS_PADRAO, capacidade=1024,
+                 impressao=impressao_digital, diario=None):
+        """Configura o detector (diario: bytearray que recebe as impressões e chaves inseridas)."""
+        if modo not in MODOS_DUPLICIDADE:
+            raise ValueError(f"Modo de duplicidade inválido: {modo} (use {', '.join(MODOS_DUPLICIDADE)})")
+        self.modo = modo
+        self.campos = campos
+        self.max_amostras = max_amostras
+        self.impressao = impressao
+        self.diario = diario
+        self.tabela = ConjuntoHashCompacto(capacidade)
+        # Chaves das primeiras ocorrências, para confirmar coincidências em fluxo
+        self.chaves = ChavesCompactas()
+        self.relatorio = RelatorioDuplicidades(modo)
+        # Chaves exatas que colidiram com outra impressão digital (raríssimo)
+        self._colididas = {}
+
+    def _registrar(self, posicao, primeira, chave):
+        rel = self.relatorio
+        rel.duplicados += 1
+        if len(rel.amostras) < self.max_amostras:
+            rel.amostras.append({
+                "registro": posicao + 1,
+                "primeira_ocorrencia": primeira + 1,
+                "chave": dict(zip(("cns_paciente", "procedimento", "data", "profissional"), chave)),
+            })
+
+    def _anotar(self, h, posicao, serializada):
+        """Acrescenta uma chave inserida ao diário."""
+        if self.diario is not None:
+            self.diario += _ENTRADA_DIARIO.pack(h, posicao, len(serializada))
+            self.diario += serializada
+
+    def _primeira_ocorrencia(self, reg, posicao, registros=None):
+        """Retorna a posição da primeira ocorrência da chave de reg (None se inédita)."""
+        chave = chave_natural(reg, self.campos)
+        h = self.impressao(chave)
+        primeira = self.tabela.buscar_ou_inserir(h, posicao)
+        serializada = serializar_chave(chave) if registros is None or self.diario is not None else None
+        if primeira is None:
+            if registros is None:
+                self.chaves.adicionar(posicao, serializada)
+            self._anotar(h, posicao, serializada)
+            return None, chave
+
+        # Confirma a coincidência com a chave real da primeira ocorrência
+        if registros is not None:
+            colidiu = chave_natural(registros[primeira], self.campos) != chave
+        else:
+            colidiu = self.chaves.obter(primeira) != serializada
+        if colidiu:
+            anterior = self._colididas.get(chave)
+            if anterior is None:
+                self.relatorio.colisoes += 1
+                self._colididas[chave] = posicao
+                self._anotar(h, posicao, serializada)
+            return anterior, chave
+        return primeira, chave
+
+    def restaurar(self, diario, relatorio=None):
+        """Reinsere as impressões e chaves de um diário (e o relatório) de uma execução anterior."""
+        buscar_ou_inserir = self.tabela.buscar_ou_inserir
+        for h, posicao, serializada in ler_diario(diario):
+            if buscar_ou_inserir(h, posicao) is None:
+                self.chaves.adicionar(posicao, serializada)
+            else:
+                # Chave que colidiu com a impressão digital de outra
+                self._colididas[tuple(serializada.decode("utf-8").split("\x1f"))] = posicao
+        if relatorio is not None:
+            self.relatorio = relatorio
+
+    def filtrar(self, registros):
+        """Percorre os registros em fluxo, descartando duplicados no modo 'descartar'."""
+        if self.modo == MODO_SOMAR:
+            raise ValueError("O modo 'somar' exige uma lista de registros (use processar)")
+        rel = self.relatorio
+        for posicao, reg in enumerate(registros, rel.total_registros):
+            rel.total_registros = posicao + 1
+            primeira, chave = self._primeira_ocorrencia(reg, posicao)
+            if primeira is not None:
+                self._registrar(posicao, primeira, chave)
+                if self.modo == MODO_DESCARTAR:
+                    rel.descartados += 1
+                    continue
+            yield reg
+
+    def processar(self, registros):
+        """Trata as duplicidades de uma lista de registros e retorna a lista resultante."""
+        rel = self.relatorio
+        rel.total_registros = len(registros)
+        resultado = []
+        # Posição no resultado da primeira ocorrência (apenas no modo 'somar')
+        destino = {}
+
+        for posicao, reg in enumerate(registros):
+            primeira, chave = self._primeira_ocorrencia(reg, posicao, registros)
+            if primeira is None:
+                if self.modo == MODO_SOMAR:
+                    destino[posicao] = len(resultado)
+                resultado.append(reg)
+                continue
+
+            self._registrar(posicao, primeira, chave)
+            if self.modo == MODO_REPORTAR:
+                resultado.append(reg)
+            elif self.modo == MODO_DESCARTAR:
+                rel.descartados += 1
+            else:
+                alvo = destino[primeira]
+                base = resultado[alvo]
+                if base is registros[primeira]:
+                    # Copia para não alterar o registro original
+                    base = dict(base)
+                    resultado[alvo] = base
+                base["quantidade"] = (base.get("quantidade") or 0) + (reg.get("quantidade") or 0)
+                rel.somados += 1
+
+        return resultado
+
+def tratar_duplicidades(registros, modo=MODO_REPORTAR):
+    """Aplica o tratamento de duplicidades a uma lista e retorna (registros, relatório)."""
+    detector = DetectorDuplicidades(modo, capacidade=max(len(registros), 1))
+    resultado = detector.processar(registros)
+    return resultado, detector.relatorio
@@ -15,11 +15,15 @@ from modules.formatter import (
     mapear_tipo_logradouro, mapear_raca, formatar_cns, formatar_cbo,
     formatar_procedimento, formatar_cpf
 )
+from modules.duplicates import tratar_duplicidades
 
-def gerar_arquivo_bpa(registros: list, ano: int, mes: int, caminho_pasta: str):
+def gerar_arquivo_bpa(registros: list, ano: int, mes: int, caminho_pasta: str, modo_duplicidade: str = None):
     """Gera o arquivo BPA-I no formato texto, seguindo o layout SIA/SUS, a partir dos registros fornecidos."""
     if registros is None:
         raise Exception("Não foi possível obter registros do banco de dados.")
+    # Descarta ou soma lançamentos duplicados antes de calcular os totais do cabeçalho
+    if modo_duplicidade:
+        registros, _ = tratar_duplicidades(registros, modo_duplicidade)
     # Se não houver registros para o período, não gera arquivo (retorna mensagem indicando isso)
     if len(registros) == 0:
         return None  # indica que não há dados
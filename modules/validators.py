@@ -3,25 +3,142 @@
 
 """
 Módulo de validação de dados para o Exportador BPA-I.
+
+A validação dos registros de exportação é feita por colunas, em lotes:
+cada campo de um lote vira uma matriz de dígitos (numpy) e os dígitos
+verificadores de CNS, CPF e CNPJ são calculados para o lote inteiro de
+uma vez. Cada registro recebe uma máscara de bits com os problemas
+encontrados; as mensagens de texto só são montadas quando exibidas.
 """
 
+import numpy as np
+
+# Tamanho padrão do lote de validação
+TAMANHO_LOTE = 50000
+
+# Bits de problema por registro
+FALTA_CNS_PACIENTE = 1 << 0
+CNS_PACIENTE_INVALIDO = 1 << 1
+FALTA_CNS_PROFISSIONAL = 1 << 2
+CNS_PROFISSIONAL_INVALIDO = 1 << 3
+FALTA_PROCEDIMENTO = 1 << 4
+PROCEDIMENTO_INVALIDO = 1 << 5
+FALTA_CBO = 1 << 6
+CPF_PACIENTE_INVALIDO = 1 << 7
+CNPJ_FABRICANTE_INVALIDO = 1 << 8
+
+# Mensagem de cada bit, na ordem em que são exibidas
+MENSAGENS_PROBLEMAS = {
+    FALTA_CNS_PACIENTE: "Falta CNS do paciente",
+    CNS_PACIENTE_INVALIDO: "CNS do paciente inválido",
+    FALTA_CNS_PROFISSIONAL: "Falta CNS do profissional",
+    CNS_PROFISSIONAL_INVALIDO: "CNS do profissional inválido",
+    FALTA_PROCEDIMENTO: "Falta código de procedimento",
+    PROCEDIMENTO_INVALIDO: "Código de procedimento inválido",
+    FALTA_CBO: "Falta CBO do profissional",
+    CPF_PACIENTE_INVALIDO: "CPF do paciente inválido",
+    CNPJ_FABRICANTE_INVALIDO: "CNPJ do fabricante inválido",
+}
+
+# Chaves aceitas para cada campo (registros do módulo e da API)
+CAMPOS_REGISTRO = {
+    "cns_paciente": ("cns_paciente",),
+    "cns_profissional": ("cns_profissional",),
+    "procedimento": ("cod_procedimento", "procedimento"),
+    "cbo": ("cod_cbo_resp", "cod_cbo", "cbo"),
+    "cpf_paciente": ("cpf_paciente",),
+    "cnpj_fabricante": ("cnpj_fabricante_aih",),
+}
+
+# Pesos dos dígitos verificadores
+_PESOS_CNS_DEFINITIVO = np.arange(15, 4, -1)
+_PESOS_CNS_PROVISORIO = np.arange(15, 0, -1)
+_PESOS_CPF_1 = np.arange(10, 1, -1)
+_PESOS_CPF_2 = np.arange(11, 1, -1)
+_PESOS_CNPJ_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_PESOS_CNPJ_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+def _somente_digitos(valor):
+    """Retorna apenas os dígitos de um valor ('' para vazio/None)."""
+    if valor is None:
+        return ""
+    texto = str(valor).strip()
+    if texto.isdigit():
+        return texto
+    return "".join(filter(str.isdigit, texto))
+
+def _matriz_digitos(valores, largura):
+    """Converte uma coluna de valores em matriz de dígitos (n x largura).
+
+    Retorna a matriz, a máscara de valores presentes e a máscara de valores
+    com exatamente ``largura`` dígitos. Linhas com tamanho diferente ficam
+    zeradas na matriz.
+    """
+    limpos = [_somente_digitos(v) for v in valores]
+    tamanhos = np.fromiter(map(len, limpos), dtype=np.int64, count=len(limpos))
+    presentes = tamanhos > 0
+    tamanho_ok = tamanhos == largura
+    vazio = "0" * largura
+    texto = "".join(v if len(v) == largura else vazio for v in limpos).encode("ascii")
+    matriz = np.frombuffer(texto, dtype=np.uint8).reshape(len(limpos), largura).astype(np.int64) - 48
+    return matriz, presentes, tamanho_ok
+
+def _digitos_repetidos(matriz):
+    """Indica as linhas em que todos os dígitos são iguais."""
+    return (matriz == matriz[:, :1]).all(axis=1)
+
+def _cns_validos(matriz):
+    """Valida uma matriz de CNS (n x 15) pelo algoritmo oficial.
+
+    CNS definitivo (inicia com 1 ou 2): o dígito é calculado sobre os 11
+    primeiros dígitos (PIS); se o resultado for 10, soma-se 2 e o número
+    leva "001" antes do dígito, senão "000". CNS provisório (inicia com
+    7, 8 ou 9): a soma ponderada dos 15 dígitos deve ser múltipla de 11.
+    """
+    primeiro = matriz[:, 0]
+
+    # Definitivo
+    soma = matriz[:, :11] @ _PESOS_CNS_DEFINITIVO
+    dv = 11 - soma % 11
+    dv[dv == 11] = 0
+    ajuste = dv == 10
+    dv_ajustado = 11 - (soma + 2) % 11
+    dv_ajustado[dv_ajustado == 11] = 0
+    dv = np.where(ajuste, dv_ajustado, dv)
+    meio = matriz[:, 11] * 100 + matriz[:, 12] * 10 + matriz[:, 13]
+    definitivo_ok = (meio == np.where(ajuste, 1, 0)) & (matriz[:, 14] == dv)
+
+    # Provisório
+    provisorio_ok = (matriz @ _PESOS_CNS_PROVISORIO) % 11 == 0
+
+    return np.where(
+        (primeiro == 1) | (primeiro == 2), definitivo_ok,
+        np.where((primeiro >= 7) & (primeiro <= 9), provisorio_ok, False)
+    )
+
+def _cpf_validos(matriz):
+    """Valida uma matriz de CPF (n x 11) pelos dígitos verificadores."""
+    dv1 = (matriz[:, :9] @ _PESOS_CPF_1) * 10 % 11 % 10
+    dv2 = (matriz[:, :10] @ _PESOS_CPF_2) * 10 % 11 % 10
+    return (matriz[:, 9] == dv1) & (matriz[:, 10] == dv2) & ~_digitos_repetidos(matriz)
+
+def _cnpj_validos(matriz):
+    """Valida uma matriz de CNPJ (n x 14) pelos dígitos verificadores."""
+    resto1 = (matriz[:, :12] @ _PESOS_CNPJ_1) % 11
+    dv1 = np.where(resto1 < 2, 0, 11 - resto1)
+    resto2 = (matriz[:, :13] @ _PESOS_CNPJ_2) % 11
+    dv2 = np.where(resto2 < 2, 0, 11 - resto2)
+    return (matriz[:, 12] == dv1) & (matriz[:, 13] == dv2) & ~_digitos_repetidos(matriz)
+
 def validar_cnpj(cnpj):
-    """Valida um CNPJ."""
-    # Limpar o CNPJ, deixando apenas os dígitos
-    cnpj = ''.join(filter(str.isdigit, str(cnpj)))
-    
-    # Verificar se tem 14 dígitos
-    if len(cnpj) != 14:
-        return False
-    
-    # Verificar se todos os dígitos são iguais
-    if len(set(cnpj)) == 1:
-        return False
-    
-    # Aqui poderia implementar o algoritmo completo de validação do CNPJ
-    # Para simplificar, apenas verificamos o comprimento e a diversidade de dígitos
-    
-    return True
+    """Valida um CNPJ (14 dígitos e dígitos verificadores)."""
+    matriz, _, tamanho_ok = _matriz_digitos([cnpj], 14)
+    return bool(tamanho_ok[0] and _cnpj_validos(matriz)[0])
+
+def validar_cpf(cpf):
+    """Valida um CPF (11 dígitos e dígitos verificadores)."""
+    matriz, _, tamanho_ok = _matriz_digitos([cpf], 11)
+    return bool(tamanho_ok[0] and _cpf_validos(matriz)[0])
 
 def validar_cnes(cnes):
     """Valida um código CNES."""
@@ -38,18 +155,9 @@ def validar_cnes(cnes):
     return True
 
 def validar_cns(cns):
-    """Valida um número de Cartão Nacional de Saúde (CNS)."""
-    # Limpar o CNS, deixando apenas os dígitos
-    cns = ''.join(filter(str.isdigit, str(cns)))
-    
-    # Verificar se tem 15 dígitos
-    if len(cns) != 15:
-        return False
-    
-    # Aqui poderia implementar o algoritmo completo de validação do CNS
-    # Para simplificar, apenas verificamos o comprimento
-    
-    return True
+    """Valida um número de Cartão Nacional de Saúde (CNS), definitivo ou provisório."""
+    matriz, _, tamanho_ok = _matriz_digitos([cns], 15)
+    return bool(tamanho_ok[0] and _cns_validos(matriz)[0])
 
 def validar_cbo(cbo):
     """Valida um código CBO (Classificação Brasileira de Ocupações)."""
@@ -128,25 +236,130 @@ def validar_competencia(competencia):
     
     return True
             
+def _coluna(lote, chaves):
+    """Extrai a coluna de um lote, usando a primeira chave preenchida."""
+    if len(chaves) == 1:
+        chave = chaves[0]
+        return [reg.get(chave) for reg in lote]
+    coluna = []
+    for reg in lote:
+        valor = None
+        for chave in chaves:
+            valor = reg.get(chave)
+            if valor:
+                break
+        coluna.append(valor)
+    return coluna
+
+def validar_lote(lote):
+    """Valida um lote de registros por colunas e retorna a máscara de problemas (uint16 por registro)."""
+    n = len(lote)
+    mascaras = np.zeros(n, dtype=np.uint16)
+    if n == 0:
+        return mascaras
+
+    # CNS do paciente e do profissional
+    for campo, falta, invalido in (
+        ("cns_paciente", FALTA_CNS_PACIENTE, CNS_PACIENTE_INVALIDO),
+        ("cns_profissional", FALTA_CNS_PROFISSIONAL, CNS_PROFISSIONAL_INVALIDO),
+    ):
+        matriz, presentes, tamanho_ok = _matriz_digitos(_coluna(lote, CAMPOS_REGISTRO[campo]), 15)
+        mascaras[~presentes] |= falta
+        mascaras[presentes & ~(tamanho_ok & _cns_validos(matriz))] |= invalido
+
+    # Procedimento: até 10 dígitos (completado com zeros à esquerda no arquivo)
+    procedimentos = [_somente_digitos(v) for v in _coluna(lote, CAMPOS_REGISTRO["procedimento"])]
+    tamanhos = np.fromiter((len(v) for v in procedimentos), dtype=np.int64, count=n)
+    mascaras[tamanhos == 0] |= FALTA_PROCEDIMENTO
+    mascaras[tamanhos > 10] |= PROCEDIMENTO_INVALIDO
+
+    # CBO
+    cbos = _coluna(lote, CAMPOS_REGISTRO["cbo"])
+    mascaras[np.fromiter((not v for v in cbos), dtype=bool, count=n)] |= FALTA_CBO
+
+    # CPF do paciente e CNPJ do fabricante: validados apenas quando informados
+    matriz, presentes, tamanho_ok = _matriz_digitos(_coluna(lote, CAMPOS_REGISTRO["cpf_paciente"]), 11)
+    mascaras[presentes & ~(tamanho_ok & _cpf_validos(matriz))] |= CPF_PACIENTE_INVALIDO
+
+    matriz, presentes, tamanho_ok = _matriz_digitos(_coluna(lote, CAMPOS_REGISTRO["cnpj_fabricante"]), 14)
+    mascaras[presentes & ~(tamanho_ok & _cnpj_validos(matriz))] |= CNPJ_FABRICANTE_INVALIDO
+
+    return mascaras
+
+class ResultadoValidacao:
+    """Resultado da validação em lote: máscaras por registro e totais por problema.
+
+    Comporta-se como uma lista de mensagens (len, fatias, iteração), mas as
+    mensagens só são montadas para as posições efetivamente acessadas.
+    """
+
+    def __init__(self, mascaras):
+        """Inicializa a partir das máscaras de todos os registros."""
+        self.mascaras = mascaras
+        self.contagens = {
+            bit: int(np.count_nonzero(mascaras & bit)) for bit in MENSAGENS_PROBLEMAS
+        }
+        self.total_problemas = sum(self.contagens.values())
+        self.registros_com_problema = int(np.count_nonzero(mascaras))
+
+    def __len__(self):
+        return self.total_problemas
+
+    def __bool__(self):
+        return self.total_problemas > 0
+
+    def __iter__(self):
+        return self.mensagens()
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            inicio, fim, passo = indice.indices(self.total_problemas)
+            mensagens = []
+            for i, mensagem in enumerate(self.mensagens()):
+                if i >= fim:
+                    break
+                if i >= inicio and (i - inicio) % passo == 0:
+                    mensagens.append(mensagem)
+            return mensagens
+        if indice < 0:
+            indice += self.total_problemas
+        for i, mensagem in enumerate(self.mensagens()):
+            if i == indice:
+                return mensagem
+        raise IndexError("Índice de problema fora do intervalo")
+
+    def mensagens(self, limite=None):
+        """Gera as mensagens dos problemas, na ordem dos registros."""
+        geradas = 0
+        for i in np.flatnonzero(self.mascaras):
+            mascara = int(self.mascaras[i])
+            for bit, texto in MENSAGENS_PROBLEMAS.items():
+                if mascara & bit:
+                    if limite is not None and geradas >= limite:
+                        return
+                    geradas += 1
+                    yield f"Registro #{i + 1}: {texto}"
+
+    def resumo(self):
+        """Retorna os totais por tipo de problema (apenas os que ocorreram)."""
+        return {
+            MENSAGENS_PROBLEMAS[bit]: total
+            for bit, total in self.contagens.items() if total
+        }
+
+def validar_registros(registros, tamanho_lote=TAMANHO_LOTE):
+    """Valida registros (lista ou iterável) em lotes por colunas."""
+    partes = []
+    lote = []
+    for reg in registros:
+        lote.append(reg)
+        if len(lote) >= tamanho_lote:
+            partes.append(validar_lote(lote))
+            lote = []
+    if lote or not partes:
+        partes.append(validar_lote(lote))
+    return ResultadoValidacao(np.concatenate(partes))
+
 def validar_dados_exportacao(registros):
-    """Valida os dados críticos para exportação BPA-I."""
-    problemas = []
-    
-    for i, reg in enumerate(registros):
-        # Verificar CNS do paciente
-        if not reg.get("cns_paciente"):
-            problemas.append(f"Registro #{i+1}: Falta CNS do paciente")
-        
-        # Verificar CNS do profissional
-        if not reg.get("cns_profissional"):
-            problemas.append(f"Registro #{i+1}: Falta CNS do profissional")
-        
-        # Verificar código de procedimento
-        if not reg.get("cod_procedimento"):
-            problemas.append(f"Registro #{i+1}: Falta código de procedimento")
-        
-        # Verificar CBO
-        if not reg.get("cod_cbo_resp") and not reg.get("cod_cbo"):
-            problemas.append(f"Registro #{i+1}: Falta CBO do profissional")
-    
-    return problemas
\ No newline at end of file
+    """Valida os dados críticos para exportação BPA-I (resultado com mensagens sob demanda)."""
+    return validar_registros(registros)
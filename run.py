@@ -10,8 +10,11 @@ necessidade de iniciar o servidor web.
 
 import os
 import sys
+import json
+import signal
 import argparse
 import logging
+import threading
 from datetime import datetime
 from pathlib import Path
 
@@ -21,20 +24,28 @@ from app.database.connection import SessionLocal
 from app.services.data_service import DataService
 from app.services.export_service import ExportService
 from app.services.bpa_service import BPAService
+from app.services.checkpoint_service import CheckpointMismatch, ResumableBPAExport
+from app.services.bpa_reader import BPAReader
+from app.services.bpa_diff import BPADiff
+from app.services.compatibility_service import ProcedureCompatibilityService
+from app.services.retention_service import RetentionManager, format_size, parse_size
+from app.services import profiling, tracing
+from app.services.trace_report import load_traces, select_traces
+from app.services.schema_catalog import refresh_catalog
+from app.services.daemon_service import CronSchedule, PrewarmDaemon
+from app.services.batch_service import (
+    ITEM_DONE, BatchExporter, batch_manifest, competencia_range, parse_formats, stream_archive
+)
+from modules.duplicates import MODO_REPORTAR, MODO_SOMAR, MODOS_DUPLICIDADE
 from app.models.header import HeaderBPA
 from app.utils.config import get_settings
+from app.utils.logs import DEFAULT_LOG_FILE, configure_logging
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bpa_exporter.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Comandos com span raiz no rastreamento
+TRACED_COMMANDS = ("stats", "csv", "xlsx", "parquet", "bpa", "batch")
+
 def get_db() -> Session:
     """
     Cria uma nova sessão do banco de dados
@@ -55,6 +66,9 @@ def export_csv(competencia=None):
     
     Args:
         competencia: Competência no formato AAAAMM (opcional)
+        
+    Returns:
+        Caminho do arquivo gerado (None sem registros ou com erro)
     """
     try:
         # Obtém a sessão do banco e configurações
@@ -79,6 +93,7 @@ def export_csv(competencia=None):
         
         logger.info(f"Exportação para CSV concluída: {csv_path}")
         print(f"Arquivo CSV gerado com sucesso: {csv_path}")
+        return csv_path
     
     except Exception as e:
         logger.error(f"Erro ao exportar para CSV: {str(e)}")
@@ -93,6 +108,9 @@ def export_xlsx(competencia=None):
     
     Args:
         competencia: Competência no formato AAAAMM (opcional)
+        
+    Returns:
+        Caminho do arquivo gerado (None sem registros ou com erro)
     """
     try:
         # Obtém a sessão do banco e configurações
@@ -117,6 +135,7 @@ def export_xlsx(competencia=None):
         
         logger.info(f"Exportação para XLSX concluída: {xlsx_path}")
         print(f"Arquivo XLSX gerado com sucesso: {xlsx_path}")
+        return xlsx_path
     
     except Exception as e:
         logger.error(f"Erro ao exportar para XLSX: {str(e)}")
@@ -125,14 +144,97 @@ def export_xlsx(competencia=None):
     finally:
         db.close()
 
-def export_bpa(competencia, cnes, orgao_emissor):
+def export_parquet(competencia=None):
+    """
+    Exporta os dados para Parquet
+    
+    Args:
+        competencia: Competência no formato AAAAMM (opcional)
+        
+    Returns:
+        Caminho do arquivo gerado (None sem registros ou com erro)
+    """
+    try:
+        # Obtém a sessão do banco e configurações
+        db = get_db()
+        settings = get_settings()
+        
+        # Inicializa serviços
+        data_service = DataService(db)
+        export_service = ExportService(settings)
+        
+        logger.info(f"Iniciando exportação para Parquet. Competência: {competencia or 'Todas'}")
+        
+        # Lê os registros em lotes e grava em row groups
+        stream = data_service.stream_records(competencia)
+        parquet_path = export_service.export_to_parquet(stream)
+        
+        if stream.rows_read == 0:
+            os.remove(parquet_path)
+            logger.warning("Nenhum registro encontrado para exportação.")
+            return
+        
+        logger.info(f"Exportação para Parquet concluída: {parquet_path}")
+        print(f"Arquivo Parquet gerado com sucesso: {parquet_path} ({stream.rows_read} registros)")
+        return parquet_path
+    
+    except Exception as e:
+        logger.error(f"Erro ao exportar para Parquet: {str(e)}")
+        print(f"Erro ao exportar para Parquet: {str(e)}")
+    
+    finally:
+        db.close()
+
+def print_compatibility(report):
+    """
+    Exibe o relatório de incompatibilidades com as regras de procedimento
+    
+    Args:
+        report: Relatório de compatibilidade (CompatibilityReport)
+    """
+    print(f"\n{report.rejeitados} de {report.total_registros} registros incompatíveis com as regras de procedimento:")
+    for motivo, total in report.contagens.items():
+        print(f"  - {motivo}: {total}")
+    for amostra in report.amostras[:5]:
+        print(f"    Registro #{amostra['registro']} (lançamento {amostra['id_lancamento']}, "
+              f"procedimento {amostra['procedimento']}): {'; '.join(amostra['motivos'])}")
+
+def print_duplicates(duplicates):
+    """
+    Exibe o relatório de lançamentos duplicados
+    
+    Args:
+        duplicates: Relatório de duplicidades (RelatorioDuplicidades)
+    """
+    print(f"\n{duplicates.duplicados} lançamentos duplicados (paciente, procedimento, data e profissional):")
+    for amostra in duplicates.amostras[:5]:
+        print(f"  - Registro #{amostra['registro']} repete o registro #{amostra['primeira_ocorrencia']}")
+    if duplicates.descartados:
+        print(f"  {duplicates.descartados} linhas descartadas")
+    elif duplicates.somados:
+        print(f"  {duplicates.somados} linhas somadas à primeira ocorrência")
+    else:
+        print("  Linhas mantidas no arquivo. Use --duplicidades descartar ou somar para tratá-las.")
+
+def export_bpa(competencia, cnes, orgao_emissor, ignorar_incompatibilidades=False, duplicidades=MODO_REPORTAR, retomar=False):
     """
     Exporta os dados para BPA-I
     
+    Com duplicidades reportar ou descartar, os registros são lidos em lotes
+    e a geração grava pontos de controle (ResumableBPAExport); com retomar,
+    uma exportação interrompida continua do último ponto de controle. O modo
+    somar precisa de todos os registros em memória e sempre gera do início.
+    
     Args:
         competencia: Competência no formato AAAAMM
         cnes: Código CNES do estabelecimento
         orgao_emissor: Órgão emissor
+        ignorar_incompatibilidades: Gera o arquivo mesmo com lançamentos incompatíveis
+        duplicidades: Tratamento de lançamentos duplicados (reportar, descartar ou somar)
+        retomar: Continua a exportação interrompida a partir do último ponto de controle
+        
+    Returns:
+        Caminho do arquivo gerado (None se não foi gerado)
     """
     try:
         # Obtém a sessão do banco e configurações
@@ -151,6 +253,10 @@ def export_bpa(competencia, cnes, orgao_emissor):
             print("Competência, CNES e órgão emissor são obrigatórios para exportação BPA-I.")
             return
         
+        if retomar and duplicidades == MODO_SOMAR:
+            print("--retomar não está disponível com --duplicidades somar.")
+            return
+        
         # Cria o objeto de cabeçalho
         header = HeaderBPA.from_competencia(
             cnes=cnes,
@@ -158,19 +264,79 @@ def export_bpa(competencia, cnes, orgao_emissor):
             orgao_emissor=orgao_emissor
         )
         
-        # Obtém os dados da competência especificada
-        records = data_service.get_records(competencia)
-        
-        if not records:
-            logger.warning(f"Nenhum registro encontrado para a competência {competencia}")
-            print(f"Nenhum registro encontrado para a competência {competencia}")
+        # Validação do daemon em dia: incompatibilidades recusadas antes da leitura
+        prewarmed = data_service.get_prewarmed_validation(competencia)
+        if prewarmed is not None and prewarmed[0].rejeitados and not ignorar_incompatibilidades:
+            print_compatibility(prewarmed[0])
+            logger.warning("Exportação BPA-I interrompida por incompatibilidades nos procedimentos.")
+            print("Exportação interrompida. Use --ignorar-incompatibilidades para gerar o arquivo mesmo assim.")
             return
         
-        # Gera o arquivo BPA-I
-        bpa_path = bpa_service.generate_bpa(records, header)
+        if duplicidades != MODO_SOMAR:
+            # Geração em lotes, com pontos de controle
+            with tracing.span("bpa.validation"):
+                compatibility = ProcedureCompatibilityService.from_database(db, competencia)
+            export = ResumableBPAExport(
+                bpa_service, header, duplicidades, ignorar_incompatibilidades, settings.checkpoint_interval
+            )
+            try:
+                bpa_path = export.run(data_service, compatibility, resume=retomar)
+            except CheckpointMismatch as e:
+                logger.error(f"Não foi possível retomar a exportação BPA-I: {str(e)}")
+                print(f"Não foi possível retomar a exportação: {str(e)}")
+                return
+            except Exception:
+                if export.checkpoint_path.exists():
+                    print("Exportação interrompida. Use --retomar para continuar do último ponto de controle.")
+                raise
+            
+            if not export.records_read:
+                logger.warning(f"Nenhum registro encontrado para a competência {competencia}")
+                print(f"Nenhum registro encontrado para a competência {competencia}")
+                return
+            
+            report = export.compatibility_report
+            if report.rejeitados:
+                print_compatibility(report)
+                if not ignorar_incompatibilidades:
+                    logger.warning("Exportação BPA-I interrompida por incompatibilidades nos procedimentos.")
+                    print("Exportação interrompida. Use --ignorar-incompatibilidades para gerar o arquivo mesmo assim.")
+                    return
+            duplicates = export.duplicate_report
+        else:
+            # Obtém os dados da competência especificada
+            records = data_service.get_records(competencia)
+            
+            if not records:
+                logger.warning(f"Nenhum registro encontrado para a competência {competencia}")
+                print(f"Nenhum registro encontrado para a competência {competencia}")
+                return
+            
+            # Verifica sexo, faixa etária e CBO contra as regras dos procedimentos
+            # (já verificados pela validação do daemon, se em dia)
+            if prewarmed is not None:
+                report = prewarmed[0]
+            else:
+                with tracing.span("bpa.validation", rows=len(records)):
+                    compatibility = ProcedureCompatibilityService.from_database(db, competencia)
+                    report = compatibility.check_records(records)
+            if report.rejeitados:
+                print_compatibility(report)
+                if not ignorar_incompatibilidades:
+                    logger.warning("Exportação BPA-I interrompida por incompatibilidades nos procedimentos.")
+                    print("Exportação interrompida. Use --ignorar-incompatibilidades para gerar o arquivo mesmo assim.")
+                    return
+            
+            # Gera o arquivo BPA-I
+            bpa_path = bpa_service.generate_bpa(records, header, duplicidades)
+            duplicates = bpa_service.duplicate_report
+        
+        if duplicates.duplicados:
+            print_duplicates(duplicates)
         
         logger.info(f"Exportação para BPA-I concluída: {bpa_path}")
         print(f"Arquivo BPA-I gerado com sucesso: {bpa_path}")
+        return bpa_path
     
     except Exception as e:
         logger.error(f"Erro ao exportar para BPA-I: {str(e)}")
@@ -219,9 +385,372 @@ def show_stats(competencia=None):
     finally:
         db.close()
 
+def check_bpa(arquivo, index=False, cns=None, procedimento=None):
+    """
+    Valida um arquivo BPA-I já gerado e, opcionalmente, consulta o índice
+    
+    Args:
+        arquivo: Caminho do arquivo BPA-I
+        index: Constrói (ou atualiza) o índice auxiliar do arquivo
+        cns: CNS do paciente a localizar
+        procedimento: Código do procedimento a localizar
+    """
+    try:
+        with BPAReader(arquivo) as reader:
+            resultado = reader.validate()
+            cabecalho = resultado.cabecalho
+            
+            print(f"\n=== VALIDAÇÃO BPA-I: {arquivo} ===")
+            print(f"Competência: {cabecalho.get('cbc_mvm')}")
+            print(f"Linhas: {resultado.total_linhas} (cabeçalho: {cabecalho.get('cbc_lin')})")
+            print(f"Folhas: {resultado.total_folhas} (cabeçalho: {cabecalho.get('cbc_flh')})")
+            print(f"Controle: {resultado.controle:04d} (cabeçalho: {cabecalho.get('cbc_smt_vrf')})")
+            
+            if resultado.valido:
+                print("Arquivo consistente.")
+            else:
+                print(f"Foram encontrados {len(resultado.problemas)} problemas:")
+                for problema in resultado.problemas:
+                    print(f"  - {problema}")
+            
+            if index and not (cns or procedimento):
+                reader.build_index().close()
+                print(f"Índice gravado em: {reader.index_path}")
+            
+            if cns or procedimento:
+                linhas = reader.lookup(cns_paciente=cns, procedimento=procedimento)
+                print(f"\n{len(linhas)} linha(s) encontrada(s):")
+                for linha in linhas:
+                    registro = reader.record(linha)
+                    print(
+                        f"  - Linha {linha + 1}: folha {registro['prd_flh']} seq {registro['prd_seq']} "
+                        f"procedimento {registro['prd_pa']} paciente {registro['prd_cnspac']} "
+                        f"data {registro['prd_dtaten']} qt {registro['prd_qt']}"
+                    )
+            
+            print("=" * 34)
+    
+    except Exception as e:
+        logger.error(f"Erro ao validar arquivo BPA-I: {str(e)}")
+        print(f"Erro ao validar arquivo BPA-I: {str(e)}")
+
+def diff_bpa(arquivo_antigo, arquivo_novo, limite=50, saida_json=None):
+    """
+    Compara dois arquivos BPA-I e exibe as linhas adicionadas, removidas e alteradas
+    
+    Args:
+        arquivo_antigo: Arquivo BPA-I antigo
+        arquivo_novo: Arquivo BPA-I novo
+        limite: Quantidade máxima de diferenças exibidas
+        saida_json: Caminho para gravar todas as diferenças em JSON Lines (opcional)
+    """
+    saida = None
+    try:
+        comparacao = BPADiff(arquivo_antigo, arquivo_novo)
+        
+        if saida_json:
+            saida = open(saida_json, "w", encoding="utf-8")
+        
+        print(f"\n=== COMPARAÇÃO BPA-I ===")
+        print(f"Antigo: {arquivo_antigo}")
+        print(f"Novo:   {arquivo_novo}\n")
+        
+        exibidas = 0
+        for diferenca in comparacao.run():
+            if saida:
+                saida.write(json.dumps(diferenca, ensure_ascii=False) + "\n")
+            
+            if exibidas >= limite:
+                continue
+            exibidas += 1
+            
+            chave = " ".join(f"{nome}={valor}" for nome, valor in diferenca["chave"].items())
+            if diferenca["tipo"] == "adicionada":
+                print(f"+ linha {diferenca['linha_nova']}: {chave}")
+            elif diferenca["tipo"] == "removida":
+                print(f"- linha {diferenca['linha_antiga']}: {chave}")
+            else:
+                print(f"~ linha {diferenca['linha_antiga']} -> {diferenca['linha_nova']}: {chave}")
+                for campo, (antes, depois) in diferenca["campos"].items():
+                    print(f"    {campo}: '{antes}' -> '{depois}'")
+        
+        resumo = comparacao.summary
+        print(f"\nLinhas: {resumo.linhas_antigo} -> {resumo.linhas_novo}")
+        print(f"Iguais: {resumo.iguais}")
+        print(f"Adicionadas: {resumo.adicionadas}")
+        print(f"Removidas: {resumo.removidas}")
+        print(f"Alteradas: {resumo.alteradas}")
+        for campo, total in sorted(resumo.campos_alterados.items(), key=lambda item: -item[1]):
+            print(f"  - {campo}: {total}")
+        
+        total = resumo.adicionadas + resumo.removidas + resumo.alteradas
+        if total > exibidas:
+            print(f"\n... e mais {total - exibidas} diferenças não exibidas.")
+        if saida_json:
+            print(f"Diferenças gravadas em: {saida_json}")
+        
+        print("=" * 34)
+    
+    except Exception as e:
+        logger.error(f"Erro ao comparar arquivos BPA-I: {str(e)}")
+        print(f"Erro ao comparar arquivos BPA-I: {str(e)}")
+    
+    finally:
+        if saida:
+            saida.close()
+
+def collect_exports(cota=None, simular=False, fixar=None, liberar=None, listar=False):
+    """
+    Aplica a cota de disco ao diretório de exportação
+    
+    Args:
+        cota: Cota (ex.: 500M, 10G; padrão: EXPORT_QUOTA_BYTES)
+        simular: Apenas informa o que seria removido
+        fixar: Arquivo a fixar (nunca removido pela cota)
+        liberar: Arquivo a liberar da fixação
+        listar: Lista os arquivos do índice
+    """
+    try:
+        manager = RetentionManager(get_settings())
+        
+        if fixar or liberar:
+            manager.scan()
+            caminho = manager.cache.set_pinned(fixar or liberar, bool(fixar))
+            if caminho is None:
+                print(f"Arquivo não encontrado no índice: {fixar or liberar}")
+            else:
+                print(f"Arquivo {'fixado' if fixar else 'liberado'}: {caminho}")
+            return
+        
+        if listar:
+            manager.scan()
+            print(f"\n=== ARQUIVOS DE EXPORTAÇÃO ===")
+            for entrada in manager.cache.entries():
+                marca = "*" if entrada["pinned"] else " "
+                print(f" {marca} {entrada['last_access'][:19]}  {format_size(entrada['size']):>10}  {entrada['path']}")
+            print("(* = fixado)")
+            return
+        
+        relatorio = manager.collect(parse_size(cota) if cota else None, simular)
+        
+        print(f"\n=== RETENÇÃO DAS EXPORTAÇÕES{' (SIMULAÇÃO)' if simular else ''} ===")
+        print(f"Cota: {format_size(relatorio.cota)}")
+        print(f"Ocupado: {format_size(relatorio.total_antes)} -> {format_size(relatorio.total_depois)}")
+        print(f"Fixados: {format_size(relatorio.fixados)}")
+        print(f"Arquivos registrados: {relatorio.registrados}")
+        print(f"Entradas sem arquivo: {relatorio.ausentes}")
+        print(f"Temporários abandonados: {relatorio.temporarios}")
+        print(f"Arquivos removidos: {len(relatorio.removidos)} ({format_size(relatorio.liberados)})")
+        for caminho in relatorio.removidos:
+            print(f"  - {caminho}")
+        if relatorio.total_depois > relatorio.cota:
+            print("ATENÇÃO: os arquivos fixados sozinhos excedem a cota")
+    
+    except Exception as e:
+        logger.error(f"Erro ao aplicar a retenção: {str(e)}")
+        print(f"Erro ao aplicar a retenção: {str(e)}")
+
+def trace_report(arquivo=None, trace_id=None, ultimos=1, raiz=None):
+    """
+    Resume o caminho crítico das exportações rastreadas
+    
+    Args:
+        arquivo: Arquivo JSON Lines dos spans (padrão: TRACE_FILE ou <export_dir>/traces.jsonl)
+        trace_id: Identificador (ou prefixo) do trace
+        ultimos: Quantidade de traces mais recentes
+        raiz: Filtra pelo nome do span raiz (ex.: http.request, job, cli.bpa)
+    """
+    try:
+        arquivo = Path(arquivo) if arquivo else tracing.default_trace_file(get_settings())
+        traces = load_traces(arquivo)
+        
+        resumos = list(select_traces(traces, trace_id, raiz, ultimos))
+        if not resumos:
+            print(f"Nenhum trace encontrado em {arquivo}")
+            return
+        
+        for resumo in resumos:
+            raiz_span = resumo.root
+            total = resumo.duration_ns or 1
+            atributos = " ".join(
+                f"{nome}={valor}" for nome, valor in raiz_span["attributes"].items() if valor not in (None, "")
+            )
+            inicio = datetime.fromtimestamp(raiz_span["start_ns"] / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+            
+            print(f"\n=== TRACE {resumo.trace_id} ===")
+            print(f"Raiz: {raiz_span['name']} {atributos}")
+            print(f"Início: {inicio}  Duração: {resumo.duration_ns / 1e9:.3f} s  Spans: {resumo.spans}")
+            
+            print("\nCaminho crítico:")
+            for nome, tempo, spans in resumo.critical_path:
+                print(f"  {nome:<20} {tempo / 1e9:>10.3f} s {100 * tempo / total:>6.1f}%  ({spans} span(s))")
+            
+            print("\nEtapas (todas as ocorrências):")
+            for nome, etapa in sorted(resumo.stages.items(), key=lambda item: -item[1]["duration_ns"]):
+                registros = f"  {etapa['rows']} registros" if etapa["rows"] else ""
+                print(f"  {nome:<20} {etapa['duration_ns'] / 1e9:>10.3f} s  {etapa['spans']:>6} span(s){registros}")
+            
+            if resumo.errors:
+                print(f"\nErros:")
+                for nome, erro in resumo.errors:
+                    print(f"  - {nome}: {erro}")
+            
+            print("=" * 34)
+    
+    except Exception as e:
+        logger.error(f"Erro ao resumir os traces: {str(e)}")
+        print(f"Erro ao resumir os traces: {str(e)}")
+
+def trace_collector(arquivo=None, host="127.0.0.1", porta=4318):
+    """
+    Executa um coletor OTLP/HTTP local que grava os spans em JSON Lines
+    
+    Args:
+        arquivo: Arquivo de saída (padrão: TRACE_FILE ou <export_dir>/traces.jsonl)
+        host: Endereço de escuta
+        porta: Porta de escuta
+    """
+    arquivo = Path(arquivo) if arquivo else tracing.default_trace_file(get_settings())
+    print(f"Coletor de spans em http://{host}:{porta}/v1/traces gravando em {arquivo} (Ctrl+C encerra)")
+    try:
+        tracing.run_collector(arquivo, host, porta)
+    except KeyboardInterrupt:
+        pass
+
+def export_batch(inicio, fim, formatos, cnes=None, orgao_emissor=None, duplicidades=MODO_REPORTAR,
+                 ignorar_incompatibilidades=False, workers=None, saida=None):
+    """
+    Exporta um intervalo de competências em um único ZIP com manifesto
+    
+    Args:
+        inicio: Primeira competência (AAAAMM)
+        fim: Última competência (AAAAMM)
+        formatos: Formatos separados por vírgula (ex.: bpa,csv)
+        cnes: CNES do estabelecimento (BPA-I; padrão: DEFAULT_CNES)
+        orgao_emissor: Órgão emissor (BPA-I; padrão: DEFAULT_ORGAO_EMISSOR)
+        duplicidades: Tratamento de lançamentos duplicados
+        ignorar_incompatibilidades: Gera o BPA-I mesmo com lançamentos incompatíveis
+        workers: Threads do lote (padrão: BATCH_WORKERS)
+        saida: Arquivo ZIP (padrão: bpa_lote_<inicio>_<fim>.zip no diretório de exportação)
+        
+    Returns:
+        Caminho do ZIP (None com erro)
+    """
+    try:
+        settings = get_settings()
+        competencias = competencia_range(inicio, fim)
+        formatos = parse_formats([formatos])
+        cnes = cnes or settings.default_cnes
+        opcoes = dict(
+            orgao_emissor=orgao_emissor or settings.default_orgao_emissor,
+            duplicidades=duplicidades,
+            ignorar_incompatibilidades=ignorar_incompatibilidades
+        )
+        saida = Path(saida) if saida else settings.export_dir / f"bpa_lote_{competencias[0]}_{competencias[-1]}.zip"
+        
+        exporter = BatchExporter(settings, SessionLocal, workers)
+        logger.info(
+            f"Exportação em lote: {len(competencias)} competência(s), formatos {', '.join(formatos)}, "
+            f"{exporter.workers} worker(s)"
+        )
+        
+        itens = []
+        def acompanhar(lote):
+            for item in lote:
+                itens.append(item)
+                situacao = item.archive_name if item.status == ITEM_DONE else f"{item.status}: {item.error}"
+                print(f"  {item.competencia} {item.format:<8} {item.seconds:>8.1f} s  {situacao}")
+                yield item
+        
+        parcial = saida.with_name(saida.name + ".part")
+        with open(parcial, "wb") as arquivo:
+            for pedaco in stream_archive(
+                acompanhar(exporter.run(competencias, formatos, cnes, opcoes)),
+                batch_manifest(competencias, formatos, cnes, opcoes)
+            ):
+                arquivo.write(pedaco)
+        os.replace(parcial, saida)
+        
+        concluidos = sum(1 for item in itens if item.status == ITEM_DONE)
+        print(f"\n=== EXPORTAÇÃO EM LOTE ===")
+        print(f"Itens concluídos: {concluidos} de {len(itens)}")
+        print(f"Arquivo: {saida}")
+        print("=" * 34)
+        return saida
+    
+    except Exception as e:
+        logger.error(f"Erro ao exportar em lote: {str(e)}")
+        print(f"Erro ao exportar em lote: {str(e)}")
+
+def schema_refresh():
+    """
+    Atualiza o catálogo offline do esquema a partir do banco
+    """
+    db = None
+    try:
+        db = get_db()
+        catalogo = refresh_catalog(db, get_settings())
+        
+        print(f"Catálogo do esquema atualizado: {len(catalogo.tables())} tabelas, {len(catalogo.columns)} colunas")
+        print(f"Arquivo: {catalogo.source}")
+    
+    except Exception as e:
+        logger.error(f"Erro ao atualizar o catálogo do esquema: {str(e)}")
+        print(f"Erro ao atualizar o catálogo do esquema: {str(e)}")
+    
+    finally:
+        if db:
+            db.close()
+
+def run_daemon(agenda=None, competencias=None, uma_vez=False):
+    """
+    Pré-extrai as competências nos horários da agenda (modo daemon)
+    
+    Args:
+        agenda: Agenda no formato do cron (padrão: DAEMON_SCHEDULE)
+        competencias: Competências fixas (padrão: a corrente e, no fechamento, a anterior)
+        uma_vez: Executa imediatamente uma única vez e termina
+    """
+    try:
+        settings = get_settings()
+        competencias = [competencia_range(competencia, competencia)[0] for competencia in competencias or []]
+        daemon = PrewarmDaemon(settings, SessionLocal, CronSchedule(agenda or settings.daemon_schedule), competencias)
+    except ValueError as e:
+        logger.error(f"Erro ao iniciar o daemon: {str(e)}")
+        print(f"Erro ao iniciar o daemon: {str(e)}")
+        return
+    
+    if uma_vez:
+        for result in daemon.run_once():
+            if result.erro:
+                print(f"Competência {result.competencia}: erro - {result.erro}")
+                continue
+            extracao = result.extracao
+            print(f"Competência {result.competencia}: {extracao['registros']} registros "
+                  f"({extracao['extraidos']} de {extracao['segmentos']} segmentos extraídos do banco, "
+                  f"{extracao['removidos']} removidos), {result.rejeitados} incompatíveis, "
+                  f"{result.duplicados} duplicados ({result.segundos:.2f} s)")
+            print(f"  Relatórios: {daemon.extraction.directory(result.competencia)}")
+        return
+    
+    # SIGTERM (systemd, docker stop) encerra após a competência em andamento
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"Daemon de pré-extração iniciado (agenda: {daemon.schedule.expression}). Ctrl+C para encerrar.")
+    try:
+        daemon.run(stop)
+    except KeyboardInterrupt:
+        pass
+    print("Daemon de pré-extração encerrado.")
+
 def main():
     """Função principal do script"""
     parser = argparse.ArgumentParser(description="BPA Exporter - Exportação de dados para BPA-I, CSV e XLSX")
+    parser.add_argument("--rastrear", nargs="?", const="", metavar="ARQUIVO",
+                        help="Grava os spans das etapas em JSON Lines (padrão: TRACE_FILE ou <export_dir>/traces.jsonl)")
+    parser.add_argument("--perfil", "--profile", dest="perfil", choices=profiling.MODOS_PERFIL,
+                        help="Perfil de desempenho do comando: cprofile, sampling ou memory "
+                             "(relatórios <arquivo>.perfil.* junto do arquivo gerado)")
     
     # Cria subcomandos
     subparsers = parser.add_subparsers(dest="command", help="Comandos disponíveis")
@@ -238,27 +767,175 @@ def main():
     xlsx_parser = subparsers.add_parser("xlsx", help="Exporta dados para XLSX")
     xlsx_parser.add_argument("--competencia", help="Competência no formato AAAAMM")
     
+    # Comando de exportação Parquet
+    parquet_parser = subparsers.add_parser("parquet", help="Exporta dados para Parquet")
+    parquet_parser.add_argument("--competencia", help="Competência no formato AAAAMM")
+    
     # Comando de exportação BPA-I
     bpa_parser = subparsers.add_parser("bpa", help="Exporta dados para BPA-I")
     bpa_parser.add_argument("--competencia", required=True, help="Competência no formato AAAAMM")
     bpa_parser.add_argument("--cnes", required=True, help="Código CNES do estabelecimento")
     bpa_parser.add_argument("--orgao", required=True, help="Órgão emissor")
+    bpa_parser.add_argument("--ignorar-incompatibilidades", action="store_true",
+                            help="Gera o arquivo mesmo com lançamentos incompatíveis (sexo, idade, CBO)")
+    bpa_parser.add_argument("--duplicidades", choices=MODOS_DUPLICIDADE, default=MODO_REPORTAR,
+                            help="Tratamento de lançamentos duplicados (padrão: reportar)")
+    bpa_parser.add_argument("--retomar", "--resume", dest="retomar", action="store_true",
+                            help="Continua uma exportação interrompida a partir do último ponto de controle")
+    
+    # Comando de validação de arquivo BPA-I
+    check_parser = subparsers.add_parser("bpa-check", help="Valida um arquivo BPA-I já gerado")
+    check_parser.add_argument("arquivo", help="Caminho do arquivo BPA-I")
+    check_parser.add_argument("--index", action="store_true", help="Gera o índice auxiliar por CNS e procedimento")
+    check_parser.add_argument("--cns", help="Localiza as linhas de um CNS de paciente")
+    check_parser.add_argument("--procedimento", help="Localiza as linhas de um procedimento")
+    
+    # Comando de comparação entre arquivos BPA-I
+    diff_parser = subparsers.add_parser("bpa-diff", help="Compara dois arquivos BPA-I")
+    diff_parser.add_argument("antigo", help="Arquivo BPA-I antigo")
+    diff_parser.add_argument("novo", help="Arquivo BPA-I novo")
+    diff_parser.add_argument("--limite", type=int, default=50, help="Quantidade máxima de diferenças exibidas")
+    diff_parser.add_argument("--json", dest="saida_json", help="Grava todas as diferenças em JSON Lines")
+    
+    # Comando de retenção do diretório de exportação
+    gc_parser = subparsers.add_parser("gc", help="Aplica a cota de disco ao diretório de exportação")
+    gc_parser.add_argument("--cota", help="Cota (ex.: 500M, 10G; padrão: EXPORT_QUOTA_BYTES)")
+    gc_parser.add_argument("--simular", action="store_true", help="Apenas informa o que seria removido")
+    pin_group = gc_parser.add_mutually_exclusive_group()
+    pin_group.add_argument("--fixar", metavar="ARQUIVO", help="Fixa um arquivo (nunca removido pela cota)")
+    pin_group.add_argument("--liberar", metavar="ARQUIVO", help="Libera a fixação de um arquivo")
+    gc_parser.add_argument("--listar", action="store_true", help="Lista os arquivos com tamanho e último acesso")
+    
+    # Comando de resumo dos traces
+    report_parser = subparsers.add_parser("trace-report", help="Resume o caminho crítico das exportações rastreadas")
+    report_parser.add_argument("arquivo", nargs="?", help="Arquivo JSON Lines dos spans")
+    report_parser.add_argument("--id", dest="trace_id", help="Identificador (ou prefixo) do trace")
+    report_parser.add_argument("--ultimos", type=int, default=1, help="Quantidade de traces mais recentes (padrão: 1)")
+    report_parser.add_argument("--raiz", help="Filtra pelo span raiz (ex.: http.request, job, cli.bpa)")
+    
+    # Coletor OTLP/HTTP local
+    collector_parser = subparsers.add_parser("trace-collector", help="Coletor OTLP/HTTP local que grava os spans em JSON Lines")
+    collector_parser.add_argument("arquivo", nargs="?", help="Arquivo JSON Lines de saída")
+    collector_parser.add_argument("--host", default="127.0.0.1", help="Endereço de escuta (padrão: 127.0.0.1)")
+    collector_parser.add_argument("--porta", type=int, default=4318, help="Porta de escuta (padrão: 4318)")
+    
+    # Comando de exportação em lote
+    batch_parser = subparsers.add_parser("batch", help="Exporta várias competências em um único ZIP com manifesto")
+    batch_parser.add_argument("--de", "--from", dest="inicio", required=True, help="Primeira competência (AAAAMM)")
+    batch_parser.add_argument("--ate", "--to", dest="fim", required=True, help="Última competência (AAAAMM)")
+    batch_parser.add_argument("--formatos", "--formats", dest="formatos", default="bpa",
+                              help="Formatos separados por vírgula: csv, xlsx, parquet, bpa (padrão: bpa)")
+    batch_parser.add_argument("--cnes", help="Código CNES do estabelecimento (padrão: DEFAULT_CNES)")
+    batch_parser.add_argument("--orgao", help="Órgão emissor (padrão: DEFAULT_ORGAO_EMISSOR)")
+    batch_parser.add_argument("--ignorar-incompatibilidades", action="store_true",
+                              help="Gera o BPA-I mesmo com lançamentos incompatíveis (sexo, idade, CBO)")
+    batch_parser.add_argument("--duplicidades", choices=MODOS_DUPLICIDADE, default=MODO_REPORTAR,
+                              help="Tratamento de lançamentos duplicados (padrão: reportar)")
+    batch_parser.add_argument("--workers", type=int, help="Threads do lote (padrão: BATCH_WORKERS)")
+    batch_parser.add_argument("--saida", help="Arquivo ZIP (padrão: bpa_lote_<de>_<ate>.zip no diretório de exportação)")
+    
+    # Comando de atualização do catálogo do esquema
+    subparsers.add_parser("schema-refresh", help="Atualiza o catálogo offline do esquema sigh a partir do banco")
+    
+    # Modo daemon: pré-extração agendada
+    daemon_parser = subparsers.add_parser("daemon", help="Pré-extrai a competência corrente nos horários de pouco movimento")
+    daemon_parser.add_argument("--agenda", "--schedule", dest="agenda",
+                               help="Agenda no formato do cron (padrão: DAEMON_SCHEDULE, \"0 1-5 * * *\")")
+    daemon_parser.add_argument("--competencia", action="append",
+                               help="Competência a preparar (AAAAMM; repetível; padrão: a corrente e, no fechamento, a anterior)")
+    daemon_parser.add_argument("--uma-vez", "--once", dest="uma_vez", action="store_true",
+                               help="Executa imediatamente uma única vez e termina")
     
     # Parse dos argumentos
     args = parser.parse_args()
     
-    # Executa o comando apropriado
+    # Logging configurado apenas na execução de um comando (não na importação nem no --help)
+    try:
+        log_file = get_settings().log_file
+    except Exception:
+        # Comandos que não usam o banco (bpa-check, bpa-diff) rodam sem DB_* configurados
+        log_file = os.environ.get("LOG_FILE", DEFAULT_LOG_FILE)
+    configure_logging(log_file)
+    
+    # Rastreamento: --rastrear ou TRACE_EXPORTER, com um span raiz por comando de exportação
+    if args.command in TRACED_COMMANDS or args.command == "daemon":
+        settings = get_settings()
+        if args.rastrear is not None:
+            tracing.configure(tracing.JsonLinesExporter(Path(args.rastrear) if args.rastrear else tracing.default_trace_file(settings)))
+        else:
+            tracing.configure_from_settings(settings)
+        try:
+            if args.command == "daemon":
+                # Um trace por competência preparada (daemon.warm), sem span raiz
+                execute(parser, args)
+            else:
+                with tracing.span(f"cli.{args.command}", competencia=getattr(args, "competencia", None)):
+                    execute(parser, args)
+        finally:
+            tracing.shutdown()
+    else:
+        execute(parser, args)
+
+def execute(parser, args):
+    """Executa o comando, sob o perfilador com --perfil"""
+    if not args.perfil:
+        return run_command(parser, args)
+    
+    profiler = profiling.Profiler(args.perfil, all_threads=True)
+    with profiler:
+        result = run_command(parser, args)
+    
+    # Relatórios junto do arquivo gerado; comandos sem arquivo usam o diretório de exportação
+    base = Path(result) if result else get_settings().export_dir / f"perfil_{args.command}_{datetime.now():%Y%m%d_%H%M%S}"
+    reports = profiler.write_reports(base)
+    print(f"\nPerfil ({args.perfil}, {profiler.seconds:.2f} s):")
+    for report in reports:
+        print(f"  {report}")
+    return result
+
+def run_command(parser, args):
+    """Executa o comando escolhido"""
     if args.command == "stats":
         show_stats(args.competencia)
     
     elif args.command == "csv":
-        export_csv(args.competencia)
+        return export_csv(args.competencia)
     
     elif args.command == "xlsx":
-        export_xlsx(args.competencia)
+        return export_xlsx(args.competencia)
+    
+    elif args.command == "parquet":
+        return export_parquet(args.competencia)
     
     elif args.command == "bpa":
-        export_bpa(args.competencia, args.cnes, args.orgao)
+        return export_bpa(
+            args.competencia, args.cnes, args.orgao, args.ignorar_incompatibilidades, args.duplicidades, args.retomar
+        )
+    
+    elif args.command == "bpa-check":
+        check_bpa(args.arquivo, args.index, args.cns, args.procedimento)
+    
+    elif args.command == "bpa-diff":
+        diff_bpa(args.antigo, args.novo, args.limite, args.saida_json)
+    
+    elif args.command == "gc":
+        collect_exports(args.cota, args.simular, args.fixar, args.liberar, args.listar)
+    
+    elif args.command == "trace-report":
+        trace_report(args.arquivo, args.trace_id, args.ultimos, args.raiz)
+    
+    elif args.command == "trace-collector":
+        trace_collector(args.arquivo, args.host, args.porta)
+    
+    elif args.command == "batch":
+        return export_batch(args.inicio, args.fim, args.formatos, args.cnes, args.orgao, args.duplicidades,
+                     args.ignorar_incompatibilidades, args.workers, args.saida)
+    
+    elif args.command == "schema-refresh":
+        schema_refresh()
+    
+    elif args.command == "daemon":
+        run_daemon(args.agenda, args.competencia, args.uma_vez)
     
     else:
         parser.print_help()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Configuração comum dos testes
+
+Os testes não usam o banco: as variáveis obrigatórias recebem valores
+fictícios e os serviços que consultam o banco são substituídos por
+versões em memória em cada teste.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+os.environ.setdefault("DB_NAME", "teste")
+os.environ.setdefault("DB_USER", "teste")
+os.environ.setdefault("DB_PASSWORD", "teste")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("EXPORT_DIR", tempfile.mkdtemp(prefix="bpa_exporter_testes_"))
+
+from app.models.header import HeaderBPA  # noqa: E402
+from app.utils.config import Settings  # noqa: E402
+
+
+@pytest.fixture
+def settings(tmp_path: Path) -> Settings:
+    """Configurações com o diretório de exportação em um diretório temporário"""
+    return Settings(export_dir=tmp_path, log_file="")
+
+
+@pytest.fixture
+def header() -> HeaderBPA:
+    """Cabeçalho do BPA-I dos testes"""
+    return HeaderBPA.from_competencia("1234567", "202401", "M")
+
+
+@pytest.fixture
+def registros_bpa() -> List[Dict[str, Any]]:
+    """
+    Registros no formato de DataService.stream_records, na ordem da chave
+
+    A chave natural (paciente, procedimento, data, profissional) se repete a
+    cada 1100 registros: há duplicados em lotes e pontos de controle diferentes.
+    """
+    registros = []
+    for i in range(2400):
+        k = i % 1100
+        registros.append({
+            "numero": 1000 + i // 3,
+            "id_lancamento": i,
+            "cod_paciente": 500 + k,
+            "cns_paciente": str(898001160000000 + k),
+            "cod_medico": 300 + k % 150,
+            "cns_profissional": None,
+            "data_atendimento": date(2024, 1, 1 + k % 28),
+            "data": datetime(2024, 1, 1 + k % 28, 8 + k % 10, k % 60),
+            "procedimento": 301010072 + k % 40,
+            "codigo_procedimento": f"03010100{72 + k % 20}",
+            "quantidade": Decimal(1 + i % 3),
+            "cbo": "225125",
+            "cod_cbo": "225125",
+            "cod_sexo_paciente": 1 + k % 2,
+            "data_nasc_paciente": date(1950 + k % 60, 1 + k % 12, 1 + k % 28),
+            "cid": "Z000" if k % 5 else None,
+            "carater_atendimento": "1",
+            "competencia": "202401",
+        })
+    return registros
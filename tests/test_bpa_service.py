@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Testes da geração do BPA-I em lotes (exportação em fluxo): mesmos bytes do
+arquivo gerado com todos os registros em memória
+"""
+
+import pytest
+
+from app.services.bpa_service import BPAService
+from app.services.compatibility_service import ProcedureCompatibilityService
+from modules.duplicates import MODO_DESCARTAR, MODO_REPORTAR
+
+
+def _lotes(registros, tamanho=700):
+    return [registros[i:i + tamanho] for i in range(0, len(registros), tamanho)]
+
+
+@pytest.mark.parametrize("modo", [MODO_REPORTAR, MODO_DESCARTAR])
+def test_lotes_geram_o_mesmo_arquivo(settings, header, registros_bpa, modo):
+    registros = registros_bpa
+    arquivo = BPAService(settings)
+    path = arquivo.generate_bpa(list(registros), header, modo, settings.export_dir / "arquivo.txt")
+    with open(path, encoding="utf-8") as file:
+        esperado = file.read()
+
+    fluxo = BPAService(settings)
+    linhas = fluxo.iter_batch_lines(_lotes(registros), header, modo, ProcedureCompatibilityService({}))
+
+    assert "".join(linha + "\n" for linha in linhas) == esperado
+    assert fluxo.duplicate_report.duplicados == arquivo.duplicate_report.duplicados > 0
+
+
+def test_lancamento_incompativel_interrompe_o_fluxo(settings, header, registros_bpa):
+    registros = registros_bpa
+    regras = ProcedureCompatibilityService({})
+    regras.check = lambda registro: 1 if registro["id_lancamento"] == 1500 else 0
+
+    linhas = BPAService(settings).iter_batch_lines(_lotes(registros), header, MODO_REPORTAR, regras)
+    with pytest.raises(ValueError):
+        list(linhas)
+
+    # Com ignore_incompatible, o arquivo sai completo
+    linhas = BPAService(settings).iter_batch_lines(_lotes(registros), header, MODO_REPORTAR, regras, True)
+    assert len(list(linhas)) == len(registros) + 1
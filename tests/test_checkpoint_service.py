@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Testes do BPA-I retomável: a retomada descarta o que foi escrito depois
+do ponto de controle e gera o mesmo arquivo de uma execução sem interrupção
+"""
+
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from app.services.bpa_service import BPAService
+from app.services.checkpoint_service import CheckpointMismatch, ResumableBPAExport
+from app.services.compatibility_service import ProcedureCompatibilityService
+from modules.duplicates import MODO_DESCARTAR, MODO_REPORTAR
+
+LOTE = 500
+INTERVALO = 600
+
+
+class Interrompido(Exception):
+    """Queda simulada no meio da geração"""
+
+
+class _Dados:
+    """DataService em memória, com cursor por chave e queda opcional após alguns lotes"""
+
+    def __init__(self, registros: List[Dict[str, Any]], falhar_apos: Optional[int] = None):
+        self.registros = registros
+        self.falhar_apos = falhar_apos
+
+    def get_freshness_token(self, competencia: Optional[str] = None) -> str:
+        return f"{len(self.registros)}-0-0-0-0"
+
+    def stream_records(self, competencia=None, after_id_fia=None, after_id_lancamento=None, **kwargs):
+        inicio = 0
+        if after_id_fia is not None:
+            chave = (after_id_fia, after_id_lancamento)
+            inicio = next(
+                (i for i, r in enumerate(self.registros) if (r["numero"], r["id_lancamento"]) > chave),
+                len(self.registros)
+            )
+        for n, i in enumerate(range(inicio, len(self.registros), LOTE)):
+            if self.falhar_apos is not None and n == self.falhar_apos:
+                raise Interrompido()
+            yield self.registros[i:i + LOTE]
+
+
+def _export(settings, header, nome: str, modo: str) -> ResumableBPAExport:
+    return ResumableBPAExport(
+        BPAService(settings), header, modo, interval=INTERVALO, filepath=settings.export_dir / nome
+    )
+
+
+def _regras() -> ProcedureCompatibilityService:
+    return ProcedureCompatibilityService({})
+
+
+@pytest.mark.parametrize("modo", [MODO_REPORTAR, MODO_DESCARTAR])
+def test_retomada_apos_queda_gera_o_mesmo_arquivo(settings, header, registros_bpa, modo):
+    registros = registros_bpa
+    referencia = _export(settings, header, "referencia.txt", modo)
+    referencia.run(_Dados(registros), _regras())
+    esperado = referencia.path.read_bytes()
+    assert referencia.duplicate_report.duplicados > 0
+
+    export = _export(settings, header, "retomado.txt", modo)
+    with pytest.raises(Interrompido):
+        export.run(_Dados(registros, falhar_apos=3), _regras())
+    assert export.checkpoint_path.exists()
+
+    # Linhas escritas depois do ponto de controle, e uma gravação cortada ao meio
+    with open(export.partial, "ab") as file:
+        file.write(b"03LINHA CORTA")
+
+    export.run(_Dados(registros), _regras(), resume=True)
+
+    assert 0 < export.resumed_at < len(registros)
+    assert export.path.read_bytes() == esperado
+    assert export.duplicate_report.duplicados == referencia.duplicate_report.duplicados
+    assert not export.partial.exists() and not export.checkpoint_path.exists() and not export.keys_path.exists()
+
+
+def test_arquivo_parcial_menor_que_o_ponto_de_controle_nao_e_retomado(settings, header, registros_bpa):
+    registros = registros_bpa
+    export = _export(settings, header, "truncado.txt", MODO_REPORTAR)
+    with pytest.raises(Interrompido):
+        export.run(_Dados(registros, falhar_apos=3), _regras())
+
+    # Perde parte do que o ponto de controle já cobria
+    tamanho = export.partial.stat().st_size
+    with open(export.partial, "r+b") as file:
+        file.truncate(tamanho // 2)
+
+    with pytest.raises(CheckpointMismatch):
+        export.run(_Dados(registros), _regras(), resume=True)
+
+
+def test_dados_alterados_nao_sao_retomados(settings, header, registros_bpa):
+    registros = registros_bpa
+    export = _export(settings, header, "alterado.txt", MODO_REPORTAR)
+    with pytest.raises(Interrompido):
+        export.run(_Dados(registros, falhar_apos=3), _regras())
+
+    with pytest.raises(CheckpointMismatch):
+        export.run(_Dados(registros[:-1]), _regras(), resume=True)
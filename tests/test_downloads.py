@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Testes das respostas de download: ETag, 304 (If-None-Match), Range e If-Range
+"""
+
+import asyncio
+import hashlib
+from typing import Dict, List, Tuple
+
+import pytest
+from fastapi import Request
+
+from app.services.artifact_cache import Artifact
+from app.utils.downloads import artifact_etag, artifact_response, parse_range
+
+CONTEUDO = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def artifact(tmp_path) -> Artifact:
+    path = tmp_path / "artefato.csv"
+    path.write_bytes(CONTEUDO)
+    return Artifact(
+        key="a" * 64,
+        path=path,
+        filename="exportacao.csv",
+        size=len(CONTEUDO),
+        sha256=hashlib.sha256(CONTEUDO).hexdigest(),
+    )
+
+
+def _request(method: str = "GET", **headers: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/download",
+        "query_string": b"",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def _send(response) -> Tuple[int, Dict[str, str], bytes]:
+    """Executa a resposta ASGI e devolve situação, cabeçalhos e corpo"""
+    mensagens: List[dict] = []
+
+    async def receive():
+        # O cliente não desconecta: a resposta em fluxo vai até o fim
+        await asyncio.Event().wait()
+
+    async def send(message):
+        mensagens.append(message)
+
+    asyncio.run(response({"type": "http", "method": "GET", "headers": []}, receive, send))
+    inicio = mensagens[0]
+    headers = {name.decode(): value.decode() for name, value in inicio["headers"]}
+    corpo = b"".join(m.get("body", b"") for m in mensagens if m["type"] == "http.response.body")
+    return inicio["status"], headers, corpo
+
+
+def test_arquivo_inteiro_com_etag(artifact):
+    status, headers, corpo = _send(artifact_response(_request(), artifact, "text/csv"))
+
+    assert status == 200
+    assert corpo == CONTEUDO
+    assert headers["etag"] == artifact_etag(artifact)
+    assert headers["accept-ranges"] == "bytes"
+
+
+def test_if_none_match_devolve_304_sem_corpo(artifact):
+    etag = artifact_etag(artifact)
+    for valor in (etag, f"W/{etag}", f'"outra", {etag}', "*"):
+        status, headers, corpo = _send(artifact_response(_request(if_none_match=valor), artifact, "text/csv"))
+        assert status == 304 and corpo == b""
+        assert headers["etag"] == etag
+
+    status, _, corpo = _send(artifact_response(_request(if_none_match='"outra"'), artifact, "text/csv"))
+    assert status == 200 and corpo == CONTEUDO
+
+
+def test_if_none_match_ignorado_fora_de_get(artifact):
+    request = _request("POST", if_none_match=artifact_etag(artifact), range="bytes=0-9")
+    status, _, corpo = _send(artifact_response(request, artifact, "text/csv"))
+    assert status == 200 and corpo == CONTEUDO
+
+
+@pytest.mark.parametrize("valor, inicio, fim", [
+    ("bytes=1000-", 1000, len(CONTEUDO) - 1),
+    ("bytes=0-9", 0, 9),
+    ("bytes=-500", len(CONTEUDO) - 500, len(CONTEUDO) - 1),
+    ("bytes=10000-99999", 10000, len(CONTEUDO) - 1),
+])
+def test_range_devolve_206_com_o_trecho(artifact, valor, inicio, fim):
+    status, headers, corpo = _send(artifact_response(_request(range=valor), artifact, "text/csv"))
+
+    assert status == 206
+    assert corpo == CONTEUDO[inicio:fim + 1]
+    assert headers["content-range"] == f"bytes {inicio}-{fim}/{len(CONTEUDO)}"
+    assert headers["content-length"] == str(fim - inicio + 1)
+
+
+def test_range_fora_do_arquivo_devolve_416(artifact):
+    status, headers, _ = _send(artifact_response(_request(range=f"bytes={len(CONTEUDO)}-"), artifact, "text/csv"))
+    assert status == 416
+    assert headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+
+def test_if_range_de_outra_versao_envia_o_arquivo_inteiro(artifact):
+    etag = artifact_etag(artifact)
+
+    status, _, corpo = _send(artifact_response(_request(range="bytes=0-9", if_range=etag), artifact, "text/csv"))
+    assert status == 206 and corpo == CONTEUDO[:10]
+
+    # If-Range usa comparação forte: ETag fraca ou de outra versão não emenda pedaços
+    for valor in ('"outra"', f"W/{etag}"):
+        status, _, corpo = _send(artifact_response(_request(range="bytes=0-9", if_range=valor), artifact, "text/csv"))
+        assert status == 200 and corpo == CONTEUDO
+
+
+def test_parse_range_ignora_cabecalhos_invalidos():
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("itens=0-1", 100) is None
+    assert parse_range("bytes=9-1", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
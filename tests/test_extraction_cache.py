@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Testes da cópia pré-extraída: a exportação a partir dos segmentos deve
+ser idêntica, byte a byte, à feita a partir do banco
+"""
+
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from app.services.csv_writer import write_csv
+from app.services.data_service import ColumnDescription
+from app.services.extraction_cache import ExtractionCache, _combine_tokens
+from app.services.ndjson_writer import encode_batch
+
+COMPETENCIA = "202401"
+TAMANHO_SEGMENTO = 10
+
+
+def _registros() -> List[Dict[str, Any]]:
+    """Registros com decimais de escalas diferentes, datas e nulos"""
+    quantidades = [Decimal("1"), Decimal("2.5"), Decimal("10"), Decimal("1.000"), Decimal("0.25"), None]
+    return [
+        {
+            "numero": i,
+            "id_lancamento": i * 10,
+            "quantidade": quantidades[i % len(quantidades)],
+            "valor": Decimal("1E+1") if i == 7 else Decimal(i) / 4,
+            "cod_procedimento": f"0301010{i % 10:03d}",
+            "data_atendimento": date(2024, 1, 1 + i % 28),
+            "criado_em": datetime(2024, 1, 2, 8, 30, i % 60, 1000 * i),
+            "observacao": None if i % 3 else "ok",
+        }
+        for i in range(1, 35)
+    ]
+
+
+class _Stream:
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.columns = [ColumnDescription(name, None, None, None) for name in rows[0]] if rows else []
+
+    def records(self):
+        return iter([dict(row) for row in self.rows])
+
+
+class _Banco:
+    """DataService em memória: tokens por segmento e consulta por faixa de fichas"""
+
+    def __init__(self, registros: List[Dict[str, Any]]):
+        self.registros = registros
+
+    def get_segment_tokens(self, competencia: str, segment_size: int) -> Dict[int, str]:
+        tokens: Dict[int, List[int]] = {}
+        for registro in self.registros:
+            token = tokens.setdefault(registro["numero"] // segment_size, [0] * 5)
+            token[0] += 1
+            token[1] += registro["id_lancamento"]
+        return {segmento: "-".join(map(str, token)) for segmento, token in tokens.items()}
+
+    def get_cached_freshness_token(self, competencia: Optional[str] = None, max_age: float = 0) -> str:
+        return _combine_tokens(iter(self.get_segment_tokens(competencia, TAMANHO_SEGMENTO).values()))
+
+    def query_records(self, competencia=None, after_id_fia=None, before_id_fia=None, **kwargs) -> _Stream:
+        return _Stream([
+            r for r in self.registros
+            if (after_id_fia is None or r["numero"] > after_id_fia)
+            and (before_id_fia is None or r["numero"] < before_id_fia)
+        ])
+
+
+@pytest.fixture
+def cache(settings):
+    settings.extraction_segment_size = TAMANHO_SEGMENTO
+    return ExtractionCache(settings)
+
+
+def _csv(registros: List[Dict[str, Any]]) -> str:
+    saida = io.StringIO(newline="")
+    assert write_csv(saida, registros)
+    return saida.getvalue()
+
+
+def test_segmentos_preservam_escala_dos_decimais(cache):
+    registros = _registros()
+    cache.refresh(_Banco(registros), COMPETENCIA)
+
+    stream = cache.open(COMPETENCIA, batch_size=7)
+    try:
+        lidos = [registro for lote in stream for registro in lote]
+    finally:
+        stream.close()
+
+    assert lidos == registros
+    assert [str(r["quantidade"]) for r in lidos] == [str(r["quantidade"]) for r in registros]
+    assert [str(r["valor"]) for r in lidos] == [str(r["valor"]) for r in registros]
+
+
+def test_csv_e_json_dos_segmentos_iguais_aos_do_banco(cache):
+    registros = _registros()
+    banco = _Banco(registros)
+    cache.refresh(banco, COMPETENCIA)
+
+    stream = cache.read(banco, COMPETENCIA, batch_size=1000)
+    assert stream is not None
+    try:
+        lidos = [registro for lote in stream for registro in lote]
+    finally:
+        stream.close()
+
+    assert _csv(lidos) == _csv(registros)
+    assert encode_batch(lidos) == encode_batch(registros)
+
+
+def test_segmento_alterado_e_extraido_de_novo(cache):
+    registros = _registros()
+    banco = _Banco(registros)
+    cache.refresh(banco, COMPETENCIA)
+
+    registros[12] = dict(registros[12], id_lancamento=999, quantidade=Decimal("3.50"))
+    resultado = cache.refresh(banco, COMPETENCIA)
+
+    assert resultado.extraidos == 1
+    stream = cache.open(COMPETENCIA, batch_size=1000)
+    try:
+        lidos = [registro for lote in stream for registro in lote]
+    finally:
+        stream.close()
+    assert str(lidos[12]["quantidade"]) == "3.50"
+    assert _csv(lidos) == _csv(registros)
+
+
+class _Resultado:
+    def __init__(self, linhas: List[Dict[str, Any]]):
+        self.linhas = linhas
+
+    def __iter__(self):
+        return iter([type("Linha", (), {"_mapping": linha})() for linha in self.linhas])
+
+
+class _Sessao:
+    """Sessão que registra as consultas e responde só a lista de competências"""
+
+    def __init__(self):
+        self.consultas: List[str] = []
+
+    def execute(self, query, params=None):
+        self.consultas.append(str(query))
+        return _Resultado([{"competencia": COMPETENCIA, "registros": 34}])
+
+
+@pytest.fixture
+def data_service(cache, monkeypatch):
+    from app.services import data_service as modulo
+
+    banco = _Banco(_registros())
+    servico = object.__new__(modulo.DataService)
+    servico.db = _Sessao()
+    monkeypatch.setattr(servico, "_extraction", lambda competencia: cache, raising=False)
+    monkeypatch.setattr(servico, "get_cached_freshness_token", banco.get_cached_freshness_token, raising=False)
+    monkeypatch.setattr(servico, "get_cached_token", lambda name, compute, max_age: compute(), raising=False)
+    monkeypatch.setattr(modulo.ProcedureCompatibilityService, "rules_token", classmethod(lambda cls, db, c=None: "r1"))
+    cache.refresh(banco, COMPETENCIA)
+    servico.banco = banco
+    return servico
+
+
+def _validacao(cache, regras: str = "r1", rejeitados: int = 0) -> None:
+    from app.services.extraction_cache import VALIDATION_FILE
+
+    cache.write_report(COMPETENCIA, VALIDATION_FILE, {
+        "regras": regras,
+        "compatibilidade": {"total_registros": 34, "rejeitados": rejeitados, "contagens": {}, "amostras": []},
+        "duplicidades": {"modo": "reportar", "total_registros": 34, "duplicados": 2, "amostras": []},
+    })
+
+
+def test_validacao_pre_calculada_vale_com_a_copia_e_as_regras(cache, data_service):
+    _validacao(cache, rejeitados=3)
+
+    compatibilidade, duplicidades = data_service.get_prewarmed_validation(COMPETENCIA)
+    assert compatibilidade.rejeitados == 3
+    assert duplicidades.duplicados == 2
+
+    # Outras regras: a validação não vale
+    _validacao(cache, regras="r0")
+    assert data_service.get_prewarmed_validation(COMPETENCIA) is None
+
+
+def test_relatorio_ignorado_quando_os_dados_mudam(cache, data_service):
+    from app.services.extraction_cache import STATS_FILE
+
+    _validacao(cache)
+    cache.write_report(COMPETENCIA, STATS_FILE, {"estatisticas": [{"competencia": COMPETENCIA, "total_fichas": 34}]})
+    assert cache.report(data_service, COMPETENCIA, STATS_FILE) is not None
+
+    # Cópia conferida há mais de FRESHNESS_TTL e banco alterado
+    manifesto = cache.manifest(COMPETENCIA)
+    manifesto["verificado_em"] = "2000-01-01T00:00:00"
+    cache._write(cache.directory(COMPETENCIA) / "manifest.json", json.dumps(manifesto).encode())
+    assert cache.report(data_service, COMPETENCIA, STATS_FILE) is not None
+    data_service.banco.registros.append(dict(_registros()[0], numero=99, id_lancamento=990))
+
+    assert cache.report(data_service, COMPETENCIA, STATS_FILE) is None
+    assert data_service.get_prewarmed_validation(COMPETENCIA) is None
+
+
+def test_estatisticas_pre_calculadas_dispensam_a_consulta(cache, data_service):
+    from app.services.extraction_cache import STATS_FILE
+
+    linha = {
+        "competencia": COMPETENCIA, "total_fichas": 34, "total_lancamentos": 34,
+        "total_pacientes": 30, "total_medicos": 5, "total_procedimentos": 10,
+    }
+    cache.write_report(COMPETENCIA, STATS_FILE, {"estatisticas": [linha]})
+
+    stats = data_service.get_statistics(COMPETENCIA)
+
+    assert stats["total_fichas"] == 34 and stats["competencia_atual"] == COMPETENCIA
+    # Só a lista de competências disponíveis foi consultada
+    assert len(data_service.db.consultas) == 1
+    assert "COUNT(DISTINCT f.id_fia) AS registros" in data_service.db.consultas[0]
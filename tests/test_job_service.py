@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Testes da fila de jobs: a reserva (worker, tentativa) impede que uma
+execução abandonada grave progresso ou resultado sobre a de outro worker
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.job_service import (
+    STATUS_CANCELLED, STATUS_DONE, STATUS_QUEUED, STATUS_RUNNING,
+    JobCancelled, JobLost, JobProgress, JobRunner, JobStore,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.sqlite3")
+
+
+def _reassign(store: JobStore, job_id: str, worker: str):
+    """Devolve o job à fila, como se o worker tivesse parado de bater, e o reserva para outro"""
+    assert store.requeue_stale(max_age=-1) == 1
+    assert store.get(job_id)["status"] == STATUS_QUEUED
+    return store.claim(worker)
+
+
+def test_reserva_antiga_nao_grava_progresso_nem_resultado(store):
+    job_id = store.create("csv", "202401", None, {})
+    antigo = store.claim("worker-a")
+    novo = _reassign(store, job_id, "worker-b")
+    assert (novo["worker"], novo["attempts"]) == ("worker-b", 2)
+
+    with pytest.raises(JobLost):
+        store.set_stage(job_id, "leitura", 10, antigo["worker"], antigo["attempts"])
+    with pytest.raises(JobLost):
+        store.set_progress(job_id, 5, antigo["worker"], antigo["attempts"])
+    assert not store.finish(job_id, STATUS_DONE, result={"arquivo": "a"}, worker="worker-a", attempt=1)
+
+    job = store.get(job_id)
+    assert job["status"] == STATUS_RUNNING and job["result"] is None
+
+    store.set_stage(job_id, "leitura", 10, "worker-b", 2)
+    assert store.finish(job_id, STATUS_DONE, result={"arquivo": "b"}, worker="worker-b", attempt=2)
+    assert json.loads(store.get(job_id)["result"]) == {"arquivo": "b"}
+
+
+def test_mesmo_worker_com_outra_tentativa_tambem_perde_a_reserva(store):
+    job_id = store.create("csv", "202401", None, {})
+    antigo = store.claim("worker-a")
+    _reassign(store, job_id, "worker-a")
+
+    progress = JobProgress(store, job_id, antigo["worker"], antigo["attempts"])
+    assert progress.cancelled()
+    with pytest.raises(JobLost):
+        progress.stage("gravacao")
+
+
+def test_runner_descarta_resultado_de_reserva_perdida(store, settings):
+    job_id = store.create("csv", "202401", None, {})
+    job = store.claim("worker-a")
+
+    runner = JobRunner(settings, lambda: SimpleNamespace(close=lambda: None))
+
+    def execute(job, db, progress):
+        # Durante a execução lenta, o job é devolvido à fila e assumido por outro worker
+        _reassign(store, job_id, "worker-b")
+        return {"arquivo": "lento.csv"}
+
+    runner._execute = execute
+    runner.run(job, store)
+
+    job = store.get(job_id)
+    assert job["status"] == STATUS_RUNNING
+    assert job["worker"] == "worker-b" and job["result"] is None
+
+
+def test_cancelamento_interrompe_no_proximo_progresso(store):
+    job_id = store.create("csv", "202401", None, {})
+    job = store.claim("worker-a")
+    progress = JobProgress(store, job_id, job["worker"], job["attempts"])
+
+    assert store.cancel(job_id) == STATUS_RUNNING
+    progress._last = float("-inf")
+    with pytest.raises(JobCancelled):
+        progress(10)
+
+    assert store.finish(job_id, STATUS_CANCELLED, worker="worker-a", attempt=job["attempts"])
+    assert store.get(job_id)["status"] == STATUS_CANCELLED
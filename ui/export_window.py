@@ -14,6 +14,7 @@ from modules.database import buscar_registros_por_competencia
 from modules.generator import gerar_arquivo_bpa
 from modules.formatter import MES_NOME
 from modules.validators import validar_dados_exportacao
+from modules.duplicates import MODO_SOMAR, tratar_duplicidades
 
 def executar_interface():
     """Cria e exibe a interface gráfica para exportação do BPA-I."""
@@ -109,6 +110,9 @@ def executar_interface():
                             msg_problemas += f"\n... e mais {len(problemas) - 5} problemas encontrados."
                         
                         janela["log"].print(f"Foram encontrados {len(problemas)} problemas nos dados:")
+                        for descricao, total in problemas.resumo().items():
+                            janela["log"].print(f"  {descricao}: {total}")
+                        janela["log"].print("Primeiras ocorrências:")
                         for prob in problemas[:5]:
                             janela["log"].print(f"  - {prob}")
                         
@@ -117,6 +121,18 @@ def executar_interface():
                             janela["log"].print("Exportação cancelada pelo usuário.")
                             continue
                     
+                    # Verificar lançamentos duplicados
+                    modo_duplicidade = None
+                    _, duplicidades = tratar_duplicidades(registros)
+                    if duplicidades.duplicados:
+                        janela["log"].print(f"Foram encontrados {duplicidades.duplicados} lançamentos duplicados (paciente, procedimento, data e profissional).")
+                        for amostra in duplicidades.amostras[:5]:
+                            janela["log"].print(f"  - Registro {amostra['registro']} repete o registro {amostra['primeira_ocorrencia']}")
+                        resposta = sg.popup_yes_no(f"Foram encontrados {duplicidades.duplicados} lançamentos duplicados.\n\nDeseja somar as quantidades em uma única linha?", title="Lançamentos Duplicados")
+                        if resposta == "Yes":
+                            modo_duplicidade = MODO_SOMAR
+                            janela["log"].print("As quantidades dos lançamentos duplicados serão somadas.")
+                    
                     janela["log"].print(f"Gerando arquivo BPA-I...")
                     janela.refresh()  # Atualizar interface
 
@@ -126,7 +142,7 @@ def executar_interface():
                         janela["log"].print(f"Calculando folhas e sequências...")
                         janela.refresh()
                         
-                        caminho_arquivo = gerar_arquivo_bpa(registros, ano_num, mes_num, pasta)
+                        caminho_arquivo = gerar_arquivo_bpa(registros, ano_num, mes_num, pasta, modo_duplicidade)
                         if caminho_arquivo:
                             janela["log"].print(f"Arquivo gerado com sucesso: {caminho_arquivo}")
                             janela["log"].print(f"Total de registros: {len(registros)}")